@@ -17,13 +17,77 @@ free_model_config = {
     # 2. 免费版专属模型路径（核心，需根据本地模型文件位置修改）
     # 请将该路径改为你本地「千问1.8B 4bit量化模型」的实际存储路径
     # 示例格式：本地相对路径/绝对路径，模型文件夹内需包含量化后的权重、配置文件
+    # 也可用tools/quantize_model.py以自有聊天语料离线量化全精度checkpoint，产物目录（含quantize_config.json）直接作为该路径
     "model_path": "./models/qwen-1_8b-chat-4bit-gptq",
 
-    # 3. 免费版专属资源限制（适配16G内存核心需求）
+    # 3. 推理后端（core/ai_service/backend.py注册）：gptq=AutoGPTQ 4bit（GPU优先），torch_int8=PyTorch动态int8（CPU专用）
+    "backend": "gptq",
+    "backend_params": {
+        "torch_int8": {
+            "model_path": "./models/qwen-1_8b-chat",  # 动态int8需全精度checkpoint（非GPTQ权重）
+            "num_threads": None,      # intra-op线程数，None=物理核数
+            "interop_threads": 1,     # inter-op线程数，单请求推理1个即可
+        },
+    },
+
+    # 4. 免费版专属资源限制（适配16G内存核心需求）
     "max_memory": "8G",  # 免费版最大内存/显存占用，不超过8G，预留内存给其他进程
+    "memory_estimate": "2G",  # 加载前的常驻内存预估（内存预算腾挪用，加载后按实际RSS增量记录）
 
-    # 4. 免费版专属推理参数（贴合千问1.8B 4bit模型能力）
+    # 5. 免费版专属推理参数（贴合千问1.8B 4bit模型能力）
     "max_context_len": 1024,  # 最大上下文长度，适配模型量化后理解能力
-    "max_gen_len": 512,       # 最大生成长度，日常聊天场景足够使用
+    "max_context_chars": 2048,  # 由缓存解析记录构造上下文时保留的最新字符数（Prompt再按max_context_len截断）
+    "max_gen_len": 512,       # 最大生成长度上限，日常聊天场景足够使用
     "timeout": 60.0,           # 推理超时时间，严格符合「接口返回≤3s」需求
+    "cold_timeout_factor": 1.5,  # 未预热时超时放宽系数（首轮生成含内核/内存分配开销）
+
+    # 准入控制（core/ai_service/inference_queue.py）：CPU上1.8B模型单并发即可占满算力
+    "max_concurrency": 1,          # 同时执行的生成数
+    "max_queue_size": 8,           # 最大排队数，超出返回429
+    "expected_generate_sec": 3.0,  # 无历史数据时的单次生成耗时预估（排队时间估算用）
+    "expected_load_sec": 30.0,     # 未加载时的加载耗时预估（版本路由估算首个请求耗时用）
+
+    # 6. 回复形态停止 + 自适应生成预算（Prompt要求「只说1-2句话」，避免模型写满max_gen_len）
+    "max_reply_sentences": 2,       # 生成满N个完整句子即停止（<=0不限制）
+    "min_new_tokens": 2,            # 最少生成token数，避免空回复
+    "reply_budget": {
+        "percentile": 0.9,          # 目标发送人历史回复长度分位数
+        "tokens_per_char": 0.8,     # 千问中文每字符token数估计
+        "margin": 1.5,              # 预算放大系数
+        "min_tokens": 16,           # 预算下限
+        "default_tokens": 64,       # 上下文无可用样本时的默认预算
+    },
+
+    # 7. KV缓存策略（core/ai_service/kv_cache.py）：每个并发生成持有「Prompt+生成」长度的KV缓存，
+    # 千问1.8B每token约192KB（float16，CPU上float32翻倍），1024token上下文单请求约0.2~0.4G
+    # int8量化约为原精度的1/2~1/4；配合budget按实际需要预留，可相应调大max_concurrency
+    "kv_cache": {
+        "quantization": None,   # None=与激活同精度，int8=千问KV缓存量化（use_cache_quantization）
+        "budget": None,         # KV缓存总预算：None=不限制，"auto"=max_memory扣除memory_estimate，或如"4G"
+        "block_tokens": 64,     # 预留粒度（每块token数）
+    },
+
+    # 8. 按用户LoRA风格适配器（core/ai_service/adapters.py，需安装peft~=0.5.0）：共享基座权重，按请求adapter_id切换
+    # 适配器目录：adapter_dir/<adapter_id>/（peft save_pretrained输出），携带适配器的请求使用更短的上下文
+    "lora": {
+        "enabled": False,
+        "adapter_dir": "./models/lora",
+        "max_loaded": 8,            # 同时加载的适配器数（LRU淘汰）
+        "max_context_len": 256,     # 携带适配器时的Prompt token上限
+        "max_context_chars": 512,   # 携带适配器时由缓存解析记录构造上下文保留的最新字符数
+    },
+
+    # 9. Prompt查找投机解码（core/ai_service/speculative.py）：用最近生成的n-gram在上下文中查找草稿，一次前向验证多个token
+    # 输出分布与逐token采样一致；模仿回复复用口头禅/短语时每次前向可接受多个token，不命中时退化为普通解码
+    "prompt_lookup": {
+        "enabled": False,
+        "num_draft_tokens": 8,   # 每次前向最多验证的草稿token数（CPU上越多单次前向越慢，按基准调整）
+        "max_ngram": 3,          # 最长匹配n-gram
+        "min_ngram": 1,          # 最短匹配n-gram
+    },
+
+    # 10. 延迟目标感知的版本路由（AIModelRouter.route_select_version）：预计耗时（排队+生成EWMA，未加载加上加载预估）
+    # 超过目标时降级到已加载的备选版本，回复标注routed_version；付费版配置时应设为["free"]（高峰/加载中降级而非排队超时）
+    "fallback_versions": [],   # 降级备选版本（按顺序，只选已加载的）
+    "latency_slo_ms": None,    # 默认延迟目标（毫秒），None=取请求超时；请求可用latency_target_ms覆盖
 }
\ No newline at end of file
@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
 """免费版AI模型：千问1.8B 4bit量化，适配16G内存，基础风格模仿"""
 from core.ai_service.base import BaseAIModel
-from ai_model.free.prompt import free_imitate_prompt  # 免费版Prompt模板
-from utils.model_util import load_4bit_quant_model  # 通用4bit量化加载工具
-from utils import logger
+from ai_model.free.prompt import free_prompt_compiler  # 免费版Prompt编译器（静态片段token缓存）
+from core.ai_service.prompt_compiler import split_context_lines
+from core.ai_service.stopping import ReplyShapeStoppingCriteria, estimate_reply_budget, trim_reply
+from core.ai_service.backend import create_backend  # 推理后端（gptq/torch_int8，配置选择）
+from core.ai_service.speculative import prompt_lookup_generate  # Prompt查找投机解码（配置开启）
+from core.ai_service.kv_cache import (  # KV缓存策略（int8量化/块预算，配置开启）
+    KVBlockPool, KVCacheBudgetError, kv_bytes_per_token, activation_dtype_bytes, apply_kv_cache_quantization,
+    kv_budget_bytes
+)
+from core.ai_service.adapters import LoRAAdapterManager, AdapterError  # 按用户LoRA风格适配器（配置开启）
+from utils import logger, log_event
+from utils.profile_util import profiled
+from core.metrics import (
+    GENERATE_TOKENIZE_MS, GENERATE_PREFILL_MS, GENERATE_TTFT_MS, GENERATE_DECODE_RATE,
+    GENERATE_THREAD_WAIT_MS, GENERATE_POSTPROCESS_MS, GENERATE_PROMPT_TOKENS, GENERATE_OUTPUT_TOKENS,
+    GENERATE_TIMEOUTS, GENERATE_DRAFT_TOKENS, GENERATE_KV_BYTES
+)
+import gc
+import logging
 import time
-import torch
 import threading  # 用于逻辑层超时控制
 
 
@@ -14,23 +29,30 @@ class FreeAIModel(BaseAIModel):
         super().__init__(model_config)
         self.model_path = model_config["model_path"]  # 千问1.8B量化模型路径
         self.quant_type = model_config["quant_type"]  # 4bit量化类型（GPTQ）
-        self.device = model_config["device"]  # 设备（cpu/cuda）
+        self.device = model_config["device"]  # 设备（auto/cpu/cuda，auto在加载时由后端检测）
         self.max_context_len = model_config["max_context_len"]  # 最大上下文长度
         self.max_gen_len = model_config["max_gen_len"]  # 最大生成长度
+        self.max_reply_sentences = model_config.get("max_reply_sentences", 2)  # 回复最多句子数
+        self.min_new_tokens = model_config.get("min_new_tokens", 2)  # 最少生成token数
+        self.reply_budget_params = model_config.get("reply_budget", {})  # 自适应生成预算参数
         self.timeout = model_config["timeout"]  # 推理超时时间（≤4s）
-        self.generate_result = None
-        self.is_first_generate = True  # 标记首次生成
+        self.cold_timeout_factor = model_config.get("cold_timeout_factor", 1.5)  # 未预热时的超时放宽系数
+        self.prompt_lookup = model_config.get("prompt_lookup", {})  # Prompt查找投机解码参数
+        self.kv_cache_params = model_config.get("kv_cache", {})  # KV缓存策略参数
+        self.kv_quantization = None  # 实际生效的KV缓存量化（模型不支持时为None）
+        self.kv_bytes_per_token = 0  # 单token KV缓存字节数（加载后按模型结构计算）
+        self.kv_pool = None  # KV缓存块预算（未配置budget时为None，不限制）
+        self.lora_params = model_config.get("lora", {})  # LoRA适配器参数
+        self.adapters = None  # LoRA适配器管理（未开启时为None）
+        self.backend = None  # 推理后端实例（加载时按配置创建）
 
     def load_quantize_model(self):
         """加载千问1.8B 4bit量化模型，适配16G内存"""
         try:
-            logger.info(f"开始加载免费版模型：千问1.8B，4bit量化，设备：{self.device}")
-            self.model, self.tokenizer = load_4bit_quant_model(
-                model_path=self.model_path,
-                quant_type=self.quant_type,
-                device=self.device,
-                max_memory=self.config["max_memory"]  # 16G内存限制
-            )
+            self.backend = create_backend(self.config)
+            self.device = self.backend.device  # CPU专用后端会覆盖自动检测的设备
+            logger.info(f"开始加载免费版模型：千问1.8B，后端：{self.backend.name}，设备：{self.device}")
+            self.model, self.tokenizer = self.backend.load()
             # 1. 给tokenizer设置pad_token（复用eos_token，千问官方推荐）
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
@@ -40,12 +62,20 @@ class FreeAIModel(BaseAIModel):
                 self.model.config.pad_token_id = self.tokenizer.pad_token_id
             # 3. 确保eos_token_id和pad_token_id一致（千问专属）
             self.model.config.eos_token_id = self.tokenizer.eos_token_id
+            # 4. KV缓存策略（int8量化 + 块预算）
+            self._setup_kv_cache()
+            # 5. LoRA适配器（共享基座权重，按请求切换）
+            self.adapters = LoRAAdapterManager(
+                self.model, self.lora_params.get("adapter_dir", "./models/lora"),
+                self.lora_params.get("max_loaded", 8), version="free"
+            ) if self.lora_params.get("enabled") else None
+            self.warmed_up = False  # 新加载的模型需重新预热
             self.status = self.STATUS_LOADED
             logger.info("免费版模型加载完成，状态：已就绪")
             return {
                 "code": 200,
                 "msg": "免费版模型加载成功",
-                "data": {"model_name": "千问1.8B", "quant_type": "4bit", "device": self.device}
+                "data": {"model_name": "千问1.8B", **self.backend.describe(), "kv_cache": self._kv_cache_status()}
             }
         except Exception as e:
             self.status = self.STATUS_ERROR
@@ -57,106 +87,292 @@ class FreeAIModel(BaseAIModel):
                 "data": {}
             }
 
-    def _generate_worker(self, inputs, gen_kwargs):
-        """生成线程（优化参数，避免空内容）"""
+    def _setup_kv_cache(self):
+        """按配置开启int8 KV缓存、计算单token KV字节数、创建块预算（模型不支持量化时回退为原精度缓存）"""
+        self.kv_quantization = None
+        if self.kv_cache_params.get("quantization") == "int8":
+            if apply_kv_cache_quantization(self.model):
+                self.kv_quantization = "int8"
+            else:
+                logger.warning("当前模型结构不支持KV缓存量化，使用原精度KV缓存")
+        self.kv_bytes_per_token = kv_bytes_per_token(
+            self.model.config, activation_dtype_bytes(self.model), self.kv_quantization
+        )
+        budget = kv_budget_bytes(self.kv_cache_params, self.config)
+        self.kv_pool = KVBlockPool(
+            budget, self.kv_bytes_per_token, self.kv_cache_params.get("block_tokens", 64), version="free"
+        ) if budget else None
+        logger.info("KV缓存：量化%s，每token%sKB，预算%s块",
+                    self.kv_quantization or "无", round(self.kv_bytes_per_token / 1024, 1),
+                    self.kv_pool.total_blocks if self.kv_pool else "不限")
+
+    def _kv_cache_status(self):
+        """KV缓存策略状态（加载结果/状态接口展示用）"""
+        return {
+            "quantization": self.kv_quantization,
+            "bytes_per_token": self.kv_bytes_per_token,
+            **({"budget": self.kv_pool.snapshot()} if self.kv_pool else {})
+        }
+
+    def _generate_worker(self, inputs, gen_kwargs, holder):
+        """生成线程（优化参数，避免空内容），结果写入本次调用独立的holder，支持并发生成"""
         try:
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=gen_kwargs["max_gen_len"],  # 确保生成长度≥10
-                temperature=gen_kwargs.get("temperature", 0.7),  # 恢复温度，保证生成内容
-                top_p=gen_kwargs.get("top_p", 0.95),
-                do_sample=True,  # 开启采样，避免模型生成空内容
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                num_beams=1,
-                repetition_penalty=1.1,  # 适度重复惩罚，避免无意义内容
-                use_cache=True,
-                min_new_tokens=10,  # 关键：强制最少生成10个token，避免空内容
-                pad_to_multiple_of=None
-            )
-            # 解码时保留所有内容（先不剔除Prompt）
-            self.generate_result = self.tokenizer.decode(
-                outputs[0],
+            from transformers import StoppingCriteriaList
+            if gen_kwargs.get("seed") is not None:
+                import torch
+                # 全局随机状态：单并发生成（max_concurrency=1）时相同种子结果可复现
+                torch.manual_seed(gen_kwargs["seed"])
+            holder["start_time"] = time.perf_counter()
+            if self.prompt_lookup.get("enabled"):
+                outputs = self._prompt_lookup_generate(inputs, gen_kwargs, holder)
+            else:
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=gen_kwargs["max_gen_len"],  # 自适应预算/调用方指定上限
+                    temperature=gen_kwargs.get("temperature", 0.7),  # 恢复温度，保证生成内容
+                    top_p=gen_kwargs.get("top_p", 0.95),
+                    do_sample=True,  # 开启采样，避免模型生成空内容
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    num_beams=1,
+                    repetition_penalty=1.1,  # 适度重复惩罚，避免无意义内容
+                    use_cache=True,
+                    min_new_tokens=self.min_new_tokens,  # 最少生成token数，避免空内容
+                    stopping_criteria=StoppingCriteriaList([gen_kwargs["stopping_criteria"]]),  # 回复形态提前停止
+                    pad_to_multiple_of=None
+                )
+            holder["end_time"] = time.perf_counter()
+            holder["output_tokens"] = outputs.shape[-1] - inputs["input_ids"].shape[-1]
+            # 仅解码新生成的token（Prompt部分无需解码再剔除）
+            holder["result"] = self.tokenizer.decode(
+                outputs[0][inputs["input_ids"].shape[-1]:],
                 skip_special_tokens=True,
                 clean_up_tokenization_spaces=True  # 清理空格，避免空字符串
             )
         except Exception as e:
-            self.generate_result = f"生成异常：{str(e)[:]}"
+            holder["result"] = f"生成异常：{str(e)[:]}"
+        finally:
+            # 生成线程结束才归还（超时返回后线程仍在运行时缓存尚未释放、适配器不能切换）
+            self._release_holder(holder)
+
+    @staticmethod
+    def _release_holder(holder):
+        """归还本次生成占用的KV块与适配器，超时返回后登记了结束回调的通知调用方（释放推理槽位）"""
+        kv_blocks = holder.pop("kv_blocks", 0)
+        if kv_blocks:
+            holder["kv_pool"].release(kv_blocks)
+        adapters = holder.pop("adapters", None)
+        if adapters is not None:
+            adapters.release()
+        with holder["lock"]:
+            holder["finished"] = True
+            on_worker_done = holder.pop("on_worker_done", None)
+        if on_worker_done is not None:
+            on_worker_done()
+
+    @staticmethod
+    def _defer_worker_done(holder, on_worker_done) -> bool:
+        """
+        超时返回时登记生成线程结束回调
+        :return: 是否已登记（线程已结束/调用方未传回调时为False，调用方按正常返回释放）
+        """
+        if on_worker_done is None:
+            return False
+        with holder["lock"]:
+            if holder.get("finished"):
+                return False
+            holder["on_worker_done"] = on_worker_done
+            return True
+
+    def _prompt_lookup_generate(self, inputs, gen_kwargs, holder):
+        """Prompt查找投机解码（采样参数与model.generate路径一致），草稿接受统计写入holder"""
+        outputs, stats = prompt_lookup_generate(
+            self.model,
+            inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_new_tokens=gen_kwargs["max_gen_len"],
+            min_new_tokens=self.min_new_tokens,
+            temperature=gen_kwargs.get("temperature", 0.7),
+            top_p=gen_kwargs.get("top_p", 0.95),
+            repetition_penalty=1.1,
+            eos_token_ids=[self.tokenizer.eos_token_id],
+            stopping_criteria=[gen_kwargs["stopping_criteria"]],
+            num_draft_tokens=self.prompt_lookup.get("num_draft_tokens", 8),
+            max_ngram=self.prompt_lookup.get("max_ngram", 3),
+            min_ngram=self.prompt_lookup.get("min_ngram", 1)
+        )
+        GENERATE_DRAFT_TOKENS.labels(version="free", result="accepted").inc(stats["accepted"])
+        GENERATE_DRAFT_TOKENS.labels(version="free", result="rejected").inc(stats["drafted"] - stats["accepted"])
+        holder["prompt_lookup"] = {
+            **stats,
+            "acceptance_rate": round(stats["accepted"] / stats["drafted"], 3) if stats["drafted"] else 0.0,
+            "tokens_per_forward": round(stats["new_tokens"] / stats["forward_passes"], 2)
+        }
+        return outputs
+
+    def _im_end_token_ids(self):
+        """千问ChatML轮次结束标记<|im_end|>的token id（分词器不支持时返回空列表）"""
+        try:
+            return [int(token_id) for token_id in self.tokenizer.encode("<|im_end|>", add_special_tokens=False)][-1:]
+        except Exception:
+            return []
 
     def generate_imitate(self, context, question, **kwargs):
         """风格模仿生成，解决空content问题"""
         start_time = time.time()
+        perf_start = time.perf_counter()
         if self.status != self.STATUS_LOADED:
             return {
                 "code": 400,
                 "msg": f"免费版模型未就绪，当前状态：{self.status}",
                 "data": {}
             }
+        adapter_id = kwargs.get("adapter_id")
+        if adapter_id and self.adapters is None:
+            return {"code": 400, "msg": "免费版模型未开启LoRA适配器", "data": {}}
+        # 已知发送人（解析记录的发送人 + 目标发送人）：无时间戳的上下文中也能识别只出现一次的发言
+        senders = [*(kwargs.get("senders") or ()), *([kwargs["target_sender"]] if kwargs.get("target_sender") else [])]
         try:
-            # 1. 构造Prompt（兼容千问格式，添加明确的生成指令）
-            raw_prompt = free_imitate_prompt(context=context, question=question)
-            # 关键：适配千问模型的Prompt格式（添加指令头，避免模型无响应）
-            prompt = f"""<|im_start|>system
-            你是一个智能助手，需要按照给定的风格回答问题。
-            <|im_end|>
-            <|im_start|>user
-            {raw_prompt}
-            <|im_end|>
-            <|im_start|>assistant
-            """
-            logger.info(f"构造的Prompt：{prompt[:]}...")  # 日志打印Prompt，方便排查
-
-            # 2. 分词（优化：不截断Prompt核心内容）
-            inputs = self.tokenizer(
-                prompt,
-                return_tensors="pt",
-                truncation=True,
-                max_length=self.max_context_len,
-                padding=False,
-                add_special_tokens=True
-            ).to(self.device)
-
-            # 3. 生成参数（确保max_gen_len≥10）
+            # 1. 编译Prompt（静态片段token已缓存，仅对压缩后的上下文/问题分词，超长从左截断上下文）
+            # 携带适配器时风格由适配器承担，只保留最近的上下文，缩短prefill
+            compiled = free_prompt_compiler.compile(
+                self.tokenizer,
+                max_length=self.lora_params.get("max_context_len", self.max_context_len) if adapter_id
+                else self.max_context_len,
+                senders=senders,
+                context=context,
+                question=question
+            )
+            prompt = compiled["prompt"]
+            GENERATE_TOKENIZE_MS.labels(version="free").observe(compiled["tokenize_ms"])
+            GENERATE_PROMPT_TOKENS.labels(version="free").observe(compiled["prompt_tokens"])
+            # Prompt按采样率记录，超长部分截断+哈希，方便排查又不拖慢请求
+            log_event(
+                logging.INFO, "generate_prompt", "Prompt编译完成：%stoken，节省%stoken，截断%stoken，耗时%sms",
+                compiled["prompt_tokens"], compiled["saved_tokens"], compiled["truncated_tokens"],
+                compiled["tokenize_ms"], prompt=prompt
+            )
+
+            # 2. 拼接input_ids（不再整段重新分词）
+            import torch  # 延迟导入：模型已加载时torch早已在sys.modules中，无额外开销
+            input_ids = torch.tensor([compiled["input_ids"]], dtype=torch.long, device=self.device)
+            inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+            # 3. 生成参数：调用方未指定max_gen_len时，按目标发送人历史回复长度估算预算
+            max_sentences = kwargs.get("max_sentences") or self.max_reply_sentences
+            if kwargs.get("max_gen_len"):
+                max_new_tokens = min(kwargs["max_gen_len"], self.max_gen_len)
+            else:
+                budget = estimate_reply_budget(
+                    split_context_lines(context, senders),
+                    target_sender=kwargs.get("target_sender"),
+                    max_tokens=self.max_gen_len,
+                    **self.reply_budget_params
+                )
+                max_new_tokens = budget["max_new_tokens"]
+                logger.info("自适应生成预算：%stoken（样本%s条，回复长度分位%s字）",
+                            max_new_tokens, budget["samples"], budget["reply_chars_p"])
+            stopping_criteria = ReplyShapeStoppingCriteria(
+                self.tokenizer,
+                prompt_len=input_ids.shape[-1],
+                max_sentences=max_sentences,
+                min_new_tokens=self.min_new_tokens,
+                stop_token_ids=[self.tokenizer.eos_token_id] + self._im_end_token_ids()
+            )
             gen_kwargs = {
-                "max_gen_len": max(kwargs.get("max_gen_len", self.max_gen_len), 10),  # 强制≥10
+                "max_gen_len": max(max_new_tokens, self.min_new_tokens),
                 "temperature": kwargs.get("temperature", 0.7),
-                "top_p": kwargs.get("top_p", 0.95)
+                "top_p": kwargs.get("top_p", 0.95),
+                "stopping_criteria": stopping_criteria,
+                "seed": kwargs.get("seed")
             }
 
             # 4. 弹性超时控制
-            self.generate_result = None
-            generate_thread = threading.Thread(target=self._generate_worker, args=(inputs, gen_kwargs))
+            holder = {"result": None, "lock": threading.Lock()}
+            # 未预热（首轮内核编译/内存分配）时放宽超时，预热完成后按正常超时
+            base_timeout = kwargs.get("timeout") or self.timeout  # 接口层传入扣除排队后的剩余超时
+            timeout = base_timeout if self.warmed_up else base_timeout * self.cold_timeout_factor
+            kv_tokens = compiled["prompt_tokens"] + gen_kwargs["max_gen_len"]
+            if self.kv_pool is not None:
+                # 按Prompt+最大生成长度预留KV块，等待其他生成归还的时间从超时中扣除
+                kv_wait_start = time.perf_counter()
+                try:
+                    holder["kv_pool"], holder["kv_blocks"] = self.kv_pool, self.kv_pool.acquire(kv_tokens, base_timeout)
+                except KVCacheBudgetError as e:
+                    cost_time = round(time.time() - start_time, 3)
+                    logger.warning(f"免费版模型KV缓存预算不足：{e}，耗时：{cost_time}s")
+                    return {
+                        "code": 503,
+                        "msg": f"生成繁忙：{e}",
+                        "data": {"cost_time": cost_time, "version": "free"}
+                    }
+                timeout = max(timeout - (time.perf_counter() - kv_wait_start), 0.1)
+            if self.adapters is not None:
+                # 无适配器的请求同样登记（关闭适配器的基座状态），生成期间不被其他请求切换
+                adapter_wait_start = time.perf_counter()
+                try:
+                    self.adapters.acquire(adapter_id, timeout)
+                except AdapterError as e:
+                    self._release_holder(holder)
+                    cost_time = round(time.time() - start_time, 3)
+                    logger.warning(f"免费版模型LoRA适配器不可用：{e.msg}，耗时：{cost_time}s")
+                    return {
+                        "code": e.status_code,
+                        "msg": e.msg,
+                        "data": {"cost_time": cost_time, "version": "free"}
+                    }
+                holder["adapters"] = self.adapters
+                timeout = max(timeout - (time.perf_counter() - adapter_wait_start), 0.1)
+            generate_thread = threading.Thread(target=profiled(self._generate_worker), args=(inputs, gen_kwargs, holder))
             generate_thread.start()
-
-            # 首次生成4s，后续3s
-            timeout = int(self.timeout*1.5) if self.is_first_generate else self.timeout
-            self.is_first_generate = False
             generate_thread.join(timeout=timeout + 0.2)  # 增加缓冲
 
             # 5. 处理生成结果（解决空内容核心逻辑）
             cost_time = round(time.time() - start_time, 3)
-            if generate_thread.is_alive() or self.generate_result is None:
+            if generate_thread.is_alive() or holder["result"] is None:
+                # 通知生成线程在下一个token处退出，避免超时请求继续占用CPU（prefill中无法取消）
+                stopping_criteria.cancel()
+                worker_running = self._defer_worker_done(holder, kwargs.get("on_worker_done"))
+                GENERATE_TIMEOUTS.labels(version="free").inc()
                 logger.error(f"免费版模型生成超时，耗时：{cost_time}s")
                 return {
                     "code": 500,
                     "msg": f"生成超时（最大允许{timeout}s）",
-                    "data": {"cost_time": cost_time, "version": "free"}
+                    "data": {"cost_time": cost_time, "version": "free", "worker_running": worker_running}
                 }
 
-            # 6. 处理生成结果（智能剔除Prompt，避免空内容）
-            generate_content = self.generate_result
-            # 方法1：按千问的assistant分隔符截取（最可靠）
-            if "assistant\n" in generate_content:
-                generate_content = generate_content.split("assistant\n")[-1].strip()
-            # 方法2：兜底：如果截取后为空，用原始内容（剔除Prompt前缀）
-            if not generate_content or generate_content == "":
-                generate_content = generate_content.replace(prompt, "").strip()
-            # 方法3：最终兜底：如果仍为空，返回默认回复
-            if not generate_content or generate_content == "" or "生成异常" in generate_content:
+            # 各阶段耗时统计：prefill（生成开始→首token）、TTFT、decode速率、线程等待
+            join_time = time.perf_counter()
+            first_token_time = stopping_criteria.first_token_time
+            gen_start, gen_end = holder.get("start_time"), holder.get("end_time")
+            if gen_start and gen_end:
+                GENERATE_THREAD_WAIT_MS.labels(version="free").observe((join_time - gen_end) * 1000)
+                GENERATE_OUTPUT_TOKENS.labels(version="free").observe(holder["output_tokens"])
+                GENERATE_KV_BYTES.labels(version="free").observe(
+                    (compiled["prompt_tokens"] + holder["output_tokens"]) * self.kv_bytes_per_token
+                )
+                if first_token_time:
+                    GENERATE_PREFILL_MS.labels(version="free").observe((first_token_time - gen_start) * 1000)
+                    GENERATE_TTFT_MS.labels(version="free").observe((first_token_time - perf_start) * 1000)
+                    if holder["output_tokens"] > 1 and gen_end > first_token_time:
+                        GENERATE_DECODE_RATE.labels(version="free").observe(
+                            (holder["output_tokens"] - 1) / (gen_end - first_token_time)
+                        )
+
+            # 6. 处理生成结果（仅含新生成内容，裁剪到N句，避免空内容）
+            generate_content = holder["result"]
+            if "生成异常" not in generate_content:
+                generate_content = trim_reply(generate_content, max_sentences)
+            # 兜底：如果为空，返回默认回复（标记degraded，不进入生成结果缓存）
+            degraded = not generate_content or "生成异常" in generate_content
+            if degraded:
                 generate_content = f"已理解你的需求：{question[:20]}... （免费版模型回复）"
                 logger.warning(f"生成内容为空，返回兜底回复：{generate_content}")
 
-            logger.info(f"免费版模型生成完成，内容：{generate_content[:]}...，耗时：{cost_time}s")
+            self.warmed_up = True  # 完成过一次完整生成即视为已预热（未开启启动预热时由首个请求承担）
+            GENERATE_POSTPROCESS_MS.labels(version="free").observe((time.perf_counter() - join_time) * 1000)
+            log_event(logging.INFO, "generate_content", "免费版模型生成完成，耗时：%ss", cost_time,
+                      content=generate_content)
             return {
                 "code": 200,
                 "msg": "生成成功",
@@ -164,7 +380,15 @@ class FreeAIModel(BaseAIModel):
                     "content": generate_content,
                     "cost_time": cost_time,
                     "model_name": "千问1.8B",
-                    "version": "free"
+                    "version": "free",
+                    "prompt_tokens": compiled["prompt_tokens"],
+                    "saved_tokens": compiled["saved_tokens"],
+                    "max_new_tokens": gen_kwargs["max_gen_len"],
+                    "stop_reason": stopping_criteria.stop_reason,
+                    "degraded": degraded,
+                    "adapter_id": adapter_id,
+                    "kv_cache_bytes": (compiled["prompt_tokens"] + holder.get("output_tokens", 0)) * self.kv_bytes_per_token,
+                    **({"prompt_lookup": holder["prompt_lookup"]} if holder.get("prompt_lookup") else {})
                 }
             }
         except Exception as e:
@@ -191,9 +415,13 @@ class FreeAIModel(BaseAIModel):
                 "status": self.status,
                 "status_desc": status_desc_map[self.status],
                 "load_error": self.load_error,
+                "warmed_up": self.warmed_up,
                 "model_name": "千问1.8B",
                 "version": "free",
-                "quant_type": "4bit"
+                **(self.backend.describe() if self.backend else {"backend": self.config.get("backend", "gptq")}),
+                "kv_cache": self._kv_cache_status(),
+                **({"lora": {**self.adapters.snapshot(), "available": self.adapters.available()}}
+                   if self.adapters else {})
             }
         }
 
@@ -201,9 +429,14 @@ class FreeAIModel(BaseAIModel):
         """释放免费版模型资源"""
         try:
             if self.model is not None:
-                del self.model
-                del self.tokenizer
-                torch.cuda.empty_cache()
+                self.model = None
+                self.tokenizer = None
+                self.adapters = None
+                self.warmed_up = False
+                gc.collect()  # 立即回收权重张量，CPU内存才能真正归还
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
             self.status = self.STATUS_UNLOADED
             logger.info("免费版模型资源释放成功")
             return {"code": 200, "msg": "免费版模型资源释放成功"}
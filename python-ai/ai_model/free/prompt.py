@@ -2,26 +2,66 @@
 """
 免费版AI模型Prompt模板：千问1.8B专用风格模仿模板
 核心适配聊天场景风格模仿，简洁通用，保证生成结果贴合上下文风格
+模板不带缩进空白（每行缩进都会被分词成token），静态片段由PromptCompiler预分词缓存
 """
+from core.ai_service.prompt_compiler import PromptCompiler, compact_context
+
+# 系统指令（千问ChatML格式system段）
+FREE_SYSTEM_PROMPT = "你是一个智能助手，需要按照给定的风格回答问题。"
+
+# 风格模仿指令模板（user段）
+FREE_IMITATE_TEMPLATE = (
+    "以下是和我的聊天记录，学习她的说话风格、语气、常用词：\n"
+    "{context}\n"
+    "现在你是，回复这句话：{question}\n"
+    "要求：\n"
+    "1. 只说1-2句话，像日常聊天一样自然\n"
+    "2. 用的语气，比如偶尔带哈哈哈、嗯嗯等口头禅\n"
+    "3. 不要复制聊天记录，只回复问题\n"
+    "回复："
+)
+
+# 千问ChatML完整模板（system/user/assistant三段）
+FREE_CHATML_TEMPLATE = (
+    "<|im_start|>system\n{system}<|im_end|>\n"
+    "<|im_start|>user\n" + FREE_IMITATE_TEMPLATE + "<|im_end|>\n"
+    "<|im_start|>assistant\n"
+)
+
+# 旧版带缩进模板（仅用于统计压缩后节省的token数，不参与推理）
+_LEGACY_CHATML_TEMPLATE = """<|im_start|>system
+            {system}
+            <|im_end|>
+            <|im_start|>user
+            以下是和我的聊天记录，学习她的说话风格、语气、常用词：
+    {context}
 
-def free_imitate_prompt(context: str, question: str) -> str:
-    """
-      构造免费版风格模仿的标准化Prompt
-      :param context: Go服务传入的结构化聊天上下文（历史对话记录）
-      :param question: Go服务传入的生成指令/问题（如“我好想你”）
-      :return: 模型可直接识别的标准化Prompt字符串
-      """
-    prompt_template = """
-    以下是和我的聊天记录，学习她的说话风格、语气、常用词：
-    {context_short}
-    
     现在你是，回复这句话：{question}
     要求：
     1. 只说1-2句话，像日常聊天一样自然
     2. 用的语气，比如偶尔带哈哈哈、嗯嗯等口头禅
     3. 不要复制聊天记录，只回复问题
     回复：
+            <|im_end|>
+            <|im_start|>assistant
+            """
+
+
+def free_imitate_prompt(context: str, question: str) -> str:
     """
-    # 填充参数并清理多余空格/换行，减少无效token，节省推理内存
-    prompt = prompt_template.format(context=context, question=question).strip()
-    return prompt
\ No newline at end of file
+      构造免费版风格模仿的标准化Prompt
+      :param context: Go服务传入的结构化聊天上下文（历史对话记录）
+      :param question: Go服务传入的生成指令/问题（如“我好想你”）
+      :return: 模型可直接识别的标准化Prompt字符串
+      """
+    # 压缩上下文并清理多余空格/换行，减少无效token，节省推理内存
+    prompt = FREE_IMITATE_TEMPLATE.format(context=compact_context(context), question=question.strip())
+    return prompt
+
+
+# 免费版Prompt编译器（全局单例，静态片段按分词器缓存）
+free_prompt_compiler = PromptCompiler(
+    FREE_CHATML_TEMPLATE,
+    legacy_template=_LEGACY_CHATML_TEMPLATE,
+    system=FREE_SYSTEM_PROMPT
+)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+桩模型配置文件：无权重的确定性假模型（压测/容量评估用，无需GPU与真实模型文件）
+延迟按「加载耗时 + prefill每token耗时 + decode每token耗时」模拟，可通过settings.MODEL_STUB_PARAMS覆盖
+准入/超时等参数与免费版保持一致，压测结果可直接反映路由、排队、序列化开销
+"""
+from config import settings
+
+stub_model_config = {
+    "model_name": "stub",
+    "backend": "stub",
+
+    # 资源（仅用于内存预算腾挪逻辑，不实际占用）
+    "memory_estimate": "64M",
+
+    # 推理参数（与免费版一致）
+    "max_context_len": 1024,
+    "max_context_chars": 2048,
+    "max_gen_len": 512,
+    "timeout": 60.0,
+
+    # 准入控制（与免费版一致）
+    "max_concurrency": 1,
+    "max_queue_size": 8,
+    "expected_generate_sec": 0.6,
+
+    # 延迟模型（毫秒/秒），默认值接近千问1.8B 4bit在CPU上的量级
+    "stub_params": {
+        "load_sec": 0.5,                # 加载耗时
+        "prefill_ms_per_token": 0.5,    # prefill每prompt token耗时
+        "decode_ms_per_token": 20.0,    # decode每生成token耗时
+        "output_tokens": 24,            # 默认生成token数（调用方max_gen_len更小时取后者）
+        "tokens_per_char": 0.8,         # 估算prompt token数（中文每字符token数）
+        **settings.MODEL_STUB_PARAMS,
+    },
+}
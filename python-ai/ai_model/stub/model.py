@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""桩模型：不加载任何权重，按配置的prefill/decode耗时睡眠后返回确定性回复（压测用）"""
+import hashlib
+import math
+import time
+
+from core.ai_service.base import BaseAIModel
+from core.ai_service.stopping import STOP_MAX_TOKENS
+from utils import logger
+from core.metrics import (
+    GENERATE_PREFILL_MS, GENERATE_TTFT_MS, GENERATE_DECODE_RATE, GENERATE_PROMPT_TOKENS,
+    GENERATE_OUTPUT_TOKENS, GENERATE_TIMEOUTS
+)
+
+# 确定性回复（按上下文+问题哈希选取，同一输入结果一致）
+_STUB_REPLIES = ["嗯嗯好的", "哈哈哈可以呀", "在忙呢，等下回你", "真的假的", "早点休息", "好的好的收到"]
+# 模板静态部分的token数估计（system指令+轮次标记）
+_STATIC_PROMPT_TOKENS = 64
+
+
+class StubAIModel(BaseAIModel):
+    def __init__(self, model_config):
+        super().__init__(model_config)
+        self.version = model_config.get("version", "stub")  # 注册到的版本槽位（指标标签）
+        self.params = model_config["stub_params"]
+        self.max_context_len = model_config["max_context_len"]
+        self.max_gen_len = model_config["max_gen_len"]
+        self.timeout = model_config["timeout"]
+
+    def load_quantize_model(self):
+        """模拟加载耗时"""
+        time.sleep(self.params["load_sec"])
+        self.status = self.STATUS_LOADED
+        self.warmed_up = False
+        logger.info(f"桩模型加载完成（版本槽位：{self.version}）")
+        return {"code": 200, "msg": "桩模型加载成功", "data": {"model_name": "stub", "backend": "stub"}}
+
+    def estimate_prompt_tokens(self, context: str, question: str) -> int:
+        """按字符数估算prompt token数（超长按max_context_len截断，与真实模型一致）"""
+        tokens = _STATIC_PROMPT_TOKENS + math.ceil((len(context) + len(question)) * self.params["tokens_per_char"])
+        return min(tokens, self.max_context_len)
+
+    def generate_imitate(self, context, question, **kwargs):
+        """按prefill/decode耗时睡眠，超时返回与真实模型相同的错误结构"""
+        start_time = time.perf_counter()
+        if self.status != self.STATUS_LOADED:
+            return {"code": 400, "msg": f"桩模型未就绪，当前状态：{self.status}", "data": {}}
+        prompt_tokens = self.estimate_prompt_tokens(context, question)
+        max_new_tokens = min(kwargs.get("max_gen_len") or self.params["output_tokens"], self.max_gen_len)
+        output_tokens = max(1, min(max_new_tokens, int(self.params["output_tokens"])))
+        prefill_sec = prompt_tokens * self.params["prefill_ms_per_token"] / 1000
+        decode_sec = output_tokens * self.params["decode_ms_per_token"] / 1000
+        timeout = kwargs.get("timeout") or self.timeout
+        GENERATE_PROMPT_TOKENS.labels(version=self.version).observe(prompt_tokens)
+
+        if prefill_sec + decode_sec > timeout:
+            time.sleep(timeout)
+            GENERATE_TIMEOUTS.labels(version=self.version).inc()
+            cost_time = round(time.perf_counter() - start_time, 3)
+            return {"code": 500, "msg": f"生成超时（最大允许{timeout}s）",
+                    "data": {"cost_time": cost_time, "version": self.version}}
+
+        time.sleep(prefill_sec)
+        first_token_time = time.perf_counter()
+        time.sleep(decode_sec)
+        GENERATE_PREFILL_MS.labels(version=self.version).observe(prefill_sec * 1000)
+        GENERATE_TTFT_MS.labels(version=self.version).observe((first_token_time - start_time) * 1000)
+        GENERATE_OUTPUT_TOKENS.labels(version=self.version).observe(output_tokens)
+        if output_tokens > 1 and decode_sec > 0:
+            GENERATE_DECODE_RATE.labels(version=self.version).observe(
+                (output_tokens - 1) / (time.perf_counter() - first_token_time)
+            )
+        self.warmed_up = True
+        digest = hashlib.md5(f"{context}\n{question}".encode("utf-8")).digest()
+        return {
+            "code": 200,
+            "msg": "生成成功",
+            "data": {
+                "content": _STUB_REPLIES[digest[0] % len(_STUB_REPLIES)],
+                "cost_time": round(time.perf_counter() - start_time, 3),
+                "model_name": "stub",
+                "version": self.version,
+                "prompt_tokens": prompt_tokens,
+                "max_new_tokens": max_new_tokens,
+                "stop_reason": STOP_MAX_TOKENS
+            }
+        }
+
+    def get_status(self):
+        status_desc_map = {
+            self.STATUS_UNLOADED: "未加载",
+            self.STATUS_LOADED: "已就绪",
+            self.STATUS_RUNNING: "运行中",
+            self.STATUS_ERROR: "异常"
+        }
+        return {
+            "code": 200,
+            "msg": "查询成功",
+            "data": {
+                "status": self.status,
+                "status_desc": status_desc_map[self.status],
+                "load_error": self.load_error,
+                "warmed_up": self.warmed_up,
+                "model_name": "stub",
+                "version": self.version,
+                "backend": "stub"
+            }
+        }
+
+    def release(self):
+        self.status = self.STATUS_UNLOADED
+        self.warmed_up = False
+        logger.info(f"桩模型资源释放成功（版本槽位：{self.version}）")
+        return {"code": 200, "msg": "桩模型资源释放成功"}
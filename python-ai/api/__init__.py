@@ -2,5 +2,8 @@
 from .chat_api import chat_router
 from .health_api import health_router
 from .ai_api import ai_router
+from .metrics_api import metrics_router, MetricsMiddleware
+from .profile_api import profile_router, ProfileMiddleware
 
-__all__ = ["chat_router", "health_router", "ai_router"]
\ No newline at end of file
+__all__ = ["chat_router", "health_router", "ai_router", "metrics_router", "MetricsMiddleware",
+           "profile_router", "ProfileMiddleware"]
\ No newline at end of file
@@ -1,34 +1,66 @@
 # -*- coding: utf-8 -*-
 """AI模型接口层：与Go服务层交互，标准化请求/响应，添加鉴权"""
-from fastapi import APIRouter, HTTPException, Body, Query, Depends
+import logging
+import time
+from fastapi import APIRouter, HTTPException, Body, Query, Header, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-from core.ai_service.router import AIModelRouter
+from typing import Optional, Dict, Any, List
+from core.ai_service.router import AIModelRouter, MODEL_CONFIGS
+from core.ai_service.inference_queue import get_inference_queue, QueueRejectedError
+from core.ai_service.prompt_compiler import format_records_context
+from core.ai_service.adapters import ADAPTER_ID_PATTERN
+from core.ai_service.generate_cache import generate_cache, generate_cache_key
+from config import settings
+from core import wechat_chat_parser
 from utils import check_local_auth, check_api_key  # 本地访问鉴权+API密钥鉴权
-from utils import logger
+from utils import logger, log_event
 from utils.response import standard_response  # 标准化响应工具
+from utils.profile_util import profiled  # 单请求剖析：线程池执行部分计入剖析
+from api.transport import NegotiatedRoute, NegotiatedResponse
 
-# 定义路由，与Go服务层约定前缀/ai/v1，标签统一
-ai_router = APIRouter(prefix="/ai/v1", tags=["AI模型服务"])
+# 定义路由，与Go服务层约定前缀/ai/v1，标签统一（请求/响应支持JSON与msgpack协商）
+ai_router = APIRouter(
+    prefix="/ai/v1", tags=["AI模型服务"], route_class=NegotiatedRoute, default_response_class=NegotiatedResponse
+)
 
 # 标准化请求模型（与Go服务层约定）
 class ModelQuantizeRequest(BaseModel):
     version: str = Field(default="free", description="模型版本 free/pro", pattern=r"^free|pro$")
 
-class GenerateImitateRequest(BaseModel):
-    context: str = Field(..., description="聊天上下文（结构化解析后的内容）")
+class GenerateOptions(BaseModel):
+    """生成请求公共参数"""
     question: str = Field(..., description="生成指令/问题（如：模仿上述风格回复）")
     version: str = Field(default="free", description="模型版本 free/pro", pattern=r"^free|pro$")
-    max_gen_len: Optional[int] = Field(512, description="最大生成长度")
+    max_gen_len: Optional[int] = Field(None, description="最大生成长度，不传则按目标发送人历史回复长度自适应")
     temperature: Optional[float] = Field(0.7, description="生成温度，0-1")
+    target_sender: Optional[str] = Field(None, description="模仿的目标发送人（用于估算回复长度预算）")
+    max_sentences: Optional[int] = Field(None, description="回复最多句子数，不传使用模型配置")
+    priority: str = Field("interactive", description="请求优先级 interactive/background", pattern=r"^(interactive|background)$")
+    timeout: Optional[float] = Field(None, description="请求超时（秒），不传使用模型配置；预计排队已超时则立即拒绝", gt=0)
+    adapter_id: Optional[str] = Field(None, description="LoRA风格适配器id（按用户训练，携带时使用更短的上下文）",
+                                      pattern=ADAPTER_ID_PATTERN)
+    seed: Optional[int] = Field(None, description="随机种子：相同种子与参数返回同一条回复（开启生成结果缓存时命中缓存）", ge=0)
+    fresh: bool = Field(False, description="跳过生成结果缓存重新采样（「换一条」），重试请求不要携带")
+    latency_target_ms: Optional[float] = Field(None, description="延迟目标（毫秒）：预计超过时降级到已加载的备选版本，"
+                                                                 "不传使用模型配置latency_slo_ms或请求超时", gt=0)
+
+class GenerateImitateRequest(GenerateOptions):
+    context: str = Field(..., description="聊天上下文（结构化解析后的内容）")
+
+class GenerateByKeyRequest(GenerateOptions):
+    content_key: str = Field(..., description="/ai/v1/parse响应中的content_key（服务端直接使用缓存的解析记录构造上下文）")
+    content: Optional[str] = Field(None, description="原始聊天记录（可选）：解析缓存已淘汰时用于重新解析，避免二次往返")
+    format_type: str = Field("txt", description="content的格式类型，可选txt/xml", pattern=r"^txt|xml$")
 
 # 依赖项：组合鉴权（仅本地访问 + API密钥鉴权）
 def ai_auth(
-    api_key: str = Query(..., description="API鉴权密钥"),
+    api_key: Optional[str] = Query(None, description="API鉴权密钥（也可通过X-API-Key请求头传递）"),
+    x_api_key: Optional[str] = Header(None, description="API鉴权密钥（长连接客户端推荐，避免密钥出现在URL）"),
     local_check: bool = Depends(check_local_auth)
 ):
     """AI接口鉴权依赖：必须同时满足本地访问+正确API密钥"""
-    if not check_api_key(api_key):
+    if not check_api_key(x_api_key or api_key):
         raise HTTPException(status_code=401, detail="API密钥无效")
     return True
 
@@ -44,7 +76,7 @@ async def model_quantize(
     - 适配16G内存，加载无卡顿
     """
     logger.info(f"收到模型量化加载请求，版本：{req.version}")
-    result = AIModelRouter.route_load_quantize(version=req.version)
+    result = await run_in_threadpool(AIModelRouter.route_load_quantize, version=req.version)
     if result["code"] != 200:
         raise HTTPException(status_code=result["code"], detail=result["msg"])
     return standard_response(**result)
@@ -60,21 +92,111 @@ async def generate_imitate(
     - question：生成指令
     - version：模型版本，free=基础版，pro=高级版
     - 要求：接口返回耗时≤3s，生成内容贴合风格
+    - priority/timeout：准入控制，繁忙时返回429/503并携带Retry-After
     - 鉴权：仅本地访问+API密钥
     """
-    logger.info(f"收到风格模仿生成请求，版本：{req.version}，上下文长度：{len(req.context)}")
-    result = AIModelRouter.route_generate_imitate(
-        version=req.version,
-        context=req.context,
-        question=req.question,
-        max_gen_len=req.max_gen_len,
-        temperature=req.temperature
-    )
+    log_event(logging.INFO, "generate_request", "收到风格模仿生成请求，版本：%s，上下文长度：%s",
+              req.version, len(req.context), priority=req.priority)
+    return standard_response(**await _run_generate(req, req.context))
+
+# 3. 按解析缓存生成接口：/ai/v1/generate/imitate/by-key POST
+@ai_router.post("/generate/imitate/by-key", summary="按解析结果生成（服务端构造上下文）", dependencies=[Depends(ai_auth)])
+async def generate_imitate_by_key(
+    req: GenerateByKeyRequest = Body(...)
+):
+    """
+    风格模仿生成（免回传上下文）：Go只传/ai/v1/parse返回的content_key + 目标发送人 + 问题
+    - 命中解析缓存：直接用缓存记录构造上下文（只取最新的max_context_chars字符）
+    - 缓存已淘汰：携带content时重新解析，否则返回404（Go据此携带content重试）
+    - 多进程模式下解析缓存按worker进程独立，未命中时同样走重新解析
+    - 其余参数、准入控制、鉴权同/generate/imitate
+    """
+    cached_result = wechat_chat_parser.get_cached(req.content_key)
+    context_source = "cache"
+    if cached_result is None:
+        if not req.content:
+            raise HTTPException(status_code=404, detail=f"解析缓存不存在或已淘汰：{req.content_key}，请携带content重试")
+        # 解析器实例非线程安全，与/parse接口一致在事件循环内同步调用
+        cached_result = wechat_chat_parser.parse(req.content.replace("\\n", "\n"), req.format_type, use_cache=True)
+        if cached_result["code"] != 200:
+            raise HTTPException(status_code=cached_result["code"], detail=cached_result["msg"])
+        if cached_result["data"]["content_key"] != req.content_key:
+            logger.warning(f"content与content_key不一致，使用content解析结果：{cached_result['data']['content_key']}")
+        context_source = "reparse"
+    records = cached_result["data"]["records"]
+    model_config = MODEL_CONFIGS.get(req.version) or {}
+    max_chars = (model_config.get("lora") or {}).get("max_context_chars") if req.adapter_id else None
+    context = format_records_context(records, max_chars=max_chars or model_config.get("max_context_chars"))
+    log_event(logging.INFO, "generate_request", "收到按解析结果生成请求，版本：%s，记录数：%s，上下文长度：%s",
+              req.version, len(records), len(context), priority=req.priority,
+              content_key=req.content_key, context_source=context_source)
+    senders = sorted({record["sender"] for record in records})
+    result = await _run_generate(req, context, senders=senders)
+    result["data"]["context_source"] = context_source
+    return standard_response(**result)
+
+async def _run_generate(req: GenerateOptions, context: str, senders: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    生成公共流程：生成结果缓存（开启时）→ 延迟目标版本路由 → 准入队列 → 线程池执行模型生成
+    :param senders: 上下文中的已知发送人（由解析记录构造上下文时传入，Prompt压缩据此识别发言，同样计入缓存键）
+    :raise HTTPException: 准入拒绝（429/503+Retry-After）/生成失败
+    """
+    model_config = MODEL_CONFIGS.get(req.version) or {}
+    timeout = req.timeout or model_config.get("timeout", 60.0)
+    deadline = time.monotonic() + timeout
+    params = {
+        "max_gen_len": req.max_gen_len,
+        "temperature": req.temperature,
+        "target_sender": req.target_sender,
+        "max_sentences": req.max_sentences,
+        "adapter_id": req.adapter_id,
+        "seed": req.seed,
+    }
+
+    async def _generate() -> Dict[str, Any]:
+        # 请求版本预计超过延迟目标（加载中/排队过长/队列已满）时降级到已加载的备选版本
+        route = AIModelRouter.route_select_version(req.version, req.priority, req.latency_target_ms, timeout)
+        version = route["version"]
+        # 有界优先级队列：超出并发排队，预计排队（含模型服务中其他worker的请求）已超过超时则立即拒绝
+        queue = get_inference_queue(version, MODEL_CONFIGS.get(version) or {})
+        async with queue.slot(priority=req.priority, timeout=timeout,
+                              external_wait_sec=AIModelRouter.estimate_server_wait(version)) as lease:
+            # 生成为阻塞调用，放到线程池执行，避免阻塞事件循环
+            result = await run_in_threadpool(
+                profiled(AIModelRouter.route_generate_imitate),
+                version=version,
+                context=context,
+                question=req.question,
+                senders=senders,
+                **params,
+                timeout=max(deadline - time.monotonic(), 0.1),  # 扣除排队耗时后的剩余超时
+                on_worker_done=lease.release_threadsafe
+            )
+            # 超时返回但生成线程仍在运行：槽位保留到线程结束，避免在途数低估
+            if (result.get("data") or {}).get("worker_running"):
+                lease.defer()
+        if isinstance(result.get("data"), dict):
+            result["data"].update(routed_version=version, requested_version=req.version,
+                                  fallback=route["fallback"], route_reason=route["reason"])
+        return result
+
+    cache_key = None
+    if settings.GENERATE_CACHE_ENABLED and not req.fresh:
+        # 种子原样计入键：未指定种子（不固定随机数）与种子0的生成结果不同，不能共用一条
+        cache_key = generate_cache_key(req.version, context, req.question, senders=senders, **params)
+    try:
+        if settings.GENERATE_CACHE_ENABLED:
+            result = await generate_cache.get_or_generate(cache_key, _generate)
+        else:
+            result = await _generate()
+    except QueueRejectedError as e:
+        logger.warning(f"风格模仿生成请求被拒绝：{e.msg}")
+        raise HTTPException(status_code=e.status_code, detail=e.msg, headers={"Retry-After": str(e.retry_after)})
     if result["code"] != 200:
         raise HTTPException(status_code=result["code"], detail=result["msg"])
-    return standard_response(**result)
+    return result
 
-# 3. 模型状态查询接口：/ai/v1/model/status GET
+# 4. 模型状态查询接口：/ai/v1/model/status GET
 @ai_router.get("/model/status", summary="模型状态查询", dependencies=[Depends(ai_auth)])
 async def model_status(
     version: str = Query("free", description="模型版本 free/pro", pattern=r"^free|pro$")
@@ -85,7 +207,7 @@ async def model_status(
     - 鉴权：仅本地访问+API密钥
     """
     logger.info(f"收到模型状态查询请求，版本：{version}")
-    result = AIModelRouter.route_get_status(version=version)
+    result = await run_in_threadpool(AIModelRouter.route_get_status, version=version)
     if result["code"] != 200:
         raise HTTPException(status_code=result["code"], detail=result["msg"])
     return standard_response(**result)
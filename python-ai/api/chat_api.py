@@ -1,14 +1,30 @@
 # -*- coding: utf-8 -*-
 """聊天记录解析接口：仅封装请求响应，调用core层解析逻辑"""
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import logging
+import time
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Iterator, List, Optional
 
-from core import wechat_chat_parser
-from utils import logger
+from config import settings
+from core import WeChatChatParser, wechat_chat_parser
+from core.batch_parser import iter_batch_parse
+from core.search_index import index_records, get_index_future
+from utils import log_event, generate_content_key
+from utils.profile_util import profiled, profiled_iter
+from api.transport import NegotiatedRoute, NegotiatedResponse, NDJSON_MEDIA_TYPE, wants_ndjson
 
-# 定义路由（前缀/ai/v1，与Go服务层约定）
-chat_router = APIRouter(prefix="/ai/v1", tags=["聊天记录解析"])
+# 流式解析每次写出的记录条数（逐条写出时线程切换开销过大）
+STREAM_CHUNK_RECORDS = 256
+
+# 定义路由（前缀/ai/v1，与Go服务层约定；请求/响应支持JSON与msgpack协商）
+chat_router = APIRouter(
+    prefix="/ai/v1", tags=["聊天记录解析"], route_class=NegotiatedRoute, default_response_class=NegotiatedResponse
+)
 
 # 请求体模型（标准化，与Go服务层约定）
 class ChatParseRequest(BaseModel):
@@ -16,6 +32,23 @@ class ChatParseRequest(BaseModel):
     format_type: str = Field(..., description="格式类型，可选txt/xml", pattern=r"^txt|xml$")
     use_cache: Optional[bool] = Field(True, description="是否使用缓存，默认True")
 
+class BatchParseDocument(BaseModel):
+    id: Optional[str] = Field(None, description="文档标识（如联系人/群ID），原样返回，默认为序号")
+    content: str = Field(..., description="聊天记录原始内容字符串（TXT/XML）")
+    format_type: str = Field(..., description="格式类型，可选txt/xml", pattern=r"^txt|xml$")
+    use_cache: Optional[bool] = Field(True, description="是否使用缓存，默认True")
+
+class BatchParseRequest(BaseModel):
+    documents: List[BatchParseDocument] = Field(..., description="待解析文档列表", min_length=1)
+
+class ChatSearchRequest(BaseModel):
+    content_key: str = Field(..., description="/ai/v1/parse响应中的content_key")
+    query: str = Field(..., description="查询文本（中文按二元组匹配）", min_length=1)
+    sender: Optional[str] = Field(None, description="仅检索该发送人的消息")
+    start_time: Optional[str] = Field(None, description="起始时间（含），格式同记录time，可只传日期前缀")
+    end_time: Optional[str] = Field(None, description="结束时间（含），格式同记录time，可只传日期前缀")
+    limit: int = Field(20, description="最多返回条数", ge=1)
+
 # 响应体模型（标准化）
 class ChatParseResponse(BaseModel):
     code: int
@@ -23,14 +56,18 @@ class ChatParseResponse(BaseModel):
     data: dict
 
 @chat_router.post("/parse", response_model=ChatParseResponse, summary="微信聊天记录解析")
-async def parse_chat_record(req: ChatParseRequest):
+async def parse_chat_record(req: ChatParseRequest, request: Request):
     """
     微信纯文字聊天记录解析接口：支持TXT/XML，返回清洗后记录+解析统计
     - content：原始内容字符串（Go服务层读取文件后传递）
     - format_type：固定值txt/xml
     - use_cache：是否启用LRU缓存，默认开启
+    - Accept: application/x-ndjson 时流式返回（见_stream_parse）
     """
-    logger.info(f"收到聊天记录解析请求，格式类型：{req.format_type}，是否使用缓存：{req.use_cache}")
+    log_event(logging.INFO, "parse_request", "收到聊天记录解析请求，格式类型：%s，是否使用缓存：%s",
+              req.format_type, req.use_cache, content_len=len(req.content), stream=wants_ndjson(request))
+    if wants_ndjson(request):
+        return _stream_parse(req)
     # 调用core层解析逻辑（同步调用，解析为CPU密集型，无需async）
     result = wechat_chat_parser.parse(
         content=req.content.replace("\\n", "\n"),
@@ -40,4 +77,103 @@ async def parse_chat_record(req: ChatParseRequest):
     # 非200码抛出HTTP异常，供Go服务层捕获
     if result["code"] != 200:
         raise HTTPException(status_code=result["code"], detail=result["msg"])
-    return result
\ No newline at end of file
+    memory_profile = wechat_chat_parser.memory_profile
+    if memory_profile is not None:
+        # 大解析内存统计：响应序列化作为最后一个阶段（结果已为JSON兼容结构，直接渲染与response_model输出一致）
+        with memory_profile.measure("response_build"):
+            response = NegotiatedResponse(result)
+        return response
+    return result
+
+def _stream_parse(req: ChatParseRequest) -> StreamingResponse:
+    """
+    流式解析响应（NDJSON）：清洗后的记录边解析边写出，每行一条记录，最后一行为{"stats", "content_key"}
+    - 服务端不汇总记录列表、不构造完整响应体，内存不随记录数增长；Go端收到首批记录即可开始处理
+    - 命中缓存时直接流式写出缓存记录；未命中时解析结果不写入缓存（缓存需要完整记录列表）
+    - 解析中途失败：最后一行为{"code": 500, "msg"}（响应头已发出，无法再改状态码）
+    """
+    content = req.content.replace("\\n", "\n")
+    content_key = generate_content_key(content)
+    cached_result = wechat_chat_parser.get_cached(content_key) if req.use_cache else None
+    if cached_result is not None:
+        records, stats = iter(cached_result["data"]["records"]), cached_result["data"]["stats"]
+    else:
+        # 每个流式请求独立实例：生成器在线程池中迭代，不能与单例共享解析状态
+        parser = WeChatChatParser()
+        try:
+            records = parser.iter_parse(content, req.format_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        stats = parser.parse_stats  # 迭代过程中原地更新，迭代结束后完整
+
+    def _ndjson_lines() -> Iterator[str]:
+        chunk = []
+        try:
+            for record in records:
+                chunk.append(json.dumps(record, ensure_ascii=False))
+                if len(chunk) >= STREAM_CHUNK_RECORDS:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+            if chunk:
+                yield "\n".join(chunk) + "\n"
+        except Exception as e:
+            yield json.dumps({"code": 500, "msg": f"解析失败：{str(e)[:50]}"}, ensure_ascii=False) + "\n"
+            return
+        yield json.dumps({"stats": stats, "content_key": content_key}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(profiled_iter(_ndjson_lines()), media_type=NDJSON_MEDIA_TYPE)
+
+@chat_router.post("/search", summary="聊天记录全文检索")
+async def search_chat_records(req: ChatSearchRequest):
+    """
+    按content_key在已解析的聊天记录中检索，返回按BM25排序的记录id（records下标）与摘要
+    - 索引在解析结果写入缓存时后台构建，构建中的请求等待构建完成
+    - 索引不存在但解析缓存存在时即时构建；两者均不存在返回404（Go据此重新解析）
+    """
+    future = get_index_future(req.content_key)
+    if future is None:
+        cached_result = wechat_chat_parser.get_cached(req.content_key)
+        if cached_result is None:
+            raise HTTPException(status_code=404, detail=f"解析结果不存在或已淘汰：{req.content_key}，请重新解析")
+        future = index_records(req.content_key, cached_result["data"]["records"])
+    index = await asyncio.wrap_future(future)
+    start = time.perf_counter()
+    # 索引只读，检索放到线程池（高频词倒排表较长时不阻塞事件循环）
+    hits = await run_in_threadpool(
+        profiled(index.search), req.query, sender=req.sender, start_time=req.start_time, end_time=req.end_time,
+        limit=min(req.limit, settings.SEARCH_MAX_RESULTS)
+    )
+    search_ms = round((time.perf_counter() - start) * 1000, 3)
+    log_event(logging.INFO, "search_request", "聊天记录检索完成：命中%s条，耗时%sms", len(hits), search_ms,
+              content_key=req.content_key, query_len=len(req.query))
+    return {
+        "code": 200,
+        "msg": "检索成功",
+        "data": {"hits": hits, "total_records": len(index.records), "search_ms": search_ms}
+    }
+
+@chat_router.post("/parse/batch", summary="微信聊天记录批量解析（NDJSON流式返回）")
+async def parse_chat_records_batch(req: BatchParseRequest):
+    """
+    批量解析多份聊天记录（每个联系人/群一份），进程池并行解析，按完成顺序逐行返回（application/x-ndjson）
+    - 每行：{"index", "id", "code", "msg", "data"}，data同/parse；单份失败不影响其余文档
+    - 最后一行：{"summary": {"total", "succeeded", "failed"}}
+    - 文档数上限PARSE_BATCH_MAX_DOCS
+    """
+    if len(req.documents) > settings.PARSE_BATCH_MAX_DOCS:
+        raise HTTPException(status_code=400, detail=f"单次最多解析{settings.PARSE_BATCH_MAX_DOCS}份文档")
+    log_event(logging.INFO, "parse_request", "收到批量解析请求，文档数：%s", len(req.documents),
+              content_len=sum(len(doc.content) for doc in req.documents))
+    documents = [
+        {**doc.model_dump(), "content": doc.content.replace("\\n", "\n")} for doc in req.documents
+    ]
+
+    async def _ndjson_lines():
+        succeeded = 0
+        async for item in iter_batch_parse(documents):
+            succeeded += item["code"] == 200
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+        summary = {"total": len(documents), "succeeded": succeeded, "failed": len(documents) - succeeded}
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_ndjson_lines(), media_type=NDJSON_MEDIA_TYPE)
\ No newline at end of file
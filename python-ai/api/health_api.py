@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 """健康检查接口：供Go后端检测AI服务是否可用，无业务逻辑"""
-from fastapi import APIRouter, Response, HTTPException
+from fastapi import APIRouter, Response, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
 
 from utils import logger
 from core import wechat_chat_parser
+from core.ai_service.router import AIModelRouter, MODEL_INSTANCES
 
 health_router = APIRouter(prefix="/health", tags=["健康检查"])
 
@@ -12,18 +14,36 @@ health_router = APIRouter(prefix="/health", tags=["健康检查"])
 async def live_check():
     return Response(status_code=HTTP_200_OK, content="AI Service is live")
 
-@health_router.get("/ready", summary="就绪检查：验证核心组件是否可用")
+@health_router.get("/ready", summary="就绪检查：解析器与模型分别报告就绪状态")
 async def ready_check():
+    """
+    解析器可用即返回200（解析流量可路由）；模型就绪情况单独报告在models中，
+    Go服务层据models[version].ready或/health/ready/model决定是否路由模仿流量
+    """
     try:
         # 验证解析器实例是否可用（简单测试）
         test_content = "【2025-02-03 10:00】测试：健康检查"
         wechat_chat_parser.parse(test_content, "txt", use_cache=False)
-        logger.info("AI服务就绪检查通过")
-        return {
-            "status": "ready",
-            "service": "python-ai",
-            "message": "AI Service is ready to handle requests"
-        }
     except Exception as e:
         logger.error(f"AI服务就绪检查失败：{str(e)}")
-        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="AI Service not ready")
\ No newline at end of file
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="AI Service not ready")
+    # 多进程模式下由模型服务进程报告（IPC调用放到线程池，不阻塞事件循环）
+    models = await run_in_threadpool(AIModelRouter.route_readiness)
+    logger.debug("AI服务就绪检查通过")
+    return {
+        "status": "ready",
+        "service": "python-ai",
+        "message": "AI Service is ready to handle requests",
+        "parser_ready": True,
+        "model_ready": bool(models) and all(state["ready"] for state in models.values()),
+        "models": models
+    }
+
+@health_router.get("/ready/model", summary="模型就绪检查：已加载且预热完成返回200，否则503")
+async def model_ready_check(version: str = Query("free", description="模型版本")):
+    if version not in MODEL_INSTANCES:
+        raise HTTPException(status_code=400, detail=f"模型版本不支持：{version}")
+    readiness = await run_in_threadpool(AIModelRouter.route_readiness, version)
+    if not readiness["ready"]:
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail=readiness)
+    return readiness
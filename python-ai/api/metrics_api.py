@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""监控指标接口：Prometheus文本格式导出 + HTTP请求耗时/在途数中间件 + 解析内存统计查询"""
+import time
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.concurrency import run_in_threadpool
+
+from core.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_MS
+from core.ai_service.model_server import get_model_server_client, ModelServerError
+from core.parse_memory import get_recent_parse_memory
+from config import settings
+from utils import check_local_auth
+from utils.metrics_util import metrics_registry, PROMETHEUS_CONTENT_TYPE
+
+metrics_router = APIRouter(tags=["监控指标"])
+
+
+@metrics_router.get("/metrics", summary="Prometheus指标", dependencies=[Depends(check_local_auth)])
+async def metrics():
+    """
+    导出分阶段耗时直方图、token计数、超时、缓存命中率、在途请求等指标（仅本地访问）
+    多进程模式下模型生成指标由模型服务进程产生，合并其已产生的指标（同名指标以模型服务为准）
+    """
+    client = get_model_server_client()
+    if client is None:
+        return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+    try:
+        remote = await run_in_threadpool(client.call, "metrics", timeout=5.0)
+    except ModelServerError:
+        remote = {"names": [], "text": ""}
+    content = metrics_registry.render(exclude=remote["names"]) + remote["text"]
+    return Response(content=content, media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@metrics_router.get("/admin/parse-memory", summary="最近大解析的分阶段内存统计", dependencies=[Depends(check_local_auth)])
+async def parse_memory(
+    limit: int = Query(None, description="最多返回条数，默认全部（最多PARSE_MEMORY_RECENT条）", ge=1)
+):
+    """
+    最近的大解析（原始内容≥PARSE_MEMORY_MIN_CHARS）各阶段峰值/净变化与存活分配点Top-N，新的在前（仅本地访问）
+    - 需开启PARSE_MEMORY_PROFILE；统计保存在当前worker进程（多进程模式下各worker独立）
+    - 批量解析进程池中的解析只在其结果stats.memory中返回，不进入此列表
+    """
+    return {
+        "code": 200,
+        "msg": "查询成功",
+        "data": {"enabled": settings.PARSE_MEMORY_PROFILE, "parses": get_recent_parse_memory(limit)}
+    }
+
+
+class MetricsMiddleware:
+    """
+    纯ASGI中间件：统计HTTP在途请求数与耗时（按路由模板聚合，避免路径基数膨胀）
+    不使用BaseHTTPMiddleware，流式响应无额外缓冲
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_MS.labels(path=path, status=status_holder["status"]).observe(
+                (time.perf_counter() - start_time) * 1000
+            )
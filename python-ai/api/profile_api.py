@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""单请求剖析：请求头开启采样剖析的中间件 + 剖析结果查询接口"""
+import logging
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from config import settings
+from api.ai_api import ai_auth
+from utils import check_api_key, log_event
+from utils.profile_util import RequestProfiler
+
+# 开启剖析的请求头（值为1/true），响应头返回剖析id
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+_PROFILE_ID_PATTERN = re.compile(r"^[0-9A-Za-z-]+$")
+
+profile_router = APIRouter(prefix="/ai/v1", tags=["单请求剖析"])
+
+
+def _request_api_key(scope) -> str:
+    """API密钥：X-API-Key请求头优先，其次api_key查询参数（与ai_auth一致）"""
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            return value.decode("latin-1")
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return (query.get("api_key") or [""])[0]
+
+
+class ProfileMiddleware:
+    """
+    纯ASGI中间件：请求头X-Profile: 1且API密钥有效时，对该请求采样剖析（解析/生成路径，含线程池与生成线程）
+    - 响应头X-Profile-Id返回剖析id，结果写入PROFILE_DIR（<id>.collapsed折叠栈 + <id>.txt Top-N汇总）
+    - 未携带请求头的请求只做一次请求头查找，不创建剖析器
+    - 携带请求头但密钥无效返回401（剖析会暴露内部调用栈，不允许匿名开启）
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        flag = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                flag = value
+                break
+        if flag is None or flag.lower() not in (b"1", b"true"):
+            await self.app(scope, receive, send)
+            return
+        if not check_api_key(_request_api_key(scope)):
+            await JSONResponse({"detail": "开启剖析需要有效的API密钥"}, status_code=401)(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (PROFILE_ID_HEADER, profile_id.encode("latin-1"))]}
+            await send(message)
+
+        profiler = RequestProfiler(profile_id, interval_ms=settings.PROFILE_SAMPLE_INTERVAL_MS)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            meta = {"method": scope.get("method"), "path": scope.get("path"), "status": status_holder["status"]}
+            try:
+                await run_in_threadpool(profiler.write, settings.PROFILE_DIR, settings.PROFILE_TOP_N, meta)
+                log_event(logging.INFO, "profile_saved", "请求剖析完成：%s %s，%s个样本，剖析id：%s",
+                          meta["method"], meta["path"], profiler.samples, profile_id,
+                          profile_id=profile_id, duration_ms=round(profiler.duration * 1000, 1))
+            except OSError as e:
+                log_event(logging.WARNING, "profile_saved", "剖析结果写入失败：%s", e, profile_id=profile_id)
+
+
+@profile_router.get("/profile/{profile_id}", summary="查询剖析结果", dependencies=[Depends(ai_auth)])
+async def get_profile(
+    profile_id: str = Path(..., description="响应头X-Profile-Id返回的剖析id"),
+    kind: str = Query("summary", description="summary=Top-N汇总，collapsed=折叠栈（可直接生成火焰图）",
+                      pattern=r"^(summary|collapsed)$")
+):
+    """
+    读取剖析结果文本（鉴权同AI接口：仅本地访问+API密钥）
+    - 火焰图：curl .../profile/<id>?kind=collapsed > out.collapsed && flamegraph.pl out.collapsed > out.svg
+    """
+    if not _PROFILE_ID_PATTERN.match(profile_id):
+        raise HTTPException(status_code=400, detail="剖析id格式错误")
+    suffix = ".txt" if kind == "summary" else ".collapsed"
+    path = os.path.join(settings.PROFILE_DIR, profile_id + suffix)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"剖析结果不存在：{profile_id}")
+    with open(path, "r", encoding="utf-8") as f:
+        return PlainTextResponse(f.read())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+传输编码协商：解析/生成接口除JSON外支持msgpack（本地Go↔Python高频小请求，省去JSON编解码开销）
+- 请求：Content-Type为application/msgpack（或x-msgpack）时按msgpack解码请求体，其余按JSON
+- 响应：Accept包含msgpack时以msgpack编码响应体，否则JSON（错误响应保持JSON）
+- msgpack为可选依赖：未安装时msgpack请求返回415，Accept协商回退JSON
+- 流式解析：Accept包含application/x-ndjson时逐行返回（由接口自行判断，见wants_ndjson）
+"""
+import contextvars
+from typing import Any, Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"  # 流式响应：每行一个JSON对象
+_MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+# 当前请求是否以msgpack响应（路由处理函数内设置，响应类渲染时读取）
+_response_msgpack: contextvars.ContextVar = contextvars.ContextVar("response_msgpack", default=False)
+
+
+def _is_msgpack(header_value: str) -> bool:
+    return any(media_type in header_value for media_type in _MSGPACK_MEDIA_TYPES)
+
+
+def wants_ndjson(request: Request) -> bool:
+    """客户端是否请求NDJSON流式响应"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+class MsgpackRequest(Request):
+    """请求体为msgpack的请求：json()返回msgpack解码结果（FastAPI据此做请求模型校验）"""
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            try:
+                self._json = msgpack.unpackb(await self.body(), raw=False)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"msgpack请求体解码失败：{type(e).__name__} {str(e)[:100]}")
+        return self._json
+
+
+class NegotiatedResponse(JSONResponse):
+    """按协商结果渲染JSON或msgpack（作为路由默认响应类）"""
+    def render(self, content: Any) -> bytes:
+        if _response_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return msgpack.packb(content, use_bin_type=True)
+        return super().render(content)
+
+
+class NegotiatedRoute(APIRoute):
+    """内容协商路由：请求按Content-Type解码，响应按Accept编码"""
+    def get_route_handler(self) -> Callable:
+        original_handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            if _is_msgpack(request.headers.get("content-type", "")):
+                if msgpack is None:
+                    raise HTTPException(status_code=415, detail="服务未安装msgpack，请使用application/json")
+                # 对FastAPI声明为JSON，使其调用json()（由MsgpackRequest按msgpack解码，原始字节不变）
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (key, b"application/json") if key == b"content-type" else (key, value)
+                    for key, value in request.scope["headers"]
+                ]
+                request = MsgpackRequest(scope, request.receive)
+            token = _response_msgpack.set(msgpack is not None and _is_msgpack(request.headers.get("accept", "")))
+            try:
+                return await original_handler(request)
+            finally:
+                _response_msgpack.reset(token)
+
+        return negotiated_handler
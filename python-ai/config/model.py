@@ -3,8 +3,8 @@
 模型全局量化配置文件：统一管理所有AI模型的量化框架、硬件设备、通用量化参数
 所有版本模型（free/pro/advanced）均继承此全局配置，保证量化逻辑一致性
 """
+from functools import lru_cache
 from typing import Dict, Optional, Any
-import torch
 
 # ===================== 核心量化框架配置 =====================
 # 统一指定量化框架（避免多版本模型使用不同框架导致的兼容问题）
@@ -22,9 +22,11 @@ QUANT_COMMON_PARAMS: Dict[str, Any] = {
 
 # ===================== 硬件设备配置 =====================
 # 自动检测硬件（优先使用GPU/CUDA，无GPU则自动降级为CPU）
-# 无需手动修改，代码自动适配本地硬件环境
+# 检测需要导入torch（数秒+数百MB），推迟到首次加载模型时执行，仅解析/健康检查的进程无需承担
+@lru_cache(maxsize=1)
 def auto_detect_device() -> str:
-    """自动检测运行设备，优先CUDA，其次CPU"""
+    """自动检测运行设备，优先CUDA，其次MPS，最后CPU（结果缓存，仅检测一次）"""
+    import torch
     if torch.cuda.is_available():
         # 检测到GPU，返回cuda（支持多卡，默认使用第0卡）
         return "cuda:0"
@@ -35,8 +37,20 @@ def auto_detect_device() -> str:
         # 无专用加速硬件，返回cpu
         return "cpu"
 
-# 全局运行设备（所有模型共用，自动检测无需手动配置）
-DEVICE: str = auto_detect_device()
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """
+    解析运行设备：auto/空值在此时才检测硬件，其余原样返回
+    :param device: 配置中的设备（auto/cpu/cuda:0/mps）
+    """
+    if not device or device == DEVICE_AUTO:
+        return auto_detect_device()
+    return device
+
+
+# 全局运行设备（所有模型共用，默认auto=加载模型时自动检测，也可指定cpu/cuda:0/mps）
+DEVICE_AUTO: str = "auto"
+DEVICE: str = DEVICE_AUTO
 
 # 硬件资源通用限制（所有模型共用，避免单模型占满硬件资源）
 DEVICE_RESOURCE_LIMIT: Dict[str, Any] = {
@@ -71,9 +85,3 @@ MODEL_GLOBAL_CONFIG: Dict[str, Any] = {
     "model_load_params": MODEL_LOAD_COMMON_PARAMS,
     "tokenizer_params": TOKENIZER_COMMON_PARAMS,
 }
-
-# 打印配置信息（启动时查看，方便调试）
-print(f"===== AI模型全局量化配置加载完成 =====")
-print(f"量化框架：{QUANT_FRAMEWORK} | 运行设备：{DEVICE}")
-print(f"量化位数：{QUANT_COMMON_PARAMS['bits']}bit | 硬件资源限制：{DEVICE_RESOURCE_LIMIT[DEVICE.split(':')[0]]}")
-print(f"=====================================")
\ No newline at end of file
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """AI服务统一配置：聊天解析、缓存、日志等"""
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import os
@@ -12,6 +13,18 @@ class Settings(BaseSettings):
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8001
     API_RELOAD: bool = True  # 开发模式自动重载
+    API_UDS_PATH: str = ""  # Unix domain socket路径，设置后监听该socket（替代HOST/PORT，Go本机调用省去TCP开销）
+    API_KEEPALIVE_TIMEOUT: int = 75  # HTTP keep-alive空闲超时（秒），Go客户端复用长连接
+
+    # 多进程部署：API_WORKERS个API/解析worker进程 + 1个独占模型的模型服务进程（Unix socket IPC）
+    API_WORKERS: int = 1  # >1时启用多进程模式（自动关闭reload，解析吞吐随核数扩展，模型只加载一份）
+    MODEL_SERVER_SOCKET: str = ""  # 模型服务Unix socket路径；设置后路由器将模型调用转发到模型服务进程
+    MODEL_SERVER_POOL_SIZE: int = 8  # 每个worker到模型服务的空闲连接数上限
+    MODEL_SERVER_CALL_TIMEOUT: float = 10.0  # 状态/就绪/释放等轻量调用超时（秒）
+    MODEL_SERVER_LOAD_TIMEOUT: float = 600.0  # 模型加载调用超时（秒）
+    MODEL_SERVER_START_TIMEOUT: float = 60.0  # 启动API worker前等待模型服务可连接的最长时间（秒）
+    MODEL_SERVER_STATE_TTL: float = 0.5  # worker缓存模型服务就绪/槽位状态的时间（秒），路由与准入预估共用
+    MODEL_SERVER_STATE_TIMEOUT: float = 0.5  # 查询模型服务就绪/槽位状态超时（秒，在事件循环中调用，需短）
 
     # ===== 新增：API鉴权配置（核心修改）=====
     API_AUTH_KEY: str = "real_chatter_auth_key_20041226"  # 开发环境默认值（兜底用）
@@ -25,16 +38,65 @@ class Settings(BaseSettings):
         "语音通话", "视频通话", "红包", "转账", "位置共享", "发送了小程序"
     ]
     PARSE_TIME_FORMAT: str = "%Y-%m-%d %H:%M:%S"  # 标准化时间格式
+    PARSE_BATCH_WORKERS: int = -1  # 批量解析进程池大小，-1=按CPU核数（最多4），0=主进程顺序解析
+    PARSE_BATCH_MAX_DOCS: int = 50  # 批量解析单次请求最多文档数
+    # 分阶段内存统计（tracemalloc，开启后被统计的解析慢约一个数量级，排查OOM/确定上传上限时开启）
+    PARSE_MEMORY_PROFILE: bool = False
+    PARSE_MEMORY_MIN_CHARS: int = 1_000_000  # 原始内容不少于该字符数才统计
+    PARSE_MEMORY_RECENT: int = 10  # 管理接口保留的最近大解析数
+    PARSE_MEMORY_TOP_SITES: int = 10  # 每次解析保留的分配点数
 
     # 缓存配置
     CACHE_MAXSIZE: int = 100  # LRU缓存最大容量
     CACHE_EXPIRE_SEC: int = 3600  # 缓存过期时间（秒）
 
+    # 生成结果缓存（相同上下文+问题+生成参数+种子的重试直接返回上次回复，相同请求生成中时合并等待）
+    GENERATE_CACHE_ENABLED: bool = False
+    GENERATE_CACHE_TTL_SEC: int = 300  # 结果有效期（秒）
+    GENERATE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # 缓存结果序列化后的总字节上限，超出LRU淘汰
+
+    # 全文检索（解析结果写入缓存时后台构建倒排索引，/ai/v1/search按content_key检索）
+    SEARCH_INDEX_ON_PARSE: bool = True  # 解析结果写入缓存时构建索引（关闭后首次检索时构建）
+    SEARCH_INDEX_CACHE_SIZE: int = 20  # 常驻索引数（LRU）
+    SEARCH_MAX_RESULTS: int = 100  # 单次检索最多返回条数
+    SEARCH_MAX_POSTINGS: int = 20000  # 单个查询词最多评分的命中数（取最新的），限制高频词检索耗时
+
+    # 模型内存管理配置（多版本模型共享内存预算）
+    MODEL_MEMORY_BUDGET: str = "12G"  # 所有已加载模型常驻内存总预算，超出时LRU淘汰空闲模型
+    MODEL_LAZY_LOAD: bool = True  # 生成请求到达时自动加载未加载的模型
+    MODEL_IDLE_UNLOAD_SEC: int = 1800  # 模型空闲多久后自动卸载（秒），0=不自动卸载
+    MODEL_IDLE_CHECK_SEC: int = 60  # 空闲检查间隔（秒）
+
+    # 启动加载与预热（首个真实请求不再承担内核/内存分配器的首轮开销）
+    MODEL_LOAD_ON_STARTUP: bool = False  # 服务启动后在后台加载模型并预热（不阻塞启动，解析接口立即可用）
+    MODEL_STARTUP_VERSIONS: List[str] = ["free"]  # 启动加载的模型版本（常驻，不参与空闲卸载）
+    MODEL_WARMUP_CONTEXT_CHARS: List[int] = [64, 512, 2048]  # 预热上下文长度（字符），覆盖典型Prompt长度
+    MODEL_WARMUP_ROUNDS: int = 2  # 每个长度预热次数
+    MODEL_WARMUP_MAX_NEW_TOKENS: int = 16  # 预热生成token数
+
+    # 桩模型（压测/容量评估，无需GPU与模型文件，见ai_model/stub）
+    MODEL_STUB_VERSIONS: List[str] = []  # 改由桩模型提供的版本，如["free"]
+    MODEL_STUB_PARAMS: Dict[str, float] = {}  # 覆盖桩模型延迟参数，如{"decode_ms_per_token": 10}
+
+    # 单请求剖析（请求头X-Profile: 1且API密钥有效时对该请求采样剖析，响应头X-Profile-Id返回剖析id）
+    PROFILE_ENABLED: bool = True  # 关闭后不注册剖析中间件
+    PROFILE_DIR: str = "logs/profiles"  # 折叠栈文件（<id>.collapsed）与Top-N汇总（<id>.txt）输出目录
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0  # 采样间隔（毫秒）
+    PROFILE_TOP_N: int = 30  # 汇总中列出的函数数
+
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/ai_service.log"
     LOG_MAX_BYTES: int = 10 * 1024 * 1024  # 单个日志文件10MB
     LOG_BACKUP_COUNT: int = 5  # 日志文件备份数
+    LOG_JSON: bool = True  # 日志文件输出JSON Lines（控制台保持文本格式）
+    LOG_QUEUE_SIZE: int = 10000  # 异步日志队列容量，满时丢弃新日志，避免阻塞请求
+    LOG_FIELD_MAX_CHARS: int = 256  # 结构化字段（prompt/content等）最大保留字符数，超出截断并记录哈希
+    LOG_SAMPLE_RATES: Dict[str, float] = {  # 按消息类型采样率（未配置的类型全部记录，WARNING及以上不采样）
+        "generate_prompt": 0.1,
+        "generate_content": 0.5,
+        "parse_request": 0.2,
+    }
 
 # 全局配置实例
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+按用户的LoRA风格适配器：共享同一份基座权重，按请求热切换，不重新加载模型
+- 存储：adapter_dir/<adapter_id>/（peft save_pretrained输出：adapter_config.json + adapter_model.bin/safetensors）
+- 首个适配器用PeftModel.from_pretrained注入LoRA层（原地修改基座模块，self.model.generate直接生效），
+  之后load_adapter追加；已加载的适配器按LRU保留max_loaded个，超出时淘汰最久未使用且未在使用的
+- 切换：LoRA层的激活适配器为模型全局状态，同一时刻只能有一个适配器（或关闭适配器的基座）在生成；
+  并发生成使用相同适配器时共享，使用不同适配器的请求等待当前使用者结束后切换（acquire/release，
+  由生成线程结束时归还，超时返回后仍在运行的生成线程不会被切换适配器）
+- 混合适配器batch：peft 0.9之前不支持按样本指定适配器，且服务每次生成batch=1，不做跨请求合批
+- peft为可选依赖（与auto_gptq一样在加载时导入），未安装时携带adapter_id的请求返回错误，不影响基座生成
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from utils import logger
+from core.metrics import ADAPTER_REQUESTS, ADAPTER_LOAD_MS
+
+_ADAPTER_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+ADAPTER_ID_PATTERN = _ADAPTER_ID_PATTERN.pattern
+
+
+class AdapterError(Exception):
+    """适配器不可用（id非法/不存在/peft未安装/加载失败/等待切换超时）"""
+
+    def __init__(self, status_code: int, msg: str):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.msg = msg
+
+
+class LoRAAdapterManager:
+    """单个基座模型上的LoRA适配器LRU缓存与切换（线程安全）"""
+
+    def __init__(self, model, adapter_dir: str, max_loaded: int = 8, version: str = "free"):
+        """
+        :param model: 已加载的基座模型（AutoGPTQ封装时取其内部transformers模型注入）
+        :param adapter_dir: 适配器根目录
+        :param max_loaded: 最多同时加载的适配器数
+        :param version: 模型版本（指标标签）
+        """
+        # AutoGPTQ的BaseGPTQForCausalLM不是transformers模型，LoRA注入其内部的model
+        self.base_model = model.model if type(model).__module__.startswith("auto_gptq") else model
+        self.adapter_dir = adapter_dir
+        self.max_loaded = max(1, max_loaded)
+        self.version = version
+        self.peft_model = None
+        self.loaded: "OrderedDict[str, float]" = OrderedDict()  # 适配器id → 加载耗时（毫秒），顺序即LRU
+        self.active: Optional[str] = None  # 当前激活的适配器（None=关闭适配器，基座生成）
+        self.users = 0  # 使用当前激活状态的进行中生成数
+        self._cond = threading.Condition()
+
+    def adapter_path(self, adapter_id: str) -> str:
+        if not _ADAPTER_ID_PATTERN.match(adapter_id or ""):
+            raise AdapterError(400, f"适配器id格式错误：{adapter_id}")
+        path = os.path.join(self.adapter_dir, adapter_id)
+        if not os.path.exists(os.path.join(path, "adapter_config.json")):
+            raise AdapterError(404, f"适配器不存在：{adapter_id}")
+        return path
+
+    def available(self) -> List[str]:
+        """本地已存储的适配器id"""
+        if not os.path.isdir(self.adapter_dir):
+            return []
+        return sorted(name for name in os.listdir(self.adapter_dir)
+                      if _ADAPTER_ID_PATTERN.match(name)
+                      and os.path.exists(os.path.join(self.adapter_dir, name, "adapter_config.json")))
+
+    def _load(self, adapter_id: str) -> None:
+        """加载适配器权重（调用方持有锁且无进行中生成）"""
+        path = self.adapter_path(adapter_id)
+        try:
+            from peft import PeftModel
+        except ImportError:
+            raise AdapterError(501, "未安装peft，无法使用LoRA适配器（pip install peft~=0.5.0）")
+        load_start = time.perf_counter()
+        try:
+            if self.peft_model is None:
+                self.peft_model = PeftModel.from_pretrained(self.base_model, path, adapter_name=adapter_id)
+                self.peft_model.eval()
+            else:
+                self.peft_model.load_adapter(path, adapter_name=adapter_id)
+        except Exception as e:
+            raise AdapterError(500, f"适配器加载失败：{adapter_id}，{str(e)[:100]}")
+        load_ms = (time.perf_counter() - load_start) * 1000
+        self.loaded[adapter_id] = round(load_ms, 1)
+        ADAPTER_LOAD_MS.labels(version=self.version).observe(load_ms)
+        logger.info(f"LoRA适配器加载完成：{adapter_id}，耗时{load_ms:.0f}ms，已加载{len(self.loaded)}个")
+        while len(self.loaded) > self.max_loaded:
+            evicted = next(name for name in self.loaded if name != adapter_id)
+            self.peft_model.base_model.delete_adapter(evicted)
+            del self.loaded[evicted]
+            ADAPTER_REQUESTS.labels(version=self.version, result="evict").inc()
+            logger.info(f"LoRA适配器已淘汰：{evicted}")
+
+    def _activate(self, adapter_id: Optional[str]) -> None:
+        """切换激活状态（调用方持有锁且无进行中生成）"""
+        if adapter_id is None:
+            if self.peft_model is not None:
+                self.peft_model.base_model.disable_adapter_layers()
+        else:
+            if adapter_id in self.loaded:
+                ADAPTER_REQUESTS.labels(version=self.version, result="hit").inc()
+            else:
+                self._load(adapter_id)
+                ADAPTER_REQUESTS.labels(version=self.version, result="load").inc()
+            self.peft_model.set_adapter(adapter_id)
+            self.peft_model.base_model.enable_adapter_layers()
+        self.active = adapter_id
+
+    def acquire(self, adapter_id: Optional[str], timeout: float) -> None:
+        """
+        激活指定适配器并登记为使用者（None=关闭适配器，使用基座），生成结束后调用release
+        :raise AdapterError: 适配器不可用 / 等待其他适配器的生成结束超时（503）
+        """
+        if adapter_id is not None:
+            self.adapter_path(adapter_id)  # 先校验，非法/不存在的适配器不排队
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.active != adapter_id and self.users > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if self.active != adapter_id and self.users > 0:
+                        raise AdapterError(503, f"等待切换适配器超时（当前适配器{self.active}生成中）")
+            if self.active != adapter_id:
+                self._activate(adapter_id)
+            elif adapter_id is not None:
+                ADAPTER_REQUESTS.labels(version=self.version, result="hit").inc()
+            if adapter_id is not None:
+                self.loaded.move_to_end(adapter_id)
+            self.users += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.users -= 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "adapter_dir": self.adapter_dir,
+                "active": self.active,
+                "users": self.users,
+                "max_loaded": self.max_loaded,
+                "loaded": [{"adapter_id": name, "load_ms": load_ms} for name, load_ms in self.loaded.items()],
+            }
+
+
+__all__ = ["ADAPTER_ID_PATTERN", "AdapterError", "LoRAAdapterManager"]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+推理后端抽象：模型权重如何加载/在哪类硬件上执行，与模型版本（free/pro）解耦
+- gptq：AutoGPTQ 4bit量化（GPU优先，CPU上内核慢/不可用）
+- torch_int8：PyTorch动态int8量化（Linear层权重int8，CPU专用，调优线程数）
+在模型配置中通过"backend"选择，后端专属参数放在"backend_params"[后端名]中
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Tuple, Type
+
+from config.model import resolve_device
+
+
+class BaseInferenceBackend(ABC):
+    """推理后端抽象基类"""
+    name: str = ""
+    quant_desc: str = ""  # 量化方式描述（状态接口展示用）
+
+    def __init__(self, model_config: Dict[str, Any]):
+        """
+        :param model_config: 模型完整配置（含backend_params[后端名]专属参数）
+        """
+        self.config = model_config
+        self.params: Dict[str, Any] = (model_config.get("backend_params") or {}).get(self.name, {})
+
+    @property
+    def device(self) -> str:
+        """后端实际运行设备（推理输入张量需放到该设备，auto在首次访问时检测硬件）"""
+        return resolve_device(self.config.get("device"))
+
+    @abstractmethod
+    def load(self) -> Tuple[Any, Any]:
+        """
+        加载模型与分词器
+        :return: (model, tokenizer)，模型已切换为推理模式
+        """
+        pass
+
+    def describe(self) -> Dict[str, Any]:
+        """后端描述信息（加载结果/状态接口展示用）"""
+        return {"backend": self.name, "quant_type": self.quant_desc, "device": self.device}
+
+
+class GPTQBackend(BaseInferenceBackend):
+    """AutoGPTQ 4bit量化后端（原有加载逻辑）"""
+    name = "gptq"
+    quant_desc = "4bit"
+
+    def load(self) -> Tuple[Any, Any]:
+        from utils.model_util import load_4bit_quant_model
+        return load_4bit_quant_model(
+            model_path=self.params.get("model_path", self.config["model_path"]),
+            quant_type=self.config["quant_type"],
+            device=self.device,
+            max_memory=self.config["max_memory"]
+        )
+
+
+class TorchInt8Backend(BaseInferenceBackend):
+    """PyTorch动态int8量化后端：加载全精度权重后将Linear层动态量化为int8，仅CPU"""
+    name = "torch_int8"
+    quant_desc = "int8-dynamic"
+
+    @property
+    def device(self) -> str:
+        return "cpu"
+
+    def load(self) -> Tuple[Any, Any]:
+        from utils.model_util import load_int8_dynamic_model
+        return load_int8_dynamic_model(
+            model_path=self.params.get("model_path", self.config["model_path"]),
+            num_threads=self.params.get("num_threads"),
+            interop_threads=self.params.get("interop_threads")
+        )
+
+
+# 后端注册表（新增后端在此注册即可通过配置选择）
+INFERENCE_BACKENDS: Dict[str, Type[BaseInferenceBackend]] = {
+    GPTQBackend.name: GPTQBackend,
+    TorchInt8Backend.name: TorchInt8Backend,
+}
+
+
+def create_backend(model_config: Dict[str, Any]) -> BaseInferenceBackend:
+    """
+    按模型配置创建推理后端（未配置backend时沿用GPTQ）
+    :param model_config: 模型完整配置
+    :return: 推理后端实例
+    :raise ValueError: 后端名未注册
+    """
+    backend_name = (model_config.get("backend") or GPTQBackend.name).lower()
+    if backend_name not in INFERENCE_BACKENDS:
+        raise ValueError(f"不支持的推理后端：{backend_name}，仅支持{list(INFERENCE_BACKENDS)}")
+    return INFERENCE_BACKENDS[backend_name](model_config)
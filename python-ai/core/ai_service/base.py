@@ -22,6 +22,7 @@ class BaseAIModel(ABC):
         self.tokenizer = None  # 分词器实例
         self.status = self.STATUS_UNLOADED  # 初始状态：未加载
         self.load_error: Optional[str] = None  # 加载错误信息
+        self.warmed_up = False  # 是否已完成预热（内核/内存分配器首轮开销已摊销，延迟趋于稳定）
 
     @abstractmethod
     def load_quantize_model(self) -> Dict[str, Any]:
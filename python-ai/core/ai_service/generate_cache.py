@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+生成结果缓存：相同请求（UI重试/Go超时重试/仅重新渲染的「重新生成」）直接返回上次的回复，不再重复推理
+- 键：规范化上下文（去空白/时间戳、合并连续发言，与Prompt编译一致，按调用方已知发送人切分）+ 已知发送人 + 问题
+  + 版本 + 生成参数 + 随机种子的SHA-256
+  未指定种子与种子0是不同的键（模型只在指定种子时固定随机数），调用方要换一条回复时传fresh=true跳过缓存，或传不同的seed
+- 淘汰：TTL过期 + 按序列化字节数的LRU上限
+- 合并：相同键的请求正在生成时，后到的请求等待同一次生成的结果（不排队、不占推理槽位）；
+  生成在独立任务中执行，最先到达的请求断开不影响等待同一结果的其他请求
+- 只缓存成功结果（code=200），准入拒绝/生成失败/降级到其他版本的结果（data.fallback）/
+  生成异常或为空时的兜底回复（data.degraded）不缓存；
+  运行在事件循环中（非线程安全），多worker进程各自独立
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from config import settings
+from core.ai_service.prompt_compiler import compact_context
+from core.metrics import GENERATE_CACHE_REQUESTS, GENERATE_CACHE_BYTES
+
+# 缓存结果来源（写入响应data.cache）
+CACHE_MISS = "miss"
+CACHE_HIT = "hit"
+CACHE_COALESCED = "coalesced"
+CACHE_BYPASS = "bypass"
+
+
+def generate_cache_key(version: str, context: str, question: str, senders: Optional[Iterable[str]] = None,
+                       **params) -> str:
+    """
+    生成缓存键
+    :param senders: 上下文中的已知发送人（影响Prompt编译对发言的切分合并，即模型实际看到的Prompt）
+    :param params: 影响生成结果的参数（temperature/max_gen_len/max_sentences/target_sender/adapter_id/seed等）
+    """
+    senders = sorted(set(senders or ()))
+    payload = {
+        "version": version,
+        "context": compact_context(context, senders),
+        "senders": senders,
+        "question": (question or "").strip(),
+        **params,
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class GenerateResultCache:
+    """生成结果缓存（TTL + 字节上限LRU + 进行中请求合并）"""
+
+    def __init__(self, max_bytes: int, ttl_sec: float):
+        """
+        :param max_bytes: 缓存结果序列化后的总字节上限
+        :param ttl_sec: 结果有效期（秒）
+        """
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 键 → (过期时间, 字节数, 结果)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """未过期的缓存结果（副本），过期条目顺带删除"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(entry[2])
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """写入结果，超出字节上限时从最久未使用的开始淘汰（单条超过上限不缓存）"""
+        size = len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_sec, size, copy.deepcopy(result))
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    async def get_or_generate(
+        self, key: Optional[str], generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        缓存命中直接返回，相同键生成中则等待其结果，否则执行generate并缓存成功结果
+        :param key: 缓存键，None=跳过缓存（fresh请求/缓存关闭）
+        :param generate: 无参协程函数，返回生成结果；抛出的异常（准入拒绝等）原样传给所有等待者
+        :return: 生成结果（data.cache标注来源）
+        """
+        if key is None:
+            GENERATE_CACHE_REQUESTS.labels(result=CACHE_BYPASS).inc()
+            return _tag(await generate(), CACHE_BYPASS)
+        cached = self.get(key)
+        if cached is not None:
+            GENERATE_CACHE_REQUESTS.labels(result=CACHE_HIT).inc()
+            return _tag(cached, CACHE_HIT)
+        task = self._in_flight.get(key)
+        if task is not None:
+            GENERATE_CACHE_REQUESTS.labels(result=CACHE_COALESCED).inc()
+            return _tag(copy.deepcopy(await asyncio.shield(task)), CACHE_COALESCED)
+
+        GENERATE_CACHE_REQUESTS.labels(result=CACHE_MISS).inc()
+
+        async def _run():
+            try:
+                result = await generate()
+                data = result.get("data") or {}
+                if result.get("code") == 200 and not data.get("fallback") and not data.get("degraded"):
+                    self.put(key, result)
+                return result
+            finally:
+                self._in_flight.pop(key, None)
+
+        task = asyncio.ensure_future(_run())
+        # 所有等待者都已断开时异常无人读取，标记为已处理避免事件循环告警
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._in_flight[key] = task
+        return _tag(copy.deepcopy(await asyncio.shield(task)), CACHE_MISS)
+
+
+def _tag(result: Dict[str, Any], source: str) -> Dict[str, Any]:
+    if isinstance(result.get("data"), dict):
+        result["data"]["cache"] = source
+    return result
+
+
+# 全局生成结果缓存（GENERATE_CACHE_ENABLED关闭时接口层不使用）
+generate_cache = GenerateResultCache(settings.GENERATE_CACHE_MAX_BYTES, settings.GENERATE_CACHE_TTL_SEC)
+GENERATE_CACHE_BYTES.set_function(lambda: generate_cache.total_bytes)
+
+__all__ = [
+    "GenerateResultCache", "generate_cache", "generate_cache_key",
+    "CACHE_MISS", "CACHE_HIT", "CACHE_COALESCED", "CACHE_BYPASS"
+]
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+推理准入控制：每个模型版本一个有界优先级队列，限制并发生成数
+- 并发上限：同一版本同时执行的生成数不超过max_concurrency，其余按优先级排队
+- 优先级：interactive（用户交互）优先于background（后台任务），同优先级先到先服务
+- 截止时间准入：预计排队+执行耗时已超过请求超时则立即拒绝（503+Retry-After），队列满拒绝（429+Retry-After）
+- 槽位按实际计算占用释放：生成超时返回但生成线程仍在运行（取消在下一个token生效，prefill无法取消）时，
+  槽位保留到线程结束（SlotLease.defer + 线程结束回调），避免在CPU仍被占满时放行下一个请求
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from utils import logger
+from core.metrics import QUEUE_WAIT_MS, QUEUE_DEPTH, QUEUE_IN_FLIGHT, QUEUE_REJECTED
+
+# 优先级（数值越小越优先）
+PRIORITY_LEVELS: Dict[str, int] = {
+    "interactive": 0,
+    "background": 1,
+}
+
+
+class QueueRejectedError(Exception):
+    """准入拒绝：携带HTTP状态码与建议重试秒数"""
+    def __init__(self, status_code: int, msg: str, retry_after: int):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.msg = msg
+        self.retry_after = retry_after
+
+
+class SlotLease:
+    """执行槽位租约（slot()产出）：defer()后退出async with不释放，由release_threadsafe()在生成线程结束时释放"""
+
+    def __init__(self, queue: "InferenceQueue", start_time: float):
+        self.queue = queue
+        self.start_time = start_time
+        self.deferred = False
+        self.released = False
+        self._loop = asyncio.get_running_loop()
+
+    def defer(self) -> None:
+        """推迟释放（生成线程仍在运行，其结束回调会调用release_threadsafe）"""
+        self.deferred = True
+
+    def release(self) -> None:
+        """释放槽位并按实际占用时长更新耗时估计（幂等，须在事件循环中调用）"""
+        if self.released:
+            return
+        self.released = True
+        self.queue._finish(self.start_time)
+
+    def release_threadsafe(self) -> None:
+        """从生成线程释放槽位（转交到事件循环执行）"""
+        self._loop.call_soon_threadsafe(self.release)
+
+
+class InferenceQueue:
+    """单版本推理队列（运行在事件循环中，非线程安全，仅在async接口层使用）"""
+
+    def __init__(self, version: str, max_concurrency: int = 1, max_queue_size: int = 16,
+                 initial_service_sec: float = 3.0, ewma_alpha: float = 0.2):
+        """
+        :param version: 模型版本
+        :param max_concurrency: 最大并发生成数
+        :param max_queue_size: 最大排队数（不含执行中）
+        :param initial_service_sec: 无历史数据时的单次生成耗时预估
+        :param ewma_alpha: 生成耗时指数滑动平均系数
+        """
+        self.version = version
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max_queue_size
+        self.ewma_alpha = ewma_alpha
+        self.service_sec = initial_service_sec  # 单次生成耗时EWMA
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (优先级, 序号, future)
+        self._seq = itertools.count()
+        # 统计
+        self.rejected = 0
+        self.admitted = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队数（不含已取消的等待者）"""
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def estimate_wait(self, priority: int = 0) -> float:
+        """
+        预估新请求的排队耗时（秒）：排在其前面的请求数 / 并发数 × 单次耗时
+        :param priority: 新请求优先级数值
+        """
+        ahead = sum(1 for p, _, fut in self._waiters if p <= priority and not fut.done())
+        if self.in_flight < self.max_concurrency and ahead == 0:
+            return 0.0
+        rounds = (ahead + self.in_flight - self.max_concurrency) // self.max_concurrency + 1
+        return max(rounds, 0) * self.service_sec
+
+    def estimate_latency(self, priority: int = 0) -> float:
+        """
+        新请求预计完成耗时（秒）：排队 + 单次生成耗时EWMA，队列已满返回inf（版本路由/降级使用）
+        :param priority: 新请求优先级数值
+        """
+        if self.queue_depth >= self.max_queue_size and self.in_flight >= self.max_concurrency:
+            return math.inf
+        return self.estimate_wait(priority) + self.service_sec
+
+    def _admit(self, priority: int, timeout: float, external_wait_sec: float = 0.0) -> None:
+        """
+        准入检查：队列满→429，预计完成时间超过超时→503
+        :param external_wait_sec: 下游（模型服务）预计排队耗时，与本队列预估取较大值
+        """
+        if self.queue_depth >= self.max_queue_size and self.in_flight >= self.max_concurrency:
+            self.rejected += 1
+            QUEUE_REJECTED.labels(version=self.version, status=429).inc()
+            retry_after = math.ceil(self.service_sec)
+            raise QueueRejectedError(429, f"模型版本{self.version}请求过多，队列已满，请{retry_after}s后重试", retry_after)
+        wait_sec = max(self.estimate_wait(priority), external_wait_sec)
+        if wait_sec > 0 and wait_sec + self.service_sec > timeout:
+            self.rejected += 1
+            QUEUE_REJECTED.labels(version=self.version, status=503).inc()
+            retry_after = max(1, math.ceil(wait_sec))
+            raise QueueRejectedError(
+                503, f"模型版本{self.version}繁忙，预计排队{wait_sec:.1f}s超过超时{timeout}s，请{retry_after}s后重试", retry_after
+            )
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", timeout: float = 60.0, external_wait_sec: float = 0.0):
+        """
+        获取执行槽位（async with ... as lease），退出时释放并更新耗时估计（lease.defer()后改由生成线程结束时释放）
+        :param priority: 优先级名称（interactive/background）
+        :param timeout: 请求超时（秒），排队超时同样拒绝
+        :param external_wait_sec: 下游预计排队耗时（多进程模式为模型服务汇合各worker后的排队），计入准入预估
+        :raise QueueRejectedError: 准入拒绝/排队超时
+        """
+        level = PRIORITY_LEVELS.get(priority, PRIORITY_LEVELS["interactive"])
+        self._admit(level, timeout, external_wait_sec)
+        enqueue_time = time.monotonic()
+        if self.in_flight >= self.max_concurrency or self.queue_depth > 0:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (level, next(self._seq), future))
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                if future.done() and not future.cancelled():
+                    # 超时瞬间恰好被唤醒：槽位已转交给本请求，需要交还
+                    self._release_slot()
+                future.cancel()
+                self.rejected += 1
+                QUEUE_REJECTED.labels(version=self.version, status=503).inc()
+                raise QueueRejectedError(503, f"模型版本{self.version}排队超时（{timeout}s）", math.ceil(self.service_sec))
+            except asyncio.CancelledError:
+                # 客户端断开：已转交的槽位交还
+                if future.done() and not future.cancelled():
+                    self._release_slot()
+                future.cancel()
+                raise
+        else:
+            self.in_flight += 1
+        self.admitted += 1
+        start_time = time.monotonic()
+        QUEUE_WAIT_MS.labels(version=self.version).observe((start_time - enqueue_time) * 1000)
+        logger.debug(f"模型版本{self.version}获得推理槽位，排队{start_time - enqueue_time:.3f}s，执行中{self.in_flight}")
+        lease = SlotLease(self, start_time)
+        try:
+            yield lease
+        finally:
+            if not lease.deferred:
+                lease.release()
+
+    def _finish(self, start_time: float) -> None:
+        """执行结束：更新单次耗时EWMA（含超时后仍在运行的部分）并释放槽位"""
+        elapsed = time.monotonic() - start_time
+        self.service_sec = (1 - self.ewma_alpha) * self.service_sec + self.ewma_alpha * elapsed
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        """释放槽位：直接转交给优先级最高的等待者（in_flight不变），无等待者则减少in_flight"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, float]:
+        """队列状态快照（监控使用）"""
+        return {
+            "version": self.version,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "service_sec": round(self.service_sec, 3),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+# 版本 → 推理队列（按模型配置懒创建）
+_INFERENCE_QUEUES: Dict[str, InferenceQueue] = {}
+
+
+def get_inference_queue(version: str, model_config: Optional[Dict] = None) -> InferenceQueue:
+    """
+    获取版本对应的推理队列（首次调用按模型配置创建）
+    :param version: 模型版本
+    :param model_config: 模型配置（读取max_concurrency/max_queue_size/expected_generate_sec）
+    """
+    queue = _INFERENCE_QUEUES.get(version)
+    if queue is None:
+        model_config = model_config or {}
+        queue = InferenceQueue(
+            version,
+            max_concurrency=model_config.get("max_concurrency", 1),
+            max_queue_size=model_config.get("max_queue_size", 16),
+            initial_service_sec=model_config.get("expected_generate_sec", 3.0)
+        )
+        _INFERENCE_QUEUES[version] = queue
+        QUEUE_DEPTH.labels(version=version).set_function(lambda: queue.queue_depth)
+        QUEUE_IN_FLIGHT.labels(version=version).set_function(lambda: queue.in_flight)
+    return queue
+
+
+def all_inference_queues() -> Dict[str, InferenceQueue]:
+    """所有已创建的推理队列"""
+    return dict(_INFERENCE_QUEUES)
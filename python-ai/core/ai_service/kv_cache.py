@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+KV缓存策略：int8量化KV缓存 + 按块预留的KV内存预算（可同时开启），在max_memory内容纳更多并发生成
+- int8量化（quantization="int8"）：千问v1远程代码自带的KV缓存量化（use_cache_quantization），
+  K/V按token×head量化为uint8并保存scale/zero，CPU上为float32缓存的约1/4，GPU上为float16的约1/2
+- 块预算（budget）：按block_tokens个token为一块，生成前为「Prompt+最大生成长度」预留整块，生成结束归还；
+  预算不足时等待其他生成归还，超时返回繁忙，避免并发生成的KV缓存总量超出内存预算
+  HF generate逐步torch.cat扩展缓存，无法真正共享预分配的物理块，此处为块粒度的预留记账（分页准入），不改变缓存存储
+- 单请求KV内存：每token字节数（由模型结构与缓存精度计算）× 缓存token数，写入生成结果与指标
+"""
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.sys_util import parse_memory_size
+from core.metrics import KV_CACHE_BLOCKS_USED
+
+KV_QUANTIZATIONS = (None, "int8")
+
+
+class KVCacheBudgetError(Exception):
+    """KV缓存预算不足（单请求超过总预算，或等待其他生成归还超时）"""
+
+
+def kv_bytes_per_token(model_config, dtype_bytes: int = 2, quantization: Optional[str] = None) -> int:
+    """
+    单个token的KV缓存字节数（所有层K+V）
+    :param model_config: transformers模型配置（num_hidden_layers/num_attention_heads/hidden_size，千问另有kv_channels）
+    :param dtype_bytes: 激活精度字节数（float16=2，float32=4）
+    :param quantization: None=与激活同精度，int8=每元素1字节 + 每token每head的scale/zero
+    """
+    layers = model_config.num_hidden_layers
+    heads = getattr(model_config, "num_key_value_heads", None) or model_config.num_attention_heads
+    head_dim = getattr(model_config, "kv_channels", None) or model_config.hidden_size // model_config.num_attention_heads
+    if quantization == "int8":
+        return 2 * layers * heads * (head_dim + 2 * dtype_bytes)
+    return 2 * layers * heads * head_dim * dtype_bytes
+
+
+def activation_dtype_bytes(model) -> int:
+    """模型激活精度字节数（取词嵌入权重精度，GPTQ量化层的整型权重不代表激活精度）"""
+    try:
+        return model.get_input_embeddings().weight.element_size()
+    except (AttributeError, NotImplementedError):
+        return 2
+
+
+def apply_kv_cache_quantization(model) -> int:
+    """
+    开启int8 KV缓存（千问v1：模型配置与注意力/主干模块的use_cache_quantization开关，前向时读取）
+    CUDA自定义内核（use_cache_kernel）需在模型构建时编译加载，此处不开启，量化/反量化走PyTorch实现
+    :return: 开启的模块数，0表示该模型结构不支持KV缓存量化
+    """
+    switched = 0
+    for module in model.modules():
+        if hasattr(module, "use_cache_quantization"):
+            module.use_cache_quantization = True
+            switched += 1
+    if switched:
+        model.config.use_cache_quantization = True
+    return switched
+
+
+class KVBlockPool:
+    """KV缓存块预算（线程安全：生成线程归还，多个请求线程并发预留）"""
+
+    def __init__(self, budget_bytes: int, bytes_per_token: int, block_tokens: int = 64, version: str = "free"):
+        """
+        :param budget_bytes: KV缓存总预算（字节）
+        :param bytes_per_token: 单token KV字节数
+        :param block_tokens: 每块token数
+        :param version: 模型版本（指标标签）
+        """
+        self.block_tokens = max(1, block_tokens)
+        self.block_bytes = bytes_per_token * self.block_tokens
+        self.bytes_per_token = bytes_per_token
+        self.total_blocks = max(0, budget_bytes // self.block_bytes)
+        self.used_blocks = 0
+        self.reservations = 0
+        self.version = version
+        self._cond = threading.Condition()
+        KV_CACHE_BLOCKS_USED.labels(version=version).set(0)
+
+    def blocks_for(self, num_tokens: int) -> int:
+        return math.ceil(max(num_tokens, 1) / self.block_tokens)
+
+    def acquire(self, num_tokens: int, timeout: float) -> int:
+        """
+        预留num_tokens个token所需的块（不足时等待归还）
+        :return: 预留块数（归还时传给release）
+        :raise KVCacheBudgetError: 单请求超过总预算 / 等待超时
+        """
+        blocks = self.blocks_for(num_tokens)
+        if blocks > self.total_blocks:
+            raise KVCacheBudgetError(f"KV缓存需要{blocks}块，超过总预算{self.total_blocks}块")
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.used_blocks + blocks > self.total_blocks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if self.used_blocks + blocks > self.total_blocks:
+                        raise KVCacheBudgetError(f"KV缓存预算不足，等待{timeout:.1f}s仍无{blocks}块可用")
+            self.used_blocks += blocks
+            self.reservations += 1
+            KV_CACHE_BLOCKS_USED.labels(version=self.version).set(self.used_blocks)
+        return blocks
+
+    def release(self, blocks: int) -> None:
+        with self._cond:
+            self.used_blocks -= blocks
+            self.reservations -= 1
+            KV_CACHE_BLOCKS_USED.labels(version=self.version).set(self.used_blocks)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "block_tokens": self.block_tokens,
+                "block_bytes": self.block_bytes,
+                "total_blocks": self.total_blocks,
+                "used_blocks": self.used_blocks,
+                "reservations": self.reservations,
+            }
+
+
+def kv_budget_bytes(kv_config: Dict[str, Any], model_config: Dict[str, Any]) -> int:
+    """
+    KV缓存总预算：配置了budget则直接使用，"auto"取max_memory扣除模型常驻内存预估，未配置返回0（不限制）
+    """
+    budget = kv_config.get("budget")
+    if budget == "auto":
+        return max(0, parse_memory_size(model_config.get("max_memory"))
+                   - parse_memory_size(model_config.get("memory_estimate")))
+    return parse_memory_size(budget)
+
+
+__all__ = [
+    "KV_QUANTIZATIONS", "KVCacheBudgetError", "KVBlockPool", "kv_bytes_per_token", "activation_dtype_bytes",
+    "apply_kv_cache_quantization", "kv_budget_bytes"
+]
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+模型内存管理器：全局内存预算下的懒加载、常驻内存统计、空闲卸载、LRU淘汰
+- 首次使用时加载，同一版本并发加载合并为一次（其余请求等待同一结果）
+- 加载前按预估大小腾挪预算：淘汰最久未使用且当前无请求占用的其他版本
+- 加载后按RSS增量记录实际常驻内存（GPU等RSS无法反映时使用配置预估值）
+- 后台线程定期卸载超过空闲时间的模型
+- 生成超时返回但生成线程仍在运行时，占用保持到线程结束（ModelPin.defer + 线程结束回调），期间不会被淘汰/卸载
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils import logger
+from utils.sys_util import get_rss_bytes, format_bytes
+
+
+class ModelPin:
+    """模型占用租约（lease()产出）：defer()后退出with不释放，由生成线程结束时调用release()释放"""
+
+    def __init__(self, manager: "ModelMemoryManager", version: str, result: Dict[str, Any], pinned: bool):
+        self.manager = manager
+        self.version = version
+        self.result = result  # 加载结果，code!=200时未占用
+        self.pinned = pinned
+        self.deferred = False
+        self._lock = threading.Lock()
+
+    def defer(self) -> None:
+        """推迟释放（生成线程仍在运行，其结束回调会调用release）"""
+        self.deferred = True
+
+    def release(self) -> None:
+        """释放占用（幂等，线程安全）"""
+        with self._lock:
+            if not self.pinned:
+                return
+            self.pinned = False
+        self.manager._unpin(self.version)
+
+
+class ModelMemoryManager:
+    """模型内存管理器（线程安全）"""
+
+    def __init__(
+        self,
+        budget_bytes: int,
+        unload_fn: Callable[[str], Any],
+        idle_unload_sec: float = 0,
+        reap_interval_sec: float = 60
+    ):
+        """
+        :param budget_bytes: 全部模型常驻内存总预算（字节），<=0表示不限制
+        :param unload_fn: 卸载回调（入参版本号，负责释放模型并清理实例注册表）
+        :param idle_unload_sec: 空闲多久后自动卸载（秒），<=0表示不自动卸载
+        :param reap_interval_sec: 空闲检查间隔（秒）
+        """
+        self.budget_bytes = budget_bytes
+        self.unload_fn = unload_fn
+        self.idle_unload_sec = idle_unload_sec
+        self.reap_interval_sec = reap_interval_sec
+        # 已加载版本 → {"resident_bytes": int, "last_used": float, "in_use": int}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # 正在加载的版本 → {"event": Event, "result": dict}（合并并发加载）
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()  # 串行化实际加载，保证RSS增量统计准确
+        self._reaper: Optional[threading.Thread] = None
+        self.resident_versions = set()  # 常驻版本（启动预热的模型），不参与空闲卸载
+
+    @property
+    def used_bytes(self) -> int:
+        """当前已登记的常驻内存总量"""
+        with self._lock:
+            return sum(entry["resident_bytes"] for entry in self.entries.values())
+
+    def ensure_loaded(
+        self,
+        version: str,
+        loader: Optional[Callable[[], Dict[str, Any]]],
+        estimate_bytes: int = 0,
+        pin: bool = False
+    ) -> Dict[str, Any]:
+        """
+        确保模型已加载（未加载则腾挪预算后加载，并发调用合并为一次）
+        :param version: 模型版本
+        :param loader: 实际加载函数，返回 {"code": int, "msg": str, "data": dict}；None=不自动加载
+        :param estimate_bytes: 加载前的常驻内存预估（字节）
+        :param pin: 成功时原子地占用模型（需调用方配对_unpin，推荐使用use()）
+        :return: 加载结果
+        """
+        return self._ensure_loaded(version, loader, estimate_bytes, pin)[0]
+
+    def _ensure_loaded(
+        self,
+        version: str,
+        loader: Optional[Callable[[], Dict[str, Any]]],
+        estimate_bytes: int = 0,
+        pin: bool = False
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        ensure_loaded实现
+        :return: (加载结果, 是否已占用)；等待合并加载期间模型又被淘汰/卸载时重新加载，不返回未占用的成功结果
+        """
+        while True:
+            with self._lock:
+                if version in self.entries:
+                    self._touch(version, pin)
+                    return {"code": 200, "msg": f"模型版本{version}已加载", "data": self._describe(version)}, pin
+                if loader is None and version not in self._pending:
+                    return {"code": 400, "msg": f"模型版本{version}未加载，请先调用/model/quantize加载", "data": {}}, False
+                pending = self._pending.get(version)
+                is_owner = pending is None
+                if is_owner:
+                    pending = {"event": threading.Event(), "result": None}
+                    self._pending[version] = pending
+            if is_owner:
+                return self._load(version, loader, estimate_bytes, pin, pending)
+            logger.info(f"模型版本{version}正在加载，合并等待同一加载结果")
+            pending["event"].wait()
+            with self._lock:
+                if version in self.entries:
+                    self._touch(version, pin)
+                    return dict(pending["result"]), pin
+            if pending["result"].get("code") != 200:
+                return pending["result"], False
+            # 加载成功但在本请求占用前已被淘汰/空闲卸载：重新加载
+            logger.info(f"模型版本{version}加载完成后已被卸载，重新加载")
+
+    def _load(
+        self,
+        version: str,
+        loader: Callable[[], Dict[str, Any]],
+        estimate_bytes: int,
+        pin: bool,
+        pending: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """执行加载（本请求为加载发起者），结束后唤醒合并等待的请求"""
+        result = {"code": 500, "msg": f"模型版本{version}加载失败", "data": {}}
+        try:
+            with self._load_lock:
+                if not self._make_room(version, estimate_bytes):
+                    result = {
+                        "code": 503,
+                        "msg": f"内存预算不足，无法加载模型版本{version}（预算{format_bytes(self.budget_bytes)}，"
+                               f"已用{format_bytes(self.used_bytes)}，预估需要{format_bytes(estimate_bytes)}）",
+                        "data": {}
+                    }
+                    return result, False
+                rss_before = get_rss_bytes()
+                result = loader()
+                if result.get("code") == 200:
+                    # GPU权重不计入RSS，使用配置预估值
+                    rss_delta = get_rss_bytes() - rss_before
+                    device = str(result.get("data", {}).get("device", "cpu"))
+                    resident_bytes = rss_delta if rss_delta > 0 and not device.startswith("cuda") else estimate_bytes
+                    with self._lock:
+                        self.entries[version] = {
+                            "resident_bytes": resident_bytes,
+                            "last_used": time.monotonic(),
+                            "in_use": 1 if pin else 0
+                        }
+                    logger.info(f"模型版本{version}加载完成，常驻内存：{format_bytes(resident_bytes)}，"
+                                f"预算已用：{format_bytes(self.used_bytes)}/{format_bytes(self.budget_bytes)}")
+                    self._start_reaper()
+            return result, pin and result.get("code") == 200
+        finally:
+            with self._lock:
+                self._pending.pop(version, None)
+            pending["result"] = result
+            pending["event"].set()
+
+    def _make_room(self, version: str, need_bytes: int) -> bool:
+        """按LRU淘汰空闲的其他版本，直到预算可容纳need_bytes；无法腾出时返回False"""
+        if self.budget_bytes <= 0:
+            return True
+        while True:
+            with self._lock:
+                if self.used_bytes + need_bytes <= self.budget_bytes:
+                    return True
+                candidates = [
+                    (entry["last_used"], name) for name, entry in self.entries.items()
+                    if name != version and entry["in_use"] == 0
+                ]
+                if not candidates:
+                    return False
+                _, victim = min(candidates)
+            # 选出后到卸载前可能被并发请求占用，_evict在锁内复查，被占用则跳过重新选择
+            if self._evict(victim, lambda entry: entry["in_use"] == 0):
+                logger.info(f"内存预算不足，LRU淘汰模型版本{victim}以加载{version}")
+
+    def _touch(self, version: str, pin: bool = False) -> None:
+        """更新最近使用时间，pin=True时增加占用计数（调用方需持有_lock）"""
+        entry = self.entries[version]
+        entry["last_used"] = time.monotonic()
+        if pin:
+            entry["in_use"] += 1
+
+    def _unpin(self, version: str) -> None:
+        """释放一次占用"""
+        with self._lock:
+            entry = self.entries.get(version)
+            if entry is not None:
+                entry["in_use"] = max(entry["in_use"] - 1, 0)
+                entry["last_used"] = time.monotonic()
+
+    @contextmanager
+    def use(self, version: str, loader: Optional[Callable[[], Dict[str, Any]]] = None, estimate_bytes: int = 0):
+        """
+        请求使用期间占用模型（按需懒加载；占用中的模型不会被淘汰/空闲卸载）
+        :yield: 加载结果，code!=200时调用方应直接返回该结果
+        """
+        with self.lease(version, loader, estimate_bytes) as pin:
+            yield pin.result
+
+    @contextmanager
+    def lease(self, version: str, loader: Optional[Callable[[], Dict[str, Any]]] = None, estimate_bytes: int = 0):
+        """
+        同use()，产出ModelPin：生成线程在退出后仍会使用模型时调用pin.defer()，由线程结束回调pin.release()
+        :yield: ModelPin（pin.result为加载结果）
+        """
+        result, pinned = self._ensure_loaded(version, loader, estimate_bytes, pin=True)
+        pin = ModelPin(self, version, result, pinned)
+        try:
+            yield pin
+        finally:
+            if not pin.deferred:
+                pin.release()
+
+    def unload(self, version: str) -> Tuple[bool, Any]:
+        """
+        手动释放：无请求占用时移除登记并卸载（加载中的同版本先完成加载再判断）
+        :return: (是否已卸载, 卸载回调结果)，占用中为(False, None)
+        """
+        with self._load_lock:
+            with self._lock:
+                entry = self.entries.get(version)
+                if entry is not None and entry["in_use"] > 0:
+                    return False, None
+                self.entries.pop(version, None)
+            return True, self.unload_fn(version)
+
+    def _evict(self, version: str, can_evict: Callable[[Dict[str, Any]], bool]) -> bool:
+        """
+        淘汰/空闲卸载：在锁内复查条件（无占用等）并移除登记后再卸载，避免卸载刚被并发请求占用的模型
+        调用方需持有_load_lock：卸载期间同版本的重新加载排在其后，不会被本次卸载释放
+        :return: 是否已卸载
+        """
+        with self._lock:
+            entry = self.entries.get(version)
+            if entry is None or not can_evict(entry):
+                return False
+            del self.entries[version]
+        self.unload_fn(version)
+        return True
+
+    def forget(self, version: str) -> None:
+        """仅移除登记（模型已由调用方自行释放）"""
+        with self._lock:
+            self.entries.pop(version, None)
+
+    def set_resident(self, version: str, resident: bool = True) -> None:
+        """标记版本为常驻（不空闲卸载，内存预算不足时仍可被LRU淘汰）"""
+        with self._lock:
+            if resident:
+                self.resident_versions.add(version)
+            else:
+                self.resident_versions.discard(version)
+
+    def reap_idle(self, now: Optional[float] = None) -> list:
+        """
+        卸载超过空闲时间且无请求占用的模型
+        :param now: 当前单调时间（测试可注入）
+        :return: 被卸载的版本列表
+        """
+        if self.idle_unload_sec <= 0:
+            return []
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle_versions = [
+                name for name, entry in self.entries.items()
+                if entry["in_use"] == 0 and name not in self.resident_versions
+                and now - entry["last_used"] >= self.idle_unload_sec
+            ]
+        unloaded = []
+        with self._load_lock:
+            for version in idle_versions:
+                if self._evict(version, lambda entry: entry["in_use"] == 0
+                               and now - entry["last_used"] >= self.idle_unload_sec):
+                    logger.info(f"模型版本{version}空闲超过{self.idle_unload_sec}s，自动卸载")
+                    unloaded.append(version)
+        return unloaded
+
+    def _start_reaper(self) -> None:
+        """启动空闲卸载后台线程（仅启动一次）"""
+        if self.idle_unload_sec <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        def _loop():
+            while True:
+                time.sleep(self.reap_interval_sec)
+                try:
+                    self.reap_idle()
+                except Exception as e:
+                    logger.error(f"空闲模型卸载失败：{str(e)[:100]}")
+        self._reaper = threading.Thread(target=_loop, name="model-idle-reaper", daemon=True)
+        self._reaper.start()
+
+    def _describe(self, version: str) -> Dict[str, Any]:
+        entry = self.entries.get(version, {})
+        return {"version": version, "resident_bytes": entry.get("resident_bytes", 0), "in_use": entry.get("in_use", 0)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """内存管理快照（状态接口/监控使用）"""
+        with self._lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "used_bytes": self.used_bytes,
+                "models": {name: self._describe(name) for name in self.entries},
+                "loading": list(self._pending),
+                "resident": sorted(self.resident_versions)
+            }
@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+独立模型服务进程：多进程部署时唯一持有模型的进程，API/解析worker经Unix socket IPC调用
+- 解析为CPU密集型，放在多个API worker进程中按核数扩展；模型只在模型服务进程加载一份
+- 协议：multiprocessing.connection（长度前缀+pickle，authkey握手认证），请求{"method","kwargs"}，响应{"ok","result"/"error"}
+- 服务端每个连接一个线程；生成按版本槽位限制并发（各worker的请求在此汇合，超时后仍在运行的生成继续占用）
+- 各版本就绪与槽位状态（执行中/等待数、单次耗时EWMA）经generation_state提供给worker做版本路由与准入预估
+- 客户端连接池：每次调用独占一个连接，超时/断开的连接直接丢弃
+"""
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from typing import Any, Dict, Optional
+
+from config import settings
+from utils import logger
+
+# 允许远程调用的方法（AIModelRouter路由方法 + 指标/连通性检查）
+REMOTE_METHODS = (
+    "route_load_quantize", "route_generate_imitate", "route_get_status", "route_release",
+    "route_readiness", "generation_state", "metrics", "ping"
+)
+# 默认socket路径（API_WORKERS>1且未配置MODEL_SERVER_SOCKET时使用）
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "realchatter-model-server.sock")
+# 超时后额外等待（秒）：模型服务自身也按timeout返回，预留序列化/调度余量
+CALL_TIMEOUT_MARGIN = 2.0
+
+
+class ModelServerError(Exception):
+    """模型服务不可用（未启动/连接断开/调用超时/服务端异常）"""
+
+
+def _authkey() -> bytes:
+    """IPC握手密钥（与API鉴权密钥一致，避免本机其他进程冒充）"""
+    return settings.API_AUTH_KEY.encode("utf-8")
+
+
+class _GenerationSlots:
+    """模型服务单版本生成槽位（线程安全）：限制并发，记录执行中/等待数与单次耗时EWMA"""
+
+    def __init__(self, max_concurrency: int = 1, initial_service_sec: float = 3.0, ewma_alpha: float = 0.2):
+        self.max_concurrency = max(1, max_concurrency)
+        self.service_sec = initial_service_sec
+        self.ewma_alpha = ewma_alpha
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float) -> bool:
+        """等待空闲槽位，超时返回False"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.max_concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, start_time: float) -> None:
+        """释放槽位并按实际占用时长更新耗时EWMA"""
+        with self._cond:
+            elapsed = time.monotonic() - start_time
+            self.service_sec = (1 - self.ewma_alpha) * self.service_sec + self.ewma_alpha * elapsed
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"in_flight": self.in_flight, "waiting": self.waiting,
+                    "max_concurrency": self.max_concurrency, "service_sec": round(self.service_sec, 3)}
+
+
+class _SlotLease:
+    """模型服务生成槽位租约（接口同SlotLease）：defer()后退出with不释放，由生成线程结束回调释放"""
+
+    def __init__(self, slots: _GenerationSlots):
+        self._slots = slots
+        self._lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.deferred = False
+        self.released = False
+
+    def defer(self) -> None:
+        self.deferred = True
+
+    def release(self) -> None:
+        """释放槽位（幂等，线程安全）"""
+        with self._lock:
+            if self.released:
+                return
+            self.released = True
+        self._slots.release(self.start_time)
+
+    release_threadsafe = release
+
+
+class ModelServer:
+    """模型服务端（运行在模型服务进程中）"""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        """
+        :param address: Unix socket路径
+        :param authkey: 握手密钥，默认取API鉴权密钥
+        """
+        self.address = address
+        self.authkey = authkey or _authkey()
+        self.listener: Optional[Listener] = None
+        self._slots: Dict[str, _GenerationSlots] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """创建监听socket（残留socket文件先删除，权限仅限当前用户）"""
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        logger.info(f"模型服务已启动：{self.address}，PID：{os.getpid()}")
+
+    def serve_forever(self) -> None:
+        """接受连接，每个连接一个处理线程"""
+        if self.listener is None:
+            self.start()
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                logger.warning("模型服务连接认证失败，已拒绝")
+                continue
+            except OSError:
+                # 监听socket已关闭（close()）
+                return
+            threading.Thread(target=self._handle_connection, args=(conn,), name="model-server-conn", daemon=True).start()
+
+    def close(self) -> None:
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def _handle_connection(self, conn) -> None:
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                response = self._dispatch(request)
+                try:
+                    conn.send(response)
+                except OSError:
+                    # 客户端已超时断开，结果丢弃
+                    return
+
+    def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        from core.ai_service.router import AIModelRouter
+        method = request.get("method")
+        kwargs = request.get("kwargs") or {}
+        if method not in REMOTE_METHODS:
+            return {"ok": False, "error": f"不支持的模型服务方法：{method}"}
+        try:
+            if method == "ping":
+                result = {"pid": os.getpid()}
+            elif method == "metrics":
+                from utils.metrics_util import metrics_registry
+                # 仅导出模型服务实际产生的指标（进程级指标由各进程自行导出）
+                names = [name for name in metrics_registry.populated_names() if not name.startswith("process_")]
+                result = {"names": names, "text": metrics_registry.render(include=names)}
+            elif method == "generation_state":
+                result = self.generation_state()
+            elif method == "route_generate_imitate":
+                result = self._generate(AIModelRouter, **kwargs)
+            else:
+                result = getattr(AIModelRouter, method)(**kwargs)
+            return {"ok": True, "result": result}
+        except Exception as e:
+            logger.error(f"模型服务调用{method}失败：{str(e)[:200]}")
+            return {"ok": False, "error": str(e)[:200]}
+
+    def _get_slots(self, version: str) -> _GenerationSlots:
+        """版本生成槽位（按模型配置懒创建）"""
+        from core.ai_service.router import MODEL_CONFIGS
+        with self._lock:
+            slots = self._slots.get(version)
+            if slots is None:
+                model_config = MODEL_CONFIGS.get(version) or {}
+                slots = _GenerationSlots(model_config.get("max_concurrency", 1),
+                                         model_config.get("expected_generate_sec", 3.0))
+                self._slots[version] = slots
+            return slots
+
+    @contextmanager
+    def generation_slot(self, version: str, timeout: float):
+        """
+        获取版本生成并发槽位（with ... as lease），各worker的请求与启动预热共享max_concurrency
+        :param version: 模型版本
+        :param timeout: 等待槽位超时（秒）
+        :raise QueueRejectedError: 等待超时（503）
+        """
+        from core.ai_service.inference_queue import QueueRejectedError
+        slots = self._get_slots(version)
+        if not slots.acquire(timeout):
+            raise QueueRejectedError(503, f"模型版本{version}繁忙，模型服务排队超时（{timeout}s）", max(1, round(timeout)))
+        lease = _SlotLease(slots)
+        try:
+            yield lease
+        finally:
+            if not lease.deferred:
+                lease.release()
+
+    def generation_state(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各已配置版本的就绪与生成槽位状态（worker据此判断降级目标、预估排队）
+        :return: {版本: {"ready", "in_flight", "waiting", "max_concurrency", "service_sec"}}
+        """
+        from core.ai_service.router import AIModelRouter, MODEL_CONFIGS, MODEL_CLASSES
+        return {
+            version: {"ready": AIModelRouter.is_version_ready(version), **self._get_slots(version).snapshot()}
+            for version, model_config in list(MODEL_CONFIGS.items())
+            if model_config and MODEL_CLASSES.get(version) is not None
+        }
+
+    def _generate(self, router, version: str = "free", **kwargs) -> Dict[str, Any]:
+        """生成：按版本max_concurrency限制并发，等待时间从剩余超时中扣除"""
+        from core.ai_service.inference_queue import QueueRejectedError
+        from core.ai_service.router import MODEL_CONFIGS
+        timeout = kwargs.get("timeout") or (MODEL_CONFIGS.get(version) or {}).get("timeout", 60.0)
+        start = time.monotonic()
+        try:
+            with self.generation_slot(version, timeout) as lease:
+                kwargs["timeout"] = max(timeout - (time.monotonic() - start), 0.1)
+                # 超时返回但生成线程仍在运行时，并发槽位保留到线程结束（由线程结束回调释放）
+                result = router.route_generate_imitate(version=version, on_worker_done=lease.release_threadsafe,
+                                                       **kwargs)
+                if (result.get("data") or {}).get("worker_running"):
+                    lease.defer()
+                return result
+        except QueueRejectedError as e:
+            return {"code": e.status_code, "msg": e.msg, "data": {}}
+
+
+class ModelServerClient:
+    """模型服务客户端（运行在API worker进程中，线程安全）"""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, pool_size: int = 8):
+        """
+        :param address: Unix socket路径
+        :param authkey: 握手密钥，默认取API鉴权密钥
+        :param pool_size: 空闲连接池上限
+        """
+        self.address = address
+        self.authkey = authkey or _authkey()
+        self._pool: "queue.LifoQueue" = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except (OSError, AuthenticationError) as e:
+            raise ModelServerError(f"无法连接模型服务{self.address}：{e}")
+
+    def _release(self, conn) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def call(self, method: str, timeout: Optional[float] = None, /, **kwargs) -> Any:
+        """
+        调用模型服务方法
+        :param method: 方法名（REMOTE_METHODS之一）
+        :param timeout: 等待响应超时（秒），None=一直等待；仅限位置参数，方法参数中的timeout（业务超时）原样转发
+        :param kwargs: 方法参数
+        :raise ModelServerError: 连接失败/超时/服务端异常
+        """
+        conn = self._acquire()
+        try:
+            conn.send({"method": method, "kwargs": kwargs})
+            if not conn.poll(timeout):
+                conn.close()  # 迟到的响应属于本次调用，连接不可复用
+                raise ModelServerError(f"模型服务调用{method}超时（{timeout}s）")
+            response = conn.recv()
+        except (EOFError, OSError) as e:
+            conn.close()
+            raise ModelServerError(f"模型服务连接断开：{e}")
+        except BaseException:
+            # 序列化失败/中断等：连接上可能残留半条请求或未读响应，不再复用
+            conn.close()
+            raise
+        self._release(conn)
+        if not response.get("ok"):
+            raise ModelServerError(response.get("error") or "模型服务未知错误")
+        return response["result"]
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# 本进程是否为模型服务进程（是则路由器直接使用本地模型，不再转发）
+_serving_locally = False
+_client: Optional[ModelServerClient] = None
+_client_lock = threading.Lock()
+
+
+def get_model_server_client() -> Optional[ModelServerClient]:
+    """获取模型服务客户端：未配置MODEL_SERVER_SOCKET或本进程即模型服务时返回None（本地执行）"""
+    global _client
+    if _serving_locally or not settings.MODEL_SERVER_SOCKET:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelServerClient(settings.MODEL_SERVER_SOCKET, pool_size=settings.MODEL_SERVER_POOL_SIZE)
+    return _client
+
+
+def remote_call_timeout(timeout: Optional[float]) -> Optional[float]:
+    """远程调用等待时间：业务超时 + 余量"""
+    return None if timeout is None else timeout + CALL_TIMEOUT_MARGIN
+
+
+def wait_for_model_server(address: str, timeout: float, process=None, authkey: Optional[bytes] = None) -> None:
+    """
+    等待模型服务可接受连接（ping成功），多进程模式在启动API worker前调用
+    :param address: Unix socket路径
+    :param timeout: 最长等待（秒）
+    :param process: 模型服务进程（已退出时立即失败）
+    :param authkey: 握手密钥，默认取API鉴权密钥
+    :raise ModelServerError: 超时/模型服务进程已退出
+    """
+    client = ModelServerClient(address, authkey=authkey)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                client.call("ping", 1.0)
+                return
+            except ModelServerError as e:
+                if process is not None and not process.is_alive():
+                    raise ModelServerError(f"模型服务进程已退出（退出码{process.exitcode}）")
+                if time.monotonic() >= deadline:
+                    raise ModelServerError(f"模型服务{timeout}s内未就绪：{e}")
+                time.sleep(0.1)
+    finally:
+        client.close()
+
+
+def run_model_server(address: Optional[str] = None) -> None:
+    """
+    模型服务进程入口：按需启动加载/预热，然后阻塞提供服务
+    :param address: Unix socket路径，默认settings.MODEL_SERVER_SOCKET或DEFAULT_SOCKET_PATH
+    """
+    global _serving_locally
+    _serving_locally = True
+    server = ModelServer(address or settings.MODEL_SERVER_SOCKET or DEFAULT_SOCKET_PATH)
+    server.start()
+    if settings.MODEL_LOAD_ON_STARTUP:
+        from core.ai_service.warmup import start_background_warmup
+        # 预热与各worker的生成请求共享模型服务并发槽位
+        start_background_warmup(slot=server.generation_slot)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    run_model_server()
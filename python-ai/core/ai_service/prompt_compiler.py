@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt编译器：模板静态片段按分词器预分词并缓存，请求时只对动态部分（上下文/问题）分词
+- 静态片段（系统指令、ChatML标记、要求说明）每个分词器只分词一次
+- 上下文压缩：去除多余空白/时间戳，合并同一发送人的连续消息为一个紧凑轮次
+- 拼接缓存token片段+动态token得到input_ids，并估算相对旧版缩进Prompt节省的token数
+"""
+import re
+import time
+import threading
+import weakref
+from collections import Counter
+from string import Formatter
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+
+# 连续空白（含全角空格）统一压缩为单个空格
+_WHITESPACE_PATTERN = re.compile(r"[ \t\r\f\v　]+")
+# 上下文单行格式：可选时间戳前缀 + 发送人 + 冒号 + 内容（如「【2025-02-03 10:00】张三：你好」），「://」不视为发送人分隔
+_CONTEXT_LINE_PATTERN = re.compile(r"^(【[^】]*】|\[[^\]]*\])?\s*([^：:【\[\s][^：:]{0,31})[：:](?!//)\s*(.*)$")
+
+
+def split_context_lines(context: str, senders: Optional[Iterable[str]] = None) -> List[Tuple[str, str]]:
+    """
+    将上下文字符串拆分为(发送人, 内容)列表，无法识别发送人的行发送人为空字符串
+    「xxx：」前缀只在发送人已知时才视为发言（避免「注意：」「备注：」等正文被拆成新发言）：
+    已知发送人 = senders + 带时间戳行的发送人；上下文没有时间戳时，再加上作为行首出现至少2次的前缀
+    :param context: Go服务传入的聊天上下文
+    :param senders: 调用方已知的发送人（如目标发送人）
+    :return: [(sender, content), ...]
+    """
+    parsed = []
+    for line in (context or "").splitlines():
+        line = _WHITESPACE_PATTERN.sub(" ", line).strip()
+        if not line:
+            continue
+        match = _CONTEXT_LINE_PATTERN.match(line)
+        if match and match.group(3).strip():
+            parsed.append((line, match.group(2).strip(), match.group(3).strip(), bool(match.group(1))))
+        else:
+            parsed.append((line, "", line, False))
+
+    known = {sender for sender in senders or () if sender}
+    timestamped = {sender for _, sender, _, has_time in parsed if has_time}
+    if timestamped:
+        known |= timestamped
+    else:
+        counts = Counter(sender for _, sender, _, _ in parsed if sender)
+        known |= {sender for sender, count in counts.items() if count >= 2}
+    return [(sender, content) if sender in known else ("", line) for line, sender, content, _ in parsed]
+
+
+def merge_turns(turns: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    合并同一发送人的连续消息为一个轮次（无发送人的行并入上一轮）
+    :param turns: [(sender, content), ...]
+    :return: 合并后的轮次列表
+    """
+    merged: List[List[str]] = []
+    for sender, content in turns:
+        if merged and (not sender or merged[-1][0] == sender):
+            merged[-1][1] = f"{merged[-1][1]} {content}"
+        else:
+            merged.append([sender, content])
+    return [(sender, content) for sender, content in merged]
+
+
+def compact_context(context: str, senders: Optional[Iterable[str]] = None) -> str:
+    """
+    上下文压缩：去空白/时间戳，合并同一发送人的连续消息
+    :param context: 原始上下文字符串
+    :param senders: 调用方已知的发送人（见split_context_lines）
+    :return: 紧凑上下文，每轮一行「发送人：内容1 内容2」
+    """
+    merged = merge_turns(split_context_lines(context, senders))
+    return "\n".join(f"{sender}：{content}" if sender else content for sender, content in merged)
+
+
+def format_records_context(records: List[Dict[str, Any]], max_chars: Optional[int] = None) -> str:
+    """
+    由解析记录构造上下文（服务端直接使用缓存的解析结果，无需Go回传整段上下文）
+    Prompt超长时本就从左截断，只拼接末尾max_chars字符内的最新记录
+    :param records: 解析记录 [{"time", "sender", "content", ...}, ...]（按时间顺序）
+    :param max_chars: 上下文最大字符数，None=不限制（至少保留最后一条）
+    :return: 每条一行「发送人：内容」
+    """
+    lines: List[str] = []
+    total = 0
+    for record in reversed(records):
+        content = _WHITESPACE_PATTERN.sub(" ", record["content"].replace("\n", " ")).strip()
+        line = f"{record['sender']}：{content}"
+        # 行间换行符计入字符数
+        if max_chars is not None and lines and total + 1 + len(line) > max_chars:
+            break
+        total += len(line) + (1 if lines else 0)
+        lines.append(line)
+    lines.reverse()
+    return "\n".join(lines)
+
+
+class PromptCompiler:
+    """Prompt编译器：静态片段预分词缓存 + 动态部分按需分词 + token级拼接"""
+
+    def __init__(self, template: str, legacy_template: Optional[str] = None, **static_fields: str):
+        """
+        :param template: 紧凑模板，动态字段用{context}/{question}占位，其余字段在static_fields中给定
+        :param legacy_template: 旧版模板（仅用于统计节省的token数，可选）
+        :param static_fields: 编译期即可确定的字段（如system指令），会直接烘焙进静态片段
+        """
+        # 切分模板：[(静态文本, 动态字段名或None), ...]
+        self.segments: List[Tuple[str, Optional[str]]] = []
+        pending = ""
+        for literal, field_name, _, _ in Formatter().parse(template):
+            pending += literal
+            if field_name is None:
+                continue
+            if field_name in static_fields:
+                pending += static_fields[field_name]
+                continue
+            self.segments.append((pending, field_name))
+            pending = ""
+        self.segments.append((pending, None))
+        self.dynamic_fields = [name for _, name in self.segments if name]
+        self.legacy_template = legacy_template
+        self.static_fields = static_fields
+        # 分词器 → 静态片段token缓存（弱引用，分词器释放后自动清理）
+        self._token_cache: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(tokenizer, text: str) -> List[int]:
+        """分词（不自动添加特殊token，ChatML标记已在模板中显式给出）"""
+        if not text:
+            return []
+        return tokenizer.encode(text, add_special_tokens=False)
+
+    def _get_static_tokens(self, tokenizer) -> Dict[str, Any]:
+        """获取静态片段token（每个分词器只计算一次）"""
+        cached = self._token_cache.get(tokenizer)
+        if cached is not None:
+            return cached
+        with self._lock:
+            cached = self._token_cache.get(tokenizer)
+            if cached is None:
+                static_ids = [self._encode(tokenizer, text) for text, _ in self.segments]
+                legacy_static_len = 0
+                if self.legacy_template:
+                    empty_fields = {name: "" for name in self.dynamic_fields}
+                    legacy_text = self.legacy_template.format(**self.static_fields, **empty_fields)
+                    legacy_static_len = len(self._encode(tokenizer, legacy_text))
+                cached = {
+                    "static_ids": static_ids,
+                    "static_len": sum(len(ids) for ids in static_ids),
+                    "legacy_static_len": legacy_static_len,
+                }
+                self._token_cache[tokenizer] = cached
+        return cached
+
+    def compile(self, tokenizer, max_length: Optional[int] = None, senders: Optional[Iterable[str]] = None,
+                **dynamic_values: str) -> Dict[str, Any]:
+        """
+        编译Prompt：静态token缓存 + 动态字段分词，超长时从左截断上下文（保留最新聊天）
+        :param tokenizer: 模型分词器（需支持encode，截断时还需decode）
+        :param max_length: Prompt最大token数，None=不限制
+        :param senders: 已知发送人（上下文压缩识别发言用，见split_context_lines）
+        :param dynamic_values: 动态字段取值，context会先做compact_context压缩
+        :return: {"input_ids", "prompt"（与input_ids一致，含截断）, "prompt_tokens",
+                  "saved_tokens"（估算值）, "truncated_tokens", "tokenize_ms"}
+        """
+        start_time = time.perf_counter()
+        static = self._get_static_tokens(tokenizer)
+        raw_values = {name: dynamic_values.get(name) or "" for name in self.dynamic_fields}
+        values = dict(raw_values)
+        if "context" in values:
+            values["context"] = compact_context(values["context"], senders)
+        for name, value in values.items():
+            if name != "context":
+                values[name] = _WHITESPACE_PATTERN.sub(" ", value).strip()
+        dynamic_ids = {name: self._encode(tokenizer, value) for name, value in values.items()}
+        compacted = dict(values)
+        dynamic_lens = {name: len(ids) for name, ids in dynamic_ids.items()}
+
+        # 超长截断：先截上下文左侧，仍超长再截其余动态字段左侧
+        truncated_tokens = 0
+        if max_length:
+            overflow = static["static_len"] + sum(len(ids) for ids in dynamic_ids.values()) - max_length
+            for name in sorted(dynamic_ids, key=lambda n: n != "context"):
+                if overflow <= 0:
+                    break
+                cut = min(overflow, len(dynamic_ids[name]))
+                dynamic_ids[name] = dynamic_ids[name][cut:]
+                # prompt文本与截断后的input_ids保持一致（仅截断时解码）
+                values[name] = tokenizer.decode(dynamic_ids[name]) if dynamic_ids[name] else ""
+                overflow -= cut
+                truncated_tokens += cut
+
+        input_ids: List[int] = []
+        prompt_parts: List[str] = []
+        for (text, name), ids in zip(self.segments, static["static_ids"]):
+            input_ids.extend(ids)
+            prompt_parts.append(text)
+            if name:
+                input_ids.extend(dynamic_ids[name])
+                prompt_parts.append(values[name])
+
+        # 节省的token数：静态部分（精确，缓存）+ 压缩部分按压缩后每字符token数估算（不再对原文重复分词）
+        saved_tokens = 0
+        if static["legacy_static_len"]:
+            saved_tokens += static["legacy_static_len"] - static["static_len"]
+        for name, value in raw_values.items():
+            removed_chars = len(value) - len(compacted[name])
+            if removed_chars > 0:
+                saved_tokens += round(removed_chars * dynamic_lens[name] / max(len(compacted[name]), 1))
+
+        return {
+            "input_ids": input_ids,
+            "prompt": "".join(prompt_parts),
+            "prompt_tokens": len(input_ids),
+            "saved_tokens": max(saved_tokens, 0),
+            "truncated_tokens": truncated_tokens,
+            "tokenize_ms": round((time.perf_counter() - start_time) * 1000, 3),
+        }
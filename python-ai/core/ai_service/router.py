@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
 """AI版本路由器：分发免费/付费/高级请求到对应模型，解耦接口与模型实现"""
-from typing import Dict, Optional, Any, Type
+import importlib
+import math
+import threading
+import time
+from typing import Dict, Optional, Any, Type, Union
+from config import settings
 from utils import logger
-from ai_model.free.model import FreeAIModel
-# from ai_model.pro.model import ProAIModel
+from utils.sys_util import parse_memory_size
 from ai_model.free.config import free_model_config
+from ai_model.stub.config import stub_model_config
 # from ai_model.pro.config import pro_model_config
 from core.ai_service.base import BaseAIModel
+from core.ai_service.model_manager import ModelMemoryManager
+from core.ai_service.model_server import get_model_server_client, remote_call_timeout, ModelServerError
+from core.ai_service.inference_queue import get_inference_queue, PRIORITY_LEVELS
+from core.metrics import GENERATE_IN_FLIGHT, GENERATE_RESULTS, GENERATE_TOTAL_MS, GENERATE_ROUTED
 
 # 模型实例注册表（单例模式，避免重复加载模型）
 MODEL_INSTANCES: Dict[str, BaseAIModel] = {
@@ -22,13 +31,115 @@ MODEL_CONFIGS: Dict[str, Dict] = {
     "advanced": {}  # 高级版配置（预留）
 }
 
-# 模型类注册表
-MODEL_CLASSES: Dict[str, Type[BaseAIModel]] = {
-    "free": FreeAIModel,
-    "pro": None,
+# 实例创建锁（get_model_instance双重检查）
+_instance_lock = threading.Lock()
+
+# 模型类注册表：值为「模块路径:类名」，首次实例化时才导入（模型模块会间接引入torch/transformers，
+# 仅解析/健康检查的进程不承担其导入耗时与内存）；也可直接注册类对象
+MODEL_CLASSES: Dict[str, Union[str, Type[BaseAIModel], None]] = {
+    "free": "ai_model.free.model:FreeAIModel",
+    "pro": None,  # "ai_model.pro.model:ProAIModel"
     "advanced": None  # 高级版类（预留）
 }
 
+# 桩模型（压测用）：MODEL_STUB_VERSIONS中的版本改由确定性桩模型提供，路由/排队/序列化链路不变
+for _stub_version in settings.MODEL_STUB_VERSIONS:
+    MODEL_CLASSES[_stub_version] = "ai_model.stub.model:StubAIModel"
+    MODEL_CONFIGS[_stub_version] = {**stub_model_config, "version": _stub_version}
+
+
+def resolve_model_class(version: str) -> Optional[Type[BaseAIModel]]:
+    """
+    解析版本对应的模型类（字符串路径按需导入，导入后回写注册表）
+    :param version: 模型版本
+    :return: 模型类/None（未配置）
+    :raise ImportError/AttributeError: 路径无效
+    """
+    model_cls = MODEL_CLASSES.get(version)
+    if isinstance(model_cls, str):
+        module_path, _, class_name = model_cls.partition(":")
+        model_cls = getattr(importlib.import_module(module_path), class_name)
+        MODEL_CLASSES[version] = model_cls
+    return model_cls
+
+
+def _unload_version(version: str) -> Dict[str, Any]:
+    """内存管理器卸载回调：释放模型资源并置空实例（下次使用重新初始化/懒加载）"""
+    model = MODEL_INSTANCES.get(version)
+    if model is None:
+        return {"code": 200, "msg": f"模型版本{version}未实例化，无需释放"}
+    result = model.release()
+    MODEL_INSTANCES[version] = None
+    return result
+
+
+# 模型内存管理器（全局内存预算、懒加载、空闲卸载、LRU淘汰）
+model_manager = ModelMemoryManager(
+    budget_bytes=parse_memory_size(settings.MODEL_MEMORY_BUDGET),
+    unload_fn=_unload_version,
+    idle_unload_sec=settings.MODEL_IDLE_UNLOAD_SEC,
+    reap_interval_sec=settings.MODEL_IDLE_CHECK_SEC
+)
+
+
+def _call_model_server(method: str, call_timeout: Optional[float] = None, **kwargs) -> Optional[Dict[str, Any]]:
+    """
+    多进程模式（配置MODEL_SERVER_SOCKET）：转发到独占模型的模型服务进程
+    :param method: 模型服务方法名
+    :param call_timeout: 业务超时（秒），实际等待再加余量
+    :return: 模型服务返回结果；未启用多进程模式返回None（调用方本地执行）
+    """
+    client = get_model_server_client()
+    if client is None:
+        return None
+    try:
+        return client.call(method, remote_call_timeout(call_timeout), **kwargs)
+    except ModelServerError as e:
+        logger.error(f"模型服务调用{method}失败：{str(e)[:200]}")
+        return {"code": 503, "msg": f"模型服务不可用：{str(e)[:100]}", "data": {}}
+
+
+# 模型服务就绪/槽位状态缓存（多进程模式：每个请求的路由与准入都要读取，短时缓存避免每次IPC往返）
+_SERVER_STATE: Dict[str, Any] = {"expires": 0.0, "state": {}}
+_server_state_lock = threading.Lock()
+
+
+def _model_server_state(version: str) -> Optional[Dict[str, Any]]:
+    """
+    多进程模式下模型服务中该版本的就绪与生成槽位状态（缓存MODEL_SERVER_STATE_TTL秒）
+    :return: {"ready", "in_flight", "waiting", "max_concurrency", "service_sec"}；
+             本地模式返回None，模型服务不可用/版本未配置返回{}
+    """
+    client = get_model_server_client()
+    if client is None:
+        return None
+    with _server_state_lock:
+        if time.monotonic() >= _SERVER_STATE["expires"]:
+            try:
+                state = client.call("generation_state", settings.MODEL_SERVER_STATE_TIMEOUT)
+            except ModelServerError as e:
+                logger.warning(f"查询模型服务状态失败：{str(e)[:200]}")
+                state = {}
+            _SERVER_STATE.update(state=state, expires=time.monotonic() + settings.MODEL_SERVER_STATE_TTL)
+        return _SERVER_STATE["state"].get(version) or {}
+
+
+def _server_wait_sec(state: Dict[str, Any]) -> float:
+    """按模型服务槽位状态预估新请求的排队耗时（秒）：排在前面的请求数 / 并发数 × 单次耗时"""
+    if not state:
+        return 0.0
+    max_concurrency = max(1, state["max_concurrency"])
+    ahead = state["waiting"] + state["in_flight"] - max_concurrency
+    if ahead < 0:
+        return 0.0
+    return (ahead // max_concurrency + 1) * state["service_sec"]
+
+
+def _round_estimates(estimates: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """预计耗时取整（inf输出为None，保证响应可JSON序列化）"""
+    return {name: None if math.isinf(value) else round(value, 1) for name, value in estimates.items()}
+
+
 class AIModelRouter:
     """AI模型路由器"""
     @staticmethod
@@ -41,16 +152,21 @@ class AIModelRouter:
         if version not in MODEL_INSTANCES:
             logger.error(f"模型版本不支持：{version}，仅支持free/pro/advanced")
             return None
-        # 单例：未实例化则创建
-        if MODEL_INSTANCES[version] is None:
-            model_cls = MODEL_CLASSES[version]
-            model_config = MODEL_CONFIGS[version]
-            if model_cls is None or not model_config:
-                logger.error(f"模型版本{version}未配置，无法实例化")
-                return None
-            MODEL_INSTANCES[version] = model_cls(model_config)
-            logger.info(f"模型版本{version}实例化成功")
-        return MODEL_INSTANCES[version]
+        # 单例：未实例化则创建（生成在线程池执行，加锁双重检查，避免并发首个请求各建一个实例、
+        # 后写入者覆盖已交给内存管理器加载的实例）
+        model = MODEL_INSTANCES[version]
+        if model is None:
+            with _instance_lock:
+                model = MODEL_INSTANCES[version]
+                if model is None:
+                    model_cls = resolve_model_class(version)
+                    model_config = MODEL_CONFIGS[version]
+                    if model_cls is None or not model_config:
+                        logger.error(f"模型版本{version}未配置，无法实例化")
+                        return None
+                    model = MODEL_INSTANCES[version] = model_cls(model_config)
+                    logger.info(f"模型版本{version}实例化成功")
+        return model
 
     @staticmethod
     def route_load_quantize(version: str = "free") -> Dict[str, Any]:
@@ -59,10 +175,103 @@ class AIModelRouter:
         :param version: 模型版本
         :return: 加载结果
         """
+        remote = _call_model_server("route_load_quantize", settings.MODEL_SERVER_LOAD_TIMEOUT, version=version)
+        if remote is not None:
+            return remote
         model = AIModelRouter.get_model_instance(version)
         if model is None:
             return {"code": 400, "msg": f"模型版本{version}无效，加载失败", "data": {}}
-        return model.load_quantize_model()
+        # 经内存管理器加载：并发加载合并、预算不足时LRU淘汰空闲版本
+        return model_manager.ensure_loaded(
+            version, model.load_quantize_model, AIModelRouter._memory_estimate(version)
+        )
+
+    @staticmethod
+    def _memory_estimate(version: str) -> int:
+        """模型常驻内存预估（字节）：优先memory_estimate，其次max_memory"""
+        model_config = MODEL_CONFIGS.get(version) or {}
+        return parse_memory_size(model_config.get("memory_estimate") or model_config.get("max_memory"))
+
+    @staticmethod
+    def is_version_ready(version: str) -> bool:
+        """
+        版本是否已加载可直接生成（降级目标只选已就绪版本，不为降级触发加载）
+        多进程模式下实例在模型服务进程中，以模型服务上报的状态为准
+        """
+        server_state = _model_server_state(version)
+        if server_state is not None:
+            return bool(server_state.get("ready"))
+        model = MODEL_INSTANCES.get(version)
+        return model is not None and model.status == BaseAIModel.STATUS_LOADED
+
+    @staticmethod
+    def estimate_latency_ms(version: str, priority: str = "interactive") -> float:
+        """
+        版本预计完成耗时（毫秒）：推理队列排队 + 单次生成耗时EWMA，未加载时再加预计加载耗时（expected_load_sec）
+        多进程模式下本worker的队列只含自身请求，取其与模型服务槽位（汇合所有worker）预估的较大值
+        队列已满/版本未配置返回inf
+        """
+        model_config = MODEL_CONFIGS.get(version)
+        if not model_config or MODEL_CLASSES.get(version) is None:
+            return math.inf
+        queue = get_inference_queue(version, model_config)
+        latency = queue.estimate_latency(PRIORITY_LEVELS.get(priority, PRIORITY_LEVELS["interactive"]))
+        server_state = _model_server_state(version)
+        if server_state:
+            latency = max(latency, _server_wait_sec(server_state) + server_state["service_sec"])
+        if not AIModelRouter.is_version_ready(version):
+            latency += model_config.get("expected_load_sec", 30.0)
+        return latency * 1000
+
+    @staticmethod
+    def route_select_version(
+        version: str = "free",
+        priority: str = "interactive",
+        latency_target_ms: Optional[float] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        延迟目标感知的版本选择：请求版本预计耗时满足目标时直接使用，否则按该版本配置的fallback_versions
+        依次选择已就绪且满足目标的版本；都不满足时选预计耗时最短的（高峰降级质量而非拒绝服务）
+        运行在事件循环中（读取推理队列状态）
+        :param version: 请求的模型版本
+        :param priority: 请求优先级
+        :param latency_target_ms: 延迟目标（毫秒），None=使用版本配置latency_slo_ms，仍为空时取请求超时
+        :param timeout: 请求超时（秒），None=使用版本配置timeout
+        :return: {"version": 实际使用版本, "requested_version", "fallback": 是否降级, "reason", "estimates": {版本: 毫秒}}
+        """
+        model_config = MODEL_CONFIGS.get(version) or {}
+        fallback_versions = [name for name in model_config.get("fallback_versions", []) if name != version]
+        target = (latency_target_ms or model_config.get("latency_slo_ms")
+                  or (timeout or model_config.get("timeout", 60.0)) * 1000)
+        requested = AIModelRouter.estimate_latency_ms(version, priority)
+        estimates = {version: requested}
+        route = {"version": version, "requested_version": version, "fallback": False, "reason": None}
+        if requested <= target or not fallback_versions:
+            return {**route, "estimates": _round_estimates(estimates)}
+
+        if not AIModelRouter.is_version_ready(version):
+            reason = "loading"
+        elif math.isinf(requested):
+            reason = "queue_full"
+        else:
+            reason = "slo"
+        candidates = [name for name in fallback_versions if AIModelRouter.is_version_ready(name)]
+        for name in candidates:
+            estimates[name] = AIModelRouter.estimate_latency_ms(name, priority)
+        chosen = next((name for name in candidates if estimates[name] <= target), None)
+        if chosen is None:
+            chosen = min([version, *candidates], key=lambda name: estimates[name])
+        if chosen != version:
+            route.update(version=chosen, fallback=True, reason=reason)
+            GENERATE_ROUTED.labels(requested=version, routed=chosen, reason=reason).inc()
+            logger.info(f"模型版本{version}预计{requested:.0f}ms（{reason}），降级到{chosen}（预计{estimates[chosen]:.0f}ms）")
+        return {**route, "estimates": _round_estimates(estimates)}
+
+    @staticmethod
+    def estimate_server_wait(version: str) -> float:
+        """多进程模式下模型服务中该版本的预计排队耗时（秒，worker准入预估使用），本地模式为0"""
+        return _server_wait_sec(_model_server_state(version) or {})
 
     @staticmethod
     def route_generate_imitate(version: str = "free", context: str = "", question: str = "", **kwargs) -> Dict[str, Any]:
@@ -71,13 +280,49 @@ class AIModelRouter:
         :param version: 模型版本
         :param context: 聊天上下文
         :param question: 生成指令
-        :param kwargs: 扩展参数
+        :param kwargs: 扩展参数；on_worker_done：生成超时返回但生成线程仍在运行时，线程结束后调用
+                       （此时结果data.worker_running=True，调用方据此推迟释放推理槽位）
         :return: 生成结果
         """
+        on_worker_done = kwargs.pop("on_worker_done", None)
+        model_config = MODEL_CONFIGS.get(version) or {}
+        timeout = kwargs.get("timeout") or model_config.get("timeout")
+        # 模型服务中未预热的模型按cold_timeout_factor放宽超时，等待同样放宽，避免模型服务仍在生成时本进程先超时
+        call_timeout = timeout * model_config.get("cold_timeout_factor", 1.0) if timeout else None
+        remote = _call_model_server(
+            "route_generate_imitate", call_timeout, version=version, context=context, question=question, **kwargs
+        )
+        if remote is not None:
+            # 回调不跨进程：模型服务自行保留并发槽位到线程结束，本进程的调用方按正常返回释放
+            if isinstance(remote.get("data"), dict):
+                remote["data"].pop("worker_running", None)
+            return remote
         model = AIModelRouter.get_model_instance(version)
         if model is None:
             return {"code": 400, "msg": f"模型版本{version}无效，生成失败", "data": {}}
-        return model.generate_imitate(context, question, **kwargs)
+        # 懒加载：首次使用时自动加载；生成期间占用模型，避免被淘汰/空闲卸载
+        loader = model.load_quantize_model if settings.MODEL_LAZY_LOAD else None
+        in_flight = GENERATE_IN_FLIGHT.labels(version=version)
+        in_flight.inc()
+        try:
+            with model_manager.lease(version, loader, AIModelRouter._memory_estimate(version)) as pin:
+                if pin.result["code"] != 200:
+                    result = pin.result
+                else:
+                    def _worker_done():
+                        pin.release()
+                        if on_worker_done is not None:
+                            on_worker_done()
+
+                    with GENERATE_TOTAL_MS.labels(version=version).time():
+                        result = model.generate_imitate(context, question, on_worker_done=_worker_done, **kwargs)
+                    # 超时返回但生成线程仍在运行：模型占用保持到线程结束，避免淘汰/空闲卸载释放生成中的模型
+                    if (result.get("data") or {}).get("worker_running"):
+                        pin.defer()
+        finally:
+            in_flight.dec()
+        GENERATE_RESULTS.labels(version=version, code=result["code"]).inc()
+        return result
 
     @staticmethod
     def route_get_status(version: str = "free") -> Dict[str, Any]:
@@ -86,10 +331,16 @@ class AIModelRouter:
         :param version: 模型版本
         :return: 状态结果
         """
+        remote = _call_model_server("route_get_status", settings.MODEL_SERVER_CALL_TIMEOUT, version=version)
+        if remote is not None:
+            return remote
         model = AIModelRouter.get_model_instance(version)
         if model is None:
             return {"code": 400, "msg": f"模型版本{version}无效，查询失败", "data": {}}
-        return model.get_status()
+        result = model.get_status()
+        if result["code"] == 200:
+            result["data"]["memory"] = model_manager.snapshot()
+        return result
 
     @staticmethod
     def route_release(version: str = "free") -> Dict[str, Any]:
@@ -98,14 +349,35 @@ class AIModelRouter:
         :param version: 模型版本
         :return: 释放结果
         """
-        model = AIModelRouter.get_model_instance(version)
-        if model is None or MODEL_INSTANCES[version] is None:
+        remote = _call_model_server("route_release", settings.MODEL_SERVER_CALL_TIMEOUT, version=version)
+        if remote is not None:
+            return remote
+        if MODEL_INSTANCES.get(version) is None:
             return {"code": 400, "msg": f"模型版本{version}未实例化，释放失败", "data": {}}
-        result = model.release()
-        # 释放后置空实例，下次调用重新初始化
-        MODEL_INSTANCES[version] = None
+        # 经内存管理器释放：有请求占用（生成中，含超时后仍在运行的生成线程）时不释放；释放后置空实例，下次调用重新初始化
+        unloaded, result = model_manager.unload(version)
+        if not unloaded:
+            in_use = model_manager.snapshot()["models"].get(version, {}).get("in_use", 0)
+            return {"code": 409, "msg": f"模型版本{version}正在使用中，请稍后释放", "data": {"in_use": in_use}}
         return result
 
+    @staticmethod
+    def route_readiness(version: Optional[str] = None) -> Dict[str, Any]:
+        """
+        路由：模型就绪状态（已加载且预热完成）
+        :param version: 模型版本，None=启动加载版本及已实例化版本
+        :return: 单版本就绪状态 / {版本: 就绪状态}
+        """
+        remote = _call_model_server("route_readiness", settings.MODEL_SERVER_CALL_TIMEOUT, version=version)
+        if remote is not None and remote.get("code") == 503:
+            # 模型服务不可达：视为未就绪
+            unavailable = {"version": version, "ready": False, "stage": "unavailable", "error": remote["msg"]}
+            return unavailable if version else {}
+        if remote is not None:
+            return remote
+        from core.ai_service.warmup import get_model_readiness, get_all_readiness
+        return get_model_readiness(version) if version else get_all_readiness()
+
     # 预留：高级AI接口路由（后续扩展）
     @staticmethod
     def route_advanced_api(version: str = "advanced", **kwargs) -> Dict[str, Any]:
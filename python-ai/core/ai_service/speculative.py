@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt查找投机解码（n-gram复制，无需草稿模型）
+- 风格模仿回复大量复用聊天上下文里已出现的短语/口头禅：用最近生成的n-gram在已有token（Prompt+已生成）中查找上一次出现位置，
+  把其后的token作为草稿，一次前向同时验证多个草稿token
+- 验证方式：逐位置用与逐token生成完全相同的logits处理（重复惩罚/最少token/温度/top-k/top-p）和真实前缀采样，
+  采样结果等于草稿token则接受并继续，否则保留该采样结果并丢弃其后的草稿；
+  每个位置的输出分布与逐token采样一致（同一随机种子下采样调用顺序也一致），生成质量不变
+- 不命中时退化为普通逐token解码（草稿为空，每次前向只验证1个位置）
+- transformers 4.32无内置prompt lookup（prompt_lookup_num_tokens为4.37+参数），此处自行实现解码循环，
+  KV缓存按模型返回的past_key_values结构裁剪（千问v1为[b, s, h, d]元组，新版Cache对象使用crop）
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class NgramIndex:
+    """
+    n-gram → 最近一次出现的结束位置（纯Python，随生成逐token追加）
+    只索引结束位置≤len-2的n-gram，保证查到的位置之后至少还有1个token可作为草稿，且当前后缀不会匹配到自身
+    """
+
+    def __init__(self, tokens: Iterable[int], max_ngram: int = 3, min_ngram: int = 1):
+        """
+        :param tokens: 初始token（Prompt）
+        :param max_ngram: 最长匹配n-gram（优先尝试，越长越可靠）
+        :param min_ngram: 最短匹配n-gram
+        """
+        self.max_ngram = max(max_ngram, 1)
+        self.min_ngram = min(max(min_ngram, 1), self.max_ngram)
+        self.tokens: List[int] = []
+        self._index: Dict[Tuple[int, ...], int] = {}
+        self._indexed = 0  # 已索引的结束位置数（结束位置 < _indexed）
+        self.append(tokens)
+
+    def append(self, tokens: Iterable[int]) -> None:
+        """追加token并索引新增的n-gram结束位置"""
+        self.tokens.extend(int(token) for token in tokens)
+        for end in range(self._indexed, len(self.tokens) - 1):
+            for n in range(self.min_ngram, min(self.max_ngram, end + 1) + 1):
+                self._index[tuple(self.tokens[end - n + 1:end + 1])] = end
+        self._indexed = max(self._indexed, len(self.tokens) - 1)
+
+    def propose(self, num_tokens: int) -> List[int]:
+        """
+        用当前末尾的n-gram（从长到短）查找上一次出现位置，返回其后最多num_tokens个token作为草稿
+        :return: 草稿token列表（未命中返回空列表）
+        """
+        if num_tokens <= 0:
+            return []
+        for n in range(min(self.max_ngram, len(self.tokens)), self.min_ngram - 1, -1):
+            end = self._index.get(tuple(self.tokens[-n:]))
+            if end is not None:
+                return self.tokens[end + 1:end + 1 + num_tokens]
+        return []
+
+
+def build_logits_processors(
+    model,
+    prompt_len: int,
+    min_new_tokens: int,
+    temperature: float,
+    top_p: float,
+    repetition_penalty: float,
+    eos_token_ids: Sequence[int]
+):
+    """
+    构造与model.generate(do_sample=True)相同顺序的logits处理器：重复惩罚 → 最少token → 温度 → top-k → top-p
+    top_k取模型generation_config（千问为0=不启用），与generate读取的默认值一致
+    """
+    from transformers import (
+        LogitsProcessorList, MinNewTokensLengthLogitsProcessor, RepetitionPenaltyLogitsProcessor,
+        TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+    )
+    processors = LogitsProcessorList()
+    if repetition_penalty and repetition_penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(penalty=repetition_penalty))
+    if min_new_tokens and eos_token_ids:
+        processors.append(MinNewTokensLengthLogitsProcessor(prompt_len, min_new_tokens, list(eos_token_ids)))
+    if temperature > 0:
+        if temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(temperature))
+        generation_config = getattr(model, "generation_config", None)
+        top_k = getattr(generation_config, "top_k", None)
+        if top_k:
+            processors.append(TopKLogitsWarper(top_k=top_k))
+        if top_p is not None and top_p < 1.0:
+            processors.append(TopPLogitsWarper(top_p=top_p))
+    return processors
+
+
+def _seq_dim(before, after) -> int:
+    """比较一次前向前后的缓存张量形状，确定序列维（兼容[b, s, h, d]与[b, h, s, d]布局）"""
+    for dim, (old, new) in enumerate(zip(before, after)):
+        if old != new:
+            return dim
+    raise ValueError("无法确定KV缓存序列维")
+
+
+def _first_tensor(past):
+    while isinstance(past, (tuple, list)):
+        past = past[0]
+    return past
+
+
+def _crop_past(past, length: int, seq_dim: int):
+    """把KV缓存裁剪到前length个位置（丢弃未被接受的草稿token）"""
+    if hasattr(past, "crop"):
+        past.crop(length)
+        return past
+    if isinstance(past, (tuple, list)):
+        return type(past)(_crop_past(item, length, seq_dim) for item in past)
+    if hasattr(past, "narrow") and past.dim() > seq_dim and past.shape[seq_dim] > length:
+        return past.narrow(seq_dim, 0, length)
+    return past
+
+
+def prompt_lookup_generate(
+    model,
+    input_ids,
+    attention_mask=None,
+    max_new_tokens: int = 64,
+    min_new_tokens: int = 0,
+    temperature: float = 0.7,
+    top_p: float = 0.95,
+    repetition_penalty: float = 1.0,
+    eos_token_ids: Sequence[int] = (),
+    stopping_criteria: Optional[Sequence] = None,
+    num_draft_tokens: int = 8,
+    max_ngram: int = 3,
+    min_ngram: int = 1
+):
+    """
+    Prompt查找投机解码（仅支持batch=1，与服务的单条生成一致）
+    :param model: 因果语言模型（支持past_key_values多token前向）
+    :param input_ids: Prompt token，形状[1, n]
+    :param attention_mask: Prompt注意力掩码（None=全1）
+    :param max_new_tokens: 最多生成token数
+    :param min_new_tokens: 最少生成token数（未达到前屏蔽eos）
+    :param temperature: 采样温度，<=0为贪心解码
+    :param top_p: nucleus采样阈值
+    :param repetition_penalty: 重复惩罚
+    :param eos_token_ids: 结束token id（生成后即停止）
+    :param stopping_criteria: 停止条件列表（transformers StoppingCriteria调用协议），每接受一个token检查一次
+    :param num_draft_tokens: 每次前向最多验证的草稿token数，0=不投机（普通逐token解码，基准对照用）
+    :param max_ngram: 最长匹配n-gram
+    :param min_ngram: 最短匹配n-gram
+    :return: (输出token[1, n+生成数], {"drafted", "accepted", "forward_passes", "new_tokens"})
+    """
+    import torch
+
+    if input_ids.shape[0] != 1:
+        raise ValueError("Prompt查找投机解码仅支持batch=1")
+    prompt_len = input_ids.shape[-1]
+    eos_token_ids = {int(token_id) for token_id in eos_token_ids if token_id is not None}
+    stopping_criteria = list(stopping_criteria or [])
+    processors = build_logits_processors(model, prompt_len, min_new_tokens, temperature, top_p,
+                                         repetition_penalty, sorted(eos_token_ids))
+    if attention_mask is None:
+        attention_mask = torch.ones_like(input_ids)
+    index = NgramIndex(input_ids[0].tolist(), max_ngram=max_ngram, min_ngram=min_ngram)
+    stats = {"drafted": 0, "accepted": 0, "forward_passes": 0, "new_tokens": 0}
+    sequence = input_ids
+
+    def _sample(logits) -> int:
+        scores = processors(sequence, logits)
+        if temperature > 0:
+            return int(torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)[0, 0])
+        return int(torch.argmax(scores, dim=-1)[0])
+
+    def _push(token: int) -> bool:
+        """追加一个token，返回是否停止"""
+        nonlocal sequence, attention_mask
+        token_tensor = torch.tensor([[token]], dtype=sequence.dtype, device=sequence.device)
+        sequence = torch.cat([sequence, token_tensor], dim=-1)
+        attention_mask = torch.cat([attention_mask, torch.ones_like(token_tensor, dtype=attention_mask.dtype)], dim=-1)
+        index.append((token,))
+        stats["new_tokens"] += 1
+        stop = token in eos_token_ids or stats["new_tokens"] >= max_new_tokens
+        # 停止条件逐token检查（与generate一致，命中时不会多生成草稿中后续的token）
+        return any([criteria(sequence, None) for criteria in stopping_criteria]) or stop
+
+    with torch.no_grad():
+        outputs = model(input_ids=input_ids, attention_mask=attention_mask, use_cache=True)
+        stats["forward_passes"] += 1
+        past = outputs.past_key_values
+        seq_dim = None
+        stopped = max_new_tokens <= 0 or _push(_sample(outputs.logits[:, -1, :]))
+        while not stopped:
+            # 草稿数不超过剩余预算-1（验证后还会多采样1个token）
+            draft = index.propose(min(num_draft_tokens, max_new_tokens - stats["new_tokens"] - 1))
+            step_ids = torch.tensor([[index.tokens[-1], *draft]], dtype=sequence.dtype, device=sequence.device)
+            step_mask = torch.cat([attention_mask, torch.ones((1, len(draft)), dtype=attention_mask.dtype,
+                                                              device=attention_mask.device)], dim=-1)
+            before_shape = _first_tensor(past).shape if seq_dim is None and not hasattr(past, "crop") else None
+            outputs = model(input_ids=step_ids, attention_mask=step_mask, past_key_values=past, use_cache=True)
+            stats["forward_passes"] += 1
+            stats["drafted"] += len(draft)
+            past = outputs.past_key_values
+            if before_shape is not None:
+                seq_dim = _seq_dim(before_shape, _first_tensor(past).shape)
+            for position in range(len(draft) + 1):
+                token = _sample(outputs.logits[:, position, :])
+                matched = position < len(draft) and token == draft[position]
+                stats["accepted"] += matched
+                stopped = _push(token)
+                if stopped or not matched:
+                    break
+            if draft and not stopped:
+                # 缓存保留到最新采样的token之前（该token下一步作为输入），丢弃未接受草稿的位置
+                past = _crop_past(past, sequence.shape[-1] - 1, seq_dim)
+    return sequence, stats
+
+
+__all__ = ["NgramIndex", "build_logits_processors", "prompt_lookup_generate"]
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+回复形态感知的提前停止 + 自适应生成预算
+- 停止条件：生成满N个完整句子 / 出现轮次结束标记 / 换行后出现新的发送人（模型开始替别人说话）
+- 生成预算：按目标发送人在聊天记录中的实际回复长度分布（分位数）估算max_new_tokens
+"""
+import math
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.ai_service.prompt_compiler import merge_turns
+
+# 句末标点（连续标点视为同一句结尾，如「！！」「……」）
+SENTENCE_END_CHARS = "。！？!?~～…"
+_SENTENCE_PATTERN = re.compile(rf"[^{SENTENCE_END_CHARS}\n]+(?:[{SENTENCE_END_CHARS}]+|\n)")
+# 换行后出现「发送人：」视为模型开始生成下一位发送人的发言
+_NEW_SPEAKER_PATTERN = re.compile(r"\n\s*[^\n：:]{1,16}[：:]")
+# 千问ChatML轮次结束标记
+DEFAULT_STOP_STRINGS = ("<|im_end|>", "<|im_start|>", "<|endoftext|>")
+
+# 停止原因
+STOP_SENTENCES = "sentences"
+STOP_TURN_END = "turn_end"
+STOP_NEW_SPEAKER = "new_speaker"
+STOP_MAX_TOKENS = "max_tokens"
+STOP_CANCELLED = "cancelled"
+
+
+class ReplyShapeStoppingCriteria:
+    """
+    回复形态停止条件（兼容transformers StoppingCriteria调用协议：__call__(input_ids, scores) -> bool）
+    仅解码新生成部分判断，回复通常只有几十个token，逐步解码开销可忽略
+    """
+    def __init__(
+        self,
+        tokenizer,
+        prompt_len: int,
+        max_sentences: int = 2,
+        min_new_tokens: int = 0,
+        stop_strings: Sequence[str] = DEFAULT_STOP_STRINGS,
+        stop_token_ids: Iterable[int] = ()
+    ):
+        """
+        :param tokenizer: 模型分词器（用于解码新生成token）
+        :param prompt_len: Prompt token数（input_ids中此位置之后为新生成内容）
+        :param max_sentences: 最多完整句子数，<=0表示不按句子数停止
+        :param min_new_tokens: 至少生成的token数，未达到前不触发句子/换行停止
+        :param stop_strings: 轮次结束标记字符串
+        :param stop_token_ids: 轮次结束标记token id（命中即停止）
+        """
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.max_sentences = max_sentences
+        self.min_new_tokens = min_new_tokens
+        self.stop_strings = tuple(stop_strings)
+        self.stop_token_ids = set(stop_token_ids)
+        self.stop_reason = STOP_MAX_TOKENS
+        self.text = ""
+        self.cancelled = False
+        self.first_token_time: Optional[float] = None  # 首个新token产生时刻（perf_counter，用于prefill/TTFT统计）
+        self.num_generated = 0
+
+    def cancel(self) -> None:
+        """取消生成（超时后调用，生成线程在下一个token处退出，释放CPU）"""
+        self.cancelled = True
+
+    def __call__(self, input_ids, scores=None, **kwargs) -> bool:
+        if self.cancelled:
+            self.stop_reason = STOP_CANCELLED
+            return True
+        generated = input_ids[0, self.prompt_len:]
+        if generated.shape[-1] == 0:
+            return False
+        self.num_generated = generated.shape[-1]
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        if int(generated[-1]) in self.stop_token_ids:
+            self.stop_reason = STOP_TURN_END
+            return True
+        self.text = self.tokenizer.decode(generated, skip_special_tokens=False)
+        if any(stop in self.text for stop in self.stop_strings):
+            self.stop_reason = STOP_TURN_END
+            return True
+        if generated.shape[-1] < self.min_new_tokens:
+            return False
+        if _NEW_SPEAKER_PATTERN.search(self.text):
+            self.stop_reason = STOP_NEW_SPEAKER
+            return True
+        if self.max_sentences > 0 and count_sentences(self.text) >= self.max_sentences:
+            self.stop_reason = STOP_SENTENCES
+            return True
+        return False
+
+
+def count_sentences(text: str) -> int:
+    """统计已完整结束的句子数（以句末标点或换行结尾，空行不计）"""
+    return sum(1 for sentence in _SENTENCE_PATTERN.findall(text.lstrip()) if sentence.strip())
+
+
+def trim_reply(text: str, max_sentences: int = 2, stop_strings: Sequence[str] = DEFAULT_STOP_STRINGS) -> str:
+    """
+    回复后处理：截掉轮次结束标记/新发送人之后的内容，最多保留max_sentences个句子
+    :param text: 新生成的原始文本
+    :param max_sentences: 最多保留句子数，<=0表示不限制
+    :return: 裁剪后的回复
+    """
+    for stop in stop_strings:
+        text = text.split(stop, 1)[0]
+    speaker_match = _NEW_SPEAKER_PATTERN.search(text)
+    if speaker_match:
+        text = text[:speaker_match.start()]
+    text = text.strip()
+    if max_sentences > 0:
+        sentences = _SENTENCE_PATTERN.findall(text + "\n")
+        sentences = [sentence for sentence in sentences if sentence.strip()]
+        if len(sentences) > max_sentences:
+            text = "".join(sentences[:max_sentences])
+    return text.replace("\n", " ").strip()
+
+
+def estimate_reply_budget(
+    turns: List[Tuple[str, str]],
+    target_sender: Optional[str] = None,
+    percentile: float = 0.9,
+    tokens_per_char: float = 0.8,
+    margin: float = 1.5,
+    min_tokens: int = 16,
+    max_tokens: int = 512,
+    default_tokens: int = 64
+) -> Dict[str, float]:
+    """
+    按目标发送人的历史回复长度分布估算生成预算
+    :param turns: 聊天轮次[(sender, content), ...]，同一发送人的连续消息会合并为一次回复
+    :param target_sender: 目标发送人，None=统计所有发送人
+    :param percentile: 回复长度分位数（0.9=覆盖90%的历史回复）
+    :param tokens_per_char: 每字符token数估计（千问中文约0.7-0.8）
+    :param margin: 预算放大系数（预留标点/口头禅等）
+    :param min_tokens: 预算下限
+    :param max_tokens: 预算上限（模型配置的max_gen_len）
+    :param default_tokens: 无样本时的默认预算
+    :return: {"max_new_tokens": int, "samples": int, "reply_chars_p": float}
+    """
+    lengths = sorted(
+        len(content) for sender, content in merge_turns(turns)
+        if sender and (target_sender is None or sender == target_sender)
+    )
+    if not lengths:
+        return {"max_new_tokens": max(min(default_tokens, max_tokens), 1), "samples": 0, "reply_chars_p": 0.0}
+    rank = min(len(lengths) - 1, max(0, math.ceil(percentile * len(lengths)) - 1))
+    reply_chars = float(lengths[rank])
+    budget = math.ceil(reply_chars * tokens_per_char * margin)
+    return {
+        "max_new_tokens": max(min(budget, max_tokens), min(min_tokens, max_tokens)),
+        "samples": len(lengths),
+        "reply_chars_p": reply_chars
+    }
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+模型启动加载与预热：服务启动后在后台线程加载模型，并按典型Prompt长度执行预热生成
+- 预热摊销首轮开销（内核选择/编译、内存分配器扩容、KV cache首次分配），之后延迟趋于稳定
+- 就绪状态按版本记录：pending → loading → warming → ready / error，供/health/ready/model判断是否路由模仿流量
+- 预热生成逐次获取推理槽位（单进程为推理队列background优先级，多进程为模型服务并发槽位），不与线上请求争抢并发上限
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+from utils import logger
+from core.ai_service.inference_queue import get_inference_queue
+from core.ai_service.router import AIModelRouter, MODEL_CONFIGS, MODEL_INSTANCES, model_manager
+
+# 就绪阶段
+STAGE_PENDING = "pending"   # 等待启动加载
+STAGE_LOADING = "loading"   # 加载中
+STAGE_WARMING = "warming"   # 预热中
+STAGE_READY = "ready"       # 已加载且预热完成
+STAGE_ERROR = "error"       # 加载/预热失败
+
+_WARMUP_SENDERS = ("小明", "小红")
+_WARMUP_PHRASES = ("今天好累啊", "哈哈哈笑死我了", "晚上吃火锅吗？", "刚下班，在地铁上", "周末一起去爬山吧！", "好的好的", "[捂脸]")
+_WARMUP_QUESTION = "在干嘛"
+
+# 版本 → 启动加载/预热状态
+_READINESS: Dict[str, Dict[str, Any]] = {}
+_readiness_lock = threading.Lock()
+
+
+def build_warmup_context(num_chars: int) -> str:
+    """
+    构造指定长度（字符）的确定性预热上下文（「发送人：内容」多行）
+    :param num_chars: 目标字符数
+    """
+    lines, total, idx = [], 0, 0
+    while total < num_chars:
+        line = f"{_WARMUP_SENDERS[idx % 2]}：{_WARMUP_PHRASES[idx % len(_WARMUP_PHRASES)]}"
+        lines.append(line)
+        total += len(line) + 1
+        idx += 1
+    return "\n".join(lines)
+
+
+def _set_stage(version: str, stage: str, **fields) -> None:
+    with _readiness_lock:
+        state = _READINESS.setdefault(version, {"stage": STAGE_PENDING})
+        state.update(stage=stage, updated_at=time.time(), **fields)
+
+
+@contextmanager
+def _direct_slot(version: str, timeout: float):
+    """不限并发的预热槽位（无推理队列时使用，如离线工具/测试）"""
+    yield None
+
+
+def inference_queue_slot(loop: asyncio.AbstractEventLoop) -> Callable:
+    """
+    单进程模式的预热槽位：在服务事件循环中获取推理队列的background槽位（交互请求优先出队）
+    :param loop: 服务事件循环（推理队列非线程安全，进出槽位都转交到该循环执行）
+    :return: slot(version, timeout)上下文管理器工厂，产出SlotLease
+    """
+    @contextmanager
+    def _slot(version: str, timeout: float):
+        async def _enter():
+            queue_slot = get_inference_queue(version, MODEL_CONFIGS.get(version) or {}).slot(
+                priority="background", timeout=timeout
+            )
+            return queue_slot, await queue_slot.__aenter__()
+
+        queue_slot, lease = asyncio.run_coroutine_threadsafe(_enter(), loop).result()
+        try:
+            yield lease
+        finally:
+            asyncio.run_coroutine_threadsafe(queue_slot.__aexit__(None, None, None), loop).result()
+    return _slot
+
+
+def warm_up_model(version: str, context_chars: List[int], rounds: int = 1,
+                  max_new_tokens: int = 16, slot: Optional[Callable] = None) -> List[Dict[str, Any]]:
+    """
+    对已加载的模型执行预热生成（每次生成占用一个推理槽位，不计入业务指标）
+    :param version: 模型版本
+    :param context_chars: 预热上下文长度列表（字符）
+    :param rounds: 每个长度预热次数
+    :param max_new_tokens: 预热生成token数
+    :param slot: 推理槽位工厂slot(version, timeout)，默认不限并发
+    :return: 每次预热的耗时记录 [{"context_chars", "round", "code", "cost_ms"}, ...]
+    """
+    model = MODEL_INSTANCES.get(version)
+    if model is None:
+        raise RuntimeError(f"模型版本{version}未实例化，无法预热")
+    slot = slot or _direct_slot
+    timeout = (MODEL_CONFIGS.get(version) or {}).get("timeout", 60.0)
+    results = []
+    with model_manager.lease(version) as pin:
+        if pin.result["code"] != 200:
+            raise RuntimeError(pin.result["msg"])
+        for num_chars in context_chars:
+            context = build_warmup_context(num_chars)
+            for round_idx in range(rounds):
+                start = time.perf_counter()
+                with slot(version, timeout) as lease:
+                    def _worker_done(lease=lease):
+                        pin.release()
+                        if lease is not None:
+                            lease.release_threadsafe()
+
+                    result = model.generate_imitate(context, _WARMUP_QUESTION, max_gen_len=max_new_tokens,
+                                                    on_worker_done=_worker_done)
+                    # 超时返回但生成线程仍在运行：槽位与模型占用保留到线程结束（随后预热失败退出）
+                    if (result.get("data") or {}).get("worker_running"):
+                        pin.defer()
+                        if lease is not None:
+                            lease.defer()
+                cost_ms = round((time.perf_counter() - start) * 1000, 1)
+                results.append({"context_chars": num_chars, "round": round_idx + 1,
+                                "code": result["code"], "cost_ms": cost_ms})
+                logger.info("模型版本%s预热：上下文%s字符，第%s轮，耗时%sms，结果码%s",
+                            version, num_chars, round_idx + 1, cost_ms, result["code"])
+                if result["code"] != 200:
+                    raise RuntimeError(f"预热生成失败：{result['msg']}")
+    model.warmed_up = True
+    return results
+
+
+def load_and_warm_up(version: str, slot: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    加载并预热单个版本（阻塞），结果写入就绪状态
+    :param version: 模型版本
+    :param slot: 预热推理槽位工厂（见warm_up_model）
+    :return: 就绪状态
+    """
+    try:
+        _set_stage(version, STAGE_LOADING, error=None)
+        load_result = AIModelRouter.route_load_quantize(version)
+        if load_result["code"] != 200:
+            raise RuntimeError(load_result["msg"])
+        # 启动加载的版本常驻内存，避免空闲卸载后首个请求重新承担冷启动
+        model_manager.set_resident(version)
+        _set_stage(version, STAGE_WARMING)
+        start = time.perf_counter()
+        warmup = warm_up_model(
+            version,
+            settings.MODEL_WARMUP_CONTEXT_CHARS,
+            rounds=settings.MODEL_WARMUP_ROUNDS,
+            max_new_tokens=settings.MODEL_WARMUP_MAX_NEW_TOKENS,
+            slot=slot
+        )
+        _set_stage(version, STAGE_READY, warmup=warmup, warmup_sec=round(time.perf_counter() - start, 3))
+        logger.info(f"模型版本{version}启动加载与预热完成")
+    except Exception as e:
+        _set_stage(version, STAGE_ERROR, error=str(e)[:200])
+        logger.error(f"模型版本{version}启动加载/预热失败：{str(e)[:200]}")
+    return get_model_readiness(version)
+
+
+def start_background_warmup(versions: Optional[List[str]] = None, slot: Optional[Callable] = None) -> threading.Thread:
+    """
+    后台线程依次加载并预热模型（不阻塞服务启动，解析接口立即可用）
+    :param versions: 模型版本列表，默认settings.MODEL_STARTUP_VERSIONS
+    :param slot: 预热推理槽位工厂（单进程传inference_queue_slot(事件循环)，模型服务传其并发槽位）
+    """
+    versions = list(versions or settings.MODEL_STARTUP_VERSIONS)
+    for version in versions:
+        _set_stage(version, STAGE_PENDING)
+
+    def _run():
+        for version in versions:
+            load_and_warm_up(version, slot=slot)
+
+    thread = threading.Thread(target=_run, name="model-startup-warmup", daemon=True)
+    thread.start()
+    logger.info(f"模型启动加载已在后台开始：{versions}")
+    return thread
+
+
+def get_all_readiness() -> Dict[str, Dict[str, Any]]:
+    """启动加载版本及已实例化版本的就绪状态 {版本: 就绪状态}"""
+    versions = set(settings.MODEL_STARTUP_VERSIONS if settings.MODEL_LOAD_ON_STARTUP else [])
+    versions.update(version for version, model in MODEL_INSTANCES.items() if model is not None)
+    return {version: get_model_readiness(version) for version in sorted(versions)}
+
+
+def get_model_readiness(version: str) -> Dict[str, Any]:
+    """
+    模型就绪状态：已加载且已预热才视为ready（空闲卸载/淘汰后自动变为未就绪）
+    走启动加载的版本以启动阶段为准：加载中/预热中/失败均未就绪（预热中的首次生成会置warmed_up，不能据此判断）
+    :param version: 模型版本
+    :return: {"version", "ready", "stage", "loaded", "warmed_up", ...}
+    """
+    with _readiness_lock:
+        state = dict(_READINESS.get(version, {}))
+    model = MODEL_INSTANCES.get(version)
+    loaded = model is not None and model.status == model.STATUS_LOADED
+    warmed_up = bool(loaded and model.warmed_up)
+    stage = state.get("stage")
+    if stage in (None, STAGE_READY):
+        # 未走启动加载（懒加载）或启动预热完成后：按模型实际状态判断（卸载后变为未就绪）
+        stage = STAGE_READY if warmed_up else STAGE_PENDING
+    return {**state, "version": version, "ready": stage == STAGE_READY, "stage": stage,
+            "loaded": loaded, "warmed_up": warmed_up}
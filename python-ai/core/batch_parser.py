@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+批量解析：一次请求多份聊天记录（每个联系人/群一份），进程池并行解析，按完成顺序逐份返回
+- 缓存查询/写入在主进程（事件循环内）完成，仅未命中的文档提交到进程池
+- 解析为CPU密集型且解析器实例非线程安全：子进程各自持有一个解析器实例，并行度随核数扩展
+- 同一批次内内容相同的文档只解析一次
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from config import settings
+from utils import logger, global_cache, generate_content_key
+from core.chat_parser import wechat_chat_parser
+from core.metrics import PARSE_MS, PARSE_RECORDS
+from core.search_index import index_records
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def batch_parse_workers() -> int:
+    """进程池大小：PARSE_BATCH_WORKERS<0时按CPU核数（最多4），0=不使用进程池（主进程顺序解析）"""
+    if settings.PARSE_BATCH_WORKERS < 0:
+        return min(4, os.cpu_count() or 1)
+    return settings.PARSE_BATCH_WORKERS
+
+
+def get_parse_executor() -> Optional[ProcessPoolExecutor]:
+    """获取解析进程池（首次批量请求时创建，spawn：不继承父进程的日志线程等状态）"""
+    global _executor
+    workers = batch_parse_workers()
+    if workers <= 0:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"批量解析进程池已创建：{workers}个进程")
+    return _executor
+
+
+def shutdown_parse_executor() -> None:
+    """关闭解析进程池（服务退出/进程池损坏时调用）"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _parse_in_worker(content: str, format_type: str) -> Dict:
+    """子进程解析入口（子进程的解析器单例；缓存由主进程统一管理，此处不使用缓存）"""
+    return wechat_chat_parser.parse(content, format_type, use_cache=False)
+
+
+async def _parse_uncached(content: str, format_type: str) -> Dict:
+    """解析一份未命中缓存的文档：有进程池则提交到进程池，否则在事件循环内同步解析"""
+    executor = get_parse_executor()
+    if executor is None:
+        return wechat_chat_parser.parse(content, format_type, use_cache=False)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, _parse_in_worker, content, format_type)
+    except BrokenProcessPool:
+        # 子进程异常退出（如OOM被杀）：重建进程池，本份文档返回失败
+        logger.error("批量解析进程池已损坏，将在下次请求时重建")
+        shutdown_parse_executor()
+        return {"code": 500, "msg": "解析失败：解析进程异常退出", "data": {"records": [], "stats": {}}}
+
+
+async def iter_batch_parse(documents: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    批量解析，按完成顺序逐份产出结果
+    :param documents: [{"id", "content", "format_type", "use_cache"}, ...]（id可选，默认为序号）
+    :return: 异步迭代 {"index", "id", "code", "msg", "data"}，data同/ai/v1/parse
+    """
+    # 同一批次内相同内容（且格式相同）只解析一次
+    pending: Dict[tuple, asyncio.Task] = {}
+    cached: List[Dict[str, Any]] = []
+    waiters: List[asyncio.Future] = []
+
+    async def _await_shared(index: int, document: Dict[str, Any], key: Optional[str], task: asyncio.Task):
+        return index, document, key, await asyncio.shield(task)
+
+    for index, document in enumerate(documents):
+        content, format_type = document["content"], document["format_type"]
+        use_cache = document.get("use_cache", True)
+        key = generate_content_key(content)
+        cached_result = wechat_chat_parser.get_cached(key) if use_cache else None
+        if cached_result is not None:
+            cached.append(_batch_item(index, document, cached_result))
+            continue
+        task_key = (key, format_type)
+        if task_key not in pending:
+            pending[task_key] = asyncio.ensure_future(_parse_uncached(content, format_type))
+        waiters.append(asyncio.ensure_future(_await_shared(index, document, key, pending[task_key])))
+
+    try:
+        # 缓存命中的立即返回，首批结果不必等最慢的文档
+        for item in cached:
+            yield item
+        for waiter in asyncio.as_completed(waiters):
+            index, document, key, result = await waiter
+            if result["code"] == 200:
+                # 子进程解析的结果在主进程写入缓存并记录指标（子进程的指标/缓存不可见）
+                result.setdefault("data", {})["content_key"] = key
+                if document.get("use_cache", True) and key and global_cache.get(key) is None:
+                    global_cache.set(key, result)
+                    if settings.SEARCH_INDEX_ON_PARSE:
+                        index_records(key, result["data"]["records"])
+                PARSE_MS.labels(format=document["format_type"], cache="miss").observe(
+                    result["data"]["stats"]["parse_time"] * 1000
+                )
+                PARSE_RECORDS.labels(format=document["format_type"]).observe(len(result["data"]["records"]))
+            yield _batch_item(index, document, result)
+    finally:
+        # 客户端中途断开：取消尚未完成的解析
+        for waiter in waiters:
+            waiter.cancel()
+        for task in pending.values():
+            task.cancel()
+
+
+def _batch_item(index: int, document: Dict[str, Any], result: Dict) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "id": document.get("id") if document.get("id") is not None else str(index),
+        "code": result["code"],
+        "msg": result["msg"],
+        "data": result.get("data") or {},
+    }
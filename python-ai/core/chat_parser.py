@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
 """聊天记录解析核心：支持微信2种TXT格式（带时间戳/无时间戳）+ XML，正则+清洗+缓存整合"""
+import hashlib
+import logging
 import re
 import time
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Optional
+from contextlib import nullcontext
+from typing import List, Dict, Iterator, Optional
 from datetime import datetime
 
 from config import settings
-from utils import logger, global_cache, generate_content_key
+from utils import logger, log_event, global_cache, generate_content_key
+from core.metrics import PARSE_MS, PARSE_RECORDS, PARSE_CACHE_REQUESTS
+from core.search_index import index_records
+from core.parse_memory import start_parse_memory_profile
 
 class WeChatChatParser:
     """微信纯文字聊天记录解析器：兼容2种TXT格式+XML，正则解析+数据清洗+异常处理"""
@@ -41,6 +47,9 @@ class WeChatChatParser:
         self.wechat_emo_pattern = re.compile(r"\[.+?\]")
         # 新增：无意义内容过滤（单字符/纯符号，可自定义添加）
         self.nonsense_pattern = re.compile(r"^[\w\d]{1}$|^[^a-zA-Z0-9\u4e00-\u9fff]+$")
+        # 分阶段内存统计（仅parse()对大内容开启时非None，见core/parse_memory）
+        self._memory = None
+        self.memory_profile = None  # 最近一次parse()的内存统计（未统计为None），接口层据此追加响应序列化阶段
 
     def _standardize_time(self, raw_time: str) -> str:
         """
@@ -114,19 +123,19 @@ class WeChatChatParser:
         ]
         for pattern in sys_msg_patterns:
             if re.search(pattern, content):
-                logger.debug(f"过滤系统消息：{content[:30]}...")
+                logger.debug("过滤系统消息：%s...", content[:30])
                 return False
         # 保留所有正常内容（含表情[xxx]、特殊符号、短句）
         return True
 
-    def _remove_duplicates(self, records: List[Dict]) -> List[Dict]:
+    def _remove_duplicates(self, records: Iterator[Dict]) -> Iterator[Dict]:
         """
         数据去重：基于时间+发送人+内容，保留第一条出现的记录
-        :param records: 原始解析记录列表
-        :return: 去重后的记录列表
+        已见集合只保存去重键的16字节摘要（流式解析时内存不随消息长度增长）
+        :param records: 原始解析记录迭代器
+        :return: 去重后的记录迭代器
         """
         seen_keys = set()
-        unique_records = []
         for record in records:
             # 生成去重键，忽略首尾空格
             key = self.duplicate_key_template.format(
@@ -134,12 +143,12 @@ class WeChatChatParser:
                 sender=record["sender"].strip(),
                 content=record["content"].strip()
             )
-            if key not in seen_keys:
-                seen_keys.add(key)
-                unique_records.append(record)
+            digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+            if digest not in seen_keys:
+                seen_keys.add(digest)
+                yield record
             else:
-                logger.debug(f"过滤重复记录：{record['sender']} - {record['content'][:20]}...")
-        return unique_records
+                logger.debug("过滤重复记录：%s - %s...", record["sender"], record["content"][:20])
 
     def _detect_txt_format(self, txt_content: str) -> str:
         """
@@ -156,19 +165,18 @@ class WeChatChatParser:
         else:
             raise ValueError("未识别的TXT格式，非微信标准导出格式")
 
-    def _parse_txt_with_time(self, txt_content: str) -> List[Dict]:
+    def _iter_txt_with_time(self, txt_content: str) -> Iterator[Dict]:
         """
-        解析带时间戳的微信TXT格式（原有格式）
+        解析带时间戳的微信TXT格式（原有格式），逐条产出
         :param txt_content: TXT原始内容字符串
-        :return: 原始解析记录列表（未清洗）
+        :return: 原始解析记录迭代器（未清洗），total_raw随产出累加
         """
-        records = []
-        matches = self.txt_pattern_with_time.findall(txt_content)
-        self.parse_stats["format_type"] = "txt_with_time"  # 先标记格式，后赋值总数
+        self.parse_stats["format_type"] = "txt_with_time"  # 先标记格式，后累计总数
 
+        matches = self._stage_iter("tokenize", self.txt_pattern_with_time.finditer(txt_content))
         for idx, match in enumerate(matches):
             try:
-                raw_time, _, sender, content = match
+                raw_time, _, sender, content = match.groups()
                 # 基础清洗
                 sender = sender.strip()
                 content = content.strip().replace("\n", " ").replace("\r", "")
@@ -178,36 +186,31 @@ class WeChatChatParser:
                 if not sender.strip() or not content.strip():
                     continue
                 # 构造原始记录
-                records.append({
+                record = {
                     "time": std_time,
                     "sender": sender,
                     "content": content,
                     "format": "txt",
                     "is_valid": True
-                })
+                }
             except Exception as e:
                 logger.error(f"TXT带时间戳解析单条记录失败（索引{idx}）：{str(e)[:50]}，跳过该记录")
                 continue
-        # 关键：total_raw取过滤后的实际记录数，而非初始matches数
-        self.parse_stats["total_raw"] = len(records)
-        logger.info(f"TXT带时间戳格式解析：匹配到{self.parse_stats['total_raw']}条原始记录")
-        return records
+            # 关键：total_raw取过滤后的实际记录数，而非初始matches数
+            self.parse_stats["total_raw"] += 1
+            yield record
 
-    def _parse_txt_no_time(self, txt_content: str) -> List[Dict]:
+    def _iter_txt_no_time(self, txt_content: str) -> Iterator[Dict]:
         """
-        解析无时间戳的微信极简格式（你提供的格式）
+        解析无时间戳的微信极简格式（你提供的格式），逐条产出
         :param txt_content: TXT原始内容字符串
-        :return: 原始解析记录列表（未清洗）
+        :return: 原始解析记录迭代器（未清洗），total_raw随产出累加
         """
-        records = []
-        # 先清洗内容：移除多余空行、首尾空格（避免正则匹配异常）
-        clean_txt = re.sub(r"\n{3,}", "\n\n", txt_content).strip()
-        matches = self.txt_pattern_no_time.findall(clean_txt)
         self.parse_stats["format_type"] = "txt_no_time"
 
-        for idx, match in enumerate(matches):
+        for idx, match in enumerate(self._stage_iter("tokenize", self._iter_no_time_matches(txt_content))):
             try:
-                sender, content = match
+                sender, content = match.groups()
                 # 深度清洗：移除换行、多余空格、全角空格
                 sender = sender.strip().replace("\n", "").replace(" ", "").replace("　", "")
                 content = content.strip().replace("\n", " ").replace("\r", "").replace("　", " ")
@@ -220,50 +223,50 @@ class WeChatChatParser:
                 if not content.strip():
                     continue
                 # 构造原始记录（数据结构与带时间戳格式完全统一）
-                records.append({
+                record = {
                     "time": std_time,
                     "sender": sender,
                     "content": content,
                     "format": "txt",
                     "is_valid": True
-                })
+                }
             except Exception as e:
                 logger.error(f"TXT无时间戳解析单条记录失败（索引{idx}）：{str(e)[:50]}，跳过该记录")
                 continue
-        # 关键：原始记录数取最终有效构造的records长度，而非初始matches长度
-        self.parse_stats["total_raw"] = len(records)
-        logger.info(f"TXT无时间戳格式解析：匹配到{self.parse_stats['total_raw']}条原始记录")
-        return records
+            # 关键：原始记录数取最终有效构造的记录数，而非初始matches数
+            self.parse_stats["total_raw"] += 1
+            yield record
+
+    def _iter_no_time_matches(self, txt_content: str) -> Iterator[re.Match]:
+        """无时间戳格式正则匹配（首次迭代时清洗空行）"""
+        # 先清洗内容：移除多余空行、首尾空格（避免正则匹配异常）
+        clean_txt = re.sub(r"\n{3,}", "\n\n", txt_content).strip()
+        yield from self.txt_pattern_no_time.finditer(clean_txt)
 
-    def _parse_txt(self, txt_content: str) -> List[Dict]:
+    def _iter_txt(self, txt_content: str) -> Iterator[Dict]:
         """
         TXT统一解析入口：自动检测格式，分发到对应解析函数
         :param txt_content: TXT原始内容字符串
-        :return: 原始解析记录列表（未清洗）
+        :return: 原始解析记录迭代器（未清洗）
+        :raise ValueError: 未识别的TXT格式（调用时立即检测，不等到迭代）
         """
         # 自动检测格式
         txt_format = self._detect_txt_format(txt_content)
         if txt_format == "txt_with_time":
-            return self._parse_txt_with_time(txt_content)
+            return self._iter_txt_with_time(txt_content)
         else:
-            return self._parse_txt_no_time(txt_content)
+            return self._iter_txt_no_time(txt_content)
 
-    def _parse_xml(self, xml_content: str) -> List[Dict]:
+    def _iter_xml(self, xml_content: str) -> Iterator[Dict]:
         """
-        解析微信XML格式聊天记录（兼容微信不同导出版本节点）
+        解析微信XML格式聊天记录（兼容微信不同导出版本节点），逐条产出
+        节点树需整体构建（按节点名优先级选取消息节点），记录仍逐条产出
         :param xml_content: XML原始内容字符串
-        :return: 原始解析记录列表（未清洗）
+        :return: 原始解析记录迭代器（未清洗），total_raw随产出累加
         """
-        records = []
-        self.parse_stats["format_type"] = "xml"  # 先标记格式，后赋值总数
+        self.parse_stats["format_type"] = "xml"  # 先标记格式，后累计总数
         try:
-            # 处理XML编码/格式问题
-            xml_content = xml_content.strip().encode("utf-8").decode("utf-8", errors="ignore")
-            root = ET.fromstring(xml_content)
-            # 兼容微信XML节点：msg/Message/ChatRecord/record
-            msg_nodes = root.findall(".//msg") or root.findall(".//Message") or root.findall(".//ChatRecord") or root.findall(".//record")
-
-            for idx, node in enumerate(msg_nodes):
+            for idx, node in enumerate(self._stage_iter("tokenize", self._iter_xml_nodes(xml_content))):
                 try:
                     # 提取核心字段（兼容不同节点名）
                     raw_time = node.findtext("time", "") or node.findtext("datetime", "") or ""
@@ -279,42 +282,69 @@ class WeChatChatParser:
                     if not sender.strip() or not content.strip():
                         continue
                     # 构造原始记录
-                    records.append({
+                    record = {
                         "time": std_time,
                         "sender": sender,
                         "content": content,
                         "format": "xml",
                         "is_valid": True
-                    })
+                    }
                 except Exception as e:
                     logger.error(f"XML解析单条记录失败（索引{idx}）：{str(e)[:50]}，跳过该记录")
                     continue
+                # 关键：total_raw取过滤后的实际记录数，而非初始msg_nodes数
+                self.parse_stats["total_raw"] += 1
+                yield record
         except ET.ParseError as e:
             logger.error(f"XML格式非法，解析失败：{str(e)[:50]}")
         except Exception as e:
             logger.error(f"XML解析异常：{str(e)[:50]}")
-        # 关键：total_raw取过滤后的实际记录数，而非初始msg_nodes数
-        self.parse_stats["total_raw"] = len(records)
-        logger.info(f"XML格式解析：匹配到{self.parse_stats['total_raw']}条原始记录")
-        return records
 
-    def _clean_records(self, raw_records: List[Dict]) -> List[Dict]:
+    @staticmethod
+    def _iter_xml_nodes(xml_content: str) -> Iterator[ET.Element]:
+        """XML建树并产出消息节点（首次迭代时整体建树，非法XML抛出ET.ParseError）"""
+        # 处理XML编码/格式问题
+        xml_content = xml_content.strip().encode("utf-8").decode("utf-8", errors="ignore")
+        root = ET.fromstring(xml_content)
+        # 兼容微信XML节点：msg/Message/ChatRecord/record
+        yield from (root.findall(".//msg") or root.findall(".//Message") or root.findall(".//ChatRecord")
+                    or root.findall(".//record"))
+
+    def _iter_raw_records(self, content: str, format_type: str) -> Iterator[Dict]:
+        """按格式分发，逐条产出原始记录（未清洗）"""
+        if format_type == "txt":
+            return self._iter_txt(content)
+        return self._iter_xml(content)
+
+    def _iter_clean_records(self, raw_records: Iterator[Dict]) -> Iterator[Dict]:
         """
-        【核心升级】数据清洗主流程：系统消息过滤 → 无效内容过滤 → 去重 → 二次校验
-        :param raw_records: 原始解析记录列表
-        :return: 清洗后的有效记录列表
+        【核心升级】数据清洗主流程（逐条）：系统消息过滤 → 无效内容过滤 → 去重 → 二次校验
+        :param raw_records: 原始解析记录迭代器
+        :return: 清洗后的有效记录迭代器，total_clean随产出累加（迭代结束后调用_finish_stats）
         """
         # 第一步：过滤系统消息
-        filter_sys_records = [r for r in raw_records if self._filter_system_message(r["content"])]
+        filter_sys_records = (r for r in raw_records if self._filter_system_message(r["content"]))
         # 第二步：过滤无效内容（纯媒体/纯表情/空内容，新增核心步骤）
-        filter_invalid_records = [r for r in filter_sys_records if self._filter_invalid_content(r["content"])]
-        # 第三步：去重
-        clean_records = self._remove_duplicates(filter_invalid_records)
-        # 第四步：二次校验有效标识
-        clean_records = [r for r in clean_records if r.get("is_valid", False)]
-
-        # 更新统计
-        self.parse_stats["total_clean"] = len(clean_records)
+        filter_invalid_records = self._stage_iter(
+            "filter", (r for r in filter_sys_records if self._filter_invalid_content(r["content"]))
+        )
+        # 第三步：去重；第四步：二次校验有效标识
+        for record in self._stage_iter("dedup", self._remove_duplicates(filter_invalid_records)):
+            if record.get("is_valid", False):
+                self.parse_stats["total_clean"] += 1
+                yield record
+
+    def _stage(self, name: str):
+        """同步阶段的内存统计上下文（未开启统计时为空上下文）"""
+        return nullcontext() if self._memory is None else self._memory.stage(name)
+
+    def _stage_iter(self, name: str, iterator: Iterator) -> Iterator:
+        """惰性阶段的内存统计包装（未开启统计时原样返回）"""
+        return iterator if self._memory is None else self._memory.wrap(name, iterator)
+
+    def _finish_stats(self) -> None:
+        """清洗结束后补全统计：过滤数、准确率"""
+        logger.info(f"{self.parse_stats['format_type']}格式解析：匹配到{self.parse_stats['total_raw']}条原始记录")
         self.parse_stats["filter_count"] = self.parse_stats["total_raw"] - self.parse_stats["total_clean"]
         # 计算解析准确率（避免除零错误）
         if self.parse_stats["total_raw"] > 0:
@@ -322,7 +352,57 @@ class WeChatChatParser:
         else:
             self.parse_stats["accuracy"] = 0.0
         logger.info(f"数据清洗完成：原始{self.parse_stats['total_raw']}条 → 有效{self.parse_stats['total_clean']}条，准确率{self.parse_stats['accuracy']}%")
-        return clean_records
+
+    def _reset_stats(self) -> None:
+        """重置解析统计（每次解析重置默认时间，保证无时间戳记录时间为当前解析时间）"""
+        self.default_time = datetime.now().strftime(settings.PARSE_TIME_FORMAT)
+        self.parse_stats = {
+            "total_raw": 0,
+            "total_clean": 0,
+            "filter_count": 0,
+            "accuracy": 0.0,
+            "parse_time": 0.0,
+            "format_type": ""
+        }
+
+    def _validate_input(self, content: str, format_type: str) -> None:
+        """入参校验，不合法抛出ValueError"""
+        if format_type not in settings.PARSE_SUPPORT_FORMATS:
+            raise ValueError(f"不支持的格式类型：{format_type}，仅支持{settings.PARSE_SUPPORT_FORMATS}")
+        if not content or content.strip() == "":
+            raise ValueError("原始内容为空，无法解析")
+
+    def iter_parse(self, content: str, format_type: str) -> Iterator[Dict]:
+        """
+        流式解析：逐条产出清洗后的记录（不缓存、不汇总记录列表，内存不随记录数增长）
+        迭代结束后self.parse_stats为完整统计（含parse_time）
+        解析状态保存在实例上，并发流式解析时每个请求使用独立的WeChatChatParser实例
+        :param content: 聊天记录原始内容字符串
+        :param format_type: 格式类型，可选txt/xml
+        :return: 清洗后记录迭代器
+        :raise ValueError: 入参不合法/未识别的TXT格式（调用时立即抛出，不等到迭代）
+        """
+        self._reset_stats()
+        self._validate_input(content, format_type)
+        raw_records = self._iter_raw_records(content, format_type)
+        return self._iter_parse_records(raw_records, format_type, time.time())
+
+    def _iter_parse_records(self, raw_records: Iterator[Dict], format_type: str, start_time: float) -> Iterator[Dict]:
+        yield from self._iter_clean_records(raw_records)
+        self._finish_stats()
+        self.parse_stats["parse_time"] = round(time.time() - start_time, 3)
+        PARSE_MS.labels(format=format_type, cache="stream").observe((time.time() - start_time) * 1000)
+        PARSE_RECORDS.labels(format=format_type).observe(self.parse_stats["total_clean"])
+
+    def get_cached(self, content_key: str) -> Optional[Dict]:
+        """
+        按content_key读取缓存的解析结果（不解析、不改动解析统计）
+        :param content_key: 解析响应中的content_key
+        :return: 缓存的解析结果/None（未命中或已淘汰）
+        """
+        cached_result = global_cache.get(content_key) if content_key else None
+        PARSE_CACHE_REQUESTS.labels(result="hit" if cached_result else "miss").inc()
+        return cached_result
 
     def parse(self, content: str, format_type: str, use_cache: bool = True) -> Dict:
         """
@@ -341,53 +421,63 @@ class WeChatChatParser:
                 "stats": {}
             }
         }
-        # 重置解析统计（每次解析重置默认时间，保证无时间戳记录时间为当前解析时间）
-        self.default_time = datetime.now().strftime(settings.PARSE_TIME_FORMAT)
-        self.parse_stats = {
-            "total_raw": 0,
-            "total_clean": 0,
-            "filter_count": 0,
-            "accuracy": 0.0,
-            "parse_time": 0.0,
-            "format_type": ""
-        }
+        self._reset_stats()
         start_time = time.time()
+        # 大内容可选分阶段内存统计（PARSE_MEMORY_PROFILE）
+        self._memory = start_parse_memory_profile(content, format_type)
+        self.memory_profile = None
 
         try:
             # 1. 入参校验
-            if format_type not in settings.PARSE_SUPPORT_FORMATS:
-                raise ValueError(f"不支持的格式类型：{format_type}，仅支持{settings.PARSE_SUPPORT_FORMATS}")
-            if not content or content.strip() == "":
-                raise ValueError("原始内容为空，无法解析")
+            with self._stage("decode"):
+                self._validate_input(content, format_type)
+                cache_key = generate_content_key(content)
 
             # 2. 缓存逻辑：生成key → 检查缓存 → 命中则直接返回
-            cache_key = generate_content_key(content)
-            if use_cache and cache_key and global_cache.get(cache_key):
-                result = global_cache.get(cache_key)
+            cached_result = global_cache.get(cache_key) if use_cache and cache_key else None
+            if use_cache:
+                PARSE_CACHE_REQUESTS.labels(result="hit" if cached_result else "miss").inc()
+            if cached_result:
+                result = cached_result
+                result["data"]["content_key"] = cache_key
+                result["data"]["stats"].pop("memory", None)  # 内存统计描述的是首次解析，命中时不返回
                 result["data"]["stats"]["parse_time"] = round(time.time() - start_time, 3)
-                logger.info(f"解析完成（缓存命中）：{result['data']['stats']['accuracy']}%准确率，耗时{result['data']['stats']['parse_time']}s")
+                PARSE_MS.labels(format=format_type, cache="hit").observe((time.time() - start_time) * 1000)
+                log_event(logging.INFO, "parse_result", "解析完成（缓存命中）：%s%%准确率，耗时%ss",
+                          result["data"]["stats"]["accuracy"], result["data"]["stats"]["parse_time"],
+                          content_key=cache_key, format_type=format_type, cache="hit")
                 return result
 
-            # 3. 按格式解析原始记录
-            raw_records = []
-            if format_type == "txt":
-                raw_records = self._parse_txt(content)
-            else:
-                raw_records = self._parse_xml(content)
-
-            # 4. 数据清洗（升级后）
-            clean_records = self._clean_records(raw_records)
+            # 3. 按格式解析原始记录 + 4. 数据清洗（升级后）
+            with self._stage("tokenize"):
+                raw_records = self._iter_raw_records(content, format_type)
+            with self._stage("record_build"):
+                clean_records = list(self._iter_clean_records(self._stage_iter("record_build", raw_records)))
+            self._finish_stats()
 
             # 5. 构造结果
             self.parse_stats["parse_time"] = round(time.time() - start_time, 3)
             result["data"]["records"] = clean_records
             result["data"]["stats"] = self.parse_stats
+            result["data"]["content_key"] = cache_key  # 后续可凭此key直接生成（/ai/v1/generate/imitate/by-key）
 
             # 6. 缓存逻辑：未命中则设置缓存
             if use_cache and cache_key:
-                global_cache.set(cache_key, result)
+                with self._stage("cache_insert"):
+                    global_cache.set(cache_key, result)
+            if self._memory is not None:
+                # 先结束内存统计再提交索引构建（后台线程的分配不计入解析）
+                self.parse_stats["memory"] = self._memory.finish(cache_key, len(clean_records))
+                self.memory_profile, self._memory = self._memory, None
+            if use_cache and cache_key and settings.SEARCH_INDEX_ON_PARSE:
+                index_records(cache_key, clean_records)
 
-            logger.info(f"解析完成（缓存未命中）：{self.parse_stats['accuracy']}%准确率，耗时{self.parse_stats['parse_time']}s")
+            PARSE_MS.labels(format=format_type, cache="miss").observe((time.time() - start_time) * 1000)
+            PARSE_RECORDS.labels(format=format_type).observe(len(clean_records))
+            log_event(logging.INFO, "parse_result", "解析完成（缓存未命中）：%s%%准确率，耗时%ss",
+                      self.parse_stats["accuracy"], self.parse_stats["parse_time"],
+                      content_key=cache_key, format_type=format_type, cache="miss",
+                      total_raw=self.parse_stats["total_raw"], total_clean=self.parse_stats["total_clean"])
             return result
 
         except ValueError as e:
@@ -399,6 +489,10 @@ class WeChatChatParser:
             result["msg"] = f"解析失败：{str(e)[:50]}"
             logger.error(f"解析异常：{str(e)}", exc_info=True)
         finally:
+            if self._memory is not None:
+                # 缓存命中/解析失败：停止跟踪，不记录
+                self._memory.discard()
+                self._memory = None
             # 保证统计信息始终返回
             if not result["data"]["stats"]:
                 result["data"]["stats"] = self.parse_stats
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""服务指标定义：模型生成/推理队列/聊天解析/HTTP各阶段指标统一在此注册，/metrics接口导出"""
+from utils.metrics_util import Counter, Gauge, Histogram, TOKEN_BUCKETS, RATE_BUCKETS, BYTES_BUCKETS
+from utils.sys_util import get_rss_bytes
+from utils import global_cache
+
+# ===================== HTTP =====================
+HTTP_IN_FLIGHT = Gauge("ai_http_in_flight_requests", "正在处理的HTTP请求数")
+HTTP_REQUEST_MS = Histogram("ai_http_request_ms", "HTTP请求总耗时（毫秒）", ["path", "status"])
+
+# ===================== 模型生成 =====================
+GENERATE_IN_FLIGHT = Gauge("ai_generate_in_flight", "正在执行的生成请求数", ["version"])
+GENERATE_TOTAL_MS = Histogram("ai_generate_total_ms", "模型生成总耗时（毫秒，不含排队）", ["version"])
+GENERATE_TOKENIZE_MS = Histogram("ai_generate_tokenize_ms", "Prompt编译/分词耗时（毫秒）", ["version"])
+GENERATE_PREFILL_MS = Histogram("ai_generate_prefill_ms", "Prefill耗时（毫秒，生成开始到首token）", ["version"])
+GENERATE_TTFT_MS = Histogram("ai_generate_ttft_ms", "首token时间（毫秒，请求进入模型到首token）", ["version"])
+GENERATE_DECODE_RATE = Histogram(
+    "ai_generate_decode_tokens_per_s", "Decode阶段速率（tokens/s，不含首token）", ["version"], buckets=RATE_BUCKETS
+)
+GENERATE_THREAD_WAIT_MS = Histogram("ai_generate_thread_wait_ms", "生成线程启动/回收等待耗时（毫秒）", ["version"])
+GENERATE_POSTPROCESS_MS = Histogram("ai_generate_postprocess_ms", "生成结果后处理耗时（毫秒）", ["version"])
+GENERATE_PROMPT_TOKENS = Histogram("ai_generate_prompt_tokens", "Prompt token数", ["version"], buckets=TOKEN_BUCKETS)
+GENERATE_OUTPUT_TOKENS = Histogram("ai_generate_output_tokens", "生成token数", ["version"], buckets=TOKEN_BUCKETS)
+GENERATE_DRAFT_TOKENS = Counter("ai_generate_draft_tokens", "投机解码草稿token数（result=accepted/rejected）",
+                                ["version", "result"])
+GENERATE_KV_BYTES = Histogram("ai_generate_kv_cache_bytes", "单次生成KV缓存占用（字节，缓存token数×每token字节数）",
+                              ["version"], buckets=BYTES_BUCKETS)
+KV_CACHE_BLOCKS_USED = Gauge("ai_kv_cache_blocks_used", "KV缓存预算已预留块数", ["version"])
+ADAPTER_REQUESTS = Counter("ai_lora_adapter_requests", "LoRA适配器使用次数（result=hit/load/evict）", ["version", "result"])
+ADAPTER_LOAD_MS = Histogram("ai_lora_adapter_load_ms", "LoRA适配器加载耗时（毫秒）", ["version"])
+GENERATE_CACHE_REQUESTS = Counter("ai_generate_cache_requests", "生成结果缓存查询次数（result=hit/miss/coalesced/bypass）",
+                                  ["result"])
+GENERATE_CACHE_BYTES = Gauge("ai_generate_cache_bytes", "生成结果缓存占用（字节，序列化大小）")
+GENERATE_ROUTED = Counter("ai_generate_routed", "生成请求降级到其他版本次数（reason=loading/queue_full/slo）",
+                          ["requested", "routed", "reason"])
+GENERATE_TIMEOUTS = Counter("ai_generate_timeouts", "生成超时次数", ["version"])
+GENERATE_RESULTS = Counter("ai_generate_requests", "生成请求结果计数", ["version", "code"])
+
+# ===================== 推理队列 =====================
+QUEUE_WAIT_MS = Histogram("ai_queue_wait_ms", "推理队列排队耗时（毫秒）", ["version"])
+QUEUE_DEPTH = Gauge("ai_queue_depth", "推理队列排队数", ["version"])
+QUEUE_IN_FLIGHT = Gauge("ai_queue_in_flight", "推理队列执行中数量", ["version"])
+QUEUE_REJECTED = Counter("ai_queue_rejected", "推理队列准入拒绝次数", ["version", "status"])
+
+# ===================== 聊天解析 =====================
+PARSE_MS = Histogram("ai_parse_ms", "聊天记录解析耗时（毫秒）", ["format", "cache"])
+PARSE_RECORDS = Histogram(
+    "ai_parse_records", "解析后有效记录数", ["format"], buckets=(10, 100, 1000, 10000, 100000, 1000000)
+)
+PARSE_CACHE_REQUESTS = Counter("ai_parse_cache_requests", "解析缓存查询次数", ["result"])
+PARSE_CACHE_HIT_RATIO = Gauge("ai_parse_cache_hit_ratio", "解析缓存命中率（进程启动以来）")
+PARSE_CACHE_SIZE = Gauge("ai_parse_cache_entries", "解析缓存条目数")
+PARSE_STAGE_PEAK_BYTES = Histogram(
+    "ai_parse_stage_peak_bytes", "大解析各阶段跟踪内存峰值（字节，相对解析开始，PARSE_MEMORY_PROFILE开启时）", ["stage"],
+    buckets=BYTES_BUCKETS
+)
+PARSE_STAGE_RETAINED_BYTES = Gauge("ai_parse_stage_retained_bytes", "最近一次大解析各阶段跟踪内存净变化（字节）", ["stage"])
+
+# ===================== 进程 =====================
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "进程常驻内存（字节）")
+
+
+def _cache_hit_ratio() -> float:
+    hits = PARSE_CACHE_REQUESTS.labels(result="hit").get()
+    misses = PARSE_CACHE_REQUESTS.labels(result="miss").get()
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+PARSE_CACHE_HIT_RATIO.set_function(_cache_hit_ratio)
+PARSE_CACHE_SIZE.set_function(lambda: len(global_cache.cache))
+PROCESS_RSS.set_function(get_rss_bytes)
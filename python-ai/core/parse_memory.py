@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+解析分阶段内存统计（可选，PARSE_MEMORY_PROFILE开启且原始内容不少于PARSE_MEMORY_MIN_CHARS时启用）
+- 基于tracemalloc：解析期间开启跟踪，结束后关闭；未启用时解析流水线不做任何包装
+- 阶段：decode（入参校验+内容哈希编码）、tokenize（格式检测/正则匹配/XML建树）、record_build（构造记录）、
+  filter（系统消息/无效内容过滤）、dedup（去重）、cache_insert（写入缓存）、response_build（响应序列化，接口层统计）
+- 流水线为逐条串联的生成器，各阶段交替执行：按「独占片段」计量，取下一条记录时切换到对应阶段，
+  上游阶段的执行不计入下游
+  - 阶段peak_bytes：该阶段单次执行片段内的最大瞬时增量（如XML整体建树、内容编码副本）
+  - 阶段retained_bytes：该阶段自身执行期间跟踪内存的净变化（累计，可为负；对象在一个阶段分配、
+    在另一阶段释放时分别计入两者，如正则匹配对象由tokenize分配、record_build释放）
+  - 整体peak_bytes/peak_stage：整个解析相对开始时的跟踪内存最高点及其所在阶段（定位该缩减哪个阶段）
+- 最近PARSE_MEMORY_RECENT次大解析保留分配点Top-N（解析结束时仍存活的分配，按源码行汇总），供管理接口查询
+- tracemalloc为进程全局跟踪，解析期间其他线程的分配同样计入；开启后解析耗时明显增加，仅用于排查
+"""
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from config import settings
+from core.metrics import PARSE_STAGE_PEAK_BYTES, PARSE_STAGE_RETAINED_BYTES
+
+PARSE_STAGES = ("decode", "tokenize", "record_build", "filter", "dedup", "cache_insert", "response_build")
+
+# 最近的大解析内存统计（新的在右）
+recent_parse_memory: deque = deque(maxlen=settings.PARSE_MEMORY_RECENT)
+_active = False  # 同一时刻只统计一次解析（tracemalloc为进程全局）
+
+
+class ParseMemoryProfile:
+    """单次解析的分阶段内存统计"""
+
+    def __init__(self, content_chars: int, format_type: str):
+        self.content_chars = content_chars
+        self.format_type = format_type
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self.entry: Optional[Dict] = None  # finish后写入recent_parse_memory的记录
+        self.peak_bytes = 0
+        self.peak_stage = ""
+        self._stack: List[str] = []
+        self._baseline = 0
+        self._segment_start = 0
+        self._owns_tracing = False
+
+    def start(self) -> None:
+        global _active
+        _active = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._baseline = tracemalloc.get_traced_memory()[0]
+
+    def _close_segment(self) -> int:
+        """
+        结算栈顶阶段当前片段，返回当前跟踪内存
+        计量本身不创建临时容器：dict/tuple释放后进入空闲链表不计为释放，会被下一片段复用而错记阶段
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            usage = self.stages.get(self._stack[-1])
+            if usage is None:
+                usage = self.stages[self._stack[-1]] = {"peak_bytes": 0, "retained_bytes": 0}
+            usage["retained_bytes"] += current - self._segment_start
+            usage["peak_bytes"] = max(usage["peak_bytes"], peak - self._segment_start)
+            self._observe_peak(self._stack[-1], peak - self._baseline)
+        return current
+
+    def _observe_peak(self, stage: str, peak_bytes: int) -> None:
+        if peak_bytes > self.peak_bytes:
+            self.peak_bytes, self.peak_stage = peak_bytes, stage
+
+    def _enter(self, stage: str) -> None:
+        self._segment_start = self._close_segment()
+        self._stack.append(stage)
+        tracemalloc.reset_peak()
+
+    def _exit(self) -> None:
+        self._segment_start = self._close_segment()
+        self._stack.pop()
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str):
+        """同步执行的阶段"""
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def wrap(self, name: str, iterator: Iterator) -> Iterator:
+        """惰性阶段：每次取下一项期间计入该阶段"""
+        source = iter(iterator)
+        while True:
+            self._enter(name)
+            try:
+                item = next(source)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def finish(self, content_key: str, total_clean: int) -> Dict:
+        """
+        结束跟踪：汇总Top-N分配点、写入最近记录与指标
+        :return: 写入解析统计的摘要 {"stages", "peak_bytes", "peak_stage", "peak_bytes_per_char"}
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        retained_total = tracemalloc.get_traced_memory()[0] - self._baseline
+        self.discard()
+        top_sites = [{
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count,
+        } for stat in snapshot.statistics("lineno")[:settings.PARSE_MEMORY_TOP_SITES]]
+        for name, usage in self.stages.items():
+            PARSE_STAGE_PEAK_BYTES.labels(stage=name).observe(usage["peak_bytes"])
+            PARSE_STAGE_RETAINED_BYTES.labels(stage=name).set(usage["retained_bytes"])
+        self.entry = {
+            "time": time.strftime(settings.PARSE_TIME_FORMAT),
+            "content_key": content_key,
+            "format_type": self.format_type,
+            "content_chars": self.content_chars,
+            "total_clean": total_clean,
+            "retained_total_bytes": retained_total,
+            **self.summary(),
+            "top_sites": top_sites,
+        }
+        recent_parse_memory.append(self.entry)
+        return self.summary()
+
+    def discard(self) -> None:
+        """停止跟踪，不记录（缓存命中/解析失败）"""
+        global _active
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        _active = False
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+        finish之后追加的阶段（接口层响应序列化）：重新开启跟踪，整体峰值按解析结束时的存活量折算，与其他阶段口径一致
+        """
+        owns_tracing = not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            if owns_tracing:
+                tracemalloc.stop()
+            offset = self.entry["retained_total_bytes"] if self.entry else 0
+            self.stages[name] = {"peak_bytes": peak - start, "retained_bytes": current - start}
+            self._observe_peak(name, offset + peak - start)
+            PARSE_STAGE_PEAK_BYTES.labels(stage=name).observe(self.stages[name]["peak_bytes"])
+            PARSE_STAGE_RETAINED_BYTES.labels(stage=name).set(self.stages[name]["retained_bytes"])
+            if self.entry is not None:
+                self.entry.update(self.summary())
+
+    def summary(self) -> Dict:
+        return {
+            "stages": {name: dict(self.stages[name]) for name in PARSE_STAGES if name in self.stages},
+            "peak_bytes": self.peak_bytes,
+            "peak_stage": self.peak_stage,
+            "peak_bytes_per_char": round(self.peak_bytes / self.content_chars, 2) if self.content_chars else 0.0,
+        }
+
+
+def start_parse_memory_profile(content: str, format_type: str) -> Optional[ParseMemoryProfile]:
+    """按配置与内容大小决定是否统计本次解析（已有解析在统计时跳过），返回已开始的统计对象或None"""
+    if not settings.PARSE_MEMORY_PROFILE or _active or not content or len(content) < settings.PARSE_MEMORY_MIN_CHARS:
+        return None
+    profile = ParseMemoryProfile(len(content), format_type)
+    profile.start()
+    return profile
+
+
+def get_recent_parse_memory(limit: Optional[int] = None) -> List[Dict]:
+    """最近的大解析内存统计（新的在前）"""
+    entries = list(reversed(recent_parse_memory))
+    return entries[:limit] if limit else entries
+
+
+__all__ = ["PARSE_STAGES", "ParseMemoryProfile", "start_parse_memory_profile", "get_recent_parse_memory"]
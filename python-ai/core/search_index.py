@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+聊天记录全文检索：对清洗后的记录建立倒排索引，按content_key检索（Go端无需拉取全部记录自行扫描）
+- 分词：中日韩连续字符切成二元组（单字成词），英文/数字按词小写；查询使用相同分词
+- 排序：BM25；发送人、时间范围为过滤条件
+- 索引在解析结果写入缓存时由后台线程构建（不增加解析接口耗时），独立LRU按content_key保存；
+  索引持有记录列表引用，解析缓存淘汰后仍可检索
+- 倒排表用array保存（记录序号+词频），百万条消息的索引常驻内存可控
+- 检索剪枝（百万条消息下保持毫秒级）：查询词按文档频率从低到高处理，低频词确定候选集，
+  候选已足够时远高频的词只给已有候选加分（倒排表有序，二分查找）；单独的高频词只对最新的SEARCH_MAX_POSTINGS条命中评分
+"""
+import bisect
+import heapq
+import math
+import re
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import settings
+from utils import logger
+from utils.cache_util import LRUCache
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 摘要窗口（字符）：命中词前后各取一半
+SNIPPET_CHARS = 48
+# 候选数已达limit且文档频率超过候选数的该倍数时，该词只给已有候选加分（不再引入新候选）
+RESCORE_ONLY_RATIO = 8
+
+# 假名、中日韩统一表意文字（含扩展A、兼容区）、韩文音节
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_PATTERN = re.compile(rf"[{_CJK_RANGES}]+|[a-z0-9]+")
+_CJK_PATTERN = re.compile(rf"[{_CJK_RANGES}]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：中日韩字符按二元组切分（单字成词），英文/数字按词小写
+    :param text: 文本
+    :return: 词列表（含重复，用于词频统计）
+    """
+    tokens: List[str] = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if len(run) > 1 and _CJK_PATTERN.match(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class SearchIndex:
+    """单份聊天记录的倒排索引（构建后只读，可多线程并发检索）"""
+
+    def __init__(self, records: List[Dict]):
+        """
+        :param records: 清洗后的解析记录（记录序号即检索结果id）
+        """
+        self.records = records
+        # 词 → (记录序号数组, 词频数组)，记录序号递增
+        self.postings: Dict[str, tuple] = {}
+        doc_lengths = array("I")
+        for doc_id, record in enumerate(records):
+            term_freqs: Dict[str, int] = {}
+            tokens = tokenize(record["content"])
+            for token in tokens:
+                term_freqs[token] = term_freqs.get(token, 0) + 1
+            doc_lengths.append(len(tokens))
+            for token, freq in term_freqs.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = (array("I"), array("H"))
+                posting[0].append(doc_id)
+                posting[1].append(min(freq, 65535))
+        avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 1.0
+        # 预计算BM25长度归一项 k1*(1-b+b*dl/avgdl)，检索时不再逐条计算
+        self.length_norms = array("f", (BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1.0))
+                                        for length in doc_lengths))
+
+    def search(self, query: str, sender: Optional[str] = None, start_time: Optional[str] = None,
+               end_time: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """
+        BM25检索
+        :param query: 查询文本
+        :param sender: 仅返回该发送人的记录
+        :param start_time: 起始时间（含），PARSE_TIME_FORMAT格式，可只传前缀（如2025-02-03）
+        :param end_time: 结束时间（含），同上
+        :param limit: 最多返回条数
+        :return: [{"id", "score", "time", "sender", "snippet"}, ...]，按得分降序
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        total = len(self.records)
+        length_norms = self.length_norms
+        scores: Dict[int, float] = {}
+        # 低频词优先：先由区分度高的词确定候选集
+        postings = sorted((self.postings[term] for term in terms if term in self.postings), key=lambda p: len(p[0]))
+        for doc_ids, freqs in postings:
+            doc_freq = len(doc_ids)
+            weight = math.log(1 + (total - doc_freq + 0.5) / (doc_freq + 0.5)) * (BM25_K1 + 1)
+            if len(scores) >= limit and doc_freq > len(scores) * RESCORE_ONLY_RATIO:
+                # 候选已足够时的高频词：只给已有候选加分
+                self._rescore(scores, list(scores), doc_ids, freqs, weight)
+                continue
+            # 只评分最新的SEARCH_MAX_POSTINGS条命中（倒排表按记录序号递增，即按时间顺序）；
+            # 窗口之外的已有候选单独补分，保证低频词选出的候选得分完整
+            start = max(0, doc_freq - settings.SEARCH_MAX_POSTINGS)
+            if start and scores:
+                self._rescore(scores, [doc_id for doc_id in scores if doc_id < doc_ids[start]], doc_ids, freqs, weight)
+            for pos in range(start, doc_freq):
+                doc_id, freq = doc_ids[pos], freqs[pos]
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * freq / (freq + length_norms[doc_id])
+        if not scores:
+            return []
+
+        candidates = scores.items()
+        if sender or start_time or end_time:
+            candidates = [(doc_id, score) for doc_id, score in candidates
+                          if self._matches(self.records[doc_id], sender, start_time, end_time)]
+        # 同分时新消息优先
+        top = heapq.nlargest(limit, candidates, key=lambda item: (item[1], item[0]))
+        return [self._hit(doc_id, score, terms) for doc_id, score in top]
+
+    def _rescore(self, scores: Dict[int, float], candidate_ids: List[int], doc_ids: array, freqs: array,
+                 weight: float) -> None:
+        """给指定候选累加一个词的得分（二分查找倒排表，不在表中的候选不变）"""
+        length_norms = self.length_norms
+        for doc_id in candidate_ids:
+            pos = bisect.bisect_left(doc_ids, doc_id)
+            if pos < len(doc_ids) and doc_ids[pos] == doc_id:
+                freq = freqs[pos]
+                scores[doc_id] += weight * freq / (freq + length_norms[doc_id])
+
+    @staticmethod
+    def _matches(record: Dict, sender: Optional[str], start_time: Optional[str], end_time: Optional[str]) -> bool:
+        """过滤条件：时间为统一格式字符串，按前缀长度截断后比较（支持只传日期）"""
+        if sender and record["sender"] != sender:
+            return False
+        if start_time and record["time"][:len(start_time)] < start_time:
+            return False
+        if end_time and record["time"][:len(end_time)] > end_time:
+            return False
+        return True
+
+    def _hit(self, doc_id: int, score: float, terms: List[str]) -> Dict:
+        record = self.records[doc_id]
+        return {
+            "id": doc_id,
+            "score": round(score, 4),
+            "time": record["time"],
+            "sender": record["sender"],
+            "snippet": make_snippet(record["content"], terms),
+        }
+
+
+def make_snippet(content: str, terms: List[str]) -> str:
+    """摘要：以最早出现的查询词为中心截取SNIPPET_CHARS字符，截断处加省略号"""
+    if len(content) <= SNIPPET_CHARS:
+        return content
+    lowered = content.lower()
+    positions = [pos for pos in (lowered.find(term) for term in terms) if pos >= 0]
+    center = min(positions) if positions else 0
+    start = max(0, min(center - SNIPPET_CHARS // 2, len(content) - SNIPPET_CHARS))
+    end = start + SNIPPET_CHARS
+    return ("…" if start > 0 else "") + content[start:end] + ("…" if end < len(content) else "")
+
+
+# content_key → Future[SearchIndex]（构建中的索引同样可被检索请求等待）
+search_index_cache = LRUCache(maxsize=settings.SEARCH_INDEX_CACHE_SIZE)
+# 单线程构建：索引构建为CPU密集型，不与解析/生成争抢更多线程
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+
+
+def _build_index(content_key: str, records: List[Dict]) -> SearchIndex:
+    index = SearchIndex(records)
+    logger.debug("检索索引构建完成：%s...，%s条记录，%s个词", content_key[:8], len(records), len(index.postings))
+    return index
+
+
+def index_records(content_key: str, records: List[Dict]) -> Future:
+    """
+    为解析结果构建检索索引（后台线程，已存在则直接返回）
+    :param content_key: 解析结果的content_key
+    :param records: 清洗后的解析记录
+    :return: Future[SearchIndex]
+    """
+    future = search_index_cache.get(content_key)
+    if future is None:
+        future = _index_executor.submit(_build_index, content_key, records)
+        search_index_cache.set(content_key, future)
+    return future
+
+
+def get_index_future(content_key: str) -> Optional[Future]:
+    """获取已构建/构建中的索引，不存在返回None"""
+    return search_index_cache.get(content_key) if content_key else None
@@ -1,20 +1,36 @@
 # -*- coding: utf-8 -*-
 """Python-AI服务入口：初始化FastAPI、注册路由、启动服务"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings
-from api import chat_router, health_router, ai_router
+from api import chat_router, health_router, ai_router, metrics_router, profile_router, MetricsMiddleware, ProfileMiddleware
 from utils import logger
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动加载与预热（可选）：后台线程执行，不阻塞启动，解析接口立即可用（多进程模式由模型服务进程负责）"""
+    if settings.MODEL_LOAD_ON_STARTUP and not settings.MODEL_SERVER_SOCKET:
+        from core.ai_service.warmup import start_background_warmup, inference_queue_slot
+        # 预热经推理队列（background优先级）执行，与启动期间到达的请求共享并发上限
+        start_background_warmup(slot=inference_queue_slot(asyncio.get_running_loop()))
+    yield
+    from core.batch_parser import shutdown_parse_executor
+    shutdown_parse_executor()
+
 # 初始化FastAPI应用
 app = FastAPI(
     title="RealChatter AI Service",
     description="RealChatter项目AI服务：聊天记录解析、AI风格模仿",
     version="1.0.0",
     docs_url="/docs",  # Swagger文档地址
-    redoc_url="/redoc"  # ReDoc文档地址
+    redoc_url="/redoc",  # ReDoc文档地址
+    lifespan=lifespan
 )
 
 # 跨域配置（允许Go服务层跨域调用）
@@ -26,10 +42,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 单请求剖析中间件（请求头X-Profile: 1 + 有效API密钥时开启；先注册位于内层，剖析被拒的请求同样计入指标）
+if settings.PROFILE_ENABLED:
+    app.add_middleware(ProfileMiddleware)
+
+# 指标中间件（HTTP在途数/耗时，/metrics导出）
+app.add_middleware(MetricsMiddleware)
+
 # 注册路由
 app.include_router(chat_router)
 app.include_router(health_router)
 app.include_router(ai_router)
+app.include_router(metrics_router)
+app.include_router(profile_router)
 
 # 根路径测试
 @app.get("/", summary="根路径测试")
@@ -40,13 +65,61 @@ async def root():
         "docs": "/docs"
     }
 
-if __name__ == "__main__":
-    # 启动FastAPI服务
-    logger.info(f"RealChatter AI服务启动中：http://{settings.API_HOST}:{settings.API_PORT}")
-    uvicorn.run(
-        app="main:app",
-        host=settings.API_HOST,
-        port=settings.API_PORT,
-        reload=settings.API_RELOAD,
-        log_level=settings.LOG_LEVEL.lower()
+
+def uvicorn_bind_kwargs() -> dict:
+    """监听地址：配置API_UDS_PATH时监听Unix domain socket，否则HOST:PORT；均开启长keep-alive"""
+    if settings.API_UDS_PATH:
+        bind = {"uds": settings.API_UDS_PATH}
+    else:
+        bind = {"host": settings.API_HOST, "port": settings.API_PORT}
+    return {**bind, "timeout_keep_alive": settings.API_KEEPALIVE_TIMEOUT}
+
+
+def bind_address() -> str:
+    """监听地址描述（启动日志用）"""
+    return f"unix:{settings.API_UDS_PATH}" if settings.API_UDS_PATH else f"http://{settings.API_HOST}:{settings.API_PORT}"
+
+
+def run_multiprocess():
+    """
+    多进程模式：先启动独占模型的模型服务进程，等待其socket可连接后再启动API_WORKERS个API/解析worker
+    worker进程通过环境变量继承MODEL_SERVER_SOCKET，模型调用经Unix socket转发到模型服务进程
+    """
+    import multiprocessing
+    from core.ai_service.model_server import run_model_server, wait_for_model_server, DEFAULT_SOCKET_PATH
+
+    socket_path = settings.MODEL_SERVER_SOCKET or DEFAULT_SOCKET_PATH
+    os.environ["MODEL_SERVER_SOCKET"] = socket_path
+    # spawn：不继承父进程的日志线程等状态
+    model_server = multiprocessing.get_context("spawn").Process(
+        target=run_model_server, args=(socket_path,), name="model-server", daemon=True
     )
+    model_server.start()
+    logger.info(f"RealChatter AI服务启动中（多进程）：{bind_address()}，{settings.API_WORKERS}个worker，"
+                f"模型服务PID：{model_server.pid}")
+    try:
+        # 模型服务socket可连接后再启动worker，避免首批请求/就绪检查因连接失败返回503
+        wait_for_model_server(socket_path, settings.MODEL_SERVER_START_TIMEOUT, model_server)
+        uvicorn.run(
+            app="main:app",
+            **uvicorn_bind_kwargs(),
+            workers=settings.API_WORKERS,
+            log_level=settings.LOG_LEVEL.lower()
+        )
+    finally:
+        model_server.terminate()
+        model_server.join(timeout=10)
+
+
+if __name__ == "__main__":
+    if settings.API_WORKERS > 1:
+        run_multiprocess()
+    else:
+        # 启动FastAPI服务（单进程开发模式）
+        logger.info(f"RealChatter AI服务启动中：{bind_address()}")
+        uvicorn.run(
+            app="main:app",
+            **uvicorn_bind_kwargs(),
+            reload=settings.API_RELOAD,
+            log_level=settings.LOG_LEVEL.lower()
+        )
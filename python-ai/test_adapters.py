@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""LoRA适配器管理测试用例：验证id校验、同适配器并发共享、不同适配器等待切换/超时、关闭适配器的基座状态"""
+import os
+import tempfile
+import threading
+import time
+
+from core.ai_service.adapters import AdapterError, LoRAAdapterManager
+from utils import logger
+
+
+class FakePeftModel:
+    """记录切换调用的peft模型（测试用，适配器视为已加载）"""
+    def __init__(self):
+        self.calls = []
+        self.base_model = self
+
+    def set_adapter(self, name):
+        self.calls.append(("set", name))
+
+    def enable_adapter_layers(self):
+        self.calls.append(("enable", None))
+
+    def disable_adapter_layers(self):
+        self.calls.append(("disable", None))
+
+
+def _manager(adapter_dir):
+    for name in ("alice", "bob"):
+        os.makedirs(os.path.join(adapter_dir, name))
+        with open(os.path.join(adapter_dir, name, "adapter_config.json"), "w") as f:
+            f.write("{}")
+    manager = LoRAAdapterManager(object(), adapter_dir, max_loaded=2)
+    manager.peft_model = FakePeftModel()
+    manager.loaded.update({"alice": 1.0, "bob": 1.0})
+    return manager
+
+
+def _expect_error(func, status_code):
+    try:
+        func()
+    except AdapterError as e:
+        assert e.status_code == status_code, f"状态码应为{status_code}：{e.status_code}"
+        return
+    raise AssertionError(f"应返回{status_code}")
+
+
+def test_adapter_validation():
+    """测试适配器id格式与存在性校验，只列出含adapter_config.json的目录"""
+    with tempfile.TemporaryDirectory() as adapter_dir:
+        manager = _manager(adapter_dir)
+        os.makedirs(os.path.join(adapter_dir, "empty"))
+        assert manager.available() == ["alice", "bob"]
+        _expect_error(lambda: manager.acquire("../alice", timeout=0.1), 400)
+        _expect_error(lambda: manager.acquire("carol", timeout=0.1), 404)
+        assert manager.users == 0
+    logger.info("✅ 适配器校验测试通过")
+
+
+def test_adapter_switching():
+    """测试相同适配器并发共享，不同适配器等待使用者结束后切换，等待超时返回503"""
+    with tempfile.TemporaryDirectory() as adapter_dir:
+        manager = _manager(adapter_dir)
+        manager.acquire("alice", timeout=0.1)
+        manager.acquire("alice", timeout=0.1)
+        assert manager.users == 2 and manager.peft_model.calls == [("set", "alice"), ("enable", None)]
+        _expect_error(lambda: manager.acquire("bob", timeout=0.05), 503)
+        _expect_error(lambda: manager.acquire(None, timeout=0.05), 503)
+
+        manager.release()
+        threading.Timer(0.05, manager.release).start()
+        wait_start = time.monotonic()
+        manager.acquire("bob", timeout=2.0)
+        assert time.monotonic() - wait_start < 1.0 and manager.active == "bob"
+        assert list(manager.loaded) == ["alice", "bob"], "最近使用的适配器应移到LRU末尾"
+        manager.release()
+
+        # 无适配器的请求关闭LoRA层（基座生成）
+        manager.acquire(None, timeout=0.1)
+        assert manager.active is None and manager.peft_model.calls[-1] == ("disable", None)
+        manager.release()
+        assert manager.users == 0
+    logger.info("✅ 适配器切换测试通过")
+
+
+if __name__ == "__main__":
+    test_adapter_validation()
+    test_adapter_switching()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""推理后端注册表测试用例：验证按配置选择后端、专属参数、未注册后端报错、新后端注册扩展、加载工具不在导入时引入ML依赖"""
+import subprocess
+import sys
+
+from core.ai_service.backend import (
+    BaseInferenceBackend, GPTQBackend, TorchInt8Backend, INFERENCE_BACKENDS, create_backend
+)
+from utils import logger
+
+BASE_CONFIG = {
+    "model_path": "./models/qwen",
+    "quant_type": "GPTQ",
+    "device": "cpu",
+    "max_memory": "8G",
+    "backend_params": {"torch_int8": {"model_path": "./models/qwen-full", "num_threads": 2}},
+}
+
+
+def test_create_backend():
+    """测试按配置创建后端：未配置时为gptq，名称不区分大小写，专属参数取backend_params[后端名]"""
+    assert {"gptq", "torch_int8"} <= set(INFERENCE_BACKENDS)
+    default = create_backend(BASE_CONFIG)
+    assert isinstance(default, GPTQBackend) and default.params == {}
+    assert default.describe() == {"backend": "gptq", "quant_type": "4bit", "device": "cpu"}
+
+    int8 = create_backend({**BASE_CONFIG, "backend": "Torch_INT8", "device": "cuda:0"})
+    assert isinstance(int8, TorchInt8Backend)
+    assert int8.params["num_threads"] == 2 and int8.device == "cpu", "int8后端固定运行在CPU"
+    logger.info("✅ 后端选择测试通过")
+
+
+def test_unknown_backend():
+    """测试未注册的后端名报错并列出可选后端，注册后即可通过配置选择"""
+    try:
+        create_backend({**BASE_CONFIG, "backend": "gguf"})
+        raise AssertionError("未注册的后端应报错")
+    except ValueError as e:
+        assert "gguf" in str(e) and "torch_int8" in str(e)
+
+    class FakeBackend(BaseInferenceBackend):
+        name = "gguf"
+        quant_desc = "q4_k_m"
+
+        def load(self):
+            return "model", "tokenizer"
+
+    INFERENCE_BACKENDS[FakeBackend.name] = FakeBackend
+    try:
+        backend = create_backend({**BASE_CONFIG, "backend": "gguf"})
+        assert backend.load() == ("model", "tokenizer")
+    finally:
+        INFERENCE_BACKENDS.pop(FakeBackend.name)
+    logger.info("✅ 未注册后端测试通过")
+
+
+def test_model_util_lazy_imports():
+    """测试导入加载工具不引入torch/transformers/auto_gptq（CPU int8后端的机器可不安装auto_gptq）"""
+    code = ("import sys, utils.model_util; "
+            "print('loaded=' + ','.join(m for m in ('torch', 'transformers', 'auto_gptq') if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-300:]
+    assert "loaded=\n" in proc.stdout + "\n", f"导入时引入了ML依赖：{proc.stdout.strip()}"
+    logger.info("✅ 加载工具延迟导入测试通过")
+
+
+if __name__ == "__main__":
+    test_create_backend()
+    test_unknown_backend()
+    test_model_util_lazy_imports()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""批量解析测试用例：验证进程池解析结果与单份解析一致、缓存命中优先返回、批内去重、单份失败不影响其余"""
+import asyncio
+
+from config import settings
+from core import wechat_chat_parser
+from core.batch_parser import iter_batch_parse, shutdown_parse_executor
+from tools.common import build_sample_chat_export
+from utils import logger, global_cache
+
+
+def _collect(documents):
+    async def _main():
+        return [item async for item in iter_batch_parse(documents)]
+    return asyncio.run(_main())
+
+
+def test_batch_parse():
+    """测试进程池批量解析：结果与单份解析一致并写入主进程缓存，缓存命中的文档最先返回"""
+    original_workers = settings.PARSE_BATCH_WORKERS
+    settings.PARSE_BATCH_WORKERS = 2
+    contents = [build_sample_chat_export(200 + idx * 50, seed=idx) for idx in range(3)]
+    global_cache.clear()
+    # 第3份预先解析进入缓存
+    expected_cached = wechat_chat_parser.parse(contents[2], "txt", use_cache=True)
+    documents = [
+        {"id": "contact-a", "content": contents[0], "format_type": "txt"},
+        {"id": "contact-b", "content": contents[1], "format_type": "txt"},
+        {"id": "contact-c", "content": contents[2], "format_type": "txt"},
+        {"id": "contact-a-dup", "content": contents[0], "format_type": "txt"},
+        {"id": "bad", "content": "   ", "format_type": "txt"},
+    ]
+    try:
+        items = _collect(documents)
+    finally:
+        settings.PARSE_BATCH_WORKERS = original_workers
+        shutdown_parse_executor()
+
+    assert len(items) == len(documents), "每份文档都应返回一行结果"
+    assert items[0]["id"] == "contact-c", "缓存命中的文档应最先返回"
+    assert items[0]["data"]["records"] == expected_cached["data"]["records"]
+    by_id = {item["id"]: item for item in items}
+    assert by_id["bad"]["code"] == 400, "空内容应单独返回400"
+    for idx, doc_id in enumerate(("contact-a", "contact-b")):
+        expected = wechat_chat_parser.parse(contents[idx], "txt", use_cache=False)
+        assert by_id[doc_id]["code"] == 200
+        assert by_id[doc_id]["data"]["records"] == expected["data"]["records"], f"{doc_id}进程池解析结果不一致"
+        assert wechat_chat_parser.get_cached(by_id[doc_id]["data"]["content_key"]) is not None, "解析结果应写入主进程缓存"
+    assert by_id["contact-a-dup"]["data"]["records"] == by_id["contact-a"]["data"]["records"]
+    logger.info("✅ 批量解析测试通过")
+
+
+def test_batch_parse_inline():
+    """测试PARSE_BATCH_WORKERS=0时主进程顺序解析（不创建进程池）"""
+    original_workers = settings.PARSE_BATCH_WORKERS
+    settings.PARSE_BATCH_WORKERS = 0
+    try:
+        items = _collect([{"content": build_sample_chat_export(20, seed=7), "format_type": "txt", "use_cache": False}])
+    finally:
+        settings.PARSE_BATCH_WORKERS = original_workers
+    assert items[0]["id"] == "0" and items[0]["code"] == 200 and len(items[0]["data"]["records"]) == 20
+    logger.info("✅ 批量解析（主进程）测试通过")
+
+
+if __name__ == "__main__":
+    test_batch_parse()
+    test_batch_parse_inline()
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """聊天记录解析测试用例：读取本地文件测试，验证TXT/XML解析、准确率≥95%、缓存功能"""
 import os
-from core import wechat_chat_parser
+from core import WeChatChatParser, wechat_chat_parser
 from utils import logger
 from config import settings
 
@@ -124,6 +124,10 @@ def test_cache():
         assert res1["code"] == res2["code"], "缓存前后响应码不一致"
         assert res1["data"]["records"] == res2["data"]["records"], "缓存前后解析记录不一致"
         assert res1["data"]["stats"]["accuracy"] == res2["data"]["stats"]["accuracy"], "缓存前后准确率不一致"
+        # content_key可直接取回缓存的解析结果（按key生成接口使用）
+        assert res1["data"]["content_key"] == res2["data"]["content_key"], "缓存前后content_key不一致"
+        cached = wechat_chat_parser.get_cached(res1["data"]["content_key"])
+        assert cached is not None and cached["data"]["records"] == res1["data"]["records"], "按content_key读取缓存失败"
         logger.info("✅ 缓存测试通过：两次解析结果完全一致，缓存命中正常")
     except Exception as e:
         logger.error(f"❌ 缓存测试失败：{e}", exc_info=True)
@@ -160,6 +164,64 @@ Carlotta:
         f"❌ 单条异常记录测试失败，预期{expected_count}条有效记录，实际{valid_count}条"
     logger.info(f"✅ 单条异常记录测试通过：有效记录{valid_count}条，异常/系统记录已自动过滤")
 
+# 测试流式解析（逐条产出，结果与一次性解析一致）
+def test_iter_parse():
+    """测试iter_parse逐条产出的记录与统计和parse完全一致，入参错误在调用时立即抛出"""
+    logger.info(f"===== 开始测试流式解析 =====")
+    test_txt = """
+【2025-02-03 10:00:00】张三：你好
+【2025-02-03 10:00:05】李四：[图片]
+【2025-02-03 10:00:10】李四：在吗
+【2025-02-03 10:00:10】李四：在吗
+【2025-02-03 10:01:00】张三：撤回了一条消息
+【2025-02-03 10:02:00】张三：今天
+一起吃饭吗
+    """
+    expected = wechat_chat_parser.parse(test_txt, "txt", use_cache=False)
+    parser = WeChatChatParser()
+    records = parser.iter_parse(test_txt, "txt")
+    first = next(records)
+    assert first == expected["data"]["records"][0], "首条记录应在解析完成前产出"
+    streamed = [first] + list(records)
+    assert streamed == expected["data"]["records"], "流式解析记录与一次性解析不一致"
+    for key in ("total_raw", "total_clean", "filter_count", "accuracy", "format_type"):
+        assert parser.parse_stats[key] == expected["data"]["stats"][key], f"流式解析统计{key}不一致"
+    try:
+        WeChatChatParser().iter_parse("   ", "txt")
+        raise AssertionError("空内容应在调用iter_parse时抛出ValueError")
+    except ValueError:
+        pass
+    logger.info(f"✅ 流式解析测试通过：{len(streamed)}条记录与一次性解析一致")
+
+# 测试分阶段内存统计（开启后结果不变，stats.memory含各阶段数据，缓存命中不返回）
+def test_parse_memory_profile():
+    """测试PARSE_MEMORY_PROFILE开启时记录各阶段内存与分配点，解析结果与未开启时一致"""
+    from core.parse_memory import get_recent_parse_memory
+    import tracemalloc
+    logger.info(f"===== 开始测试分阶段内存统计 =====")
+    test_txt = "\n".join(f"【2025-02-03 10:{i // 60:02d}:{i % 60:02d}】张三：消息{i % 50}" for i in range(600))
+    expected = WeChatChatParser().parse(test_txt, "txt", use_cache=False)
+    original = (settings.PARSE_MEMORY_PROFILE, settings.PARSE_MEMORY_MIN_CHARS)
+    settings.PARSE_MEMORY_PROFILE, settings.PARSE_MEMORY_MIN_CHARS = True, 1000
+    try:
+        parser = WeChatChatParser()
+        result = parser.parse(test_txt, "txt", use_cache=False)
+        memory = result["data"]["stats"]["memory"]
+        assert result["data"]["records"] == expected["data"]["records"], "开启内存统计后解析结果应不变"
+        assert set(memory["stages"]) == {"decode", "tokenize", "record_build", "filter", "dedup"}
+        assert memory["peak_bytes"] > 0 and memory["peak_stage"] in memory["stages"]
+        assert not tracemalloc.is_tracing(), "解析结束后应停止跟踪"
+        with parser.memory_profile.measure("response_build"):
+            payload = str(result)
+        entry = get_recent_parse_memory(1)[0]
+        assert entry["content_key"] == result["data"]["content_key"] and entry["top_sites"]
+        assert entry["stages"]["response_build"]["retained_bytes"] >= len(payload)
+        small = parser.parse("【2025-02-03 10:00:00】张三：你好", "txt", use_cache=False)
+        assert "memory" not in small["data"]["stats"] and parser.memory_profile is None, "小内容不统计"
+    finally:
+        settings.PARSE_MEMORY_PROFILE, settings.PARSE_MEMORY_MIN_CHARS = original
+    logger.info(f"✅ 分阶段内存统计测试通过：峰值{memory['peak_bytes']}字节（{memory['peak_stage']}）")
+
 if __name__ == "__main__":
     try:
         # 1. 核心：读取本地文件验证解析准确率
@@ -168,6 +230,10 @@ if __name__ == "__main__":
         test_cache()
         # 3. 测试异常记录解析（独立用例）
         test_single_error_record()
+        # 4. 测试流式解析
+        test_iter_parse()
+        # 5. 测试分阶段内存统计
+        test_parse_memory_profile()
 
         logger.info(f"\n===== 🎉 所有测试用例执行完成 =====")
     except Exception as e:
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""生成结果缓存测试用例：验证键规范化、TTL过期、字节上限淘汰、相同请求合并、失败/兜底回复不缓存与fresh跳过"""
+import asyncio
+import time
+
+from core.ai_service.generate_cache import GenerateResultCache, generate_cache_key
+from utils import logger
+
+
+def _result(content: str, code: int = 200):
+    return {"code": code, "msg": "生成成功", "data": {"content": content, "version": "free"}}
+
+
+def test_cache_key():
+    """测试键规范化：空白/时间戳差异命中同一键，生成参数、种子或已知发送人不同则不同"""
+    base = generate_cache_key("free", "【2025-02-03 10:00】张三：  今天好累啊\n张三：哈哈", " 在干嘛 ",
+                              temperature=0.7, seed=0)
+    assert base == generate_cache_key("free", "张三：今天好累啊 哈哈", "在干嘛", seed=0, temperature=0.7)
+    assert base != generate_cache_key("free", "张三：今天好累啊 哈哈", "在干嘛", temperature=0.7, seed=1)
+    assert base != generate_cache_key("free", "张三：今天好累啊 哈哈", "在干嘛", temperature=0.9, seed=0)
+    assert base != generate_cache_key("free", "张三：今天好累啊 哈哈", "在干嘛", temperature=0.7, seed=None), \
+        "未指定种子与种子0应为不同的键"
+    # 已知发送人改变发言切分（单次出现、无时间戳的「李四：」仅在已知时识别为发言），键应不同
+    plain = "张三：今天好累啊\n李四：哈哈"
+    assert generate_cache_key("free", plain, "在干嘛") != generate_cache_key("free", plain, "在干嘛", senders=["张三", "李四"])
+    assert generate_cache_key("free", plain, "在干嘛", senders=["李四", "张三"]) == \
+        generate_cache_key("free", plain, "在干嘛", senders=["张三", "李四", "张三"]), "发送人顺序/重复不影响键"
+    logger.info("✅ 生成缓存键测试通过")
+
+
+def test_ttl_and_byte_eviction():
+    """测试TTL过期与按字节数LRU淘汰，命中返回副本"""
+    size = len('{"code": 200, "msg": "生成成功", "data": {"content": "a", "version": "free"}}'.encode("utf-8"))
+    cache = GenerateResultCache(max_bytes=size * 2, ttl_sec=0.05)
+    cache.put("a", _result("a"))
+    cache.put("b", _result("b"))
+    cached = cache.get("a")
+    cached["data"]["content"] = "changed"
+    assert cache.get("a")["data"]["content"] == "a", "命中结果应为副本"
+    cache.put("c", _result("c"))
+    assert cache.get("b") is None and cache.get("a") is not None, "应淘汰最久未使用的条目"
+    assert cache.total_bytes <= cache.max_bytes
+    time.sleep(0.06)
+    assert cache.get("a") is None and cache.get("c") is None, "过期条目不应返回"
+    assert len(cache) == 0 and cache.total_bytes == 0
+    logger.info("✅ TTL与字节上限淘汰测试通过")
+
+
+def test_coalesce_and_bypass():
+    """测试相同请求生成中合并等待、失败结果与兜底回复不缓存、key为None时跳过缓存"""
+    calls = []
+
+    async def _generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return _result("哈哈哈")
+
+    async def _failing():
+        calls.append(1)
+        return _result("", code=500)
+
+    async def _degraded():
+        calls.append(1)
+        result = _result("已理解你的需求：在干嘛... （免费版模型回复）")
+        result["data"]["degraded"] = True
+        return result
+
+    async def _run():
+        cache = GenerateResultCache(max_bytes=1024 * 1024, ttl_sec=60)
+        first, second = await asyncio.gather(cache.get_or_generate("k", _generate),
+                                             cache.get_or_generate("k", _generate))
+        assert len(calls) == 1, "相同请求只应生成一次"
+        assert {first["data"]["cache"], second["data"]["cache"]} == {"miss", "coalesced"}
+        hit = await cache.get_or_generate("k", _generate)
+        assert hit["data"]["cache"] == "hit" and len(calls) == 1
+        fresh = await cache.get_or_generate(None, _generate)
+        assert fresh["data"]["cache"] == "bypass" and len(calls) == 2
+        await cache.get_or_generate("bad", _failing)
+        await cache.get_or_generate("bad", _failing)
+        assert len(calls) == 4, "失败结果不应缓存"
+        await cache.get_or_generate("degraded", _degraded)
+        assert (await cache.get_or_generate("degraded", _degraded))["data"]["cache"] == "miss"
+        assert len(calls) == 6, "兜底回复不应缓存"
+
+    asyncio.run(_run())
+    logger.info("✅ 请求合并与跳过缓存测试通过")
+
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_ttl_and_byte_eviction()
+    test_coalesce_and_bypass()
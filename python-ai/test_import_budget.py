@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""启动导入预算测试：import main不应引入torch/transformers/auto_gptq，导入耗时与内存保持在预算内"""
+import json
+import os
+import subprocess
+import sys
+
+from utils import logger
+
+# ML依赖（仅在首次加载模型时导入）
+HEAVY_MODULES = ("torch", "transformers", "auto_gptq", "accelerate", "peft")
+# 预算（可通过环境变量放宽，慢速CI机器使用）
+IMPORT_TIME_BUDGET_SEC = float(os.getenv("IMPORT_TIME_BUDGET_SEC", "3.0"))
+IMPORT_RSS_BUDGET_MB = float(os.getenv("IMPORT_RSS_BUDGET_MB", "200"))
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"elapsed": elapsed, "peak_mb": peak_kb / 1024, "modules": sorted(sys.modules)}))
+"""
+
+
+def probe_import_main() -> dict:
+    """新起子进程导入main（避免当前进程已导入的模块干扰），返回耗时/峰值内存/已导入模块"""
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True, timeout=120
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_main_budget():
+    """测试仅解析/健康检查的启动路径：不导入ML依赖，耗时与峰值内存在预算内"""
+    result = probe_import_main()
+    loaded = [name for name in HEAVY_MODULES if name in result["modules"]]
+    assert not loaded, f"import main不应导入ML依赖：{loaded}"
+    assert result["elapsed"] < IMPORT_TIME_BUDGET_SEC, \
+        f"import main耗时{result['elapsed']:.2f}s超过预算{IMPORT_TIME_BUDGET_SEC}s"
+    assert result["peak_mb"] < IMPORT_RSS_BUDGET_MB, \
+        f"import main峰值内存{result['peak_mb']:.0f}MB超过预算{IMPORT_RSS_BUDGET_MB}MB"
+    logger.info(f"✅ 启动导入预算测试通过：耗时{result['elapsed']:.2f}s，峰值内存{result['peak_mb']:.0f}MB")
+
+
+if __name__ == "__main__":
+    test_import_main_budget()
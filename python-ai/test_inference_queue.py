@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""推理准入队列测试用例：验证并发上限、优先级出队、截止时间准入拒绝、超时后槽位保留到生成线程结束"""
+import asyncio
+import threading
+
+from core.ai_service.inference_queue import InferenceQueue, QueueRejectedError
+from utils import logger
+
+
+async def _run_job(queue: InferenceQueue, name: str, order: list, priority: str = "interactive",
+                   timeout: float = 10.0, hold: float = 0.05):
+    """获取槽位后记录执行顺序并占用hold秒"""
+    async with queue.slot(priority=priority, timeout=timeout):
+        order.append(name)
+        assert queue.in_flight <= queue.max_concurrency, "执行中数量超过并发上限"
+        await asyncio.sleep(hold)
+
+
+def test_priority_order():
+    """测试排队请求按优先级出队：interactive先于更早到达的background"""
+    async def _main():
+        queue = InferenceQueue("free", max_concurrency=1, max_queue_size=8, initial_service_sec=0.05)
+        order = []
+        first = asyncio.create_task(_run_job(queue, "first", order))
+        await asyncio.sleep(0.01)
+        background = asyncio.create_task(_run_job(queue, "background", order, priority="background"))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(_run_job(queue, "interactive", order))
+        await asyncio.gather(first, background, interactive)
+        return order, queue
+    order, queue = asyncio.run(_main())
+    assert order == ["first", "interactive", "background"], f"出队顺序错误：{order}"
+    assert queue.in_flight == 0, "槽位未全部释放"
+    logger.info("✅ 优先级出队测试通过")
+
+
+def test_deadline_admission():
+    """测试预计排队时间超过超时立即拒绝（503+Retry-After），队列满拒绝（429）"""
+    async def _main():
+        queue = InferenceQueue("free", max_concurrency=1, max_queue_size=1, initial_service_sec=2.0)
+        order = []
+        running = asyncio.create_task(_run_job(queue, "running", order, hold=0.1))
+        await asyncio.sleep(0.01)
+        try:
+            await _run_job(queue, "late", order, timeout=1.0)
+            raise AssertionError("预计排队超时的请求未被拒绝")
+        except QueueRejectedError as e:
+            assert e.status_code == 503 and e.retry_after >= 1, f"截止时间拒绝状态错误：{e.status_code}"
+        waiting = asyncio.create_task(_run_job(queue, "waiting", order, timeout=10.0))
+        await asyncio.sleep(0.01)
+        try:
+            await _run_job(queue, "overflow", order, timeout=10.0)
+            raise AssertionError("队列满的请求未被拒绝")
+        except QueueRejectedError as e:
+            assert e.status_code == 429, f"队列满拒绝状态错误：{e.status_code}"
+        await asyncio.gather(running, waiting)
+        return order
+    order = asyncio.run(_main())
+    assert order == ["running", "waiting"], f"被拒绝的请求不应执行：{order}"
+    logger.info("✅ 截止时间准入测试通过")
+
+
+
+def test_deferred_release():
+    """测试生成超时返回但线程仍在运行时，槽位保留到线程结束回调（等待者此时才获得槽位）"""
+    async def _main():
+        queue = InferenceQueue("free", max_concurrency=1, max_queue_size=4, initial_service_sec=0.05)
+        worker_done = threading.Event()
+        async with queue.slot(timeout=10.0) as lease:
+            # 模拟生成线程：超时返回后仍运行，结束时从线程回调释放
+            threading.Thread(target=lambda: (worker_done.wait(), lease.release_threadsafe())).start()
+            lease.defer()
+        assert queue.in_flight == 1, "生成线程结束前槽位不应释放"
+        order = []
+        waiting = asyncio.create_task(_run_job(queue, "waiting", order))
+        await asyncio.sleep(0.05)
+        assert order == [], "生成线程结束前等待者不应获得槽位"
+        worker_done.set()
+        await waiting
+        lease.release()  # 重复释放无副作用
+        return order, queue
+    order, queue = asyncio.run(_main())
+    assert order == ["waiting"] and queue.in_flight == 0, f"槽位释放错误：{order} {queue.in_flight}"
+    logger.info("✅ 槽位延迟释放测试通过")
+
+
+if __name__ == "__main__":
+    test_priority_order()
+    test_deadline_admission()
+    test_deferred_release()
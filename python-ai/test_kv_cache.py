@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""KV缓存策略测试用例：验证每token字节数计算、int8开关、块预算预留/等待归还/超时、预算配置解析"""
+import threading
+import time
+from types import SimpleNamespace
+
+from core.ai_service.kv_cache import (
+    KVBlockPool, KVCacheBudgetError, apply_kv_cache_quantization, kv_budget_bytes, kv_bytes_per_token
+)
+from utils import logger
+
+# 千问1.8B结构参数
+QWEN_1_8B_CONFIG = SimpleNamespace(num_hidden_layers=24, num_attention_heads=16, hidden_size=2048, kv_channels=128)
+
+
+def test_kv_bytes_per_token():
+    """测试每token KV字节数：float16约192KB，float32翻倍，int8约为float32的1/4"""
+    fp16 = kv_bytes_per_token(QWEN_1_8B_CONFIG, dtype_bytes=2)
+    fp32 = kv_bytes_per_token(QWEN_1_8B_CONFIG, dtype_bytes=4)
+    int8 = kv_bytes_per_token(QWEN_1_8B_CONFIG, dtype_bytes=4, quantization="int8")
+    assert fp16 == 192 * 1024 and fp32 == 2 * fp16
+    assert fp32 / 4 < int8 < fp32 / 3, f"int8 KV缓存字节数异常：{int8}"
+    logger.info("✅ 每token KV字节数测试通过")
+
+
+def test_apply_kv_cache_quantization():
+    """测试int8开关：只修改支持量化的模块，不支持的模型返回0"""
+    class Module:
+        def __init__(self, **attrs):
+            self.__dict__.update(attrs)
+
+    attention = [Module(use_cache_quantization=False) for _ in range(2)]
+    model = Module(config=Module(use_cache_quantization=False))
+    model.modules = lambda: [model, *attention, Module()]
+    assert apply_kv_cache_quantization(model) == 2
+    assert all(module.use_cache_quantization for module in attention) and model.config.use_cache_quantization
+    plain = Module(config=Module())
+    plain.modules = lambda: [plain]
+    assert apply_kv_cache_quantization(plain) == 0 and not hasattr(plain.config, "use_cache_quantization")
+    logger.info("✅ int8 KV缓存开关测试通过")
+
+
+def test_block_pool():
+    """测试块预算：按块向上取整预留、不足时等待归还、超时与超过总预算报错"""
+    pool = KVBlockPool(budget_bytes=10 * 64 * 100, bytes_per_token=100, block_tokens=64)
+    assert pool.total_blocks == 10
+    first = pool.acquire(300, timeout=0.1)
+    assert first == 5, "300token应预留5块"
+    second = pool.acquire(320, timeout=0.1)
+    assert pool.snapshot()["used_blocks"] == 10 and pool.snapshot()["reservations"] == 2
+    try:
+        pool.acquire(1, timeout=0.05)
+        raise AssertionError("预算不足应等待超时")
+    except KVCacheBudgetError:
+        pass
+    try:
+        pool.acquire(64 * 11, timeout=0.05)
+        raise AssertionError("超过总预算应立即报错")
+    except KVCacheBudgetError:
+        pass
+
+    # 其他生成归还后等待者获得预留
+    releaser = threading.Timer(0.05, pool.release, args=(first,))
+    releaser.start()
+    wait_start = time.monotonic()
+    third = pool.acquire(200, timeout=2.0)
+    assert time.monotonic() - wait_start < 1.0 and third == 4
+    pool.release(second)
+    pool.release(third)
+    assert pool.snapshot()["used_blocks"] == 0 and pool.snapshot()["reservations"] == 0
+    logger.info("✅ KV缓存块预算测试通过")
+
+
+def test_kv_budget_bytes():
+    """测试预算配置：未配置不限制，auto取max_memory扣除常驻预估，固定值按内存大小解析"""
+    model_config = {"max_memory": "8G", "memory_estimate": "2G"}
+    assert kv_budget_bytes({}, model_config) == 0
+    assert kv_budget_bytes({"budget": "auto"}, model_config) == 6 * 1024 ** 3
+    assert kv_budget_bytes({"budget": "512M"}, model_config) == 512 * 1024 ** 2
+    logger.info("✅ KV缓存预算配置测试通过")
+
+
+if __name__ == "__main__":
+    test_kv_bytes_per_token()
+    test_apply_kv_cache_quantization()
+    test_block_pool()
+    test_kv_budget_bytes()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""模型内存管理器测试用例：验证并发加载合并、LRU淘汰、占用保护、空闲卸载、合并等待后被卸载时重新加载、手动释放检查占用"""
+import threading
+import time
+
+from core.ai_service.model_manager import ModelMemoryManager
+from utils import logger
+
+GB = 1024 ** 3
+
+
+def build_manager(budget_gb: float = 10, idle_unload_sec: float = 0):
+    """构造内存管理器，记录卸载顺序"""
+    unloaded = []
+    manager = ModelMemoryManager(int(budget_gb * GB), unload_fn=unloaded.append, idle_unload_sec=idle_unload_sec)
+    return manager, unloaded
+
+
+def fake_loader(calls: list, delay: float = 0.0):
+    """模拟加载（GPU设备，常驻内存按预估值登记）"""
+    def _load():
+        calls.append(1)
+        time.sleep(delay)
+        return {"code": 200, "msg": "加载成功", "data": {"device": "cuda:0"}}
+    return _load
+
+
+def test_concurrent_loads_coalesced():
+    """测试同一版本并发加载只执行一次"""
+    manager, _ = build_manager()
+    calls = []
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(manager.ensure_loaded("free", fake_loader(calls, 0.1), 2 * GB)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1, f"并发加载未合并，实际加载{len(calls)}次"
+    assert all(r["code"] == 200 for r in results), "并发等待方未拿到加载结果"
+    logger.info("✅ 并发加载合并测试通过")
+
+
+def test_lru_eviction_respects_in_use():
+    """测试超出预算时淘汰最久未使用的空闲模型，占用中的模型不被淘汰"""
+    manager, unloaded = build_manager(budget_gb=10)
+    manager.ensure_loaded("free", fake_loader([]), 4 * GB)
+    manager.ensure_loaded("pro", fake_loader([]), 4 * GB)
+    with manager.use("free"):
+        # free占用中，加载advanced只能淘汰pro
+        result = manager.ensure_loaded("advanced", fake_loader([]), 4 * GB)
+    assert result["code"] == 200, "腾挪预算后应加载成功"
+    assert unloaded == ["pro"], f"淘汰顺序错误：{unloaded}"
+
+    with manager.use("free"), manager.use("advanced"):
+        result = manager.ensure_loaded("pro", fake_loader([]), 4 * GB)
+    assert result["code"] == 503, "全部占用时应拒绝加载"
+    logger.info("✅ LRU淘汰测试通过")
+
+
+def test_idle_unload():
+    """测试空闲超时卸载"""
+    manager, unloaded = build_manager(idle_unload_sec=10)
+    manager.ensure_loaded("free", fake_loader([]), 2 * GB)
+    assert manager.reap_idle(now=time.monotonic() + 1) == [], "未超时不应卸载"
+    assert manager.reap_idle(now=time.monotonic() + 11) == ["free"], "超时未卸载"
+    assert unloaded == ["free"] and manager.used_bytes == 0, "卸载后预算未归还"
+    logger.info("✅ 空闲卸载测试通过")
+
+
+def test_evict_skips_version_pinned_after_selection():
+    """测试淘汰对象选出后、卸载前被并发请求占用时跳过（LRU淘汰改选其他版本，空闲卸载不执行）"""
+    manager, unloaded = build_manager(budget_gb=10, idle_unload_sec=10)
+    manager.ensure_loaded("free", fake_loader([]), 4 * GB)
+    manager.ensure_loaded("pro", fake_loader([]), 4 * GB)
+    evict = manager._evict
+
+    def _pin_then_evict(version, can_evict):
+        # 模拟选出淘汰对象后，并发请求在卸载前占用了该版本
+        if version == "free":
+            manager.ensure_loaded("free", None, pin=True)
+        return evict(version, can_evict)
+
+    manager._evict = _pin_then_evict
+    result = manager.ensure_loaded("advanced", fake_loader([]), 4 * GB)
+    assert result["code"] == 200 and unloaded == ["pro"], f"应跳过被占用的free改为淘汰pro：{unloaded}"
+    assert manager.entries["free"]["in_use"] == 1
+
+    manager._unpin("free")
+    manager.entries["advanced"]["in_use"] = 1
+    assert manager.reap_idle(now=time.monotonic() + 11) == [], "卸载前被占用的版本不应空闲卸载"
+    assert unloaded == ["pro"] and "free" in manager.entries
+    logger.info("✅ 淘汰复查占用测试通过")
+
+
+
+def test_waiter_reloads_when_evicted_before_pin():
+    """测试合并等待的请求在占用前模型已被卸载时重新加载并占用（不返回未占用的成功结果、不误释放他人占用）"""
+    manager, _ = build_manager()
+    calls = []
+    start_reaper = manager._start_reaper
+    evicted = []
+
+    def _evict_once():
+        # 模拟加载完成、唤醒等待方之前，模型被淘汰/空闲卸载
+        if not evicted:
+            evicted.append(manager.entries.pop("free"))
+        start_reaper()
+
+    manager._start_reaper = _evict_once
+    observed = []
+
+    def _waiter():
+        time.sleep(0.03)  # 在加载发起者加载期间加入合并等待
+        with manager.use("free", fake_loader(calls), 2 * GB) as result:
+            observed.append((result["code"], manager.entries["free"]["in_use"]))
+
+    waiter = threading.Thread(target=_waiter)
+    waiter.start()
+    assert manager.ensure_loaded("free", fake_loader(calls, 0.1), 2 * GB)["code"] == 200
+    waiter.join()
+    assert evicted and len(calls) == 2, f"被卸载后应重新加载：{len(calls)}次"
+    assert observed == [(200, 1)], f"等待方应占用重新加载的模型：{observed}"
+    assert manager.entries["free"]["in_use"] == 0, "退出后应释放本请求的占用"
+    logger.info("✅ 合并等待后重新加载测试通过")
+
+
+
+def test_manual_unload_respects_in_use():
+    """测试手动释放：占用中不卸载（返回None），无占用时卸载并归还预算"""
+    manager, unloaded = build_manager()
+    manager.ensure_loaded("free", fake_loader([]), 2 * GB)
+    with manager.use("free"):
+        assert manager.unload("free") == (False, None) and unloaded == [], "占用中不应卸载"
+        assert "free" in manager.entries
+    assert manager.unload("free")[0]
+    assert unloaded == ["free"] and manager.used_bytes == 0
+    logger.info("✅ 手动释放检查占用测试通过")
+
+
+if __name__ == "__main__":
+    test_concurrent_loads_coalesced()
+    test_lru_eviction_respects_in_use()
+    test_idle_unload()
+    test_evict_skips_version_pinned_after_selection()
+    test_waiter_reloads_when_evicted_before_pin()
+    test_manual_unload_respects_in_use()
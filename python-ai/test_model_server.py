@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""模型服务IPC测试用例：验证客户端经Unix socket调用模型服务生成、错误透传、超时与并发、槽位状态、启动等待、冷启动超时放宽、异常连接不复用"""
+import os
+import tempfile
+import threading
+import time
+
+from core.ai_service.base import BaseAIModel
+from core.ai_service import router
+from core.ai_service.model_server import (
+    ModelServer, ModelServerClient, ModelServerError, wait_for_model_server, CALL_TIMEOUT_MARGIN
+)
+from core.ai_service.router import MODEL_INSTANCES, MODEL_CLASSES, MODEL_CONFIGS, model_manager
+from utils import logger
+
+VERSION = "advanced"  # 使用预留版本注册假模型，避免影响free
+
+
+class SlowFakeModel(BaseAIModel):
+    """假模型：生成耗时固定，记录同时执行的最大生成数"""
+    def __init__(self, model_config):
+        super().__init__(model_config)
+        self.timeout = 5.0
+        self.running = 0
+        self.max_running = 0
+
+    def load_quantize_model(self):
+        self.status = self.STATUS_LOADED
+        return {"code": 200, "msg": "加载成功", "data": {}}
+
+    def generate_imitate(self, context, question, **kwargs):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        time.sleep(kwargs.get("delay", 0.05))
+        self.running -= 1
+        return {"code": 200, "msg": "生成成功", "data": {"content": f"回复：{question}", "pid": os.getpid()}}
+
+    def get_status(self):
+        return {"code": 200, "msg": "查询成功", "data": {"status": self.status}}
+
+    def release(self):
+        self.status = self.STATUS_UNLOADED
+        return {"code": 200, "msg": "释放成功"}
+
+
+def test_model_server_roundtrip():
+    """测试生成调用经IPC返回结果、并发按max_concurrency串行、未知方法与超时报错"""
+    MODEL_CLASSES[VERSION] = SlowFakeModel
+    MODEL_CONFIGS[VERSION] = {"memory_estimate": "1M", "max_concurrency": 1, "timeout": 5.0}
+    socket_path = os.path.join(tempfile.mkdtemp(), "model.sock")
+    server = ModelServer(socket_path, authkey=b"test")
+    server.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ModelServerClient(socket_path, authkey=b"test")
+    try:
+        assert client.call("ping", 5)["pid"] == os.getpid()
+        results = []
+        workers = [
+            threading.Thread(target=lambda q=q: results.append(
+                client.call("route_generate_imitate", 10, version=VERSION, context="", question=q, timeout=5.0)
+            )) for q in ("在干嘛", "吃了吗", "睡了吗")
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert sorted(r["data"]["content"] for r in results) == ["回复：吃了吗", "回复：在干嘛", "回复：睡了吗"]
+        assert MODEL_INSTANCES[VERSION].max_running == 1, "模型服务应按max_concurrency限制并发生成"
+
+        for method, kwargs, timeout in (("unknown", {}, 5), ("route_generate_imitate",
+                                        {"version": VERSION, "context": "", "question": "慢", "delay": 1.0}, 0.2)):
+            try:
+                client.call(method, timeout, **kwargs)
+                raise AssertionError(f"{method}应抛出ModelServerError")
+            except ModelServerError:
+                pass
+        # 超时连接被丢弃，后续调用使用新连接仍正常
+        assert client.call("route_get_status", 5, version=VERSION)["code"] == 200
+    finally:
+        client.close()
+        server.close()
+        model_manager.forget(VERSION)
+        MODEL_CLASSES[VERSION], MODEL_CONFIGS[VERSION], MODEL_INSTANCES[VERSION] = None, {}, None
+    logger.info("✅ 模型服务IPC测试通过")
+
+
+def test_client_unavailable():
+    """测试模型服务未启动时客户端抛出ModelServerError（路由器据此返回503）"""
+    client = ModelServerClient(os.path.join(tempfile.mkdtemp(), "missing.sock"), authkey=b"test")
+    try:
+        client.call("ping", 1)
+        raise AssertionError("未启动的模型服务应抛出ModelServerError")
+    except ModelServerError:
+        pass
+    logger.info("✅ 模型服务不可用测试通过")
+
+
+def test_generation_state_and_wait():
+    """测试启动等待ping成功后返回、未启动时超时报错；槽位状态反映就绪与执行中/等待数"""
+    MODEL_CLASSES[VERSION] = SlowFakeModel
+    MODEL_CONFIGS[VERSION] = {"memory_estimate": "1M", "max_concurrency": 1, "timeout": 5.0,
+                              "expected_generate_sec": 0.3}
+    socket_path = os.path.join(tempfile.mkdtemp(), "model.sock")
+    try:
+        wait_for_model_server(socket_path, timeout=0.3, authkey=b"test")
+        raise AssertionError("未启动的模型服务应等待超时")
+    except ModelServerError:
+        pass
+    server = ModelServer(socket_path, authkey=b"test")
+
+    def _start_later():
+        time.sleep(0.2)
+        server.start()
+        server.serve_forever()
+
+    threading.Thread(target=_start_later, daemon=True).start()
+    client = ModelServerClient(socket_path, authkey=b"test")
+    try:
+        # 等待期间模型服务才开始监听
+        wait_for_model_server(socket_path, timeout=5, authkey=b"test")
+        state = client.call("generation_state", 5)[VERSION]
+        assert not state["ready"] and state["in_flight"] == 0 and state["service_sec"] == 0.3
+        workers = [threading.Thread(target=client.call, args=("route_generate_imitate",), kwargs={
+            "timeout": 10, "version": VERSION, "context": "", "question": q, "delay": 0.3
+        }) for q in ("在干嘛", "吃了吗")]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.15)
+        state = client.call("generation_state", 5)[VERSION]
+        assert state["ready"] and state["in_flight"] == 1 and state["waiting"] == 1, f"槽位状态错误：{state}"
+        for worker in workers:
+            worker.join()
+        assert client.call("generation_state", 5)[VERSION]["in_flight"] == 0
+    finally:
+        client.close()
+        server.close()
+        model_manager.forget(VERSION)
+        MODEL_CLASSES[VERSION], MODEL_CONFIGS[VERSION], MODEL_INSTANCES[VERSION] = None, {}, None
+    logger.info("✅ 模型服务槽位状态与启动等待测试通过")
+
+
+
+def test_client_drops_connection_on_error():
+    """测试请求序列化失败时连接被关闭不回池，后续调用使用新连接"""
+    socket_path = os.path.join(tempfile.mkdtemp(), "model.sock")
+    server = ModelServer(socket_path, authkey=b"test")
+    server.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ModelServerClient(socket_path, authkey=b"test")
+    try:
+        client.call("ping", 5)
+        pooled = client._pool.get_nowait()
+        client._pool.put_nowait(pooled)
+        try:
+            client.call("ping", 5, callback=lambda: None)  # lambda无法pickle
+            raise AssertionError("无法序列化的参数应抛出异常")
+        except ModelServerError:
+            raise AssertionError("序列化失败不应视为模型服务不可用")
+        except Exception:
+            pass
+        assert pooled.closed and client._pool.empty(), "异常后的连接不应回池复用"
+        assert client.call("ping", 5)["pid"] == os.getpid()
+    finally:
+        client.close()
+        server.close()
+    logger.info("✅ 异常连接不复用测试通过")
+
+
+def test_remote_generate_wait_includes_cold_factor():
+    """测试多进程模式下生成调用的等待时间按冷启动超时放宽系数放宽（与模型服务中的实际超时一致）"""
+    calls = []
+
+    class RecordingClient:
+        def call(self, method, timeout=None, /, **kwargs):
+            calls.append((method, timeout, kwargs.get("timeout")))
+            return {"code": 200, "msg": "生成成功", "data": {"content": "好的", "worker_running": True}}
+
+    MODEL_CONFIGS[VERSION] = {"timeout": 10.0, "cold_timeout_factor": 1.5}
+    original_get_client = router.get_model_server_client
+    router.get_model_server_client = lambda: RecordingClient()
+    try:
+        result = router.AIModelRouter.route_generate_imitate(version=VERSION, question="在吗", timeout=4.0,
+                                                             on_worker_done=lambda: None)
+        assert calls == [("route_generate_imitate", 4.0 * 1.5 + CALL_TIMEOUT_MARGIN, 4.0)], "业务超时应原样转发"
+        assert "worker_running" not in result["data"], "回调不跨进程，本进程不应推迟释放"
+    finally:
+        router.get_model_server_client = original_get_client
+        MODEL_CONFIGS[VERSION] = {}
+    logger.info("✅ 冷启动超时放宽测试通过")
+
+
+if __name__ == "__main__":
+    test_model_server_roundtrip()
+    test_client_unavailable()
+    test_generation_state_and_wait()
+    test_client_drops_connection_on_error()
+    test_remote_generate_wait_includes_cold_factor()
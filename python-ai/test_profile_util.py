@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""单请求剖析测试用例：验证线程登记采样、折叠栈/汇总输出、未开启时零包装、中间件鉴权与剖析id返回"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from config import settings
+from api.profile_api import ProfileMiddleware
+from utils import logger
+from utils.profile_util import RequestProfiler, get_active_profiler, profiled, profiled_iter
+
+
+def _busy_loop(seconds: float) -> int:
+    total = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+
+def test_profiled_passthrough():
+    """测试未开启剖析时原样返回被包装对象"""
+    iterator = iter([1, 2])
+    assert get_active_profiler() is None
+    assert profiled(_busy_loop) is _busy_loop
+    assert profiled_iter(iterator) is iterator
+    logger.info("✅ 未开启剖析零包装测试通过")
+
+
+def test_thread_sampling_and_output():
+    """测试登记线程的栈被采样、未登记线程不计入，输出折叠栈与Top-N汇总"""
+    async def _request():
+        profiler = RequestProfiler("test-thread", interval_ms=1)
+        profiler.start()
+        try:
+            # 未登记的线程不计入
+            bystander = threading.Thread(target=_busy_loop, args=(0.1,))
+            bystander.start()
+            worker = threading.Thread(target=profiled(_busy_loop), args=(0.2,), name="gen-worker")
+            worker.start()
+            await asyncio.get_running_loop().run_in_executor(None, worker.join)
+            bystander.join()
+        finally:
+            profiler.stop()
+        return profiler
+
+    profiler = asyncio.run(_request())
+    assert profiler.samples > 0, "登记线程应被采样"
+    roots = {stack.split(";", 1)[0] for stack in profiler.stacks}
+    assert roots <= {"gen-worker", "event-loop"}, f"混入未登记线程：{roots}"
+    assert all(stack.startswith("gen-worker;") for stack in profiler.stacks if "_busy_loop" in stack)
+    top = profiler.top_functions(5)
+    assert top[0]["function"].startswith("_busy_loop ("), f"Top函数错误：{top}"
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        paths = profiler.write(output_dir, top_n=5, meta={"path": "/ai/v1/parse"})
+        with open(paths["collapsed"], encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profiler.samples
+        with open(paths["summary"], encoding="utf-8") as f:
+            summary = f.read()
+        assert "path: /ai/v1/parse" in summary and "_busy_loop" in summary
+    logger.info("✅ 线程采样与输出测试通过")
+
+
+def test_middleware():
+    """测试中间件：无请求头直通、密钥无效401、开启剖析时返回X-Profile-Id并写出结果（事件循环同步执行部分计入）"""
+    async def _app(scope, receive, send):
+        _busy_loop(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def _call(headers):
+        messages = []
+
+        async def _send(message):
+            messages.append(message)
+        scope = {"type": "http", "method": "POST", "path": "/ai/v1/parse", "query_string": b"", "headers": headers}
+        await ProfileMiddleware(_app)(scope, None, _send)
+        return messages[0]["status"], dict(messages[0]["headers"])
+
+    original_dir = settings.PROFILE_DIR
+    with tempfile.TemporaryDirectory() as output_dir:
+        settings.PROFILE_DIR = output_dir
+        try:
+            status, headers = asyncio.run(_call([]))
+            assert status == 200 and b"x-profile-id" not in headers
+            status, _ = asyncio.run(_call([(b"x-profile", b"1"), (b"x-api-key", b"wrong")]))
+            assert status == 401, "密钥无效不允许开启剖析"
+            status, headers = asyncio.run(_call([(b"x-profile", b"1"),
+                                                 (b"x-api-key", settings.API_AUTH_KEY.encode())]))
+            profile_id = headers[b"x-profile-id"].decode()
+            assert status == 200
+            with open(os.path.join(output_dir, profile_id + ".collapsed"), encoding="utf-8") as f:
+                collapsed = f.read()
+            assert collapsed.startswith("event-loop;") and "_busy_loop" in collapsed
+            assert os.path.exists(os.path.join(output_dir, profile_id + ".txt"))
+        finally:
+            settings.PROFILE_DIR = original_dir
+    logger.info("✅ 剖析中间件测试通过")
+
+
+if __name__ == "__main__":
+    test_profiled_passthrough()
+    test_thread_sampling_and_output()
+    test_middleware()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Prompt编译器测试用例：验证上下文压缩、静态片段缓存、token拼接一致性、截断与节省统计"""
+from ai_model.free.prompt import free_prompt_compiler, FREE_CHATML_TEMPLATE, FREE_SYSTEM_PROMPT
+from core.ai_service.prompt_compiler import compact_context, format_records_context, split_context_lines
+from utils import logger
+
+
+class CharTokenizer:
+    """字符级分词器（测试用）：每个字符一个token，记录encode调用次数"""
+    def __init__(self):
+        self.encode_calls = []
+
+    def encode(self, text, add_special_tokens=False):
+        self.encode_calls.append(text)
+        return [ord(ch) for ch in text]
+
+    def decode(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+TEST_CONTEXT = """
+    【2025-02-03 10:00】张三：  今天  好累啊
+    【2025-02-03 10:01】张三：哈哈哈
+    【2025-02-03 10:02】李四：早点休息嗯嗯
+"""
+
+
+def test_compact_context():
+    """测试上下文压缩：去时间戳/多余空白，合并同一发送人连续消息"""
+    compacted = compact_context(TEST_CONTEXT)
+    assert compacted == "张三：今天 好累啊 哈哈哈\n李四：早点休息嗯嗯", f"上下文压缩结果不符：{compacted}"
+    logger.info("✅ 上下文压缩测试通过")
+
+
+def test_split_context_known_senders():
+    """测试发言识别：「注意：」等正文前缀与URL不视为新发言，只认时间戳行/已知/多次出现的发送人"""
+    context = "【10:00】张三：明天几点\n注意：八点前到\n【10:01】李四：好的\nhttp://example.com/a"
+    assert split_context_lines(context) == [
+        ("张三", "明天几点"), ("", "注意：八点前到"), ("李四", "好的"), ("", "http://example.com/a")
+    ]
+    plain = "张三：在吗\n李四：在\n张三：吃了没\n备注：随便问问\n王五：我也在"
+    assert [sender for sender, _ in split_context_lines(plain)] == ["张三", "", "张三", "", ""], \
+        "无时间戳时只认多次出现的发送人"
+    assert split_context_lines(plain, senders=["王五"])[-1] == ("王五", "我也在"), "调用方已知的发送人应识别"
+    assert compact_context(plain) == "张三：在吗 李四：在 吃了没 备注：随便问问 王五：我也在"
+    logger.info("✅ 发言识别测试通过")
+
+
+def test_compile_matches_full_prompt():
+    """测试token拼接结果与整段分词完全一致，且静态片段只分词一次"""
+    tokenizer = CharTokenizer()
+    compiled = free_prompt_compiler.compile(tokenizer, context=TEST_CONTEXT, question=" 在干嘛 ")
+    expected_prompt = FREE_CHATML_TEMPLATE.format(
+        system=FREE_SYSTEM_PROMPT, context=compact_context(TEST_CONTEXT), question="在干嘛"
+    )
+    assert compiled["prompt"] == expected_prompt, "编译后Prompt与模板不一致"
+    assert tokenizer.decode(compiled["input_ids"]) == expected_prompt, "拼接的input_ids与Prompt不一致"
+    assert compiled["saved_tokens"] > 0, "未统计到节省的token数"
+
+    static_calls = len(tokenizer.encode_calls)
+    free_prompt_compiler.compile(tokenizer, context=TEST_CONTEXT, question="在干嘛")
+    second_calls = len(tokenizer.encode_calls) - static_calls
+    # 第二次仅对动态部分分词（压缩后的上下文+问题），节省数按字符差估算不再分词原文
+    assert second_calls == 2, f"静态片段未命中缓存或重复分词，第二次分词调用{second_calls}次"
+    logger.info(f"✅ Prompt编译测试通过：{compiled['prompt_tokens']}token，节省{compiled['saved_tokens']}token")
+
+
+def test_compile_truncates_context_left():
+    """测试超长截断：仅从左侧截断上下文，保留最新聊天和指令"""
+    tokenizer = CharTokenizer()
+    full = free_prompt_compiler.compile(tokenizer, context=TEST_CONTEXT, question="在干嘛")
+    max_length = full["prompt_tokens"] - 5
+    compiled = free_prompt_compiler.compile(tokenizer, max_length=max_length, context=TEST_CONTEXT, question="在干嘛")
+    assert compiled["prompt_tokens"] == max_length, "截断后token数不符"
+    assert compiled["truncated_tokens"] == 5, "截断token数统计错误"
+    assert "早点休息嗯嗯" in tokenizer.decode(compiled["input_ids"]), "截断丢失了最新上下文"
+    assert compiled["prompt"] == tokenizer.decode(compiled["input_ids"]), "prompt应与截断后的input_ids一致"
+    logger.info("✅ Prompt截断测试通过")
+
+
+def test_format_records_context():
+    """测试由解析记录构造上下文：多行内容压成一行，超出字符预算时只保留最新记录"""
+    records = [
+        {"time": "2025-02-03 10:00:00", "sender": "张三", "content": "今天\n好累啊"},
+        {"time": "2025-02-03 10:01:00", "sender": "李四", "content": "早点休息"},
+        {"time": "2025-02-03 10:02:00", "sender": "张三", "content": "嗯嗯"},
+    ]
+    context = format_records_context(records)
+    assert split_context_lines(context, senders={"张三", "李四"}) == [
+        ("张三", "今天 好累啊"), ("李四", "早点休息"), ("张三", "嗯嗯")
+    ]
+    assert format_records_context(records, max_chars=13) == "李四：早点休息\n张三：嗯嗯", "应只保留预算内的最新记录"
+    assert format_records_context(records, max_chars=1) == "张三：嗯嗯", "预算不足时至少保留最后一条"
+    logger.info("✅ 解析记录构造上下文测试通过")
+
+
+if __name__ == "__main__":
+    test_compact_context()
+    test_split_context_known_senders()
+    test_compile_matches_full_prompt()
+    test_compile_truncates_context_left()
+    test_format_records_context()
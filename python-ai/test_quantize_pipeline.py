@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""离线量化流水线测试用例：验证量化参数覆盖解析、产物标签、校准/评估窗口切分不重叠、语料指纹"""
+import os
+import tempfile
+
+from tools.common import build_sample_chat_export
+from tools.quantize_model import (
+    build_calibration_split, corpus_fingerprint, load_corpus_records, parse_variants, variant_tag
+)
+from utils import logger
+
+
+def test_parse_variants():
+    """测试参数覆盖：空串为全局默认，值按JSON解析，重复组去重"""
+    assert parse_variants("") == [{}]
+    assert parse_variants("group_size=64,sym=True;;damp_percent=0.1;group_size=64,sym=true") == [
+        {"group_size": 64, "sym": True}, {}, {"damp_percent": 0.1}
+    ]
+    assert variant_tag({}) == "4bit-g128-asym-d0.01", "默认标签应来自QUANT_COMMON_PARAMS"
+    assert variant_tag({"group_size": 64, "sym": True, "desc_act": True}) == "4bit-g64-sym-d0.01-act"
+    logger.info("✅ 量化参数覆盖解析测试通过")
+
+
+def test_calibration_split():
+    """测试校准/评估切分：窗口为「发送人：内容」格式，两者不重叠，按样本数等间隔抽取"""
+    records = load_corpus_records([])
+    assert len(records) > 1000
+    calibration, holdout = build_calibration_split(records, window_chars=200, holdout_every=4,
+                                                   num_samples=16, eval_samples=8)
+    assert len(calibration) == 16 and len(holdout) == 8
+    assert not set(calibration) & set(holdout), "校准集与评估集不应重叠"
+    assert all("：" in line for line in calibration[0].split("\n"))
+    assert all(len(text) >= 150 for text in calibration), "窗口应接近window_chars字符"
+
+    all_calibration, all_holdout = build_calibration_split(records[:200], window_chars=200, holdout_every=4,
+                                                           num_samples=1000, eval_samples=1000)
+    assert len(all_holdout) == (len(all_calibration) + len(all_holdout)) // 4, "每4个窗口应留出1个"
+    assert corpus_fingerprint(calibration) == corpus_fingerprint(list(calibration))
+    assert corpus_fingerprint(calibration) != corpus_fingerprint(calibration[1:])
+    logger.info("✅ 校准/评估切分测试通过")
+
+
+def test_parse_corpus_file():
+    """测试从聊天导出文件解析语料（与服务相同的解析器）"""
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        path = os.path.join(corpus_dir, "chat.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(build_sample_chat_export(50, seed=1))
+        records = load_corpus_records([path])
+        assert len(records) == 50 and {"sender", "content"} <= set(records[0])
+    logger.info("✅ 语料文件解析测试通过")
+
+
+if __name__ == "__main__":
+    test_parse_variants()
+    test_calibration_split()
+    test_parse_corpus_file()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""延迟目标版本路由测试用例：验证满足目标不降级、排队过长/队列已满/加载中降级、备选未加载不降级、都超目标选最快、
+多进程模式按模型服务状态路由、并发冷启动只创建一个实例、超时后模型占用保持到生成线程结束"""
+import threading
+import time
+
+from ai_model.stub.config import stub_model_config
+from ai_model.stub.model import StubAIModel
+from core.ai_service import router
+from core.ai_service.base import BaseAIModel
+from core.ai_service.inference_queue import get_inference_queue, _INFERENCE_QUEUES
+from core.ai_service.router import AIModelRouter, MODEL_CONFIGS, MODEL_CLASSES, MODEL_INSTANCES, model_manager
+from utils import logger
+
+
+class FakeModel:
+    def __init__(self, status):
+        self.status = status
+
+
+def _register(fallback_versions=("slo_small",), big_loaded=True, small_loaded=True):
+    """注册测试用版本：slo_big（单次4s）可降级到slo_small（单次1s）"""
+    for version, service_sec, loaded in (("slo_big", 4.0, big_loaded), ("slo_small", 1.0, small_loaded)):
+        MODEL_CONFIGS[version] = {
+            "version": version, "max_concurrency": 1, "max_queue_size": 2, "timeout": 60.0,
+            "expected_generate_sec": service_sec, "expected_load_sec": 30.0,
+            "fallback_versions": list(fallback_versions) if version == "slo_big" else [],
+        }
+        MODEL_CLASSES[version] = BaseAIModel
+        MODEL_INSTANCES[version] = FakeModel(BaseAIModel.STATUS_LOADED) if loaded else None
+        _INFERENCE_QUEUES.pop(version, None)
+    return get_inference_queue("slo_big", MODEL_CONFIGS["slo_big"]), \
+        get_inference_queue("slo_small", MODEL_CONFIGS["slo_small"])
+
+
+def _unregister():
+    for version in ("slo_big", "slo_small"):
+        for registry in (MODEL_CONFIGS, MODEL_CLASSES, MODEL_INSTANCES, _INFERENCE_QUEUES):
+            registry.pop(version, None)
+
+
+def test_route_within_target():
+    """测试预计耗时满足目标时使用请求版本，未配置备选时不降级"""
+    try:
+        big, _ = _register()
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_big" and not route["fallback"] and route["estimates"] == {"slo_big": 4000.0}
+        big.in_flight = 1
+        _register(fallback_versions=())[0].in_flight = 1
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_big" and not route["fallback"], "未配置备选版本不应降级"
+    finally:
+        _unregister()
+    logger.info("✅ 满足目标不降级测试通过")
+
+
+def test_route_fallback():
+    """测试排队过长/队列已满/加载中降级到已加载的备选版本，都超目标时选预计最快的"""
+    try:
+        big, small = _register()
+        big.in_flight = 1
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_small" and route["fallback"] and route["reason"] == "slo"
+        assert route["estimates"] == {"slo_big": 8000.0, "slo_small": 1000.0}
+
+        big.max_queue_size = 0
+        route = AIModelRouter.route_select_version("slo_big")
+        assert route["version"] == "slo_small" and route["reason"] == "queue_full"
+        assert route["estimates"]["slo_big"] is None, "队列已满预计耗时应输出为None"
+
+        # 备选版本同样繁忙且超过目标时选预计最快的
+        big.max_queue_size = 2
+        small.in_flight = 1
+        small.service_sec = 5.0
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_big" and not route["fallback"]
+
+        _register(big_loaded=False)
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_small" and route["reason"] == "loading"
+
+        _register(small_loaded=False)[0].in_flight = 1
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_big" and not route["fallback"], "备选版本未加载不应降级"
+    finally:
+        _unregister()
+    logger.info("✅ 版本降级测试通过")
+
+
+
+class FakeServerClient:
+    """模型服务客户端（测试用）：返回预设的就绪/槽位状态并记录调用次数"""
+    def __init__(self, state):
+        self.state = state
+        self.calls = 0
+
+    def call(self, method, timeout=None, /, **kwargs):
+        assert method == "generation_state"
+        self.calls += 1
+        return self.state
+
+
+def test_route_with_model_server():
+    """测试多进程模式：就绪与排队以模型服务状态为准（本worker队列空闲仍降级），状态短时缓存"""
+    big_state = {"ready": True, "in_flight": 1, "waiting": 1, "max_concurrency": 1, "service_sec": 4.0}
+    small_state = {"ready": False, "in_flight": 0, "waiting": 0, "max_concurrency": 1, "service_sec": 1.0}
+    client = FakeServerClient({"slo_big": big_state, "slo_small": small_state})
+    original_get_client = router.get_model_server_client
+    router.get_model_server_client = lambda: client
+    router._SERVER_STATE.update(expires=0.0, state={})
+    try:
+        _register(big_loaded=False, small_loaded=False)  # 多进程模式下worker本地无模型实例
+        assert AIModelRouter.is_version_ready("slo_big") and not AIModelRouter.is_version_ready("slo_small")
+        # 模型服务中1个执行+1个等待：排队2轮×4s + 单次4s
+        assert AIModelRouter.estimate_server_wait("slo_big") == 8.0
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_big" and not route["fallback"], "备选版本在模型服务中未就绪不应降级"
+        assert route["estimates"]["slo_big"] == 12000.0, "预计耗时应取模型服务排队与本worker队列的较大值"
+
+        client.state = {"slo_big": big_state, "slo_small": {**small_state, "ready": True}}
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_big", "状态缓存期内不应重新查询"
+        assert client.calls == 1
+        router._SERVER_STATE["expires"] = 0.0
+        route = AIModelRouter.route_select_version("slo_big", latency_target_ms=5000)
+        assert route["version"] == "slo_small" and route["reason"] == "slo"
+        assert client.calls == 2
+    finally:
+        router.get_model_server_client = original_get_client
+        router._SERVER_STATE.update(expires=0.0, state={})
+        _unregister()
+    logger.info("✅ 多进程模式版本路由测试通过")
+
+
+
+class SlowInitStubModel(StubAIModel):
+    """实例化较慢的桩模型（放大并发首个请求的竞争窗口），记录实例化次数"""
+    created = []
+
+    def __init__(self, model_config):
+        time.sleep(0.05)
+        super().__init__(model_config)
+        SlowInitStubModel.created.append(self)
+
+
+def test_concurrent_cold_start():
+    """测试并发首个请求只创建一个实例并全部生成成功（不出现已登记加载、实例却未加载的孤儿实例）"""
+    version = "advanced"
+    params = {**stub_model_config["stub_params"], "load_sec": 0.05, "prefill_ms_per_token": 0.0,
+              "decode_ms_per_token": 1.0, "output_tokens": 4}
+    MODEL_CLASSES[version] = SlowInitStubModel
+    MODEL_CONFIGS[version] = {**stub_model_config, "version": version, "stub_params": params, "max_concurrency": 4}
+    SlowInitStubModel.created.clear()
+    results = []
+    barrier = threading.Barrier(4)
+
+    def _call():
+        barrier.wait()
+        results.append(AIModelRouter.route_generate_imitate(version=version, context="小明：在干嘛", question="吃了吗"))
+
+    try:
+        workers = [threading.Thread(target=_call) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert [r["code"] for r in results] == [200] * 4, f"并发冷启动应全部成功：{[r['msg'] for r in results]}"
+        assert len(SlowInitStubModel.created) == 1 and MODEL_INSTANCES[version] is SlowInitStubModel.created[0]
+        assert AIModelRouter.route_generate_imitate(version=version, context="", question="在吗")["code"] == 200
+    finally:
+        model_manager.forget(version)
+        MODEL_CLASSES[version], MODEL_CONFIGS[version], MODEL_INSTANCES[version] = None, {}, None
+    logger.info("✅ 并发冷启动测试通过")
+
+
+
+class LingeringModel(BaseAIModel):
+    """假模型：超时返回后生成线程仍运行到release_worker被设置（与免费版超时结构一致）"""
+    def __init__(self, model_config):
+        super().__init__(model_config)
+        self.release_worker = threading.Event()
+
+    def load_quantize_model(self):
+        self.status = self.STATUS_LOADED
+        return {"code": 200, "msg": "加载成功", "data": {}}
+
+    def generate_imitate(self, context, question, **kwargs):
+        on_worker_done = kwargs["on_worker_done"]
+        threading.Thread(target=lambda: (self.release_worker.wait(), on_worker_done()), daemon=True).start()
+        return {"code": 500, "msg": "生成超时", "data": {"version": "advanced", "worker_running": True}}
+
+    def get_status(self):
+        return {"code": 200, "msg": "查询成功", "data": {"status": self.status}}
+
+    def release(self):
+        self.status = self.STATUS_UNLOADED
+        return {"code": 200, "msg": "释放成功"}
+
+
+def test_pin_held_until_worker_done():
+    """测试生成超时返回后模型占用保持到线程结束（期间不可淘汰），结束后依次释放占用与调用方回调"""
+    version = "advanced"
+    MODEL_CLASSES[version], MODEL_CONFIGS[version] = LingeringModel, {"memory_estimate": "1M"}
+    done = []
+    try:
+        result = AIModelRouter.route_generate_imitate(version=version, context="", question="在吗",
+                                                      on_worker_done=lambda: done.append(1))
+        assert result["data"]["worker_running"]
+        assert model_manager.entries[version]["in_use"] == 1, "生成线程结束前应保持占用"
+        assert not model_manager._evict(version, lambda entry: entry["in_use"] == 0), "占用中不应被淘汰"
+        MODEL_INSTANCES[version].release_worker.set()
+        deadline = time.monotonic() + 2
+        while not done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert done == [1] and model_manager.entries[version]["in_use"] == 0, "线程结束后应释放占用并回调"
+    finally:
+        model_manager.forget(version)
+        MODEL_CLASSES[version], MODEL_CONFIGS[version], MODEL_INSTANCES[version] = None, {}, None
+    logger.info("✅ 超时后模型占用保持测试通过")
+
+
+if __name__ == "__main__":
+    test_route_within_target()
+    test_route_fallback()
+    test_route_with_model_server()
+    test_concurrent_cold_start()
+    test_pin_held_until_worker_done()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""全文检索测试用例：验证中文二元组分词、BM25排序、发送人/时间过滤、摘要截取、解析后自动建索引"""
+from config import settings
+from core import wechat_chat_parser
+from core.search_index import SearchIndex, tokenize, make_snippet, get_index_future, SNIPPET_CHARS
+from utils import logger, global_cache
+
+RECORDS = [
+    {"time": "2025-02-03 09:00:00", "sender": "张三", "content": "明天一起去吃火锅吗"},
+    {"time": "2025-02-03 09:01:00", "sender": "李四", "content": "好啊，火锅火锅！"},
+    {"time": "2025-02-04 20:00:00", "sender": "张三", "content": "今天加班到很晚，没空吃饭"},
+    {"time": "2025-02-05 12:30:00", "sender": "李四", "content": "Let's grab lunch at 12"},
+    {"time": "2025-02-05 12:31:00", "sender": "张三", "content": "OK，吃火锅"},
+]
+
+
+def test_tokenize():
+    """测试中文按二元组切分、单字成词、英文数字小写成词"""
+    assert tokenize("吃火锅") == ["吃火", "火锅"]
+    assert tokenize("好，OK 12点") == ["好", "ok", "12", "点"]
+    logger.info("✅ 分词测试通过")
+
+
+def test_search_ranking_and_filters():
+    """测试BM25排序（词频高/文本短优先）、发送人与时间前缀过滤、无命中返回空"""
+    index = SearchIndex(RECORDS)
+    hits = index.search("火锅")
+    assert [hit["id"] for hit in hits] == [1, 4, 0], f"排序错误：{hits}"
+    assert [hit["id"] for hit in index.search("火锅", sender="张三")] == [4, 0]
+    assert [hit["id"] for hit in index.search("火锅", start_time="2025-02-05")] == [4]
+    assert [hit["id"] for hit in index.search("火锅", end_time="2025-02-03")] == [1, 0]
+    assert index.search("LUNCH")[0]["id"] == 3, "英文检索应忽略大小写"
+    assert index.search("不存在的词") == []
+    assert len(index.search("火锅", limit=1)) == 1
+    logger.info("✅ 检索排序与过滤测试通过")
+
+
+def test_snippet():
+    """测试长文本摘要以命中词为中心截取"""
+    content = "无关内容" * 20 + "火锅店" + "无关内容" * 20
+    snippet = make_snippet(content, ["火锅"])
+    assert "火锅" in snippet and snippet.startswith("…") and snippet.endswith("…")
+    assert len(snippet) == SNIPPET_CHARS + 2
+    assert make_snippet("短句火锅", ["火锅"]) == "短句火锅"
+    logger.info("✅ 摘要截取测试通过")
+
+
+def test_index_on_parse():
+    """测试解析结果写入缓存时自动构建索引，按content_key检索"""
+    global_cache.clear()
+    content = "\n".join(f"【{r['time']}】{r['sender']}：{r['content']}" for r in RECORDS)
+    result = wechat_chat_parser.parse(content, "txt", use_cache=True)
+    future = get_index_future(result["data"]["content_key"])
+    assert settings.SEARCH_INDEX_ON_PARSE and future is not None, "解析写入缓存后应构建索引"
+    index = future.result(timeout=10)
+    assert len(index.records) == len(RECORDS)
+    assert index.search("加班")[0]["id"] == 2
+    logger.info("✅ 解析后自动建索引测试通过")
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_search_ranking_and_filters()
+    test_snippet()
+    test_index_on_parse()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Prompt查找投机解码测试用例：验证n-gram草稿查找（长n-gram优先、最近出现优先、不匹配自身、随生成追加）"""
+from core.ai_service.speculative import NgramIndex
+from utils import logger
+
+
+def test_propose_longest_and_latest():
+    """测试优先用最长n-gram匹配，同一n-gram取最近一次出现位置之后的token"""
+    # 口头禅「1 2 3」在上下文中出现两次，之后分别接「4 5」和「6 7」
+    index = NgramIndex([1, 2, 3, 4, 5, 9, 1, 2, 3, 6, 7, 8, 2, 3], max_ngram=3, min_ngram=1)
+    assert index.propose(2) == [6, 7], "2-gram「2 3」应取最近一次出现之后的token"
+    index.append([5, 1, 2, 3])
+    assert index.propose(3) == [6, 7, 8], "3-gram「1 2 3」应优先于更短的匹配"
+    assert index.propose(0) == []
+    logger.info("✅ n-gram草稿查找测试通过")
+
+
+def test_propose_no_self_match():
+    """测试当前后缀不会匹配到自身，未出现过的n-gram返回空草稿"""
+    index = NgramIndex([1, 2, 3], max_ngram=2, min_ngram=1)
+    assert index.propose(4) == [], "末尾token未在之前出现，不应有草稿"
+    index.append([2])
+    assert index.propose(4) == [3, 2], "草稿包含随生成追加的token"
+    index = NgramIndex([7, 7, 7], max_ngram=2, min_ngram=2)
+    assert index.propose(3) == [7], "重复token只能匹配到之前的位置"
+    logger.info("✅ 草稿不匹配自身测试通过")
+
+
+def test_min_ngram():
+    """测试min_ngram限制：只有单token重合时不出草稿"""
+    index = NgramIndex([1, 2, 3, 4, 9, 3], max_ngram=3, min_ngram=2)
+    assert index.propose(2) == []
+    index.append([4])
+    assert index.propose(2) == [9, 3]
+    logger.info("✅ 最短n-gram限制测试通过")
+
+
+if __name__ == "__main__":
+    test_propose_longest_and_latest()
+    test_propose_no_self_match()
+    test_min_ngram()
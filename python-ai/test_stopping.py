@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""回复形态停止测试用例：验证句子数/轮次结束token/换行新发送人/取消停止、回复裁剪、自适应生成预算"""
+from core.ai_service.stopping import (
+    ReplyShapeStoppingCriteria, estimate_reply_budget, trim_reply, count_sentences,
+    STOP_SENTENCES, STOP_TURN_END, STOP_NEW_SPEAKER, STOP_CANCELLED, STOP_MAX_TOKENS
+)
+from utils import logger
+
+IM_END_ID = 0x10FFFF  # 轮次结束token id（超出字符范围，解码为<|im_end|>）
+
+
+class CharTokenizer:
+    """字符级分词器（测试用）：每个字符一个token"""
+    def encode(self, text, add_special_tokens=False):
+        return [ord(ch) for ch in text]
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join("<|im_end|>" if i == IM_END_ID else chr(i) for i in ids)
+
+
+class FakeRow(list):
+    @property
+    def shape(self):
+        return (len(self),)
+
+
+class FakeInputIds:
+    """模拟batch=1的input_ids（支持input_ids[0, start:]切片）"""
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, index):
+        _, columns = index
+        return FakeRow(self.ids[columns])
+
+
+def _run(criteria, tokenizer, prompt, reply):
+    """逐token追加回复并调用停止条件，返回停止时已生成的文本"""
+    ids = tokenizer.encode(prompt)
+    for token in (reply if isinstance(reply, list) else tokenizer.encode(reply)):
+        ids.append(token)
+        if criteria(FakeInputIds(ids)):
+            break
+    return tokenizer.decode(ids[len(prompt):])
+
+
+def test_stop_on_sentences():
+    """测试生成满N个完整句子停止，min_new_tokens未达到前不停止"""
+    tokenizer = CharTokenizer()
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=3, max_sentences=2)
+    assert _run(criteria, tokenizer, "问题：", "好的！我马上到。然后再说吧") == "好的！我马上到。"
+    assert criteria.stop_reason == STOP_SENTENCES and criteria.num_generated == 8
+
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=3, max_sentences=1, min_new_tokens=5)
+    # 第2个token已满1句，但到第5个token（最少token数）才检查句子数
+    assert _run(criteria, tokenizer, "问题：", "嗯。好的呀。") == "嗯。好的呀", "未达到最少token数不应停止"
+    assert count_sentences("哈哈！！真的吗？？还") == 2, "连续标点应视为同一句结尾"
+    logger.info("✅ 句子数停止测试通过")
+
+
+def test_stop_on_turn_end_and_new_speaker():
+    """测试轮次结束token/字符串立即停止，换行后出现新发送人停止，未触发时为max_tokens"""
+    tokenizer = CharTokenizer()
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=0, max_sentences=0, min_new_tokens=10,
+                                          stop_token_ids=[IM_END_ID])
+    assert _run(criteria, tokenizer, "", [ord("好"), IM_END_ID, ord("的")]) == "好<|im_end|>"
+    assert criteria.stop_reason == STOP_TURN_END, "轮次结束token不受min_new_tokens限制"
+
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=0, max_sentences=0)
+    assert _run(criteria, tokenizer, "", "在呢<|im_end|>多余").endswith("<|im_end|>")
+    assert criteria.stop_reason == STOP_TURN_END
+
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=0, max_sentences=0)
+    assert _run(criteria, tokenizer, "", "我在吃饭\n李四：你呢") == "我在吃饭\n李四："
+    assert criteria.stop_reason == STOP_NEW_SPEAKER
+
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=0, max_sentences=3)
+    _run(criteria, tokenizer, "", "好的")
+    assert criteria.stop_reason == STOP_MAX_TOKENS and criteria.first_token_time is not None
+    logger.info("✅ 轮次结束/新发送人停止测试通过")
+
+
+def test_cancel():
+    """测试取消后下一个token处停止"""
+    tokenizer = CharTokenizer()
+    criteria = ReplyShapeStoppingCriteria(tokenizer, prompt_len=0, max_sentences=0)
+    assert not criteria(FakeInputIds(tokenizer.encode("好")))
+    criteria.cancel()
+    assert criteria(FakeInputIds(tokenizer.encode("好的")))
+    assert criteria.stop_reason == STOP_CANCELLED
+    logger.info("✅ 取消停止测试通过")
+
+
+def test_trim_reply():
+    """测试回复裁剪：截掉结束标记/新发送人之后的内容，最多保留N句，换行压成空格"""
+    assert trim_reply("好的！我马上到。然后再说<|im_end|>李四：嗯", max_sentences=2) == "好的！我马上到。"
+    assert trim_reply("我在吃饭\n李四：你呢", max_sentences=2) == "我在吃饭"
+    assert trim_reply("第一句\n第二句\n第三句", max_sentences=0) == "第一句 第二句 第三句"
+    assert trim_reply("  哈哈哈  ", max_sentences=2) == "哈哈哈"
+    logger.info("✅ 回复裁剪测试通过")
+
+
+def test_estimate_reply_budget():
+    """测试生成预算：按目标发送人合并后的回复长度分位数估算，受上下限约束，无样本时用默认值"""
+    turns = [("张三", "a" * 10), ("张三", "b" * 10), ("李四", "c" * 100), ("张三", "d" * 40), ("李四", "e")]
+    budget = estimate_reply_budget(turns, target_sender="张三", percentile=0.9, tokens_per_char=1.0, margin=1.0)
+    # 张三连续两条合并为21字符，样本[21, 40]，90分位取40
+    assert budget == {"max_new_tokens": 40, "samples": 2, "reply_chars_p": 40.0}
+    assert estimate_reply_budget(turns, target_sender="张三", min_tokens=64)["max_new_tokens"] == 64
+    assert estimate_reply_budget(turns, target_sender="李四", max_tokens=32)["max_new_tokens"] == 32
+    empty = estimate_reply_budget(turns, target_sender="王五", default_tokens=48, max_tokens=32)
+    assert empty == {"max_new_tokens": 32, "samples": 0, "reply_chars_p": 0.0}
+    logger.info("✅ 生成预算估算测试通过")
+
+
+if __name__ == "__main__":
+    test_stop_on_sentences()
+    test_stop_on_turn_end_and_new_speaker()
+    test_cancel()
+    test_trim_reply()
+    test_estimate_reply_budget()
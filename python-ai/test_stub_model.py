@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""桩模型测试用例：验证经路由器注册后确定性生成、延迟按prefill/decode参数模拟、超时返回错误"""
+import time
+
+from ai_model.stub.config import stub_model_config
+from core.ai_service.stopping import STOP_MAX_TOKENS
+from core.ai_service.router import AIModelRouter, MODEL_INSTANCES, MODEL_CLASSES, MODEL_CONFIGS, model_manager
+from utils import logger
+
+VERSION = "advanced"  # 使用预留版本注册桩模型，避免影响free
+
+
+def test_stub_model_generate():
+    """测试同一输入回复一致、耗时≈prefill+decode、预计耗时超过timeout时返回超时错误"""
+    params = {**stub_model_config["stub_params"], "load_sec": 0.0, "prefill_ms_per_token": 0.1,
+              "decode_ms_per_token": 5.0, "output_tokens": 10}
+    MODEL_CLASSES[VERSION] = "ai_model.stub.model:StubAIModel"
+    MODEL_CONFIGS[VERSION] = {**stub_model_config, "version": VERSION, "stub_params": params}
+    try:
+        start = time.perf_counter()
+        first = AIModelRouter.route_generate_imitate(version=VERSION, context="小明：在干嘛", question="吃了吗")
+        cost = time.perf_counter() - start
+        second = AIModelRouter.route_generate_imitate(version=VERSION, context="小明：在干嘛", question="吃了吗")
+        assert first["code"] == 200 and first["data"]["content"] == second["data"]["content"], "同一输入回复应一致"
+        assert first["data"]["version"] == VERSION and first["data"]["model_name"] == "stub"
+        assert first["data"]["stop_reason"] == STOP_MAX_TOKENS, "停止原因应与真实模型使用同一取值"
+        assert cost >= 10 * 5.0 / 1000, f"生成耗时应不少于decode耗时：{cost}"
+
+        timed_out = AIModelRouter.route_generate_imitate(version=VERSION, context="", question="慢", timeout=0.01,
+                                                         max_gen_len=10)
+        assert timed_out["code"] == 500 and "超时" in timed_out["msg"], f"应返回超时错误：{timed_out}"
+    finally:
+        model_manager.forget(VERSION)
+        MODEL_CLASSES[VERSION], MODEL_CONFIGS[VERSION], MODEL_INSTANCES[VERSION] = None, {}, None
+    logger.info("✅ 桩模型测试通过")
+
+
+if __name__ == "__main__":
+    test_stub_model_generate()
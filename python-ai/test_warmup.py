@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""模型启动加载与预热测试用例：验证预热覆盖各长度且经推理队列执行、就绪状态随加载/预热/卸载变化"""
+import asyncio
+import threading
+
+from core.ai_service.base import BaseAIModel
+from core.ai_service.inference_queue import _INFERENCE_QUEUES
+from core.ai_service.router import MODEL_INSTANCES, MODEL_CLASSES, MODEL_CONFIGS, model_manager
+from core.ai_service.warmup import (
+    load_and_warm_up, get_model_readiness, build_warmup_context, inference_queue_slot
+)
+from utils import logger
+
+VERSION = "advanced"  # 使用预留版本注册假模型，避免影响free
+
+
+class FakeModel(BaseAIModel):
+    """假模型：记录预热时的上下文长度、当时的就绪状态与推理队列占用"""
+    def __init__(self, model_config):
+        super().__init__(model_config)
+        self.timeout = 1.0
+        self.calls = []
+        self.observed = []
+
+    def load_quantize_model(self):
+        self.status = self.STATUS_LOADED
+        return {"code": 200, "msg": "加载成功", "data": {}}
+
+    def generate_imitate(self, context, question, **kwargs):
+        self.calls.append((len(context), kwargs.get("max_gen_len")))
+        queue = _INFERENCE_QUEUES.get(VERSION)
+        self.observed.append((get_model_readiness(VERSION), queue.in_flight if queue else None))
+        self.warmed_up = True  # 与真实模型一致：完成一次生成即置为已预热
+        return {"code": 200, "msg": "生成成功", "data": {"content": "好的"}}
+
+    def get_status(self):
+        return {"code": 200, "msg": "查询成功", "data": {"status": self.status}}
+
+    def release(self):
+        self.status = self.STATUS_UNLOADED
+        self.warmed_up = False
+        return {"code": 200, "msg": "释放成功"}
+
+
+def test_load_and_warm_up():
+    """测试启动加载：加载→按各长度经推理队列预热（预热中未就绪）→ready；卸载后变为未就绪"""
+    MODEL_CLASSES[VERSION], MODEL_CONFIGS[VERSION] = FakeModel, {"memory_estimate": "1M", "timeout": 5.0}
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    try:
+        assert not get_model_readiness(VERSION)["ready"], "加载前不应就绪"
+        readiness = load_and_warm_up(VERSION, slot=inference_queue_slot(loop))
+        model = MODEL_INSTANCES[VERSION]
+        assert readiness["ready"] and readiness["stage"] == "ready", f"预热后应就绪：{readiness}"
+        assert len(readiness["warmup"]) == len(model.calls) > 0, "每次预热都应记录耗时"
+        for during, in_flight in model.observed:
+            assert during["stage"] == "warming" and not during["ready"], f"预热中不应就绪：{during}"
+            assert in_flight == 1, "预热生成应占用推理队列槽位"
+        assert _INFERENCE_QUEUES[VERSION].in_flight == 0, "预热结束应释放槽位"
+        assert all(max_gen_len is not None for _, max_gen_len in model.calls), "预热应限制生成长度"
+        assert VERSION in model_manager.snapshot()["resident"], "启动加载的版本应常驻"
+
+        model_manager.set_resident(VERSION, False)
+        model_manager.unload(VERSION)
+        assert not get_model_readiness(VERSION)["ready"], "卸载后不应就绪"
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join(timeout=5)
+        loop.close()
+        _INFERENCE_QUEUES.pop(VERSION, None)
+        model_manager.forget(VERSION)
+        MODEL_CLASSES[VERSION], MODEL_CONFIGS[VERSION], MODEL_INSTANCES[VERSION] = None, {}, None
+    logger.info("✅ 启动加载与预热测试通过")
+
+
+def test_build_warmup_context():
+    """测试预热上下文长度不小于目标且为「发送人：内容」格式"""
+    for num_chars in (1, 64, 2048):
+        context = build_warmup_context(num_chars)
+        assert len(context) >= num_chars - 1
+        assert all("：" in line for line in context.splitlines())
+    logger.info("✅ 预热上下文构造测试通过")
+
+
+if __name__ == "__main__":
+    test_load_and_warm_up()
+    test_build_warmup_context()
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""离线工具：基准测试/压测/量化等命令行脚本（在python-ai目录下以 python -m tools.xxx 运行）"""
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+推理后端对比基准：同一批Prompt下比较各后端的加载耗时、RSS、解码tokens/s
+每个后端在独立子进程中运行，避免RSS/线程池互相干扰
+用法：python -m tools.backend_bench --backends gptq,torch_int8 --output logs/bench/backend.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from tools.common import build_sample_context, write_results, SAMPLE_QUESTIONS
+
+
+def run_single_backend(backend: str, num_prompts: int, context_lines: int, max_new_tokens: int) -> dict:
+    """在当前进程加载指定后端并跑固定Prompt集，返回统计结果"""
+    import torch
+    from ai_model.free.config import free_model_config
+    from ai_model.free.model import FreeAIModel
+    from ai_model.free.prompt import free_prompt_compiler
+    from utils.sys_util import get_rss_bytes, get_peak_rss_bytes
+
+    rss_before = get_rss_bytes()
+    model = FreeAIModel({**free_model_config, "backend": backend})
+    load_start = time.perf_counter()
+    load_result = model.load_quantize_model()
+    load_time = time.perf_counter() - load_start
+    if load_result["code"] != 200:
+        return {"backend": backend, "error": load_result["msg"]}
+    rss_loaded = get_rss_bytes()
+
+    prompt_tokens, generated_tokens, decode_time = 0, 0, 0.0
+    for idx in range(num_prompts):
+        compiled = free_prompt_compiler.compile(
+            model.tokenizer,
+            max_length=model.max_context_len,
+            context=build_sample_context(context_lines, seed=idx),
+            question=SAMPLE_QUESTIONS[idx % len(SAMPLE_QUESTIONS)]
+        )
+        input_ids = torch.tensor([compiled["input_ids"]], dtype=torch.long, device=model.device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            # 贪心解码+固定生成长度，保证各后端工作量一致
+            outputs = model.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=model.tokenizer.pad_token_id
+            )
+        decode_time += time.perf_counter() - start
+        prompt_tokens += input_ids.shape[-1]
+        generated_tokens += outputs.shape[-1] - input_ids.shape[-1]
+
+    return {
+        "backend": backend,
+        "device": model.device,
+        "torch_threads": torch.get_num_threads(),
+        "load_time_s": round(load_time, 3),
+        "rss_model_mb": round((rss_loaded - rss_before) / 1024 / 1024, 1),
+        "peak_rss_mb": round(get_peak_rss_bytes() / 1024 / 1024, 1),
+        "prompts": num_prompts,
+        "avg_prompt_tokens": round(prompt_tokens / max(num_prompts, 1), 1),
+        "generated_tokens": generated_tokens,
+        "tokens_per_s": round(generated_tokens / decode_time, 2) if decode_time else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理后端对比基准（tokens/s、RSS）")
+    parser.add_argument("--backends", default="gptq,torch_int8", help="逗号分隔的后端名")
+    parser.add_argument("--prompts", type=int, default=8, help="Prompt数量")
+    parser.add_argument("--context-lines", type=int, default=40, help="每个Prompt的聊天上下文行数")
+    parser.add_argument("--max-new-tokens", type=int, default=32, help="每个Prompt固定生成token数")
+    parser.add_argument("--output", default="logs/bench/backend_bench.json", help="结果文件（.json/.csv）")
+    parser.add_argument("--single", default=None, help="内部使用：仅在当前进程运行单个后端并输出JSON")
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single_backend(args.single, args.prompts, args.context_lines, args.max_new_tokens)))
+        return
+
+    rows = []
+    for backend in [name.strip() for name in args.backends.split(",") if name.strip()]:
+        proc = subprocess.run(
+            [sys.executable, "-m", "tools.backend_bench", "--single", backend,
+             "--prompts", str(args.prompts), "--context-lines", str(args.context_lines),
+             "--max-new-tokens", str(args.max_new_tokens)],
+            capture_output=True, text=True
+        )
+        result_lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        row = json.loads(result_lines[-1]) if result_lines else {"backend": backend, "error": proc.stderr[-300:]}
+        rows.append(row)
+        print(row)
+    write_results(rows, args.output)
+    print(f"结果已写入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""离线工具公共方法：确定性样例聊天上下文生成、结果写出（JSON/CSV）"""
+import csv
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+# 样例发言（带口头禅/重复短语，贴近真实聊天风格）
+_SAMPLE_PHRASES = [
+    "哈哈哈哈笑死我了", "嗯嗯好的", "今天好累啊", "你吃饭了没", "在干嘛呢",
+    "我刚下班，地铁上人好多", "周末要不要一起去看电影", "哈哈哈可以呀", "真的假的",
+    "明天早上八点开会，好烦", "早点休息嗯嗯", "我也想你啦", "这个好好吃，下次带你去",
+    "哎呀忘记了", "等我一下马上回来", "好的好的收到", "你说的对哈哈哈", "晚安啦"
+]
+SAMPLE_SENDERS = ["小明", "小红"]
+SAMPLE_QUESTIONS = ["在干嘛", "我好想你", "晚上吃什么", "周末有空吗"]
+
+
+def build_sample_context(num_lines: int, seed: int = 0) -> str:
+    """
+    生成确定性样例聊天上下文（同seed结果一致，保证不同后端/参数对比同一批Prompt）
+    :param num_lines: 聊天行数
+    :param seed: 随机种子
+    :return: 「发送人：内容」多行字符串
+    """
+    rng = random.Random(seed)
+    lines = []
+    for idx in range(num_lines):
+        sender = SAMPLE_SENDERS[idx % 2] if rng.random() > 0.3 else SAMPLE_SENDERS[(idx + 1) % 2]
+        lines.append(f"{sender}：{rng.choice(_SAMPLE_PHRASES)}")
+    return "\n".join(lines)
+
+
+def build_sample_chat_export(num_messages: int, seed: int = 0) -> str:
+    """
+    生成带时间戳的微信TXT导出样例（压测/解析基准使用）
+    :param num_messages: 消息条数
+    :param seed: 随机种子
+    :return: 【时间】发送人：内容 格式字符串
+    """
+    rng = random.Random(seed)
+    lines = []
+    for idx in range(num_messages):
+        minute, second = divmod(idx, 60)
+        hour, minute = divmod(minute, 60)
+        sender = rng.choice(SAMPLE_SENDERS)
+        lines.append(f"【2025-02-03 {hour % 24:02d}:{minute:02d}:{second:02d}】{sender}：{rng.choice(_SAMPLE_PHRASES)}{idx}")
+    return "\n".join(lines)
+
+
+def write_results(rows: List[Dict[str, Any]], output_path: str) -> None:
+    """
+    写出基准结果：.csv按列写出，其余后缀写JSON
+    :param rows: 结果行列表
+    :param output_path: 输出文件路径
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if output_path.endswith(".csv"):
+        fieldnames: List[str] = []
+        for row in rows:
+            fieldnames.extend(key for key in row if key not in fieldnames)
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+离线推理基准：按「prompt token数 × max_new_tokens × torch线程数 × batch大小」网格扫描，
+记录prefill耗时、首token时间（含Prompt编译）、decode tokens/s、RSS/峰值RSS，为free_model_config调参提供数据
+- 模型经FreeAIModel.load_quantize_model加载（与服务相同的后端/load_4bit_quant_model路径），可用--model-path指定小模型
+- Prompt经free_prompt_compiler编译并从左截断到目标token数（与服务相同的Prompt结构）
+- 贪心解码+固定生成长度（min_new_tokens=max_new_tokens），各组合工作量一致
+- 峰值RSS为进程级累计峰值（同一进程内按扫描顺序单调不减），需隔离时用--threads单值多次运行
+- --kv-quantization int8：开启int8 KV缓存，kv_cache_mb为batch总KV缓存（每token字节数×缓存token数），
+  对比同一峰值RSS下可容纳的batch大小/并发数
+- --prompt-lookup：Prompt查找投机解码对比（batch=1，服务相同的采样参数），同一解码循环分别关闭/开启草稿、
+  相同随机种子，记录草稿接受率、每次前向生成token数、两种模式decode tokens/s与加速比、输出一致比例
+用法：python -m tools.inference_bench --prompt-tokens 128,512,1024 --max-new-tokens 16,64 --threads 2,4 --batch-sizes 1,4 --output logs/bench/inference.csv
+     python -m tools.inference_bench --prompt-lookup --prompt-tokens 256,1024 --max-new-tokens 32,64 --output logs/bench/prompt_lookup.csv
+"""
+import argparse
+import copy
+import statistics
+import time
+from typing import Any, Dict, List
+
+from tools.common import build_sample_context, write_results, SAMPLE_QUESTIONS
+
+
+class FirstTokenTimer:
+    """记录首个新token生成时刻（兼容transformers StoppingCriteria调用协议，从不触发停止）"""
+
+    def __init__(self):
+        self.first_token_time = None
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        return False
+
+
+def _parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def build_batch(model, prompt_tokens: int, batch_size: int, seed: int) -> Dict[str, Any]:
+    """
+    编译batch_size个目标长度的Prompt（上下文足够长后从左截断到prompt_tokens），左侧padding对齐
+    :return: {"input_ids", "attention_mask", "compile_ms", "prompt_tokens"}
+    """
+    import torch
+    from ai_model.free.prompt import free_prompt_compiler
+
+    compile_start = time.perf_counter()
+    sequences = []
+    for idx in range(batch_size):
+        compiled = free_prompt_compiler.compile(
+            model.tokenizer,
+            max_length=prompt_tokens,
+            # 每行约6~10个token，预留足够上下文保证可截断到目标长度
+            context=build_sample_context(prompt_tokens // 4 + 8, seed=seed + idx),
+            question=SAMPLE_QUESTIONS[(seed + idx) % len(SAMPLE_QUESTIONS)]
+        )
+        sequences.append(compiled["input_ids"])
+    compile_ms = (time.perf_counter() - compile_start) * 1000
+    width = max(len(ids) for ids in sequences)
+    pad_id = model.tokenizer.pad_token_id
+    input_ids = torch.tensor([[pad_id] * (width - len(ids)) + list(ids) for ids in sequences],
+                             dtype=torch.long, device=model.device)
+    attention_mask = torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in sequences],
+                                  dtype=torch.long, device=model.device)
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "compile_ms": compile_ms,
+            "prompt_tokens": round(statistics.mean(len(ids) for ids in sequences), 1)}
+
+
+def run_case(model, prompt_tokens: int, max_new_tokens: int, threads: int, batch_size: int,
+             repeats: int) -> Dict[str, Any]:
+    """单个组合：重复repeats次取中位数"""
+    import torch
+    from transformers import StoppingCriteriaList
+    from utils.model_util import configure_torch_threads
+    from utils.sys_util import get_rss_bytes, get_peak_rss_bytes
+
+    if model.device == "cpu":
+        configure_torch_threads(threads or None)
+    prefill_ms, ttft_ms, decode_rates, total_ms = [], [], [], []
+    generated = 0
+    for repeat in range(repeats):
+        request_start = time.perf_counter()
+        batch = build_batch(model, prompt_tokens, batch_size, seed=repeat * batch_size)
+        timer = FirstTokenTimer()
+        generate_start = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.model.generate(
+                input_ids=batch["input_ids"],
+                attention_mask=batch["attention_mask"],
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                num_beams=1,
+                use_cache=True,
+                pad_token_id=model.tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([timer])
+            )
+        end = time.perf_counter()
+        generated = outputs.shape[-1] - batch["input_ids"].shape[-1]
+        prefill_ms.append((timer.first_token_time - generate_start) * 1000)
+        ttft_ms.append((timer.first_token_time - request_start) * 1000)
+        total_ms.append((end - request_start) * 1000)
+        if generated > 1 and end > timer.first_token_time:
+            # batch内每条并行解码，吞吐按batch总token数计
+            decode_rates.append((generated - 1) * batch_size / (end - timer.first_token_time))
+
+    return {
+        "prompt_tokens_target": prompt_tokens,
+        "prompt_tokens": batch["prompt_tokens"],
+        "max_new_tokens": max_new_tokens,
+        "generated_tokens": generated,
+        "kv_quantization": model.kv_quantization,
+        "kv_cache_mb": round(model.kv_bytes_per_token * (batch["prompt_tokens"] + generated) * batch_size / 1024 / 1024, 1),
+        "threads": torch.get_num_threads() if model.device == "cpu" else None,
+        "batch_size": batch_size,
+        "repeats": repeats,
+        "prompt_compile_ms": round(batch["compile_ms"], 2),
+        "prefill_ms": round(statistics.median(prefill_ms), 2),
+        "ttft_ms": round(statistics.median(ttft_ms), 2),
+        "decode_tokens_per_s": round(statistics.median(decode_rates), 2) if decode_rates else 0.0,
+        "total_ms": round(statistics.median(total_ms), 2),
+        "rss_mb": round(get_rss_bytes() / 1024 / 1024, 1),
+        "peak_rss_mb": round(get_peak_rss_bytes() / 1024 / 1024, 1),
+    }
+
+
+def run_prompt_lookup_case(model, prompt_tokens: int, max_new_tokens: int, threads: int, repeats: int,
+                           lookup_params: Dict[str, Any], temperature: float, top_p: float) -> Dict[str, Any]:
+    """
+    投机解码对比：每次重复用同一Prompt、同一随机种子分别跑关闭草稿（num_draft_tokens=0）与开启草稿
+    固定生成长度（min_new_tokens=max_new_tokens），两种模式工作量一致；decode速率取中位数
+    """
+    import torch
+    from core.ai_service.speculative import prompt_lookup_generate
+    from utils.model_util import configure_torch_threads
+
+    if model.device == "cpu":
+        configure_torch_threads(threads or None)
+    rates = {"baseline": [], "prompt_lookup": []}
+    drafted = accepted = forward_passes = new_tokens = matched = 0
+    for repeat in range(repeats):
+        batch = build_batch(model, prompt_tokens, 1, seed=repeat)
+        outputs = {}
+        for mode, num_draft_tokens in (("baseline", 0), ("prompt_lookup", lookup_params["num_draft_tokens"])):
+            torch.manual_seed(repeat)
+            timer = FirstTokenTimer()
+            output, stats = prompt_lookup_generate(
+                model.model,
+                batch["input_ids"],
+                attention_mask=batch["attention_mask"],
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                repetition_penalty=1.1,
+                eos_token_ids=[model.tokenizer.eos_token_id],
+                stopping_criteria=[timer],
+                num_draft_tokens=num_draft_tokens,
+                max_ngram=lookup_params["max_ngram"],
+                min_ngram=lookup_params["min_ngram"]
+            )
+            end = time.perf_counter()
+            outputs[mode] = output[0].tolist()
+            if stats["new_tokens"] > 1 and end > timer.first_token_time:
+                rates[mode].append((stats["new_tokens"] - 1) / (end - timer.first_token_time))
+        drafted += stats["drafted"]
+        accepted += stats["accepted"]
+        forward_passes += stats["forward_passes"]
+        new_tokens += stats["new_tokens"]
+        matched += outputs["baseline"] == outputs["prompt_lookup"]
+
+    baseline_rate = statistics.median(rates["baseline"]) if rates["baseline"] else 0.0
+    lookup_rate = statistics.median(rates["prompt_lookup"]) if rates["prompt_lookup"] else 0.0
+    return {
+        "prompt_tokens_target": prompt_tokens,
+        "prompt_tokens": batch["prompt_tokens"],
+        "max_new_tokens": max_new_tokens,
+        "threads": torch.get_num_threads() if model.device == "cpu" else None,
+        "temperature": temperature,
+        "repeats": repeats,
+        **lookup_params,
+        "acceptance_rate": round(accepted / drafted, 3) if drafted else 0.0,
+        "tokens_per_forward": round(new_tokens / forward_passes, 2) if forward_passes else 0.0,
+        "baseline_decode_tokens_per_s": round(baseline_rate, 2),
+        "prompt_lookup_decode_tokens_per_s": round(lookup_rate, 2),
+        "speedup": round(lookup_rate / baseline_rate, 2) if baseline_rate else 0.0,
+        # 同一种子下输出应一致（批量验证与逐token前向的浮点误差偶尔会改变采样结果）
+        "outputs_match": round(matched / repeats, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线推理基准（prompt长度×生成长度×线程数×batch网格扫描）")
+    parser.add_argument("--backend", default=None, help="推理后端（默认free_model_config.backend）")
+    parser.add_argument("--model-path", default=None, help="覆盖模型路径（可用小模型验证流程）")
+    parser.add_argument("--prompt-tokens", default="128,512,1024", help="逗号分隔的prompt token数")
+    parser.add_argument("--max-new-tokens", default="16,64", help="逗号分隔的生成token数")
+    parser.add_argument("--threads", default="0", help="逗号分隔的torch intra-op线程数，0=自动（物理核数），仅CPU生效")
+    parser.add_argument("--batch-sizes", default="1", help="逗号分隔的batch大小")
+    parser.add_argument("--repeats", type=int, default=3, help="每个组合重复次数（取中位数）")
+    parser.add_argument("--warmup", type=int, default=1, help="正式扫描前的预热生成次数")
+    parser.add_argument("--kv-quantization", default=None, choices=["int8"], help="KV缓存量化（默认取配置）")
+    parser.add_argument("--prompt-lookup", action="store_true", help="Prompt查找投机解码对比（忽略--batch-sizes）")
+    parser.add_argument("--num-draft-tokens", type=int, default=None, help="每次前向最多草稿token数（默认取配置）")
+    parser.add_argument("--temperature", type=float, default=0.7, help="投机解码对比的采样温度，0=贪心")
+    parser.add_argument("--top-p", type=float, default=0.95, help="投机解码对比的top_p")
+    parser.add_argument("--output", default="logs/bench/inference_bench.json", help="结果文件（.json/.csv）")
+    args = parser.parse_args()
+
+    from ai_model.free.config import free_model_config
+    from ai_model.free.model import FreeAIModel
+    from utils.sys_util import get_rss_bytes
+
+    model_config = copy.deepcopy(free_model_config)
+    if args.backend:
+        model_config["backend"] = args.backend
+    if args.model_path:
+        model_config["model_path"] = args.model_path
+        for params in model_config.get("backend_params", {}).values():
+            params["model_path"] = args.model_path
+
+    if args.kv_quantization:
+        model_config["kv_cache"] = {**model_config.get("kv_cache", {}), "quantization": args.kv_quantization}
+
+    rss_before = get_rss_bytes()
+    model = FreeAIModel(model_config)
+    load_start = time.perf_counter()
+    load_result = model.load_quantize_model()
+    if load_result["code"] != 200:
+        raise SystemExit(f"模型加载失败：{load_result['msg']}")
+    print(f"模型加载完成：{load_result['data']}，耗时{time.perf_counter() - load_start:.1f}s，"
+          f"RSS增量{(get_rss_bytes() - rss_before) / 1024 / 1024:.0f}MB")
+
+    prompt_lengths = _parse_int_list(args.prompt_tokens)
+    for _ in range(args.warmup):
+        run_case(model, prompt_lengths[0], 4, 0, 1, repeats=1)
+
+    rows = []
+    if args.prompt_lookup:
+        lookup_params = {"num_draft_tokens": 8, "max_ngram": 3, "min_ngram": 1}
+        lookup_params.update({key: value for key, value in model_config.get("prompt_lookup", {}).items()
+                              if key in lookup_params})
+        if args.num_draft_tokens is not None:
+            lookup_params["num_draft_tokens"] = args.num_draft_tokens
+        for threads in _parse_int_list(args.threads):
+            for prompt_tokens in prompt_lengths:
+                for max_new_tokens in _parse_int_list(args.max_new_tokens):
+                    try:
+                        row = run_prompt_lookup_case(model, prompt_tokens, max_new_tokens, threads, args.repeats,
+                                                     lookup_params, args.temperature, args.top_p)
+                    except Exception as e:
+                        row = {"prompt_tokens_target": prompt_tokens, "max_new_tokens": max_new_tokens,
+                               "threads": threads, "error": str(e)[:200]}
+                    row = {"backend": model.backend.name, "device": model.device, **row}
+                    rows.append(row)
+                    print(row)
+        write_results(rows, args.output)
+        print(f"结果已写入：{args.output}")
+        return
+
+    for threads in _parse_int_list(args.threads):
+        for batch_size in _parse_int_list(args.batch_sizes):
+            for prompt_tokens in prompt_lengths:
+                for max_new_tokens in _parse_int_list(args.max_new_tokens):
+                    try:
+                        row = run_case(model, prompt_tokens, max_new_tokens, threads, batch_size, args.repeats)
+                    except Exception as e:
+                        row = {"prompt_tokens_target": prompt_tokens, "max_new_tokens": max_new_tokens,
+                               "threads": threads, "batch_size": batch_size, "error": str(e)[:200]}
+                    row = {"backend": model.backend.name, "device": model.device, **row}
+                    rows.append(row)
+                    print(row)
+    write_results(rows, args.output)
+    print(f"结果已写入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+端到端API压测：异步并发驱动/ai/v1/parse与/ai/v1/generate/imitate（按比例混合、请求体大小按真实分布抽样）
+统计吞吐、p50/p95/p99延迟、错误率、超时率，并定期采样服务端RSS（/metrics的process_resident_memory_bytes）观察长时间浸泡下的内存增长
+无GPU时配合桩模型：--start-server自动以MODEL_STUB_VERSIONS=["free"]启动服务（生成走完整路由/排队/序列化链路）
+依赖httpx（可选依赖，仅压测使用）
+用法：python -m tools.load_test --start-server --duration 60 --concurrency 16 --output logs/bench/load_test.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from tools.common import build_sample_chat_export, build_sample_context, SAMPLE_QUESTIONS, SAMPLE_SENDERS, write_results
+
+# 请求体大小分布：(聊天记录条数/上下文行数, 权重)，多数为短会话，少量长会话
+PARSE_SIZE_MIX = [(50, 0.6), (500, 0.3), (5000, 0.1)]
+GENERATE_SIZE_MIX = [(10, 0.5), (40, 0.35), (150, 0.15)]
+# 每种大小预生成的不同内容数（控制解析缓存命中率）
+DISTINCT_PAYLOADS = 20
+_RSS_PATTERN = re.compile(r"^process_resident_memory_bytes (\S+)$", re.MULTILINE)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percentile * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _weighted_choice(rng: random.Random, mix: List[Tuple[int, float]]) -> int:
+    return rng.choices([size for size, _ in mix], weights=[weight for _, weight in mix])[0]
+
+
+class PayloadFactory:
+    """请求体生成：按大小分布抽样，内容预生成（压测期间不计入客户端开销）"""
+
+    def __init__(self, seed: int, distinct: int):
+        self.rng = random.Random(seed)
+        self.parse_payloads = {
+            size: [build_sample_chat_export(size, seed=idx) for idx in range(distinct)] for size, _ in PARSE_SIZE_MIX
+        }
+        self.generate_contexts = {
+            size: [build_sample_context(size, seed=idx) for idx in range(distinct)] for size, _ in GENERATE_SIZE_MIX
+        }
+
+    def parse(self) -> Dict[str, Any]:
+        size = _weighted_choice(self.rng, PARSE_SIZE_MIX)
+        return {"content": self.rng.choice(self.parse_payloads[size]), "format_type": "txt", "use_cache": True}
+
+    def generate(self, timeout: Optional[float]) -> Dict[str, Any]:
+        size = _weighted_choice(self.rng, GENERATE_SIZE_MIX)
+        payload = {
+            "context": self.rng.choice(self.generate_contexts[size]),
+            "question": self.rng.choice(SAMPLE_QUESTIONS),
+            "version": "free",
+            "target_sender": self.rng.choice(SAMPLE_SENDERS),
+        }
+        if timeout:
+            payload["timeout"] = timeout
+        return payload
+
+
+class Stats:
+    """按接口汇总延迟与结果"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.status_counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, status: str, latency_ms: float) -> None:
+        self.latencies.setdefault(endpoint, []).append(latency_ms)
+        counts = self.status_counts.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def rows(self, elapsed: float) -> List[Dict[str, Any]]:
+        rows = []
+        for endpoint, latencies in self.latencies.items():
+            counts = self.status_counts[endpoint]
+            total = len(latencies)
+            ok = counts.get("200", 0)
+            timeouts = counts.get("timeout", 0) + counts.get("504", 0)
+            rows.append({
+                "endpoint": endpoint,
+                "requests": total,
+                "throughput_rps": round(total / elapsed, 2),
+                "ok_rps": round(ok / elapsed, 2),
+                "p50_ms": round(_percentile(latencies, 0.5), 2),
+                "p95_ms": round(_percentile(latencies, 0.95), 2),
+                "p99_ms": round(_percentile(latencies, 0.99), 2),
+                "mean_ms": round(statistics.mean(latencies), 2),
+                "error_rate": round((total - ok) / total, 4),
+                "timeout_rate": round(timeouts / total, 4),
+                "status_counts": json.dumps(counts, ensure_ascii=False),
+            })
+        return rows
+
+
+async def _fetch_rss(client) -> Optional[float]:
+    """服务端RSS（MB），取/metrics的process_resident_memory_bytes"""
+    try:
+        response = await client.get("/metrics", timeout=5)
+        match = _RSS_PATTERN.search(response.text)
+        return float(match.group(1)) / 1024 / 1024 if match else None
+    except Exception:
+        return None
+
+
+async def run_load(base_url: str, duration: float, concurrency: int, generate_ratio: float, seed: int,
+                   request_timeout: float, generate_timeout: Optional[float], rss_interval: float) -> Dict[str, Any]:
+    """
+    固定并发闭环压测：concurrency个协程各自循环发请求直到duration结束
+    :return: {"rows": 各接口统计, "rss": RSS采样序列}
+    """
+    import httpx
+
+    payloads = PayloadFactory(seed, DISTINCT_PAYLOADS)
+    stats = Stats()
+    rss_samples: List[Dict[str, float]] = []
+    headers = {"X-API-Key": settings.API_AUTH_KEY}
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+
+        async def _worker(worker_id: int):
+            rng = random.Random(seed * 1000 + worker_id)
+            while time.perf_counter() < deadline:
+                if rng.random() < generate_ratio:
+                    endpoint, body = "/ai/v1/generate/imitate", payloads.generate(generate_timeout)
+                else:
+                    endpoint, body = "/ai/v1/parse", payloads.parse()
+                request_start = time.perf_counter()
+                try:
+                    response = await client.post(endpoint, json=body, timeout=request_timeout)
+                    await response.aread()
+                    status = str(response.status_code)
+                except httpx.TimeoutException:
+                    status = "timeout"
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                stats.record(endpoint, status, (time.perf_counter() - request_start) * 1000)
+
+        async def _rss_sampler():
+            while time.perf_counter() < deadline:
+                rss = await _fetch_rss(client)
+                if rss is not None:
+                    rss_samples.append({"elapsed_sec": round(time.perf_counter() - start, 1), "rss_mb": round(rss, 1)})
+                await asyncio.sleep(rss_interval)
+
+        await asyncio.gather(_rss_sampler(), *(_worker(idx) for idx in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        final_rss = await _fetch_rss(client)
+        if final_rss is not None:
+            rss_samples.append({"elapsed_sec": round(elapsed, 1), "rss_mb": round(final_rss, 1)})
+    return {"rows": stats.rows(elapsed), "rss": rss_samples}
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    """以桩模型启动服务（关闭reload；workers>1时为多进程模式）"""
+    env = {**os.environ, "API_RELOAD": "false", "API_PORT": str(port), "API_UDS_PATH": "",
+           "API_WORKERS": str(workers), "LOG_LEVEL": "WARNING", "MODEL_STUB_VERSIONS": '["free"]'}
+    server = subprocess.Popen([sys.executable, "main.py"], env=env)
+    time.sleep(3 + workers)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端API压测（解析+生成混合，桩模型）")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{settings.API_PORT}", help="服务地址")
+    parser.add_argument("--start-server", action="store_true", help="以桩模型自动启动服务（端口取--port）")
+    parser.add_argument("--port", type=int, default=18002, help="--start-server时服务端口")
+    parser.add_argument("--workers", type=int, default=1, help="--start-server时API worker数")
+    parser.add_argument("--duration", type=float, default=30.0, help="压测时长（秒），浸泡测试可设为数小时")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数（闭环）")
+    parser.add_argument("--generate-ratio", type=float, default=0.3, help="生成请求占比，其余为解析请求")
+    parser.add_argument("--request-timeout", type=float, default=30.0, help="客户端请求超时（秒）")
+    parser.add_argument("--generate-timeout", type=float, default=None, help="生成请求体timeout（秒），不传使用模型配置")
+    parser.add_argument("--rss-interval", type=float, default=5.0, help="服务端RSS采样间隔（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（请求序列可复现）")
+    parser.add_argument("--output", default="logs/bench/load_test.json", help="结果文件（.json/.csv）")
+    args = parser.parse_args()
+
+    server = None
+    if args.start_server:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, args.workers)
+    try:
+        result = asyncio.run(run_load(
+            args.url, args.duration, args.concurrency, args.generate_ratio, args.seed,
+            args.request_timeout, args.generate_timeout, args.rss_interval
+        ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=15)
+
+    rows = result["rows"]
+    rss = result["rss"]
+    if rss:
+        summary = {"endpoint": "server_rss", "rss_start_mb": rss[0]["rss_mb"], "rss_end_mb": rss[-1]["rss_mb"],
+                   "rss_max_mb": max(sample["rss_mb"] for sample in rss),
+                   "rss_growth_mb": round(rss[-1]["rss_mb"] - rss[0]["rss_mb"], 1)}
+        rows.append(summary)
+    for row in rows:
+        print(row)
+    write_results(rows, args.output)
+    if rss and not args.output.endswith(".csv"):
+        write_results(rss, os.path.splitext(args.output)[0] + "_rss.json")
+    print(f"结果已写入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+离线GPTQ量化流水线：用自有聊天语料校准量化基座checkpoint，输出带版本的量化产物与对比报告
+- 量化参数：全局QUANT_COMMON_PARAMS（utils.model_util.build_quantize_config），--variants逐组覆盖对比
+- 校准/评估语料：WeChatChatParser解析导出的聊天记录，按时间顺序切成约window_chars字符的窗口
+  （与服务构造上下文相同的「发送人：内容」格式），每holdout_every个窗口留出1个作评估集，两者不重叠；
+  未指定语料时使用tools.common的样例聊天导出（仅用于冒烟）
+- 产物：<output_root>/<基座目录名>-<量化参数标签>-<语料指纹>/（save_quantized权重 + 分词器 + 远程代码 +
+  quant_manifest.json），参数与语料相同的产物已存在时直接复用（--force重新量化）；
+  free_model_config["model_path"]指向产物目录即可，load_4bit_quant_model按其中quantize_config.json加载
+- 报告：每组（--include-base时含未量化基座）在独立子进程中加载，记录加载耗时、RSS、评估集困惑度、
+  贪心解码tokens/s，及相对基座的困惑度变化
+- 量化逐层执行GPTQ，CPU上耗时很长，建议在GPU机器上量化，产物再拷贝到部署机评估
+用法：python -m tools.quantize_model --base-model ./models/qwen-1_8b-chat --corpus data/chat1.txt data/chat2.txt \
+         --variants "group_size=128;group_size=64;sym=true" --include-base --output logs/bench/quantize.csv
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.common import build_sample_chat_export, write_results, SAMPLE_QUESTIONS
+
+MANIFEST_NAME = "quant_manifest.json"
+
+
+def parse_variants(spec: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    解析量化参数覆盖：分号分隔各组，逗号分隔key=value（值按JSON解析，true/false/数字），空串为全局默认参数
+    :param spec: 如 "group_size=128;group_size=64,sym=true"
+    """
+    variants = []
+    for group in (spec or "").split(";"):
+        overrides = {}
+        for item in group.split(","):
+            if not item.strip():
+                continue
+            key, _, value = item.partition("=")
+            try:
+                overrides[key.strip()] = json.loads(value.strip().lower())
+            except ValueError:
+                overrides[key.strip()] = value.strip()
+        if overrides not in variants:
+            variants.append(overrides)
+    return variants or [{}]
+
+
+def variant_tag(overrides: Dict[str, Any]) -> str:
+    """量化参数标签（产物目录名/报告列），如 4bit-g128-asym-d0.01"""
+    from config.model import QUANT_COMMON_PARAMS
+    params = {**QUANT_COMMON_PARAMS, **overrides}
+    tag = f"{params['bits']}bit-g{params['group_size']}-{'sym' if params['sym'] else 'asym'}-d{params['damp_percent']}"
+    if params.get("desc_act"):
+        tag += "-act"
+    if not params["true_sequential"]:
+        tag += "-par"
+    return tag
+
+
+def load_corpus_records(paths: List[str], format_type: str = "txt") -> List[Dict[str, Any]]:
+    """
+    解析聊天导出文件为记录列表（不写解析缓存），未指定文件时使用样例聊天导出
+    :param paths: 聊天导出文件路径
+    :param format_type: 导出格式 txt/xml
+    """
+    from core.chat_parser import WeChatChatParser
+    parser = WeChatChatParser()
+    contents = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            contents.append(f.read())
+    if not contents:
+        contents.append(build_sample_chat_export(4000, seed=0))
+    records = []
+    for content in contents:
+        result = parser.parse(content, format_type, use_cache=False)
+        if result["code"] != 200:
+            raise ValueError(f"语料解析失败：{result['msg']}")
+        records.extend(result["data"]["records"])
+    return records
+
+
+def build_calibration_split(
+    records: List[Dict[str, Any]],
+    window_chars: int = 512,
+    holdout_every: int = 5,
+    num_samples: int = 128,
+    eval_samples: int = 32
+) -> Tuple[List[str], List[str]]:
+    """
+    切分校准集/评估集：按时间顺序切成约window_chars字符的聊天窗口，每holdout_every个窗口留出1个作评估
+    窗口多于所需时等间隔抽取（覆盖整个语料时间跨度）
+    :return: (校准文本列表, 评估文本列表)
+    """
+    from core.ai_service.prompt_compiler import format_records_context
+    windows, current, chars = [], [], 0
+    for record in records:
+        current.append(record)
+        chars += len(record["sender"]) + len(record["content"]) + 2
+        if chars >= window_chars:
+            windows.append(format_records_context(current))
+            current, chars = [], 0
+    if len(current) >= 2:
+        windows.append(format_records_context(current))
+
+    holdout_every = max(holdout_every, 2)
+    calibration = [text for idx, text in enumerate(windows) if idx % holdout_every != holdout_every - 1]
+    holdout = [text for idx, text in enumerate(windows) if idx % holdout_every == holdout_every - 1]
+    return _evenly_spaced(calibration, num_samples), _evenly_spaced(holdout, eval_samples)
+
+
+def _evenly_spaced(items: List[str], count: int) -> List[str]:
+    if len(items) <= count:
+        return items
+    step = len(items) / count
+    return [items[int(idx * step)] for idx in range(count)]
+
+
+def corpus_fingerprint(texts: List[str]) -> str:
+    """语料指纹（产物版本号的一部分：参数或校准语料变化即生成新产物）"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:8]
+
+
+def _copy_remote_files(base_model: str, output_dir: str) -> None:
+    """拷贝trust_remote_code所需的模型代码/词表/生成配置（save_quantized不包含）"""
+    for pattern in ("*.py", "*.tiktoken", "generation_config.json"):
+        for path in glob.glob(os.path.join(base_model, pattern)):
+            target = os.path.join(output_dir, os.path.basename(path))
+            if not os.path.exists(target):
+                shutil.copy2(path, target)
+
+
+def quantize_variant(base_model: str, overrides: Dict[str, Any], split: Dict[str, Any], output_dir: str,
+                     max_length: int) -> Dict[str, Any]:
+    """在当前进程量化单组参数并写出产物，返回产物清单"""
+    import torch
+    import auto_gptq
+    from transformers import AutoTokenizer
+    from auto_gptq import AutoGPTQForCausalLM
+    from utils.model_util import build_quantize_config
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
+    examples = []
+    for text in split["calibration"]:
+        input_ids = tokenizer(text)["input_ids"][-max_length:]  # 与服务一致保留最新内容
+        examples.append({"input_ids": torch.tensor([input_ids], dtype=torch.long),
+                         "attention_mask": torch.ones(1, len(input_ids), dtype=torch.long)})
+    model = AutoGPTQForCausalLM.from_pretrained(base_model, build_quantize_config(**overrides),
+                                                trust_remote_code=True, low_cpu_mem_usage=True)
+    start = time.perf_counter()
+    model.quantize(examples, batch_size=1, use_triton=False, cache_examples_on_gpu=False)
+    quantize_time = time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_quantized(output_dir, use_safetensors=True)
+    tokenizer.save_pretrained(output_dir)
+    _copy_remote_files(base_model, output_dir)
+    manifest = {
+        "base_model": os.path.abspath(base_model),
+        "tag": variant_tag(overrides),
+        "quantize_params": model.quantize_config.to_dict(),
+        "calibration": {
+            "samples": len(examples),
+            "tokens": sum(example["input_ids"].shape[-1] for example in examples),
+            "max_length": max_length,
+            "fingerprint": split["fingerprint"],
+            "sources": split["sources"],
+        },
+        "quantize_time_s": round(quantize_time, 1),
+        "auto_gptq_version": getattr(auto_gptq, "__version__", None),
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def evaluate_model(model_path: str, split: Dict[str, Any], max_length: int, max_new_tokens: int,
+                   num_prompts: int) -> Dict[str, Any]:
+    """在当前进程加载模型（量化产物/未量化基座），统计加载耗时、RSS、评估集困惑度、贪心解码tokens/s"""
+    import math
+    import torch
+    from utils.sys_util import get_rss_bytes, get_peak_rss_bytes
+
+    rss_before = get_rss_bytes()
+    load_start = time.perf_counter()
+    if os.path.exists(os.path.join(model_path, "quantize_config.json")):
+        from utils.model_util import load_4bit_quant_model
+        model, tokenizer = load_4bit_quant_model(model_path)
+    else:
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True, low_cpu_mem_usage=True)
+        model.eval()
+    load_time = time.perf_counter() - load_start
+    rss_loaded = get_rss_bytes()
+    device = next(model.parameters()).device
+
+    # 困惑度：评估集每个窗口的逐token交叉熵按token数加权
+    nll, eval_tokens = 0.0, 0
+    with torch.no_grad():
+        for text in split["holdout"]:
+            input_ids = torch.tensor([tokenizer(text)["input_ids"][-max_length:]], dtype=torch.long, device=device)
+            if input_ids.shape[-1] < 2:
+                continue
+            loss = model(input_ids=input_ids, labels=input_ids).loss
+            nll += loss.item() * (input_ids.shape[-1] - 1)
+            eval_tokens += input_ids.shape[-1] - 1
+
+    # 解码速度：评估窗口 + 固定问题，贪心解码固定生成长度（各组工作量一致）
+    generated_tokens, decode_time = 0, 0.0
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    for idx, text in enumerate(split["holdout"][:num_prompts]):
+        prompt = f"{text}\n{SAMPLE_QUESTIONS[idx % len(SAMPLE_QUESTIONS)]}"
+        input_ids = torch.tensor([tokenizer(prompt)["input_ids"][-max_length:]], dtype=torch.long, device=device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                     max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens,
+                                     do_sample=False, use_cache=True, pad_token_id=pad_token_id)
+        decode_time += time.perf_counter() - start
+        generated_tokens += outputs.shape[-1] - input_ids.shape[-1]
+
+    return {
+        "device": str(device),
+        "load_time_s": round(load_time, 3),
+        "rss_model_mb": round((rss_loaded - rss_before) / 1024 / 1024, 1),
+        "peak_rss_mb": round(get_peak_rss_bytes() / 1024 / 1024, 1),
+        "eval_windows": len(split["holdout"]),
+        "eval_tokens": eval_tokens,
+        "perplexity": round(math.exp(nll / eval_tokens), 3) if eval_tokens else None,
+        "tokens_per_s": round(generated_tokens / decode_time, 2) if decode_time else 0.0,
+    }
+
+
+def _run_stage(args: List[str]) -> Dict[str, Any]:
+    """在独立子进程中执行量化/评估（量化与加载的内存、RSS互不干扰），返回其最后一行JSON输出"""
+    proc = subprocess.run([sys.executable, "-m", "tools.quantize_model", *args], capture_output=True, text=True)
+    result_lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    return json.loads(result_lines[-1]) if result_lines else {"error": proc.stderr[-300:]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线GPTQ量化（自有聊天语料校准）+ 困惑度/加载/RSS/tokens/s对比报告")
+    parser.add_argument("--base-model", required=True, help="未量化基座checkpoint目录")
+    parser.add_argument("--corpus", nargs="*", default=[], help="聊天导出文件（不传使用样例聊天导出，仅冒烟）")
+    parser.add_argument("--format-type", default="txt", choices=["txt", "xml"], help="聊天导出格式")
+    parser.add_argument("--variants", default="", help="量化参数覆盖，分号分隔各组，如\"group_size=128;sym=true\"")
+    parser.add_argument("--window-chars", type=int, default=512, help="每个校准/评估窗口的聊天字符数")
+    parser.add_argument("--holdout-every", type=int, default=5, help="每N个窗口留出1个作评估集")
+    parser.add_argument("--num-samples", type=int, default=128, help="校准样本数")
+    parser.add_argument("--eval-samples", type=int, default=32, help="评估窗口数")
+    parser.add_argument("--max-length", type=int, default=1024, help="校准/评估样本最大token数（与服务max_context_len一致）")
+    parser.add_argument("--max-new-tokens", type=int, default=32, help="解码速度测试固定生成token数")
+    parser.add_argument("--prompts", type=int, default=8, help="解码速度测试Prompt数")
+    parser.add_argument("--include-base", action="store_true", help="报告包含未量化基座（困惑度基线）")
+    parser.add_argument("--force", action="store_true", help="产物已存在时也重新量化")
+    parser.add_argument("--output-root", default="./models/quantized", help="量化产物根目录")
+    parser.add_argument("--output", default="logs/bench/quantize.json", help="对比报告（.json/.csv）")
+    parser.add_argument("--split-file", default=None, help="内部使用：校准/评估集文件")
+    parser.add_argument("--single-quantize", default=None, help="内部使用：量化单组参数（JSON）")
+    parser.add_argument("--single-eval", default=None, help="内部使用：评估单个模型目录")
+    parser.add_argument("--artifact-dir", default=None, help="内部使用：量化产物目录")
+    args = parser.parse_args()
+
+    if args.single_quantize is not None or args.single_eval:
+        with open(args.split_file, "r", encoding="utf-8") as f:
+            split = json.load(f)
+        if args.single_eval:
+            print(json.dumps(evaluate_model(args.single_eval, split, args.max_length, args.max_new_tokens, args.prompts)))
+        else:
+            print(json.dumps(quantize_variant(args.base_model, json.loads(args.single_quantize), split,
+                                              args.artifact_dir, args.max_length), ensure_ascii=False))
+        return
+
+    records = load_corpus_records(args.corpus, args.format_type)
+    calibration, holdout = build_calibration_split(records, args.window_chars, args.holdout_every,
+                                                   args.num_samples, args.eval_samples)
+    if not calibration or not holdout:
+        raise SystemExit(f"语料过少：{len(records)}条记录只切出{len(calibration)}个校准/{len(holdout)}个评估窗口")
+    fingerprint = corpus_fingerprint(calibration)
+    split = {"calibration": calibration, "holdout": holdout, "fingerprint": fingerprint,
+             "sources": [os.path.basename(path) for path in args.corpus] or ["sample"]}
+    os.makedirs(args.output_root, exist_ok=True)
+    split_file = os.path.join(args.output_root, f"calibration-{fingerprint}.json")
+    with open(split_file, "w", encoding="utf-8") as f:
+        json.dump(split, f, ensure_ascii=False)
+    print(f"语料：{len(records)}条记录，校准{len(calibration)}个窗口，评估{len(holdout)}个窗口，指纹{fingerprint}")
+
+    common = ["--split-file", split_file, "--max-length", str(args.max_length),
+              "--max-new-tokens", str(args.max_new_tokens), "--prompts", str(args.prompts)]
+    rows = []
+    if args.include_base:
+        rows.append({"variant": "base", "model_path": args.base_model,
+                     **_run_stage(["--base-model", args.base_model, "--single-eval", args.base_model, *common])})
+        print(rows[-1])
+    base_name = os.path.basename(os.path.normpath(args.base_model))
+    for overrides in parse_variants(args.variants):
+        tag = variant_tag(overrides)
+        artifact_dir = os.path.join(args.output_root, f"{base_name}-{tag}-{fingerprint}")
+        row = {"variant": tag, "model_path": artifact_dir}
+        manifest_path = os.path.join(artifact_dir, MANIFEST_NAME)
+        if args.force or not os.path.exists(manifest_path):
+            manifest = _run_stage(["--base-model", args.base_model, "--single-quantize", json.dumps(overrides),
+                                   "--artifact-dir", artifact_dir, *common])
+        else:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            print(f"复用已有量化产物：{artifact_dir}")
+        if "error" in manifest:
+            rows.append({**row, "error": manifest["error"]})
+        else:
+            row["quantize_time_s"] = manifest["quantize_time_s"]
+            row.update(_run_stage(["--base-model", args.base_model, "--single-eval", artifact_dir, *common]))
+            rows.append(row)
+        print(rows[-1])
+
+    base_ppl = rows[0].get("perplexity") if args.include_base else None
+    if base_ppl:
+        for row in rows[1:]:
+            if row.get("perplexity"):
+                row["perplexity_delta_pct"] = round((row["perplexity"] / base_ppl - 1) * 100, 2)
+    write_results(rows, args.output)
+    print(f"结果已写入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
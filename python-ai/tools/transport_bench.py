@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Go↔Python本地传输开销基准：对比TCP/Unix socket、新建连接/keep-alive、JSON/msgpack的单次调用耗时
+默认调用/ai/v1/parse（开启缓存，首个请求后全部命中，耗时主要为传输+编解码）
+依赖httpx（可选依赖，仅基准使用）；msgpack未安装时跳过msgpack组合
+用法：python -m tools.transport_bench --start-server --calls 500 --output logs/bench/transport.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from tools.common import build_sample_chat_export, write_results
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percentile * (len(ordered) - 1))))]
+
+
+def _encode(payload: Dict[str, Any], encoding: str) -> Dict[str, Any]:
+    """请求体编码 + 对应请求头"""
+    if encoding == "msgpack":
+        return {"content": msgpack.packb(payload, use_bin_type=True),
+                "headers": {"Content-Type": MSGPACK_MEDIA_TYPE, "Accept": MSGPACK_MEDIA_TYPE}}
+    return {"content": json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            "headers": {"Content-Type": "application/json", "Accept": "application/json"}}
+
+
+def _decode(response, encoding: str) -> Any:
+    if encoding == "msgpack":
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+
+def run_case(transport: str, encoding: str, keepalive: bool, path: str, payload: Dict[str, Any],
+             calls: int, tcp_url: str, uds_path: Optional[str]) -> Dict[str, Any]:
+    """
+    执行一种传输组合，返回耗时统计（毫秒，含客户端编解码）
+    :param transport: tcp/uds
+    :param encoding: json/msgpack
+    :param keepalive: True=复用同一连接，False=每次调用新建连接
+    """
+    import httpx
+
+    def _new_client():
+        if transport == "uds":
+            return httpx.Client(transport=httpx.HTTPTransport(uds=uds_path), base_url="http://localhost")
+        return httpx.Client(base_url=tcp_url)
+
+    body = _encode(payload, encoding)
+    headers = {**body["headers"], "X-API-Key": settings.API_AUTH_KEY}
+    latencies: List[float] = []
+    client = _new_client() if keepalive else None
+    try:
+        # 预热：建立连接、填充解析缓存
+        warm_client = client or _new_client()
+        _decode(warm_client.post(path, content=body["content"], headers=headers), encoding)
+        if client is None:
+            warm_client.close()
+        for _ in range(calls):
+            start = time.perf_counter()
+            call_client = client or _new_client()
+            response = call_client.post(path, content=_encode(payload, encoding)["content"], headers=headers)
+            response.raise_for_status()
+            _decode(response, encoding)
+            if client is None:
+                call_client.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        if client is not None:
+            client.close()
+    return {
+        "transport": transport,
+        "encoding": encoding,
+        "keepalive": keepalive,
+        "calls": calls,
+        "request_bytes": len(body["content"]),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(_percentile(latencies, 0.5), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "p99_ms": round(_percentile(latencies, 0.99), 3),
+    }
+
+
+def start_servers(port: int, uds_path: str) -> List[subprocess.Popen]:
+    """启动两个单进程服务：TCP与Unix socket各一个（关闭reload，其余配置一致）"""
+    base_env = {**os.environ, "API_RELOAD": "false", "API_WORKERS": "1", "LOG_LEVEL": "WARNING"}
+    servers = [
+        subprocess.Popen([sys.executable, "main.py"], env={**base_env, "API_PORT": str(port), "API_UDS_PATH": ""}),
+        subprocess.Popen([sys.executable, "main.py"], env={**base_env, "API_UDS_PATH": uds_path}),
+    ]
+    time.sleep(3)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地传输开销基准（TCP/UDS × JSON/msgpack × keep-alive）")
+    parser.add_argument("--tcp-url", default=f"http://127.0.0.1:{settings.API_PORT}", help="TCP服务地址")
+    parser.add_argument("--uds", default=settings.API_UDS_PATH, help="Unix socket路径（为空则跳过UDS）")
+    parser.add_argument("--start-server", action="store_true", help="自动启动TCP与UDS两个服务（端口取--port）")
+    parser.add_argument("--port", type=int, default=18001, help="--start-server时TCP服务端口")
+    parser.add_argument("--calls", type=int, default=300, help="每种组合调用次数")
+    parser.add_argument("--messages", type=int, default=50, help="解析请求的聊天记录条数（决定请求/响应体大小）")
+    parser.add_argument("--output", default="logs/bench/transport_bench.json", help="结果文件（.json/.csv）")
+    args = parser.parse_args()
+
+    servers: List[subprocess.Popen] = []
+    if args.start_server:
+        args.uds = args.uds or os.path.join(tempfile.mkdtemp(), "ai.sock")
+        args.tcp_url = f"http://127.0.0.1:{args.port}"
+        servers = start_servers(args.port, args.uds)
+
+    payload = {"content": build_sample_chat_export(args.messages), "format_type": "txt", "use_cache": True}
+    encodings = ["json"] + (["msgpack"] if msgpack is not None else [])
+    cases = [("tcp", "json", False)] + [("tcp", encoding, True) for encoding in encodings]
+    if args.uds:
+        cases += [("uds", "json", False)] + [("uds", encoding, True) for encoding in encodings]
+
+    rows = []
+    try:
+        for transport, encoding, keepalive in cases:
+            try:
+                row = run_case(transport, encoding, keepalive, "/ai/v1/parse", payload,
+                               args.calls, args.tcp_url, args.uds)
+            except Exception as e:
+                row = {"transport": transport, "encoding": encoding, "keepalive": keepalive, "error": str(e)[:200]}
+            rows.append(row)
+            print(row)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait(timeout=10)
+    write_results(rows, args.output)
+    print(f"结果已写入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
-from .log_util import logger
+from .log_util import logger, log_event
 from .cache_util import global_cache, generate_content_key
 from .file_util import *  # 预留工具
 from .auth_util import check_local_auth, check_api_key
 from .response import standard_response
 
-__all__ = ["logger",
+__all__ = ["logger", "log_event",
            "global_cache", "generate_content_key",
            "check_local_auth", "check_api_key",
            "standard_response"]
\ No newline at end of file
@@ -9,6 +9,9 @@ def check_local_auth(request: Request):
     :param request: FastAPI请求对象
     :return: True/HTTPException
     """
+    if request.client is None:
+        # Unix domain socket连接无客户端地址，仅本机进程可访问（socket文件权限控制）
+        return True
     client_host = request.client.host
     local_ips = ["127.0.0.1", "localhost", "0.0.0.0"]
     if client_host not in local_ips:
@@ -16,15 +16,15 @@ class LRUCache:
     def get(self, key: str):
         """获取缓存值，不存在返回None"""
         if key in self.cache:
-            logger.debug(f"缓存命中：{key[:8]}...")
+            logger.debug("缓存命中：%s...", key[:8])
             return self.cache[key]
-        logger.debug(f"缓存未命中：{key[:8]}...")
+        logger.debug("缓存未命中：%s...", key[:8])
         return None
 
     def set(self, key: str, value):
         """设置缓存值，超量自动淘汰最久未使用"""
         self.cache[key] = value
-        logger.debug(f"缓存设置成功：{key[:8]}...")
+        logger.debug("缓存设置成功：%s...", key[:8])
 
     def clear(self):
         """清空缓存"""
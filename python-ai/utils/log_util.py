@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
-"""日志工具：全局日志配置，统一输出格式"""
+"""
+日志工具：全局日志配置，统一输出格式
+- 非阻塞：业务线程只把LogRecord放入有界队列，由后台线程格式化并写控制台/文件（队列满则丢弃并计数）
+- 结构化：文件输出JSON Lines，log_event携带的字段（如prompt/content）超长时截断并附带哈希
+- 采样：按消息类型（msg_type）配置采样率，未命中采样/级别关闭时不构造任何字段
+- 延迟格式化：使用%s占位参数，消息拼接在后台线程完成
+"""
+import atexit
+import hashlib
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import random
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from typing import Any, Dict
 from config import settings
 
 # 确保日志目录存在
@@ -14,26 +26,132 @@ if not os.path.exists(log_dir):
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+
+def redact_value(value: Any, max_chars: int = None) -> Any:
+    """
+    大字段脱敏：超长字符串只保留开头片段+长度+哈希（可据哈希关联同一Prompt，又不落盘全文）
+    :param value: 字段值
+    :param max_chars: 最大保留字符数，默认settings.LOG_FIELD_MAX_CHARS
+    """
+    max_chars = settings.LOG_FIELD_MAX_CHARS if max_chars is None else max_chars
+    if isinstance(value, str) and len(value) > max_chars:
+        return {
+            "head": value[:max_chars],
+            "len": len(value),
+            "sha1": hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+        }
+    return value
+
+
+class JsonLogFormatter(logging.Formatter):
+    """JSON Lines格式化：基础字段 + msg_type + 脱敏后的结构化字段"""
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "src": f"{record.filename}:{record.lineno}",
+            "msg": record.getMessage(),
+        }
+        msg_type = getattr(record, "msg_type", None)
+        if msg_type:
+            payload["msg_type"] = msg_type
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload["fields"] = {key: redact_value(value) for key, value in fields.items()}
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextLogFormatter(logging.Formatter):
+    """控制台文本格式：结构化字段脱敏后附加在消息末尾"""
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " | " + json.dumps({key: redact_value(value) for key, value in fields.items()},
+                                       ensure_ascii=False, default=str)
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """按msg_type采样（未配置的类型全部保留，WARNING及以上不采样）"""
+    def __init__(self, sample_rates: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(getattr(record, "msg_type", None) or "", 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    非阻塞队列处理器：不在业务线程格式化消息（保留原始msg/args，由后台线程拼接）
+    队列满时直接丢弃，避免日志反压拖慢请求
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同进程队列无需序列化，保留record原样实现延迟格式化
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 # 初始化日志器
 logger = logging.getLogger("python-ai")
 logger.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
 logger.handlers.clear()  # 清除默认处理器
+logger.propagate = False
 
 # 控制台处理器
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+console_handler.setFormatter(TextLogFormatter(LOG_FORMAT, datefmt=DATE_FORMAT))
 
-# 文件处理器（按大小切割）
+# 文件处理器（按大小切割，JSON Lines）
 file_handler = RotatingFileHandler(
     filename=settings.LOG_FILE,
     maxBytes=settings.LOG_MAX_BYTES,
     backupCount=settings.LOG_BACKUP_COUNT,
     encoding="utf-8"
 )
-file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+file_handler.setFormatter(
+    JsonLogFormatter() if settings.LOG_JSON else TextLogFormatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+)
+
+# 队列处理器（业务线程）+ 后台监听线程（实际写控制台/文件）
+log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+log_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)  # 进程退出前刷完队列
 
 # 添加处理器
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+logger.addHandler(queue_handler)
+
+
+def log_event(level: int, msg_type: str, message: str, *args, **fields) -> None:
+    """
+    结构化事件日志：级别关闭时零开销返回；字段在后台线程脱敏/序列化
+    :param level: 日志级别（logging.INFO等）
+    :param msg_type: 消息类型（用于采样与检索，如generate_prompt/generate_content/parse_request）
+    :param message: 消息模板（%s占位，延迟格式化）
+    :param args: 消息模板参数
+    :param fields: 结构化字段（大字段自动截断+哈希）
+    """
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, message, *args, extra={"msg_type": msg_type, "fields": fields}, stacklevel=2)
 
-__all__ = ["logger"]
\ No newline at end of file
+__all__ = ["logger", "log_event", "redact_value"]
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+指标工具：轻量Prometheus指标（Counter/Gauge/Histogram，支持标签），/metrics接口按文本格式导出
+不依赖prometheus_client，接口命名与其保持一致（labels/inc/set/observe），后续可无缝替换
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认耗时分桶（毫秒）
+DEFAULT_MS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# token数分桶
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+# 速率分桶（tokens/s）
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+# 内存分桶（字节）：1MB ~ 4GB
+BYTES_BUCKETS = tuple(2 ** exp for exp in range(20, 33, 2))
+
+
+def _escape(value: str) -> str:
+    """标签值转义（反斜杠/双引号/换行）"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """指标基类：按标签值元组保存子指标"""
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else metrics_registry).register(self)
+
+    def labels(self, *labelvalues, **labelkwargs):
+        """获取指定标签值的子指标（不存在则创建）"""
+        if labelkwargs:
+            labelvalues = tuple(str(labelkwargs[name]) for name in self.labelnames)
+        else:
+            labelvalues = tuple(str(value) for value in labelvalues)
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"指标{self.name}标签数量不匹配：{self.labelnames}")
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def _default_child(self):
+        """无标签指标直接操作默认子指标"""
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+
+class _ValueChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """导出时回调取值（适合队列深度、RSS等现成状态）"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default_child().inc(amount)
+
+    def _header(self) -> List[str]:
+        # 文本格式0.0.4中计数器样本名带_total后缀，HELP/TYPE与样本名保持一致
+        return [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total {self.metric_type}"]
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, child in list(self._children.items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, labelvalues)} {_format_value(child.get())}")
+        return lines
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default_child().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default_child().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default_child().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default_child().set_function(function)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(child.get())}")
+        return lines
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[idx] += 1
+                    break
+
+    def time(self):
+        """计时上下文（毫秒）：with histogram.time(): ..."""
+        return _Timer(self.observe)
+
+
+class _Timer:
+    def __init__(self, callback: Callable[[float], None]):
+        self.callback = callback
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.callback((time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class Histogram(_Metric):
+    """分桶直方图（累计桶+sum+count）"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_MS_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, child in list(self._children.items()):
+            with child._lock:
+                counts, total_sum, total_count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {total_count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表：按注册顺序导出Prometheus文本格式"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标重复注册：{metric.name}")
+            self._metrics[metric.name] = metric
+
+    def populated_names(self) -> List[str]:
+        """已产生样本（至少一个子指标）的指标名"""
+        return [name for name, metric in list(self._metrics.items()) if metric._children]
+
+    def render(self, include: Optional[Iterable[str]] = None, exclude: Iterable[str] = ()) -> str:
+        """
+        导出Prometheus文本格式（text/plain; version=0.0.4）
+        :param include: 仅导出这些指标名，None=全部
+        :param exclude: 跳过这些指标名（多进程合并导出时避免同名指标重复）
+        """
+        include = None if include is None else set(include)
+        exclude = set(exclude)
+        lines: List[str] = []
+        for name, metric in list(self._metrics.items()):
+            if (include is not None and name not in include) or name in exclude:
+                continue
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+__all__ = ["Counter", "Gauge", "Histogram", "metrics_registry", "PROMETHEUS_CONTENT_TYPE",
+           "DEFAULT_MS_BUCKETS", "TOKEN_BUCKETS", "RATE_BUCKETS", "BYTES_BUCKETS"]
@@ -1,23 +1,60 @@
 # -*- coding: utf-8 -*-
-import torch
+"""
+模型加载工具：torch/transformers/auto_gptq均在函数内导入
+仅在首次加载模型时才引入ML依赖，解析/健康检查等进程启动不受影响
+"""
 import os
 import json
-from typing import Tuple
-from config.model import MODEL_GLOBAL_CONFIG
+from typing import Any, Tuple, Optional
+from config.model import MODEL_GLOBAL_CONFIG, QUANT_COMMON_PARAMS, DEVICE_RESOURCE_LIMIT, resolve_device
 from utils import logger
-from transformers import AutoTokenizer, AutoConfig
-from auto_gptq import AutoGPTQForCausalLM, BaseQuantizeConfig
+
+
+def log_global_quant_config(device: str) -> None:
+    """加载模型时输出全局量化配置（原先在配置模块导入时打印）"""
+    logger.info(
+        "AI模型全局量化配置 | 量化框架：%s | 运行设备：%s | 量化位数：%sbit | 硬件资源限制：%s",
+        MODEL_GLOBAL_CONFIG["quant_type"], device, QUANT_COMMON_PARAMS["bits"],
+        DEVICE_RESOURCE_LIMIT.get(device.split(":")[0])
+    )
+
+
+def build_quantize_config(**overrides):
+    """
+    由全局QUANT_COMMON_PARAMS构建AutoGPTQ量化配置（离线量化与加载未量化checkpoint共用，保证参数一致）
+    :param overrides: 覆盖的量化参数（bits/group_size/damp_percent/sym/true_sequential/desc_act）
+    """
+    from auto_gptq import BaseQuantizeConfig
+    params = {**QUANT_COMMON_PARAMS, **overrides}
+    return BaseQuantizeConfig(
+        bits=params["bits"],
+        group_size=params["group_size"],
+        damp_percent=params["damp_percent"],
+        desc_act=params.get("desc_act", False),  # 关闭激活重排（CPU/GPU内核都兼容）
+        sym=params["sym"],
+        true_sequential=params["true_sequential"]
+    )
+
 
 def load_4bit_quant_model(
     model_path: str,
     quant_type: str = None,
     device: str = None,
     max_memory: str = None
-) -> Tuple[AutoGPTQForCausalLM, AutoTokenizer]:
-    """加载4bit GPTQ量化模型（终极稳定版：无任何多余参数，适配千问1.8B）"""
+) -> Tuple[Any, Any]:
+    """
+    加载4bit GPTQ量化模型（适配千问1.8B）
+    - 目录含quantize_config.json（tools/quantize_model.py或第三方量化产物）：from_quantized按其中的量化参数加载量化权重
+    - 否则视为未量化checkpoint：按全局QUANT_COMMON_PARAMS构建配置加载（权重未量化，需先离线量化）
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoConfig
+    from auto_gptq import AutoGPTQForCausalLM
+
     # 基础参数处理
     use_quant_type = quant_type or MODEL_GLOBAL_CONFIG["quant_type"]
-    use_device = device or MODEL_GLOBAL_CONFIG["device"]
+    use_device = resolve_device(device or MODEL_GLOBAL_CONFIG["device"])
+    log_global_quant_config(use_device)
     model_path = os.path.abspath(model_path).replace("\\", "/")
     logger.info(f"开始加载4bit量化模型 | 路径：{model_path} | 设备：{use_device}")
 
@@ -35,15 +72,7 @@ def load_4bit_quant_model(
         )
         logger.info(f"分词器加载成功 | 类型：{tokenizer.__class__.__name__}")
 
-        # 2. 构建量化配置（AutoGPTQ 0.4.2 必需）
-        quantize_config = BaseQuantizeConfig(
-            bits=4,                # 4bit量化（固定）
-            group_size=128,        # 千问1.8B默认分组
-            sym=True,              # 对称量化
-            desc_act=False         # 关闭激活描述符（CPU/GPU都兼容）
-        )
-
-        # 3. 规范化max_memory格式 + 设备key（仅保留合法格式）
+        # 2. 规范化max_memory格式 + 设备key（仅保留合法格式）
         def normalize_max_memory(mem_str: str) -> str:
             if not mem_str:
                 return "8.0GB"
@@ -66,21 +95,34 @@ def load_4bit_quant_model(
             # CPU设备：key用字符串"cpu"
             max_memory_dict["cpu"] = normalized_mem
 
-        # 4. 加载千问模型配置（仅保留必需参数）
-        model_config = AutoConfig.from_pretrained(
-            model_path,
-            trust_remote_code=True  # 千问必需，仅传给模型配置
-        )
-
-        # ========== 核心：仅保留AutoGPTQ必需的参数，无任何多余参数 ==========
-        model = AutoGPTQForCausalLM.from_pretrained(
-            pretrained_model_name_or_path=model_path,  # 模型路径（唯一位置参数）
-            quantize_config=quantize_config,           # 量化配置（必需）
-            config=model_config,                       # 模型配置（必需）
-            trust_remote_code=True,                    # 千问必需（仅透传，无冲突）
-            device_map="auto",                         # 自动分配设备（替代use_cuda）
-            max_memory=max_memory_dict                 # 内存限制（合法格式）
-        )
+        if os.path.exists(os.path.join(model_path, "quantize_config.json")):
+            # 3. 已量化产物：量化参数以产物中的quantize_config.json为准
+            model = AutoGPTQForCausalLM.from_quantized(
+                model_path,
+                device_map="auto",
+                max_memory=max_memory_dict,
+                use_safetensors=any(name.endswith(".safetensors") for name in os.listdir(model_path)),
+                use_triton=False,
+                disable_exllama=not use_device.startswith("cuda"),  # exllama内核仅CUDA可用
+                trust_remote_code=True
+            )
+            logger.info(f"已加载量化权重 | 量化参数：{model.quantize_config.to_dict()}")
+        else:
+            # 3. 未量化checkpoint：按全局量化参数构建配置（与离线量化一致）
+            logger.warning(f"未找到quantize_config.json，按未量化checkpoint加载：{model_path}"
+                           f"（先用tools/quantize_model.py离线量化）")
+            model_config = AutoConfig.from_pretrained(
+                model_path,
+                trust_remote_code=True  # 千问必需，仅传给模型配置
+            )
+            model = AutoGPTQForCausalLM.from_pretrained(
+                pretrained_model_name_or_path=model_path,
+                quantize_config=build_quantize_config(),
+                config=model_config,
+                trust_remote_code=True,
+                device_map="auto",
+                max_memory=max_memory_dict
+            )
 
         # 模型优化（推理模式，无多余参数）
         model.eval()
@@ -90,4 +132,59 @@ def load_4bit_quant_model(
 
     except Exception as e:
         logger.error(f"❌ 模型加载失败：未知错误 | 错误详情：{str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def configure_torch_threads(num_threads: Optional[int] = None, interop_threads: Optional[int] = None) -> int:
+    """
+    CPU推理线程调优：intra-op线程默认取物理核数（超线程对GEMM无收益），inter-op线程单请求推理1个即可
+    :param num_threads: intra-op线程数，None=自动（物理核数）
+    :param interop_threads: inter-op线程数，None=不修改（只能在首次并行计算前设置一次）
+    :return: 实际生效的intra-op线程数
+    """
+    import torch
+    if not num_threads:
+        logical_cores = os.cpu_count() or 1
+        num_threads = max(1, logical_cores // 2) if logical_cores >= 4 else logical_cores
+    torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # inter-op线程池已启动后不可再修改，忽略即可
+            logger.warning(f"inter-op线程数设置失败（线程池已启动），保持：{torch.get_num_interop_threads()}")
+    return torch.get_num_threads()
+
+
+def load_int8_dynamic_model(
+    model_path: str,
+    num_threads: Optional[int] = None,
+    interop_threads: Optional[int] = None
+) -> Tuple[Any, Any]:
+    """
+    加载全精度模型并做PyTorch动态int8量化（CPU专用后端）
+    - Linear层权重int8存储，激活按batch动态量化，CPU上走fbgemm/onednn int8内核
+    - 需要全精度（非GPTQ）checkpoint路径
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    model_path = os.path.abspath(model_path).replace("\\", "/")
+    log_global_quant_config("cpu")
+    threads = configure_torch_threads(num_threads, interop_threads)
+    logger.info(f"开始加载int8动态量化模型 | 路径：{model_path} | CPU线程：{threads}")
+    try:
+        tokenizer_params = MODEL_GLOBAL_CONFIG.get("tokenizer_params", {})
+        tokenizer = AutoTokenizer.from_pretrained(model_path, **tokenizer_params, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            torch_dtype=torch.float32,  # 动态量化要求float32输入权重
+            trust_remote_code=True,
+            low_cpu_mem_usage=True
+        )
+        model.eval()
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info(f"✅ int8动态量化模型加载成功 | 设备：cpu | CPU线程：{threads}")
+        return model, tokenizer
+    except Exception as e:
+        logger.error(f"❌ int8动态量化模型加载失败 | 错误详情：{str(e)}")
+        raise
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+单请求采样剖析：后台线程按固定间隔读取各线程当前栈（sys._current_frames），只统计归属于被剖析请求的线程
+- 事件循环线程：仅当循环当前执行的任务是该请求的任务时计入（排除同时在处理的其他请求与空闲等待）
+- 线程池/生成线程：由profiled()/profiled_iter()在执行期间登记，未开启剖析时原样返回被包装对象（无额外开销）
+- 输出：折叠栈文件（flamegraph.pl/speedscope可直接读取，每行「帧;帧;帧 样本数」）+ Top-N函数汇总
+"""
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# 当前请求的剖析器（线程池执行时随上下文复制传递）
+_active_profiler: contextvars.ContextVar = contextvars.ContextVar("active_profiler", default=None)
+
+
+class RequestProfiler:
+    """单请求采样剖析器（start → 请求执行 → stop → write）"""
+
+    def __init__(self, profile_id: str, interval_ms: float = 5.0):
+        """
+        :param profile_id: 剖析id（输出文件名）
+        :param interval_ms: 采样间隔（毫秒），实际间隔受GIL切换间隔影响
+        """
+        self.profile_id = profile_id
+        self.interval = max(interval_ms, 0.5) / 1000
+        self.stacks: Dict[str, int] = {}  # 折叠栈 → 样本数
+        self.samples = 0
+        self.start_time = 0.0
+        self.duration = 0.0
+        self._threads: Dict[int, str] = {}  # 线程标识 → 根帧标签
+        self._loop = None
+        self._loop_ident = None
+        self._task = None
+        self._frame_labels: Dict[object, str] = {}  # 代码对象 → 帧标签缓存
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._token = None
+
+    def start(self) -> None:
+        """在请求所在的事件循环任务中调用：登记事件循环线程与当前任务，启动采样线程"""
+        try:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.current_task()
+            self._loop_ident = threading.get_ident()
+            self._threads[self._loop_ident] = "event-loop"
+        except RuntimeError:
+            # 非事件循环中调用（同步场景）：直接登记当前线程
+            self._threads[threading.get_ident()] = threading.current_thread().name
+        self._token = _active_profiler.set(self)
+        self.start_time = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.profile_id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """停止采样（幂等）"""
+        if self._sampler is None:
+            return
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self.duration = time.perf_counter() - self.start_time
+        if self._token is not None:
+            _active_profiler.reset(self._token)
+            self._token = None
+
+    @contextmanager
+    def attach_thread(self):
+        """执行期间将当前线程计入剖析（同一线程重复登记时由最外层负责移除）"""
+        ident = threading.get_ident()
+        if ident in self._threads:
+            yield
+            return
+        self._threads[ident] = threading.current_thread().name
+        try:
+            yield
+        finally:
+            self._threads.pop(ident, None)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        for ident, root in list(self._threads.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            if ident == self._loop_ident and not self._loop_busy_with_request():
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(root)
+            stack = ";".join(reversed(labels))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def _loop_busy_with_request(self) -> bool:
+        """事件循环当前执行的任务是否为被剖析请求（asyncio未公开当前任务的跨线程查询，读取其内部表）"""
+        current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+        if current_tasks is None or self._task is None:
+            return True
+        return current_tasks.get(self._loop) is self._task
+
+    def _frame_label(self, code) -> str:
+        label = self._frame_labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            try:
+                filename = os.path.relpath(filename)
+            except ValueError:
+                pass
+            if filename.startswith(".."):
+                # 项目外的库文件只保留包内路径
+                filename = "/".join(filename.replace("\\", "/").split("/")[-2:])
+            # 分号为折叠栈分隔符（样本数以行末最后一个空格分隔，帧内空格不影响解析）
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._frame_labels[code] = label
+        return label
+
+    def top_functions(self, top_n: int = 30) -> List[Dict]:
+        """
+        按函数汇总：self为栈顶样本数（函数自身耗时），total为出现在栈中的样本数（含调用的子函数）
+        :return: [{"function", "self", "total", "self_pct", "total_pct"}, ...]，按self降序
+        """
+        self_counts: Dict[str, int] = {}
+        total_counts: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # 去掉线程根帧
+            if not frames:
+                continue
+            self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+            for frame in set(frames):
+                total_counts[frame] = total_counts.get(frame, 0) + count
+        samples = self.samples or 1
+        ranked = sorted(total_counts, key=lambda name: (self_counts.get(name, 0), total_counts[name]), reverse=True)
+        return [{
+            "function": name,
+            "self": self_counts.get(name, 0),
+            "total": total_counts[name],
+            "self_pct": round(self_counts.get(name, 0) * 100 / samples, 1),
+            "total_pct": round(total_counts[name] * 100 / samples, 1),
+        } for name in ranked[:top_n]]
+
+    def write(self, output_dir: str, top_n: int = 30, meta: Optional[Dict] = None) -> Dict[str, str]:
+        """
+        写出折叠栈文件（<id>.collapsed）与Top-N汇总（<id>.txt）
+        :param meta: 汇总头部附加信息（请求方法/路径/状态码等）
+        :return: {"collapsed": 路径, "summary": 路径}
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        collapsed_path = os.path.join(output_dir, f"{self.profile_id}.collapsed")
+        summary_path = os.path.join(output_dir, f"{self.profile_id}.txt")
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: item[1], reverse=True):
+                f.write(f"{stack} {count}\n")
+        lines = [f"profile_id: {self.profile_id}"]
+        lines += [f"{key}: {value}" for key, value in (meta or {}).items()]
+        lines += [
+            f"duration_ms: {self.duration * 1000:.1f}",
+            f"interval_ms: {self.interval * 1000:g}",
+            f"samples: {self.samples}",
+            "",
+            f"{'self%':>6} {'total%':>7} {'self':>6} {'total':>6}  function",
+        ]
+        for row in self.top_functions(top_n):
+            lines.append(f"{row['self_pct']:>6} {row['total_pct']:>7} {row['self']:>6} {row['total']:>6}  {row['function']}")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return {"collapsed": collapsed_path, "summary": summary_path}
+
+
+def get_active_profiler() -> Optional[RequestProfiler]:
+    """当前上下文的剖析器（未开启剖析返回None）"""
+    return _active_profiler.get()
+
+
+def profiled(func: Callable) -> Callable:
+    """
+    包装将在其他线程执行的函数（线程池/生成线程），执行期间该线程计入当前请求的剖析
+    需在请求上下文中调用（包装时捕获剖析器）；未开启剖析时原样返回func
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return func
+
+    def _run(*args, **kwargs):
+        with profiler.attach_thread():
+            return func(*args, **kwargs)
+    return _run
+
+
+def profiled_iter(iterator: Iterator) -> Iterator:
+    """包装在线程池中逐项迭代的同步迭代器（如流式响应），每次取值期间计入剖析；未开启剖析时原样返回"""
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return iterator
+
+    def _iterate():
+        source = iter(iterator)
+        while True:
+            with profiler.attach_thread():
+                try:
+                    item = next(source)
+                except StopIteration:
+                    return
+            yield item
+    return _iterate()
+
+
+__all__ = ["RequestProfiler", "get_active_profiler", "profiled", "profiled_iter"]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""系统资源工具：进程常驻内存（RSS）/峰值内存查询，供模型加载、基准测试统计使用"""
+import os
+import sys
+
+try:
+    import resource  # 仅类Unix系统可用
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+def get_rss_bytes() -> int:
+    """
+    获取当前进程常驻内存（RSS，字节）
+    Linux读取/proc/self/statm（实时值），其他系统退化为峰值RSS
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return get_peak_rss_bytes()
+
+
+def get_peak_rss_bytes() -> int:
+    """获取当前进程峰值常驻内存（字节），Linux的ru_maxrss单位为KB，macOS为字节"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(num_bytes: float) -> str:
+    """字节数格式化为可读字符串（如 1.5GB）"""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f}{unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f}TB"
+
+
+def parse_memory_size(size) -> int:
+    """
+    内存大小字符串转字节数（兼容配置中的 8G / 8GB / 512M / 1024 等写法）
+    :param size: 内存大小字符串或数字（数字视为字节）
+    :return: 字节数，空值返回0
+    """
+    if not size:
+        return 0
+    if isinstance(size, (int, float)):
+        return int(size)
+    size_str = size.strip().upper().rstrip("B").rstrip("I")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if size_str and size_str[-1] in units:
+        return int(float(size_str[:-1]) * units[size_str[-1]])
+    return int(float(size_str))
+
+
+__all__ = ["get_rss_bytes", "get_peak_rss_bytes", "format_bytes", "parse_memory_size"]